@@ -0,0 +1,33 @@
+import { test, beforeEach } from 'node:test'
+import assert from 'node:assert/strict'
+import { applyTrackEvents, listLiveTracks, listTrackEvents, resetTrackEvents } from '../src/storage/trackEventsStore.js'
+
+beforeEach(() => {
+  resetTrackEvents()
+})
+
+test('trackEventsStore rebuilds live tracks from pushed batches', () => {
+  applyTrackEvents({
+    events: [
+      { type: 'created', camera: '0', trackId: 1, track: { trackId: 1, label: 'fire' } },
+      { type: 'created', camera: '0', trackId: 2, track: { trackId: 2, label: 'smoke' } },
+      { type: 'updated', camera: '0', trackId: 1, track: { trackId: 1, label: 'fire', hits: 5 } }
+    ]
+  })
+  const result = applyTrackEvents({
+    events: [
+      { type: 'lost', camera: '0', trackId: 2 },
+      { type: 'target', camera: '0', trackId: 1, previous: null }
+    ],
+    dropped: { updated: 3 }
+  })
+
+  assert.deepEqual(result, { accepted: 2, seq: 5 })
+  const live = listLiveTracks()
+  assert.deepEqual(live.trackers.map((track) => [track.trackId, track.hits]), [[1, 5]])
+  assert.equal(live.targetTrackId, 1)
+
+  const newer = listTrackEvents({ since: 3 })
+  assert.deepEqual(newer.events.map((event) => event.type), ['lost', 'target'])
+  assert.deepEqual(newer.dropped, { updated: 3 })
+})
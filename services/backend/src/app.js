@@ -7,6 +7,7 @@ import { detectionsRouter, detectionStatusHandler } from './routes/detections.js
 import { internalRouter } from './routes/internal.js'
 import { configRouter } from './routes/config.js'
 import { trackersRouter } from './routes/trackers.js'
+import { trackEventsRouter } from './routes/trackEvents.js'
 
 export function createApp() {
   const app = express()
@@ -32,6 +33,7 @@ export function createApp() {
   })
 
   app.use('/api/detections', detectionsRouter)
+  app.use('/api/trackers/events', trackEventsRouter)
   app.use('/api/trackers', trackersRouter)
   app.get('/api/detection', detectionStatusHandler)
   app.use('/api/config', configRouter)
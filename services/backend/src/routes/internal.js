@@ -1,8 +1,10 @@
 import express from 'express'
 import { internalDetectionsRouter } from './detections.js'
+import { internalTrackEventsRouter } from './trackEvents.js'
 
 export const internalRouter = express.Router()
 
 internalRouter.use('/detections', internalDetectionsRouter)
+internalRouter.use('/track-events', internalTrackEventsRouter)
 
 
@@ -0,0 +1,26 @@
+import express from 'express'
+import { applyTrackEvents, listLiveTracks, listTrackEvents } from '../storage/trackEventsStore.js'
+
+export const trackEventsRouter = express.Router()
+export const internalTrackEventsRouter = express.Router()
+
+// Пакеты событий треков от detection service (created/updated/lost/target)
+internalTrackEventsRouter.post('/', (req, res) => {
+  const { events } = req.body ?? {}
+  if (!Array.isArray(events)) {
+    return res.status(400).json({ error: 'events array is required' })
+  }
+  res.json(applyTrackEvents(req.body))
+})
+
+trackEventsRouter.get('/', (req, res) => {
+  const since = Number.parseInt(req.query.since, 10)
+  const limit = Number.parseInt(req.query.limit, 10)
+  res.json({
+    ...listTrackEvents({
+      since: Number.isFinite(since) ? since : 0,
+      limit: Number.isFinite(limit) && limit > 0 ? limit : 200
+    }),
+    ...listLiveTracks()
+  })
+})
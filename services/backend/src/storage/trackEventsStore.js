@@ -0,0 +1,68 @@
+// In-memory view of track lifecycle events pushed by the detection service.
+// Events are kept in a bounded log (read incrementally by sequence number),
+// live tracks are rebuilt from created/updated/lost.
+
+const MAX_EVENTS = Number.parseInt(process.env.TRACK_EVENTS_LIMIT ?? '1000', 10)
+
+let events = []
+let nextSeq = 1
+let liveTracks = new Map()
+let targetTrackId = null
+let droppedTotal = {}
+
+function trackKey(camera, trackId) {
+  return `${camera ?? '0'}:${trackId}`
+}
+
+export function applyTrackEvents(batch) {
+  const incoming = Array.isArray(batch?.events) ? batch.events : []
+  let accepted = 0
+  for (const event of incoming) {
+    if (!event || typeof event.type !== 'string') continue
+    const stored = { ...event, seq: nextSeq++ }
+    events.push(stored)
+    accepted += 1
+    const key = trackKey(event.camera, event.trackId)
+    if (event.type === 'created' || event.type === 'updated') {
+      liveTracks.set(key, { ...(event.track ?? {}), camera: event.camera ?? '0', updatedAt: event.timestamp })
+    } else if (event.type === 'lost') {
+      liveTracks.delete(key)
+    } else if (event.type === 'target') {
+      targetTrackId = event.trackId ?? null
+    }
+  }
+  if (events.length > MAX_EVENTS) {
+    events = events.slice(events.length - MAX_EVENTS)
+  }
+  // Events the detection service dropped under overload are only counted
+  if (batch?.dropped && typeof batch.dropped === 'object') {
+    for (const [type, count] of Object.entries(batch.dropped)) {
+      droppedTotal[type] = (droppedTotal[type] ?? 0) + (Number(count) || 0)
+    }
+  }
+  return { accepted, seq: nextSeq - 1 }
+}
+
+export function listTrackEvents({ since = 0, limit = 200 } = {}) {
+  const newer = events.filter((event) => event.seq > since)
+  return {
+    events: newer.slice(0, limit),
+    seq: nextSeq - 1,
+    dropped: { ...droppedTotal }
+  }
+}
+
+export function listLiveTracks() {
+  return {
+    trackers: Array.from(liveTracks.values()),
+    targetTrackId
+  }
+}
+
+export function resetTrackEvents() {
+  events = []
+  nextSeq = 1
+  liveTracks = new Map()
+  targetTrackId = null
+  droppedTotal = {}
+}
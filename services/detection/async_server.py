@@ -0,0 +1,660 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Detection Service - asyncio HTTP server (aiohttp).
+
+Production alternative to the Flask/Werkzeug server in ``detection_server``
+with the same routes and payloads (``SERVER_MODE=async``). MJPEG and SSE
+clients are coroutines woken by frame notifications from the camera
+pipelines, so an idle connection costs a few kilobytes instead of an OS
+thread. Service calls that may wait on a lock held by the detection thread
+or a model load (status, tracker payloads, model switch, crops, profiling)
+run in the default thread pool, never on the event loop.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+try:
+    from aiohttp import web
+    AIOHTTP_AVAILABLE = True
+except ImportError:
+    AIOHTTP_AVAILABLE = False
+    web = None  # type: ignore[assignment]
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from services.detection.config.runtime import RuntimeConfig
+from services.detection.monitoring.profiler import ProfilerBusyError, debug_token_valid
+from services.detection.pipeline import CameraPipeline
+from services.detection.service import DetectionService
+from services.detection.streaming.generators import (
+    MJPEG_CONTENT_TYPE,
+    SSE_KEEPALIVE_SECONDS,
+    mjpeg_part,
+    sse_event,
+)
+from services.detection.streaming.variants import StreamVariant, VariantEncoder, parse_variant_query
+
+logger = logging.getLogger(__name__)
+
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Headers': 'Content-Type,Authorization,Accept,Origin,X-Requested-With',
+    'Access-Control-Allow-Methods': 'GET,POST,PUT,DELETE,OPTIONS,PATCH',
+    'Access-Control-Max-Age': '86400',
+}
+# Same maximum rates as the threaded server's generators
+RAW_STREAM_INTERVAL = 0.033
+DETECTIONS_STREAM_INTERVAL = 0.1
+ALL_CAMERAS = '*'
+SERVICE_KEY = web.AppKey('service', DetectionService) if AIOHTTP_AVAILABLE else 'service'
+BROADCASTER_KEY = web.AppKey('broadcaster', object) if AIOHTTP_AVAILABLE else 'broadcaster'
+
+
+class FrameBroadcaster:
+    """Turns pipeline frame notifications (capture/detection threads) into asyncio wake-ups.
+
+    Each ``(camera, kind)`` key owns an ``asyncio.Event`` that is set and
+    replaced on every notification; waiters grab the current event and await
+    it. Raw frames are JPEG-encoded once per frame and stream variant in a
+    dedicated thread pool, pinned to the encode CPUs, and shared by all viewers
+    of that variant; the default executor stays free of the encode affinity.
+    """
+
+    def __init__(self, service: DetectionService, loop: asyncio.AbstractEventLoop):
+        self.service = service
+        self.loop = loop
+        self._events: Dict[Tuple[str, str], asyncio.Event] = {}
+        self._trackers_cache: Dict[Optional[str], Tuple[tuple, bytes]] = {}
+        # Payloads being built in the pool, shared by the SSE clients waiting for them
+        self._trackers_pending: Dict[Optional[str], Tuple[tuple, asyncio.Future]] = {}
+        layout = service.cpu_layout
+        self.encode_executor = ThreadPoolExecutor(
+            max_workers=max(2, len(layout.affinity.get('encode', ())) or (os.cpu_count() or 1)),
+            thread_name_prefix='stream-encode',
+            initializer=layout.pin,
+            initargs=('encode',),
+        )
+
+    def start(self) -> None:
+        for pipeline in self.service.pipelines.values():
+            pipeline.add_listener(self._on_frame)
+
+    def stop(self) -> None:
+        for pipeline in self.service.pipelines.values():
+            pipeline.remove_listener(self._on_frame)
+        self.encode_executor.shutdown(wait=False, cancel_futures=True)
+
+    def _on_frame(self, pipeline: CameraPipeline, kind: str) -> None:
+        # Runs in a capture or detection thread
+        try:
+            self.loop.call_soon_threadsafe(self._wake, pipeline.camera_id, kind)
+        except RuntimeError:
+            pass  # loop closed during shutdown
+
+    def _wake(self, camera_id: str, kind: str) -> None:
+        for key in ((camera_id, kind), (ALL_CAMERAS, kind)):
+            event = self._events.pop(key, None)
+            if event is not None:
+                event.set()
+
+    def next_frame(self, camera_id: str, kind: str) -> asyncio.Event:
+        """Event set by the next ``raw``/``annotated`` frame; take it before reading the current frame."""
+        key = (camera_id, kind)
+        event = self._events.get(key)
+        if event is None:
+            event = self._events[key] = asyncio.Event()
+        return event
+
+    @staticmethod
+    async def wait(event: asyncio.Event, timeout: float) -> bool:
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def variant_jpeg(self, encoder: VariantEncoder) -> Tuple[Optional[bytes], Optional[float]]:
+        frame, timestamp = encoder.cached()
+        if frame is not None:
+            return frame, timestamp
+        # Concurrent viewers of the variant serialize on the encoder lock; only one encodes
+        return await self.loop.run_in_executor(self.encode_executor, encoder.frame)
+
+    async def trackers_event(self, camera_id: Optional[str]) -> bytes:
+        """SSE event with the trackers payload, built once per processed frame for all clients.
+
+        Built in the thread pool: ``list_trackers`` waits for the tracker lock,
+        which the detection thread holds while tracking.
+        """
+        version = self.service.processed_version(camera_id)
+        cached = self._trackers_cache.get(camera_id)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        pending = self._trackers_pending.get(camera_id)
+        if pending is None or pending[0] != version:
+            future = self.loop.run_in_executor(
+                None, lambda: sse_event(self.service.list_trackers(camera_id), 'trackers')
+            )
+            pending = self._trackers_pending[camera_id] = (version, future)
+        data = await asyncio.shield(pending[1])
+        if self._trackers_pending.get(camera_id) is pending:
+            del self._trackers_pending[camera_id]
+            self._trackers_cache[camera_id] = (version, data)
+        return data
+
+
+def _service(request: 'web.Request') -> Optional[DetectionService]:
+    return request.app[SERVICE_KEY]
+
+
+def _not_initialized(extra: Optional[dict] = None) -> 'web.Response':
+    payload = dict(extra or {})
+    payload['error'] = 'Service not initialized'
+    return web.json_response(payload, status=503)
+
+
+async def cors_middleware(request: 'web.Request', handler):
+    """CORS заголовки и preflight OPTIONS, как в Flask-сервере"""
+    if request.method == 'OPTIONS':
+        return web.Response(status=204, headers=CORS_HEADERS)
+    response = await handler(request)
+    if not response.prepared:
+        response.headers.update(CORS_HEADERS)
+    return response
+
+
+# Streams ---------------------------------------------------------------------------------
+
+
+async def _mjpeg_stream(request: 'web.Request', camera_id: Optional[str], annotated: bool,
+                        min_interval: float, stream: str, variant: Optional[StreamVariant] = None):
+    service = _service(request)
+    broadcaster: FrameBroadcaster = request.app[BROADCASTER_KEY]
+    pipeline = service.get_pipeline(camera_id)
+    if variant is not None:
+        min_interval = variant.interval
+    response = web.StreamResponse(headers={'Content-Type': MJPEG_CONTENT_TYPE, **CORS_HEADERS})
+    await response.prepare(request)
+
+    metrics = service.metrics
+    subscribers = metrics.gauge('stream_subscribers', 'Connected MJPEG clients', stream=stream)
+    bytes_total = metrics.counter('stream_bytes_total', 'Bytes sent to MJPEG clients', stream=stream)
+    frames_total = metrics.counter('stream_frames_total', 'Frames sent to MJPEG clients', stream=stream)
+    subscribers.inc()
+    encoder = service.stream_variants.subscribe(pipeline, variant) if variant is not None else None
+    kind = 'annotated' if annotated else 'raw'
+    last_frame = None
+    last_sent = 0.0
+    try:
+        while True:
+            next_frame = broadcaster.next_frame(pipeline.camera_id, kind)
+            if annotated:
+                frame, timestamp = pipeline.capture_annotated_jpeg(), pipeline.annotated_timestamp
+            else:
+                frame, timestamp = await broadcaster.variant_jpeg(encoder)
+            if frame is not None and frame is not last_frame:
+                delay = last_sent + min_interval - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                part = mjpeg_part(frame, timestamp)
+                # Waits for the socket to drain, so a slow client just skips frames
+                await response.write(part)
+                bytes_total.inc(len(part))
+                frames_total.inc()
+                last_frame = frame
+                last_sent = time.monotonic()
+            await broadcaster.wait(next_frame, timeout=1.0)
+    except (ConnectionResetError, ConnectionError):
+        pass
+    finally:
+        subscribers.dec()
+        if encoder is not None:
+            service.stream_variants.unsubscribe(encoder)
+    return response
+
+
+def _select_variant(request: 'web.Request') -> StreamVariant:
+    """Вариант потока по ?width=&quality=&fps=; ValueError при некорректных значениях"""
+    return _service(request).stream_variants.select(**parse_variant_query(request.query))
+
+
+async def video_feed_raw(request: 'web.Request'):
+    """MJPEG stream без детекции (?width=&quality=&fps= выбирают вариант потока)"""
+    if _service(request) is None:
+        return _not_initialized()
+    try:
+        variant = _select_variant(request)
+    except ValueError as exc:
+        return web.json_response({'error': f'Invalid stream parameters: {exc}'}, status=400)
+    return await _mjpeg_stream(request, None, False, RAW_STREAM_INTERVAL, 'raw', variant)
+
+
+async def list_cameras(request: 'web.Request'):
+    """Список камер"""
+    service = _service(request)
+    if service is None:
+        return _not_initialized({'cameras': []})
+    return web.json_response(await asyncio.get_running_loop().run_in_executor(None, service.list_cameras_payload))
+
+
+async def camera_stream(request: 'web.Request'):
+    """MJPEG поток конкретной камеры без детекции"""
+    service = _service(request)
+    camera_id = request.match_info['camera_id']
+    if service is None:
+        return _not_initialized()
+    if service.get_pipeline(camera_id) is None:
+        return web.json_response({'error': 'Camera not found'}, status=404)
+    try:
+        variant = _select_variant(request)
+    except ValueError as exc:
+        return web.json_response({'error': f'Invalid stream parameters: {exc}'}, status=400)
+    return await _mjpeg_stream(request, camera_id, False, RAW_STREAM_INTERVAL, f'raw/{camera_id}', variant)
+
+
+async def camera_detections_stream(request: 'web.Request'):
+    """MJPEG поток конкретной камеры с наложенными детекциями"""
+    service = _service(request)
+    camera_id = request.match_info['camera_id']
+    if service is None:
+        return _not_initialized()
+    if service.get_pipeline(camera_id) is None:
+        return web.json_response({'error': 'Camera not found'}, status=404)
+    return await _mjpeg_stream(request, camera_id, True, DETECTIONS_STREAM_INTERVAL, f'detections/{camera_id}')
+
+
+async def camera_trackers(request: 'web.Request'):
+    """Активные трекеры конкретной камеры"""
+    service = _service(request)
+    camera_id = request.match_info['camera_id']
+    if service is None:
+        return _not_initialized({'trackers': []})
+    if service.get_pipeline(camera_id) is None:
+        return web.json_response({'trackers': [], 'error': 'Camera not found'}, status=404)
+    payload = await asyncio.get_running_loop().run_in_executor(None, service.list_trackers, camera_id)
+    return web.json_response(payload)
+
+
+async def trackers_stream(request: 'web.Request'):
+    """SSE поток трекеров: событие после каждого обработанного кадра (?camera=<id>)"""
+    service = _service(request)
+    if service is None:
+        return _not_initialized()
+    camera_id = request.query.get('camera') or None
+    if camera_id is not None and service.get_pipeline(camera_id) is None:
+        return web.json_response({'error': 'Camera not found'}, status=404)
+
+    broadcaster: FrameBroadcaster = request.app[BROADCASTER_KEY]
+    response = web.StreamResponse(headers={
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        **CORS_HEADERS,
+    })
+    await response.prepare(request)
+    try:
+        next_frame = broadcaster.next_frame(camera_id or ALL_CAMERAS, 'annotated')
+        await response.write(await broadcaster.trackers_event(camera_id))
+        while True:
+            if await broadcaster.wait(next_frame, timeout=SSE_KEEPALIVE_SECONDS):
+                next_frame = broadcaster.next_frame(camera_id or ALL_CAMERAS, 'annotated')
+                await response.write(await broadcaster.trackers_event(camera_id))
+            else:
+                await response.write(b': keep-alive\n\n')
+    except (ConnectionResetError, ConnectionError):
+        pass
+    return response
+
+
+# JSON endpoints --------------------------------------------------------------------------
+
+
+async def health(request: 'web.Request'):
+    """Health check endpoint"""
+    service = _service(request)
+    if service is None:
+        return web.json_response({'status': 'error', 'error': 'Service not initialized'}, status=503)
+    return web.json_response({
+        'status': 'ok',
+        'camera_available': service.camera_type is not None,
+        'camera_type': service.camera_type,
+    })
+
+
+async def ready(request: 'web.Request'):
+    """Готовность детекции: модель загружена и прогрета (503 пока идёт загрузка)"""
+    service = _service(request)
+    if service is None:
+        return web.json_response({'ready': False, 'error': 'Service not initialized'}, status=503)
+    payload = service.get_ready_payload()
+    return web.json_response(payload, status=200 if payload['ready'] else 503)
+
+
+async def detection_status(request: 'web.Request'):
+    """Статус детекции"""
+    service = _service(request)
+    if service is None:
+        return web.json_response({'status': 'error', 'error': 'Service not initialized'}, status=503)
+    # Waits for the model lock, which a model switch holds for the whole load
+    return web.json_response(await asyncio.get_running_loop().run_in_executor(None, service.get_status_payload))
+
+
+async def metrics(request: 'web.Request'):
+    """Метрики в формате Prometheus"""
+    service = _service(request)
+    if service is None:
+        return web.Response(status=503, content_type='text/plain')
+    response = web.Response(text=service.render_metrics())
+    response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    return response
+
+
+def _debug_authorized(request: 'web.Request') -> bool:
+    service = _service(request)
+    return debug_token_valid(service.config.debug_token if service is not None else None, request.headers)
+
+
+async def debug_stacks(request: 'web.Request'):
+    """Стеки всех потоков (детекция, захват, стримы)"""
+    service = _service(request)
+    if service is None:
+        return _not_initialized()
+    if not _debug_authorized(request):
+        return web.json_response({'error': 'Not found'}, status=404)
+    if request.query.get('format') == 'text':
+        return web.Response(text=service.thread_stacks(text=True), content_type='text/plain')
+    return web.json_response(service.thread_stacks())
+
+
+async def debug_profile(request: 'web.Request'):
+    """Профилирование на N секунд: ?seconds=10&mode=sample|cprofile&interval=0.005&thread=detection"""
+    service = _service(request)
+    if service is None:
+        return _not_initialized()
+    if not _debug_authorized(request):
+        return web.json_response({'error': 'Not found'}, status=404)
+    try:
+        seconds = float(request.query.get('seconds', 5))
+        interval = float(request.query.get('interval', 0.005))
+    except ValueError:
+        return web.json_response({'error': 'seconds and interval must be numbers'}, status=400)
+    mode = request.query.get('mode', 'sample')
+
+    loop = asyncio.get_running_loop()
+    try:
+        result = await loop.run_in_executor(
+            None, partial(service.profile, seconds, mode, interval, request.query.get('thread') or None)
+        )
+    except ProfilerBusyError as exc:
+        return web.json_response({'error': str(exc)}, status=409)
+    except ValueError as exc:
+        return web.json_response({'error': str(exc)}, status=400)
+    except RuntimeError as exc:
+        return web.json_response({'error': str(exc)}, status=503)
+    return web.Response(text=result, content_type='text/plain')
+
+
+async def list_trackers(request: 'web.Request'):
+    """Список активных трекеров"""
+    service = _service(request)
+    if service is None:
+        return _not_initialized({'trackers': []})
+    return web.json_response(await asyncio.get_running_loop().run_in_executor(None, service.list_trackers))
+
+
+async def _json_body(request: 'web.Request'):
+    try:
+        return await request.json()
+    except Exception:
+        return None
+
+
+async def update_target(request: 'web.Request'):
+    service = _service(request)
+    if service is None:
+        return _not_initialized()
+
+    data = await _json_body(request)
+    track_id = data.get('trackId') if isinstance(data, dict) else None
+    if track_id is not None and not isinstance(track_id, int):
+        try:
+            track_id = int(track_id)
+        except (TypeError, ValueError):
+            return web.json_response({'error': 'trackId must be integer'}, status=400)
+
+    try:
+        return web.json_response(service.set_target_track(track_id))
+    except Exception as exc:  # pragma: no cover
+        logger.error("Не удалось обновить таргет: %s", exc, exc_info=True)
+        return web.json_response({'error': str(exc)}, status=500)
+
+
+async def tracker_crop(request: 'web.Request'):
+    """Кропнутый кадр для трекера"""
+    service = _service(request)
+    if service is None:
+        return _not_initialized()
+    track_id = int(request.match_info['track_id'])
+    crop = await asyncio.get_running_loop().run_in_executor(None, service.get_tracker_crop, track_id)
+    if crop is None:
+        return web.json_response({'error': 'Tracker not found or frame unavailable'}, status=404)
+    return web.Response(body=crop, content_type='image/jpeg')
+
+
+async def tracker_frames(request: 'web.Request'):
+    """Последовательность кадров для трекера"""
+    service = _service(request)
+    if service is None:
+        return _not_initialized()
+    track_id = int(request.match_info['track_id'])
+    payload = await asyncio.get_running_loop().run_in_executor(None, service.get_tracker_frames_payload, track_id)
+    return web.json_response(payload)
+
+
+async def history(request: 'web.Request'):
+    """История завершённых треков (?since=&until=&label=&track_id=&camera=&limit=&cursor=)"""
+    service = _service(request)
+    if service is None:
+        return _not_initialized()
+    try:
+        payload = await asyncio.get_running_loop().run_in_executor(None, service.query_history, dict(request.query))
+    except ValueError as exc:
+        return web.json_response({'error': f'Invalid query: {exc}'}, status=400)
+    if payload is None:
+        return web.json_response({'error': 'History is disabled (HISTORY_DB)'}, status=404)
+    return web.json_response(payload)
+
+
+async def history_crop(request: 'web.Request'):
+    """Сохранённый кроп завершённого трека"""
+    service = _service(request)
+    if service is None:
+        return _not_initialized()
+    record_id = int(request.match_info['record_id'])
+    crop = await asyncio.get_running_loop().run_in_executor(None, service.get_history_crop, record_id)
+    if crop is None:
+        return web.json_response({'error': 'Crop not found'}, status=404)
+    return web.Response(body=crop, content_type='image/jpeg')
+
+
+async def trajectories(request: 'web.Request'):
+    """Траектории треков (?track_id=1,2&camera=&points=&limit=)"""
+    service = _service(request)
+    if service is None:
+        return _not_initialized()
+    try:
+        payload = await asyncio.get_running_loop().run_in_executor(
+            None, service.query_trajectories, dict(request.query)
+        )
+    except ValueError as exc:
+        return web.json_response({'error': f'Invalid query: {exc}'}, status=400)
+    if payload is None:
+        return web.json_response({'error': 'Trajectories are disabled (TRAJECTORY_POINTS=0)'}, status=404)
+    return web.json_response(payload)
+
+
+async def heatmap(request: 'web.Request'):
+    """Тепловая карта детекций (?camera=&label=&format=png|json&width=)"""
+    service = _service(request)
+    if service is None:
+        return _not_initialized()
+    try:
+        rendered = await asyncio.get_running_loop().run_in_executor(None, service.render_heatmap, dict(request.query))
+    except ValueError as exc:
+        return web.json_response({'error': f'Invalid query: {exc}'}, status=400)
+    if rendered is None:
+        return web.json_response({'error': 'Heatmap is disabled or has no data yet'}, status=404)
+    if isinstance(rendered, dict):
+        return web.json_response(rendered)
+    return web.Response(body=rendered, content_type='image/png')
+
+
+async def list_models(request: 'web.Request'):
+    """Список доступных моделей"""
+    service = _service(request)
+    if service is None:
+        return _not_initialized({'available_models': [], 'active_model': None})
+    return web.json_response(service.list_models_payload())
+
+
+async def switch_model(request: 'web.Request'):
+    """Переключение модели"""
+    service = _service(request)
+    if service is None:
+        return _not_initialized()
+
+    data = await _json_body(request)
+    if not data or 'name' not in data:
+        return web.json_response({'error': 'Model name is required in "name" field'}, status=400)
+
+    try:
+        result = await asyncio.get_running_loop().run_in_executor(None, service.switch_model, data['name'])
+        return web.json_response(result)
+    except RuntimeError as e:
+        return web.json_response({'error': str(e)}, status=503)
+    except FileNotFoundError as e:
+        return web.json_response({'error': str(e)}, status=404)
+    except Exception as e:
+        logger.error("Ошибка переключения модели: %s", e, exc_info=True)
+        return web.json_response({'error': str(e)}, status=500)
+
+
+async def autotune_models(request: 'web.Request'):
+    """Подбор размера входа модели под бюджет задержки (замер заново)"""
+    service = _service(request)
+    if service is None:
+        return _not_initialized()
+
+    try:
+        result = await asyncio.get_running_loop().run_in_executor(None, service.autotune_input_size)
+        return web.json_response(result)
+    except RuntimeError as e:
+        return web.json_response({'error': str(e)}, status=503)
+
+
+async def index(request: 'web.Request'):
+    """Главная страница с видео потоком"""
+    return web.Response(content_type='text/html', text='''
+                    <html>
+                        <head>
+                            <title>Video Stream</title>
+                        </head>
+                        <body>
+                            <h1>Video Stream</h1>
+                            <p><a href="/video_feed_raw">Raw stream</a></p>
+                            <img src="/video_feed_raw" width="1280" height="720">
+                        </body>
+                    </html>
+    ''')
+
+
+# Application -----------------------------------------------------------------------------
+
+
+def create_async_app(service: Optional[DetectionService]) -> 'web.Application':
+    """Builds the aiohttp application around an already started ``service``."""
+    if not AIOHTTP_AVAILABLE:
+        raise ImportError("aiohttp не установлен. Установите: pip install aiohttp")
+
+    app = web.Application(middlewares=[web.middleware(cors_middleware)])
+    app[SERVICE_KEY] = service
+
+    async def on_startup(app):
+        if service is not None:
+            broadcaster = FrameBroadcaster(service, asyncio.get_running_loop())
+            broadcaster.start()
+            app[BROADCASTER_KEY] = broadcaster
+
+    async def on_cleanup(app):
+        broadcaster = app.get(BROADCASTER_KEY)
+        if broadcaster is not None:
+            broadcaster.stop()
+
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+
+    router = app.router
+    router.add_get('/health', health)
+    router.add_get('/ready', ready)
+    router.add_get('/video_feed_raw', video_feed_raw)
+    router.add_get('/stream.mjpeg', video_feed_raw)
+    router.add_get('/cameras', list_cameras)
+    router.add_get('/cameras/{camera_id}/stream.mjpeg', camera_stream)
+    router.add_get('/cameras/{camera_id}/detections.mjpeg', camera_detections_stream)
+    router.add_get('/cameras/{camera_id}/trackers', camera_trackers)
+    router.add_get('/api/detection', detection_status)
+    router.add_get('/metrics', metrics)
+    router.add_get('/debug/stacks', debug_stacks)
+    router.add_get('/debug/profile', debug_profile)
+    router.add_get('/api/trackers/stream', trackers_stream)
+    router.add_get('/api/trackers', list_trackers)
+    router.add_post('/api/trackers/target', update_target)
+    router.add_get(r'/api/trackers/{track_id:\d+}/crop', tracker_crop)
+    router.add_get(r'/api/trackers/{track_id:\d+}/frames', tracker_frames)
+    router.add_get('/api/history', history)
+    router.add_get(r'/api/history/{record_id:\d+}/crop', history_crop)
+    router.add_get('/api/trajectories', trajectories)
+    router.add_get('/api/heatmap', heatmap)
+    router.add_get('/models', list_models)
+    router.add_post('/models', switch_model)
+    router.add_post('/models/autotune', autotune_models)
+    router.add_get('/', index)
+    return app
+
+
+def run_async_server(config: RuntimeConfig) -> None:
+    """Starts the service and serves it with aiohttp until SIGINT/SIGTERM."""
+    service = DetectionService(config)
+    service.start()
+    logger.info("Detection service started (async server)")
+    app = create_async_app(service)
+    try:
+        logger.info("🌐 Сервер (aiohttp) запущен на http://0.0.0.0:%d", config.port)
+        # Open streams never finish on their own, so do not wait long for them on shutdown
+        web.run_app(app, host='0.0.0.0', port=config.port, print=None, shutdown_timeout=2.0)
+    finally:
+        service.stop()
+        logger.info("Сервис остановлен")
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    run_async_server(RuntimeConfig.from_env())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,248 @@
+"""Concurrent webcam probing and the camera discovery cache.
+
+Opening a V4L2/DirectShow device and waiting for its first frames dominates
+camera start-up, so every index is probed in its own thread under one global
+deadline. The camera that worked last time is stored in a small JSON file and
+tried alone first on the next start.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    import cv2
+    CV2_AVAILABLE = True
+except ImportError:  # pragma: no cover - OpenCV might be unavailable on CI
+    cv2 = None  # type: ignore[assignment]
+    CV2_AVAILABLE = False
+
+DEFAULT_CACHE_PATH = Path.home() / ".cache" / "dc-detector" / "camera.json"
+CACHE_DISABLED_VALUES = ("off", "none", "false", "0")
+# Frames that must decode before a device counts as working
+REQUIRED_FRAMES = 2
+
+
+@dataclass
+class ProbeResult:
+    """Outcome of opening one camera (webcam index + OpenCV API, or Picamera2)."""
+
+    backend: str
+    index: Optional[int] = None
+    api: Optional[int] = None
+    ok: bool = False
+    width: Optional[int] = None
+    height: Optional[int] = None
+    seconds: float = 0.0
+    error: Optional[str] = None
+    cached: bool = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def resolve_cache_path(value: Optional[str]) -> Optional[Path]:
+    """``CAMERA_CACHE_FILE``: unset → default path, ``off`` → no cache."""
+    if value is None or value.strip() == "":
+        return DEFAULT_CACHE_PATH
+    if value.strip().lower() in CACHE_DISABLED_VALUES:
+        return None
+    return Path(value).expanduser()
+
+
+def cache_key(backends: Sequence[str], indices: Sequence[int]) -> str:
+    """Entries are keyed by what was searched, so several cameras can share one file."""
+    return f"{','.join(backends)}|{','.join(str(i) for i in indices)}"
+
+
+def load_cached_camera(path: Optional[Path], key: str) -> Optional[Dict[str, Any]]:
+    if path is None:
+        return None
+    try:
+        with path.open("r", encoding="utf-8") as fh:
+            entry = json.load(fh).get(key)
+    except (OSError, ValueError, AttributeError):
+        return None
+    return entry if isinstance(entry, dict) and entry.get("backend") else None
+
+
+def save_cached_camera(path: Optional[Path], key: str, result: ProbeResult) -> None:
+    if path is None:
+        return
+    try:
+        try:
+            with path.open("r", encoding="utf-8") as fh:
+                data = json.load(fh)
+            if not isinstance(data, dict):
+                data = {}
+        except (OSError, ValueError):
+            data = {}
+        data[key] = {
+            "backend": result.backend,
+            "index": result.index,
+            "api": result.api,
+            "width": result.width,
+            "height": result.height,
+            "saved_at": time.time(),
+        }
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + ".tmp")
+        with tmp_path.open("w", encoding="utf-8") as fh:
+            json.dump(data, fh, indent=2)
+        os.replace(tmp_path, path)
+    except OSError as exc:
+        logger.debug("Не удалось сохранить кэш камеры %s: %s", path, exc)
+
+
+def default_webcam_apis() -> List[int]:
+    if not CV2_AVAILABLE:
+        return []
+    import sys
+
+    if sys.platform == "win32":
+        return [cv2.CAP_DSHOW, cv2.CAP_MSMF, cv2.CAP_ANY]
+    return [cv2.CAP_ANY]
+
+
+def probe_webcam(
+    index: int,
+    api: int,
+    size: Optional[Tuple[int, int]] = (1280, 720),
+    deadline: Optional[float] = None,
+) -> Tuple[ProbeResult, Any]:
+    """Opens one device and waits until ``REQUIRED_FRAMES`` frames decode.
+
+    Returns the result and the open ``VideoCapture`` (None unless ``ok``).
+    """
+    started = time.monotonic()
+    result = ProbeResult(backend="webcam", index=index, api=api)
+    capture = None
+    try:
+        capture = cv2.VideoCapture(index, api)
+        if not capture.isOpened():
+            result.error = "not opened"
+            return result, None
+        if size is not None:
+            capture.set(cv2.CAP_PROP_FRAME_WIDTH, size[0])
+            capture.set(cv2.CAP_PROP_FRAME_HEIGHT, size[1])
+        capture.set(cv2.CAP_PROP_FPS, 30)
+
+        good = 0
+        # Poll instead of a fixed settle delay: most cameras deliver within ~100 ms
+        while good < REQUIRED_FRAMES:
+            ret, frame = capture.read()
+            if ret and frame is not None and frame.size > 0 and len(frame.shape) >= 2:
+                good += 1
+                result.height, result.width = int(frame.shape[0]), int(frame.shape[1])
+                continue
+            if deadline is not None and time.monotonic() >= deadline:
+                result.error = "no frames before timeout"
+                break
+            time.sleep(0.05)
+        result.ok = good >= REQUIRED_FRAMES
+        if result.ok:
+            return result, capture
+    except Exception as exc:
+        result.error = str(exc)
+    finally:
+        result.seconds = round(time.monotonic() - started, 3)
+        if not result.ok and capture is not None:
+            try:
+                capture.release()
+            except Exception:
+                pass
+    return result, None
+
+
+def _probe_index(index: int, apis: Sequence[int], size, deadline: float) -> List[Tuple[ProbeResult, Any]]:
+    # APIs of one index are tried in order: opening the same device twice at once fails on Windows
+    outcomes = []
+    for api in apis:
+        if time.monotonic() >= deadline:
+            break
+        result, capture = probe_webcam(index, api, size, deadline)
+        outcomes.append((result, capture))
+        if result.ok:
+            break
+    return outcomes
+
+
+def discover_webcam(
+    indices: Sequence[int],
+    apis: Optional[Sequence[int]] = None,
+    timeout: float = 5.0,
+    size: Optional[Tuple[int, int]] = (1280, 720),
+) -> Tuple[Any, Optional[ProbeResult], List[ProbeResult]]:
+    """Probes all ``indices`` concurrently; returns ``(capture, chosen, all_results)``.
+
+    The lowest working index wins (same preference as sequential probing), but
+    the search ends as soon as every lower index has failed. Devices still
+    opening after ``timeout`` are released in the background.
+    """
+    if not CV2_AVAILABLE or not indices:
+        return None, None, []
+    apis = list(apis) if apis is not None else default_webcam_apis()
+    deadline = time.monotonic() + timeout
+    order = {index: position for position, index in enumerate(indices)}
+    results: List[ProbeResult] = []
+    working: Dict[int, Tuple[ProbeResult, Any]] = {}
+    finished: set = set()
+
+    def _release_late(future) -> None:
+        # A probe that outlived the search must not keep the device open
+        try:
+            for result, capture in future.result():
+                if capture is not None:
+                    capture.release()
+        except Exception:
+            pass
+
+    executor = ThreadPoolExecutor(max_workers=len(indices), thread_name_prefix="camera-probe")
+    futures = {executor.submit(_probe_index, index, apis, size, deadline): index for index in indices}
+    pending = set(futures)
+    best: Optional[int] = None
+    try:
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = futures[future]
+                finished.add(index)
+                for result, capture in future.result():
+                    results.append(result)
+                    if capture is not None:
+                        working[index] = (result, capture)
+            if working:
+                best = min(working, key=order.__getitem__)
+                if all(i in finished for i in indices if order[i] < order[best]):
+                    break
+    finally:
+        for future in pending:
+            future.add_done_callback(_release_late)
+        executor.shutdown(wait=False)
+
+    if best is None and working:
+        best = min(working, key=order.__getitem__)
+    for index, (_, capture) in working.items():
+        if index != best:
+            capture.release()
+    timed_out = time.monotonic() >= deadline
+    for index in indices:
+        if index not in finished:
+            # Still probing: either past the deadline or no longer needed
+            results.append(ProbeResult(backend="webcam", index=index, error="timeout" if timed_out else "skipped"))
+    results.sort(key=lambda r: (order.get(r.index, len(order)), r.api or 0))
+    if best is None:
+        return None, None, results
+    result, capture = working[best]
+    return capture, result, results
@@ -0,0 +1,131 @@
+"""Immutable frames and the buffer pool they are captured into.
+
+A captured frame is shared by reference between the capture thread, the
+detection loop, MJPEG streams and crop endpoints. It is exposed as a read-only
+ndarray, so a consumer that needs to draw on it has to copy explicitly, and
+nothing has to defensively copy it under a lock.
+
+Buffers are recycled by reference count: numpy views keep their base array
+alive, so a pooled buffer whose only reference is the pool itself is no longer
+used by any frame, view or crop and can be filled again.
+"""
+from __future__ import annotations
+
+import sys
+import threading
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_POOL_CAPACITY = 6
+
+
+def _free_refcount() -> int:
+    # References seen by sys.getrefcount for an array held only by a list; differs
+    # between interpreter versions, so it is measured instead of hard-coded
+    holder = [np.empty(1, dtype=np.uint8)]
+    return sys.getrefcount(holder[0])
+
+
+_FREE_REFCOUNT = _free_refcount()
+
+
+def _read_only(array: np.ndarray) -> np.ndarray:
+    view = array.view()
+    view.flags.writeable = False
+    return view
+
+
+@dataclass(frozen=True)
+class Frame:
+    """One captured image plus its sequence number, capture time and colour order.
+
+    ``inference`` optionally holds a smaller image of the same instant (the
+    Picamera2 lores stream) that the model runs on instead of ``data``.
+    """
+
+    data: np.ndarray
+    seq: int
+    timestamp: float
+    color: str = "bgr"
+    inference: Optional[np.ndarray] = None
+
+    @classmethod
+    def wrap(
+        cls,
+        array: np.ndarray,
+        seq: int,
+        timestamp: float,
+        color: str = "bgr",
+        inference: Optional[np.ndarray] = None,
+    ) -> "Frame":
+        """Wraps ``array`` without copying; the frame sees it through a read-only view."""
+        return cls(_read_only(array), seq, timestamp, color, _read_only(inference) if inference is not None else None)
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        return self.data.shape
+
+    @property
+    def inference_data(self) -> np.ndarray:
+        return self.inference if self.inference is not None else self.data
+
+    @property
+    def inference_scale(self) -> Tuple[float, float]:
+        """Factors mapping ``inference_data`` pixel coordinates onto ``data``."""
+        if self.inference is None:
+            return 1.0, 1.0
+        return self.data.shape[1] / self.inference.shape[1], self.data.shape[0] / self.inference.shape[0]
+
+    def writable_copy(self) -> np.ndarray:
+        return self.data.copy()
+
+
+class FramePool:
+    """Fixed set of equally sized buffers reused once nothing references them.
+
+    ``acquire`` never blocks: when every buffer is in use it allocates an
+    unpooled one, which shows up in ``allocations``.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_POOL_CAPACITY):
+        self.capacity = capacity
+        self._buffers: List[np.ndarray] = []
+        self._spec: Optional[Tuple[Tuple[int, ...], np.dtype]] = None
+        self._lock = threading.Lock()
+        self.allocations = 0
+        self.reuses = 0
+
+    def acquire(self, shape: Tuple[int, ...], dtype=np.uint8) -> np.ndarray:
+        """A writable buffer of ``shape``; recycled if one is free."""
+        spec = (tuple(shape), np.dtype(dtype))
+        with self._lock:
+            if spec != self._spec:
+                # Resolution changed (e.g. after a reconnect): old buffers die with their frames
+                self._buffers = []
+                self._spec = spec
+            for index in range(len(self._buffers)):
+                if sys.getrefcount(self._buffers[index]) <= _FREE_REFCOUNT:
+                    self.reuses += 1
+                    return self._buffers[index]
+            buffer = np.empty(spec[0], dtype=spec[1])
+            self.allocations += 1
+            if len(self._buffers) < self.capacity:
+                self._buffers.append(buffer)
+            return buffer
+
+    def in_use(self) -> int:
+        with self._lock:
+            return sum(
+                1 for index in range(len(self._buffers))
+                if sys.getrefcount(self._buffers[index]) > _FREE_REFCOUNT
+            )
+
+    def stats(self) -> dict:
+        return {
+            "buffers": len(self._buffers),
+            "in_use": self.in_use(),
+            "allocations": self.allocations,
+            "reuses": self.reuses,
+        }
@@ -5,10 +5,22 @@ import logging
 import sys
 import time
 import warnings
-from io import BytesIO
-from typing import Optional
+from typing import Any, Dict, List, Optional, Sequence
 
 from ..config.runtime import RuntimeConfig
+from ..streaming.jpeg import encode_jpeg
+from .discovery import (
+    ProbeResult,
+    cache_key,
+    default_webcam_apis,
+    discover_webcam,
+    load_cached_camera,
+    probe_webcam,
+    resolve_cache_path,
+    save_cached_camera,
+)
+from .frames import FramePool
+from .sources import FrameSource, open_source
 
 logger = logging.getLogger(__name__)
 
@@ -27,6 +39,11 @@ except ImportError:  # pragma: no cover - OpenCV might be unavailable on CI
     CV2_AVAILABLE = False
 
 
+# Lores formats in order of preference: RGB888 is BGR in memory (what the model takes);
+# the Pi 4 and older ISP only produce YUV420 on the lores stream
+LORES_FORMATS = ("RGB888", "YUV420")
+
+
 class CameraInitializationError(RuntimeError):
     """Raised when no camera backend can be initialized."""
 
@@ -34,71 +51,107 @@ class CameraInitializationError(RuntimeError):
 class CameraManager:
     """Encapsulates camera discovery, capture and resource management."""
 
-    def __init__(self, config: RuntimeConfig):
+    def __init__(self, config: RuntimeConfig, backends: Optional[Sequence[str]] = None):
         self.config = config
-        self.camera_type: Optional[str] = None  # 'picamera2' or 'webcam'
+        # Hardware backends to try, in order; a configured CAMERA_SOURCE takes precedence.
+        self.backends = tuple(backends) if backends is not None else ("picamera2", "webcam")
+        self.camera_type: Optional[str] = None  # 'picamera2', 'webcam' or a FrameSource kind
         self.picam2: Optional[Picamera2] = None
         self.webcam = None
+        self.source: Optional[FrameSource] = None
+        # Hardware frames are written into recycled buffers instead of fresh arrays
+        self.frame_pool = FramePool()
+        self._webcam_shape = None
+        # Picamera2 dual stream: lores format actually configured and the newest lores frame
+        self.lores_format: Optional[str] = None
+        self.last_lores = None
+        self._lores_pool = FramePool(capacity=4)
+        # Discovery report for status: duration, cache hit and every probe
+        self.probe: Dict[str, Any] = {"seconds": None, "from_cache": False, "results": []}
+        self._probe_results: List[ProbeResult] = []
 
     def start(self) -> None:
         """Initialize available camera backend."""
-        if self._try_init_picamera():
-            self.camera_type = "picamera2"
+        if self.config.camera_source:
+            # An explicit replay source never falls back to hardware discovery.
+            self._init_source()
             return
 
-        if self._try_init_webcam():
-            self.camera_type = "webcam"
-            return
+        started = time.monotonic()
+        self._probe_results = []
+        try:
+            if self._try_cached_camera():
+                self.probe["from_cache"] = True
+                return
+
+            if "picamera2" in self.backends and self._try_init_picamera():
+                self.camera_type = "picamera2"
+                self._remember_camera()
+                return
+
+            if "webcam" in self.backends and self._try_init_webcam():
+                self.camera_type = "webcam"
+                self._remember_camera()
+                return
+        finally:
+            self.probe["seconds"] = round(time.monotonic() - started, 3)
+            self.probe["results"] = [result.to_dict() for result in self._probe_results]
+            logger.info("Поиск камеры занял %.2f с (кэш: %s)", self.probe["seconds"], self.probe["from_cache"])
 
         raise CameraInitializationError("Не удалось инициализировать ни один источник камеры")
 
     def capture_raw(self):
-        """Capture raw frame as numpy array in BGR format."""
-        if self.camera_type == "picamera2" and self.picam2 is not None and CV2_AVAILABLE:
-            array = self.picam2.capture_array()
-            if array is None:
-                return None
-            if len(array.shape) == 3:
-                return cv2.cvtColor(array, cv2.COLOR_RGB2BGR)
-            return array
+        """Capture raw frame as numpy array in BGR format.
+
+        Hardware frames land in a buffer from ``frame_pool``; callers must treat
+        the array as read-only once they hand it on.
+        """
+        if self.source is not None:
+            return self.source.read()
+
+        if self.camera_type == "picamera2" and self.picam2 is not None:
+            return self._capture_picamera()
 
         if self.camera_type == "webcam" and self.webcam is not None and CV2_AVAILABLE:
-            ret, frame = self.webcam.read()
+            if self._webcam_shape is not None:
+                ret, frame = self.webcam.read(self.frame_pool.acquire(self._webcam_shape))
+            else:
+                ret, frame = self.webcam.read()
             if ret and frame is not None:
+                # OpenCV decodes into the given buffer when the size matches, otherwise allocates
+                self._webcam_shape = frame.shape
                 return frame
         return None
 
+    @property
+    def dual_stream(self) -> bool:
+        """True when ``capture_raw`` also yields a lores inference frame in ``last_lores``."""
+        return self.camera_type == "picamera2" and self.lores_format is not None
+
     def capture_jpeg(self) -> Optional[bytes]:
         """Capture frame as JPEG bytes."""
-        # Для PiCamera2 используем capture_file() напрямую (как в рабочем скрипте)
-        if self.camera_type == "picamera2" and self.picam2 is not None:
-            try:
-                buffer = BytesIO()
-                self.picam2.capture_file(buffer, format="jpeg")
-                if buffer.getbuffer().nbytes > 0:
-                    return buffer.getvalue()
-            except Exception as exc:
-                logger.debug("Ошибка захвата JPEG с PiCamera2: %s", exc)
-            return None
-        
-        # Для веб-камеры используем OpenCV
+        # Picamera2 is encoded from the main stream like a webcam frame, no capture_file request
         if not CV2_AVAILABLE:
             return None
         frame = self.capture_raw()
         if frame is None:
             return None
-        success, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.config.jpeg_quality])
-        if not success:
-            return None
-        return buffer.tobytes()
+        return encode_jpeg(frame, quality=self.config.jpeg_quality)
 
     def shutdown(self) -> None:
         """Release camera resources."""
+        if self.source is not None:
+            try:
+                self.source.release()
+            finally:
+                self.source = None
         if self.picam2 is not None:
             try:
                 self.picam2.stop()
+                self.picam2.close()
             finally:
                 self.picam2 = None
+                self.last_lores = None
         if self.webcam is not None:
             try:
                 self.webcam.release()
@@ -107,6 +160,108 @@ class CameraManager:
 
     # Internal helpers -----------------------------------------------------------------
 
+    def _init_source(self) -> None:
+        spec = self.config.camera_source or ""
+        try:
+            self.source = open_source(
+                spec,
+                pace=self.config.camera_source_pace,
+                fps=self.config.camera_source_fps,
+                loop=self.config.camera_source_loop,
+            )
+        except (ValueError, OSError, RuntimeError) as exc:
+            raise CameraInitializationError(f"Не удалось открыть источник кадров {spec!r}: {exc}") from exc
+        self.camera_type = self.source.kind
+        logger.info(
+            "Источник кадров %s (%s, pace=%s, fps=%.1f, loop=%s)",
+            spec, self.source.kind, self.source.pace, self.source.native_fps, self.source.loop,
+        )
+
+    def _cache_location(self):
+        indices = self.config.camera_indices or list(range(5))
+        return resolve_cache_path(self.config.camera_cache_file), cache_key(self.backends, indices)
+
+    def _try_cached_camera(self) -> bool:
+        """Tries the camera that worked last time, alone, before any discovery."""
+        path, key = self._cache_location()
+        entry = load_cached_camera(path, key)
+        if entry is None or entry.get("backend") not in self.backends:
+            return False
+        logger.info("Камера из кэша: %s", entry)
+        if entry["backend"] == "picamera2":
+            if self._try_init_picamera():
+                self._probe_results[-1].cached = True
+                self.camera_type = "picamera2"
+                return True
+            return False
+        if entry["backend"] == "webcam" and CV2_AVAILABLE and entry.get("index") is not None:
+            size = (entry["width"], entry["height"]) if entry.get("width") and entry.get("height") else (1280, 720)
+            api = entry.get("api") if entry.get("api") is not None else cv2.CAP_ANY
+            deadline = time.monotonic() + self.config.camera_probe_timeout
+            result, capture = probe_webcam(int(entry["index"]), int(api), size, deadline)
+            result.cached = True
+            self._probe_results.append(result)
+            if capture is not None:
+                self.webcam = capture
+                self.camera_type = "webcam"
+                logger.info("Веб-камера %d из кэша открыта за %.2f с", result.index, result.seconds)
+                return True
+        logger.info("Камера из кэша недоступна, выполняется полный поиск")
+        return False
+
+    def _remember_camera(self) -> None:
+        chosen = next((result for result in reversed(self._probe_results) if result.ok), None)
+        if chosen is not None:
+            path, key = self._cache_location()
+            save_cached_camera(path, key, chosen)
+
+    def _configure_picamera(self) -> None:
+        """Main stream for viewers plus, if enabled, a lores stream at model input size.
+
+        "RGB888" is BGR in memory, so neither stream needs a colour conversion
+        unless the ISP only offers YUV420 on lores.
+        """
+        main = {"size": tuple(self.config.picamera_main_size), "format": "RGB888"}
+        lores_size = self.config.picamera_lores_size
+        self.lores_format = None
+        if lores_size:
+            for fmt in LORES_FORMATS:
+                try:
+                    config = self.picam2.create_preview_configuration(
+                        main=main, lores={"size": tuple(lores_size), "format": fmt}
+                    )
+                    self.picam2.configure(config)
+                except Exception as exc:
+                    logger.debug("Picamera2: lores %s недоступен: %s", fmt, exc)
+                    continue
+                self.lores_format = fmt
+                logger.info("Picamera2: main %s, lores %s %s", main["size"], tuple(lores_size), fmt)
+                return
+            logger.warning("Picamera2: lores-поток недоступен, инференс на main-потоке")
+        self.picam2.configure(self.picam2.create_preview_configuration(main=main))
+
+    def _capture_picamera(self):
+        if self.lores_format is None:
+            self.last_lores = None
+            return self._to_bgr(self.picam2.capture_array("main"))
+        # Both arrays come from the same request, so they show the same instant
+        (main, lores), _ = self.picam2.capture_arrays(["main", "lores"])
+        if lores is not None and self.lores_format == "YUV420" and CV2_AVAILABLE:
+            height = lores.shape[0] * 2 // 3
+            out = self._lores_pool.acquire((height, lores.shape[1], 3))
+            lores = cv2.cvtColor(lores, cv2.COLOR_YUV2BGR_I420, dst=out)
+        self.last_lores = lores
+        return self._to_bgr(main)
+
+    def _to_bgr(self, array):
+        if array is None:
+            return None
+        if len(array.shape) == 3 and array.shape[2] == 4 and CV2_AVAILABLE:
+            # XBGR8888/XRGB8888 if a platform ignores the RGB888 request
+            out = self.frame_pool.acquire(array.shape[:2] + (3,), array.dtype)
+            return cv2.cvtColor(array, cv2.COLOR_BGRA2BGR, dst=out)
+        return array
+
     def _try_init_picamera(self) -> bool:
         if not PICAMERA2_AVAILABLE:
             # На Linux (Raspberry Pi) это может быть проблемой, на Windows - нормально
@@ -116,21 +271,26 @@ class CameraManager:
                 logger.debug("Picamera2 недоступен (ожидаемо на Windows)")
             return False
 
+        started = time.monotonic()
+        result = ProbeResult(backend="picamera2")
+        self._probe_results.append(result)
         try:
             logger.info("Инициализация Picamera2...")
             self.picam2 = Picamera2()
-            config = self.picam2.create_preview_configuration(main={"size": (1280, 720)})
-            self.picam2.configure(config)
+            self._configure_picamera()
             self.picam2.start()
-            # Небольшая задержка для стабилизации камеры (как в рабочем скрипте обычно не требуется, но для надежности оставляем минимальную)
-            time.sleep(0.5)
-            # Тестовый снимок для проверки работоспособности (как в рабочем скрипте)
-            buffer = BytesIO()
-            self.picam2.capture_file(buffer, format="jpeg")
-            if buffer.getbuffer().nbytes > 0:
+            # The first capture returns as soon as a frame is ready: no fixed settle
+            # delay and no test JPEG encode
+            self.camera_type = "picamera2"
+            array = self._capture_picamera()
+            if array is not None and getattr(array, "size", 0) > 0:
+                result.ok = True
+                result.height, result.width = int(array.shape[0]), int(array.shape[1])
                 logger.info("Picamera2 успешно инициализирован")
                 return True
+            result.error = "empty frame"
         except Exception as exc:
+            result.error = str(exc)
             error_msg = str(exc)
             # Проверяем, является ли ошибка связанной с занятостью камеры
             if "busy" in error_msg.lower() or "in use" in error_msg.lower() or "did not complete" in error_msg.lower():
@@ -140,11 +300,14 @@ class CameraManager:
                 )
             else:
                 logger.warning("Ошибка инициализации Picamera2: %s", exc)
-            if self.picam2 is not None:
-                try:
-                    self.picam2.stop()
-                finally:
-                    self.picam2 = None
+        finally:
+            result.seconds = round(time.monotonic() - started, 3)
+        self.camera_type = None
+        if self.picam2 is not None:
+            try:
+                self.picam2.stop()
+            finally:
+                self.picam2 = None
         return False
 
     def _try_init_webcam(self) -> bool:
@@ -152,83 +315,22 @@ class CameraManager:
             return False
 
         warnings.filterwarnings("ignore")
-        cv2.setLogLevel(0)
+        if hasattr(cv2, "setLogLevel"):  # missing from some opencv-python builds
+            cv2.setLogLevel(0)
 
         indices = self.config.camera_indices or list(range(5))
-        logger.info("Инициализация веб-камеры, проверка индексов: %s", indices)
-        
-        # Список backend'ов для попытки инициализации (Windows)
-        backends = []
-        try:
-            # На Windows пробуем разные backend'ы
-            import sys
-            if sys.platform == 'win32':
-                backends = [
-                    cv2.CAP_DSHOW,  # DirectShow (Windows)
-                    cv2.CAP_MSMF,  # Microsoft Media Foundation
-                    cv2.CAP_ANY,   # Любой доступный
-                ]
-            else:
-                backends = [cv2.CAP_ANY]
-        except:
-            backends = [cv2.CAP_ANY]
-        
-        for idx in indices:
-            for backend in backends:
-                capture = None
-                try:
-                    logger.debug("Проверка камеры %d с backend %s...", idx, backend)
-                    capture = cv2.VideoCapture(idx, backend)
-                    if not capture.isOpened():
-                        if capture is not None:
-                            capture.release()
-                        continue
-                    
-                    # Пробуем установить параметры, но не критично если не получится
-                    try:
-                        capture.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
-                        capture.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
-                    except:
-                        pass
-                    
-                    try:
-                        capture.set(cv2.CAP_PROP_FPS, 30)
-                    except:
-                        pass
-                    
-                    # Даем камере время на инициализацию
-                    time.sleep(0.5)
-                    
-                    # Пробуем прочитать несколько кадров
-                    success_count = 0
-                    for attempt in range(5):
-                        ret, frame = capture.read()
-                        if ret and frame is not None and frame.size > 0:
-                            # Проверяем, что кадр валидный
-                            if len(frame.shape) >= 2 and frame.shape[0] > 0 and frame.shape[1] > 0:
-                                success_count += 1
-                                if success_count >= 2:  # Нужно минимум 2 успешных кадра
-                                    self.webcam = capture
-                                    logger.info("Веб-камера %d успешно инициализирована с backend %s (разрешение: %dx%d)", 
-                                               idx, backend, frame.shape[1], frame.shape[0])
-                                    return True
-                        time.sleep(0.2)
-                    
-                    # Если не получилось, освобождаем ресурсы
-                    if capture is not None:
-                        capture.release()
-                        capture = None
-                        
-                except Exception as exc:
-                    logger.debug("Ошибка при проверке камеры %d с backend %s: %s", idx, backend, exc)
-                    if capture is not None:
-                        try:
-                            capture.release()
-                        except:
-                            pass
-                    continue
-                    
+        logger.info("Инициализация веб-камеры, параллельная проверка индексов: %s", indices)
+        capture, chosen, results = discover_webcam(
+            indices, default_webcam_apis(), timeout=self.config.camera_probe_timeout
+        )
+        self._probe_results.extend(results)
+        if capture is not None and chosen is not None:
+            self.webcam = capture
+            logger.info(
+                "Веб-камера %d успешно инициализирована с backend %s (разрешение: %dx%d) за %.2f с",
+                chosen.index, chosen.api, chosen.width, chosen.height, chosen.seconds,
+            )
+            return True
+
         logger.warning("Не удалось инициализировать ни одну веб-камеру из индексов: %s", indices)
         return False
-
-
@@ -0,0 +1,238 @@
+"""File-backed and synthetic frame sources.
+
+These stand in for a physical camera so the whole service (capture, detection
+loop, streams) can be replayed deterministically and benchmarked on machines
+without camera hardware. A source is selected with ``CAMERA_SOURCE``:
+
+* ``file:/path/to/video.mp4`` — video file decoded with OpenCV;
+* ``file:/path/to/frames/`` or ``images:/path/to/frames/`` — sorted image sequence;
+* ``synthetic`` or ``synthetic:1280x720`` — generated moving-box pattern.
+
+Pacing (``CAMERA_SOURCE_PACE``):
+
+* ``realtime`` — native rate of the footage (video FPS, otherwise the configured FPS);
+* ``fixed`` — the configured ``CAMERA_SOURCE_FPS``;
+* ``fast`` — no waiting, a new frame every time a consumer pulls.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+try:
+    import cv2
+    CV2_AVAILABLE = True
+except ImportError:  # pragma: no cover - OpenCV might be unavailable on CI
+    cv2 = None  # type: ignore[assignment]
+    CV2_AVAILABLE = False
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+PACE_MODES = ('realtime', 'fixed', 'fast')
+DEFAULT_SYNTHETIC_SIZE = (1280, 720)
+
+
+class FrameSource:
+    """Base class: paced, optionally looping, thread-safe frame reader."""
+
+    kind = 'source'
+
+    def __init__(self, pace: str = 'realtime', fps: float = 30.0, loop: bool = True):
+        if pace not in PACE_MODES:
+            raise ValueError(f'Unknown pace mode: {pace}')
+        self.pace = pace
+        self.fps = fps
+        self.loop = loop
+        self.position = -1  # index of the last returned frame within the footage
+        self.frames_read = 0
+        self._lock = threading.Lock()
+        self._next_deadline: Optional[float] = None
+
+    @property
+    def native_fps(self) -> float:
+        return self.fps
+
+    @property
+    def frame_interval(self) -> float:
+        if self.pace == 'fast':
+            return 0.0
+        rate = self.native_fps if self.pace == 'realtime' else self.fps
+        return 1.0 / rate if rate and rate > 0 else 0.0
+
+    def read(self) -> Optional[np.ndarray]:
+        """Returns the next frame (BGR) or ``None`` once a non-looping source is exhausted."""
+        with self._lock:
+            self._wait_for_deadline()
+            frame = self._read_next()
+            if frame is None and self.loop and self.frames_read > 0:
+                self._rewind()
+                self.position = -1
+                frame = self._read_next()
+            if frame is None:
+                return None
+            self.position += 1
+            self.frames_read += 1
+            return frame
+
+    def release(self) -> None:
+        """Frees underlying resources."""
+
+    def _wait_for_deadline(self) -> None:
+        interval = self.frame_interval
+        if interval <= 0:
+            return
+        now = time.monotonic()
+        if self._next_deadline is None:
+            self._next_deadline = now
+        delay = self._next_deadline - now
+        if delay > 0:
+            time.sleep(delay)
+            self._next_deadline += interval
+        else:
+            # Consumer fell behind: do not try to catch up with a burst of frames.
+            self._next_deadline = now + interval
+
+    def _read_next(self) -> Optional[np.ndarray]:  # pragma: no cover - abstract
+        raise NotImplementedError
+
+    def _rewind(self) -> None:  # pragma: no cover - abstract
+        raise NotImplementedError
+
+
+class VideoFileSource(FrameSource):
+    """Frames decoded from a video file."""
+
+    kind = 'file'
+
+    def __init__(self, path: Path, **kwargs):
+        super().__init__(**kwargs)
+        if not CV2_AVAILABLE:
+            raise RuntimeError('OpenCV is required for video file sources')
+        self.path = Path(path)
+        self._capture = cv2.VideoCapture(str(self.path))
+        if not self._capture.isOpened():
+            raise FileNotFoundError(f'Не удалось открыть видео: {self.path}')
+        self._native_fps = float(self._capture.get(cv2.CAP_PROP_FPS) or 0.0)
+
+    @property
+    def native_fps(self) -> float:
+        return self._native_fps or self.fps
+
+    def _read_next(self) -> Optional[np.ndarray]:
+        ok, frame = self._capture.read()
+        return frame if ok and frame is not None else None
+
+    def _rewind(self) -> None:
+        if not self._capture.set(cv2.CAP_PROP_POS_FRAMES, 0):
+            self._capture.release()
+            self._capture = cv2.VideoCapture(str(self.path))
+
+    def release(self) -> None:
+        if self._capture is not None:
+            self._capture.release()
+
+
+class ImageSequenceSource(FrameSource):
+    """Frames read from a sorted directory of images."""
+
+    kind = 'images'
+
+    def __init__(self, path: Path, **kwargs):
+        super().__init__(**kwargs)
+        if not CV2_AVAILABLE:
+            raise RuntimeError('OpenCV is required for image sequence sources')
+        self.path = Path(path)
+        self.images: List[Path] = sorted(p for p in self.path.iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS)
+        if not self.images:
+            raise FileNotFoundError(f'В каталоге нет изображений: {self.path}')
+        self._index = 0
+
+    def _read_next(self) -> Optional[np.ndarray]:
+        while self._index < len(self.images):
+            image_path = self.images[self._index]
+            self._index += 1
+            frame = cv2.imread(str(image_path), cv2.IMREAD_COLOR)
+            if frame is not None:
+                return frame
+            logger.warning('Не удалось прочитать изображение %s', image_path)
+        return None
+
+    def _rewind(self) -> None:
+        self._index = 0
+
+
+class SyntheticSource(FrameSource):
+    """Deterministic generated pattern: a gradient with boxes moving across it.
+
+    Frame ``n`` is always the same image, so replays are reproducible.
+    """
+
+    kind = 'synthetic'
+
+    def __init__(self, size: Tuple[int, int] = DEFAULT_SYNTHETIC_SIZE, length: int = 300, **kwargs):
+        super().__init__(**kwargs)
+        width, height = size
+        self.size = (width, height)
+        self.length = max(int(length), 1)
+        gradient = np.linspace(40, 120, width, dtype=np.uint8)
+        self._background = np.empty((height, width, 3), dtype=np.uint8)
+        self._background[:] = gradient[None, :, None]
+        self._index = 0
+
+    def box_for(self, index: int) -> Tuple[int, int, int, int]:
+        """Returns the moving box drawn on frame ``index`` as ``(x1, y1, x2, y2)``."""
+        width, height = self.size
+        box_w, box_h = max(width // 8, 2), max(height // 6, 2)
+        span_x = max(width - box_w, 1)
+        x1 = (index * 7) % span_x
+        y1 = (height - box_h) // 2
+        return x1, y1, x1 + box_w, y1 + box_h
+
+    def _read_next(self) -> Optional[np.ndarray]:
+        if self._index >= self.length:
+            return None
+        frame = self._background.copy()
+        x1, y1, x2, y2 = self.box_for(self._index)
+        frame[y1:y2, x1:x2] = (0, 0, 230)
+        self._index += 1
+        return frame
+
+    def _rewind(self) -> None:
+        self._index = 0
+
+
+def parse_source_spec(spec: str) -> Tuple[str, str]:
+    """Splits ``kind:target`` into its parts, e.g. ``file:/tmp/a.mp4`` -> ``('file', '/tmp/a.mp4')``."""
+    kind, _, target = spec.strip().partition(':')
+    kind = kind.strip().lower()
+    if kind not in ('file', 'images', 'synthetic'):
+        raise ValueError(f'Unknown camera source: {spec}')
+    return kind, target.strip()
+
+
+def _parse_size(value: str) -> Tuple[int, int]:
+    if not value:
+        return DEFAULT_SYNTHETIC_SIZE
+    width, _, height = value.lower().partition('x')
+    return int(width), int(height)
+
+
+def open_source(spec: str, pace: str = 'realtime', fps: float = 30.0, loop: bool = True) -> FrameSource:
+    """Creates a frame source from a ``CAMERA_SOURCE`` specification."""
+    kind, target = parse_source_spec(spec)
+    options = {'pace': pace, 'fps': fps, 'loop': loop}
+    if kind == 'synthetic':
+        return SyntheticSource(size=_parse_size(target), **options)
+
+    path = Path(target).expanduser()
+    if not path.exists():
+        raise FileNotFoundError(f'Источник кадров не найден: {path}')
+    if kind == 'images' or path.is_dir():
+        return ImageSequenceSource(path, **options)
+    return VideoFileSource(path, **options)
@@ -3,7 +3,22 @@ from __future__ import annotations
 
 import os
 from dataclasses import dataclass, field
-from typing import List
+from typing import List, Optional, Tuple
+
+
+# (width, quality, fps); the first entry is the stream served without query parameters
+DEFAULT_STREAM_VARIANTS: Tuple[Tuple[int, int, float], ...] = ((0, 0, 30.0), (640, 70, 15.0), (320, 60, 5.0))
+# (name, infer_fps, imgsz, jpeg_quality) from full quality down; 0 = configured value / model default
+DEFAULT_GOVERNOR_PROFILES: Tuple[Tuple[str, float, int, int], ...] = (
+    ("full", 0, 0, 0),
+    ("warm", 3.0, 480, 75),
+    ("hot", 2.0, 416, 65),
+    ("critical", 1.0, 320, 50),
+)
+# Model input sizes (WxH, multiples of 32, about 16:9) the autotuner chooses from
+DEFAULT_AUTOTUNE_SIZES: Tuple[Tuple[int, int], ...] = (
+    (320, 192), (384, 224), (448, 256), (512, 288), (576, 320), (640, 384),
+)
 
 
 def _parse_camera_indices(value: str | None) -> List[int]:
@@ -20,32 +35,302 @@ def _parse_camera_indices(value: str | None) -> List[int]:
     return indices or list(range(5))
 
 
+def _parse_camera_list(value: str | None) -> List[str]:
+    """Parses ``CAMERAS``: comma-separated webcam indices, ``picamera2`` or source specs."""
+    if not value:
+        return []
+    return [part.strip() for part in value.split(',') if part.strip()]
+
+
+def _parse_size(
+    value: str | None, default: Optional[Tuple[int, int]], square: bool = False
+) -> Optional[Tuple[int, int]]:
+    """Parses ``WxH`` (with ``square`` a bare ``N`` too, as ``NxN``); ``off``/``none``/``0`` disable the stream."""
+    if value is None or value.strip() == "":
+        return default
+    value = value.strip().lower()
+    if value in ("off", "none", "false", "0"):
+        return None
+    try:
+        if square and "x" not in value:
+            width = height = int(value)
+        else:
+            width, height = (int(part) for part in value.split("x", 1))
+    except ValueError:
+        return default
+    return (width, height) if width > 0 and height > 0 else default
+
+
+def _parse_size_list(value: str | None) -> List[Tuple[int, int]]:
+    """Parses ``AUTOTUNE_SIZES``: comma-separated ``WxH`` (or square ``N``) entries."""
+    sizes = [size for size in (_parse_size(part, None, square=True) for part in (value or "").split(',')) if size]
+    return sizes or list(DEFAULT_AUTOTUNE_SIZES)
+
+
+def _parse_stream_variants(value: str | None) -> List[Tuple[int, int, float]]:
+    """Parses ``STREAM_VARIANTS``: ``width:quality:fps`` entries, 0 = native width / ``JPEG_QUALITY``."""
+    if not value:
+        return list(DEFAULT_STREAM_VARIANTS)
+    variants: List[Tuple[int, int, float]] = []
+    for part in value.split(','):
+        fields = [item.strip() for item in part.split(':')]
+        if len(fields) != 3:
+            continue
+        try:
+            variants.append((int(fields[0]), int(fields[1]), float(fields[2])))
+        except ValueError:
+            continue
+    return variants or list(DEFAULT_STREAM_VARIANTS)
+
+
+def _parse_governor_profiles(value: str | None) -> List[Tuple[str, float, int, int]]:
+    """Parses ``GOVERNOR_PROFILES``: ``name:fps:imgsz:quality`` entries, from full quality down."""
+    if not value:
+        return list(DEFAULT_GOVERNOR_PROFILES)
+    profiles: List[Tuple[str, float, int, int]] = []
+    for part in value.split(','):
+        fields = [item.strip() for item in part.split(':')]
+        if len(fields) != 4 or not fields[0]:
+            continue
+        try:
+            profiles.append((fields[0], float(fields[1]), int(fields[2]), int(fields[3])))
+        except ValueError:
+            continue
+    return profiles or list(DEFAULT_GOVERNOR_PROFILES)
+
+
+def _parse_cpu_list(value: str | None) -> Tuple[int, ...]:
+    """Parses a CPU list like ``taskset``/``cpuset``: ``0-1,3``; empty leaves the thread unpinned."""
+    if not value:
+        return ()
+    cpus = set()
+    for part in value.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        start, _, end = part.partition('-')
+        try:
+            first, last = int(start), int(end or start)
+        except ValueError:
+            continue
+        if 0 <= first <= last:
+            cpus.update(range(first, last + 1))
+    return tuple(sorted(cpus))
+
+
+def _parse_labels(value: str | None) -> List[str]:
+    """Parses a comma-separated label list (case-insensitive)."""
+    if not value:
+        return []
+    return [part.strip().lower() for part in value.split(',') if part.strip()]
+
+
+def _parse_bool(value: str | None, default: bool) -> bool:
+    if value is None or value.strip() == "":
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
 @dataclass(slots=True)
 class RuntimeConfig:
     """Container for environment-driven runtime settings."""
 
     port: int = field(default=8001)
+    # "threaded" (Flask/Werkzeug) or "async" (aiohttp, optional dependency)
+    server_mode: str = field(default="threaded")
     confidence_threshold: float = field(default=0.5)
     infer_fps: float = field(default=5.0)
     jpeg_quality: int = field(default=85)
     camera_indices: List[int] = field(default_factory=lambda: list(range(5)))
+    # Camera discovery: global probe deadline and last-working-camera cache ("off" disables)
+    camera_probe_timeout: float = field(default=5.0)
+    camera_cache_file: Optional[str] = field(default=None)
+    # Watchdog: camera stall/read-error limits, reconnect backoff cap, wedged detection thread
+    camera_stall_timeout: float = field(default=5.0)
+    camera_max_failures: int = field(default=20)
+    camera_reconnect_max_backoff: float = field(default=30.0)
+    detection_stall_timeout: float = field(default=30.0)
+    watchdog_interval: float = field(default=1.0)
+    # Picamera2 streams: "main" for viewers, "lores" at model input size for inference (None = single stream)
+    picamera_main_size: Tuple[int, int] = field(default=(1280, 720))
+    picamera_lores_size: Optional[Tuple[int, int]] = field(default=(640, 360))
+    # MJPEG stream variants selected with ?width=&quality=&fps=, dropped after idle seconds
+    stream_variants: List[Tuple[int, int, float]] = field(default_factory=lambda: list(DEFAULT_STREAM_VARIANTS))
+    stream_variant_idle_seconds: float = field(default=10.0)
+    # Multi-camera mode: one pipeline per entry (empty = single auto-discovered camera)
+    cameras: List[str] = field(default_factory=list)
     # Tracker settings
     tracker_iou_threshold: float = field(default=0.3)
     tracker_max_age: int = field(default=5)
     tracker_min_hits: int = field(default=1)
+    # File-backed / synthetic camera source (replaces hardware discovery when set)
+    camera_source: Optional[str] = field(default=None)
+    camera_source_pace: str = field(default="realtime")
+    camera_source_fps: float = field(default=30.0)
+    camera_source_loop: bool = field(default=True)
+    # Event clips: pre-roll ring of encoded frames, written on new tracks / target selection (disabled when unset)
+    clip_dir: Optional[str] = field(default=None)
+    clip_labels: List[str] = field(default_factory=list)
+    clip_on_target: bool = field(default=True)
+    clip_pre_roll_seconds: float = field(default=5.0)
+    clip_post_roll_seconds: float = field(default=10.0)
+    clip_max_seconds: float = field(default=60.0)
+    clip_max_disk_mb: float = field(default=1024.0)
+    clip_buffer_mb: float = field(default=32.0)
+    clip_source: str = field(default="annotated")
+    # Shared-memory frame bus for local consumers: segment name prefix, one segment per camera (disabled when unset)
+    frame_bus: Optional[str] = field(default=None)
+    frame_bus_slots: int = field(default=4)
+    # Track lifecycle events pushed to the backend in batches (disabled when unset)
+    events_url: Optional[str] = field(default=None)
+    events_queue_size: int = field(default=1000)
+    events_batch_size: int = field(default=200)
+    events_flush_interval: float = field(default=0.5)
+    # SQLite history of finalized tracks, with their last crop (disabled when unset)
+    history_db: Optional[str] = field(default=None)
+    history_crops: bool = field(default=True)
+    history_flush_interval: float = field(default=1.0)
+    # In-memory simplified trajectories: points per track (0 disables), tolerance in pixels, finished tracks kept
+    trajectory_points: int = field(default=256)
+    trajectory_tolerance: float = field(default=2.0)
+    trajectory_tracks: int = field(default=1000)
+    # Per-label detection heatmap: grid columns x rows (off disables), decay half-life, optional .npz file
+    heatmap_grid: Optional[Tuple[int, int]] = field(default=(64, 36))
+    heatmap_half_life: float = field(default=6 * 3600.0)
+    heatmap_path: Optional[str] = field(default=None)
+    heatmap_save_interval: float = field(default=60.0)
+    # Thermal/load governor stepping through performance profiles (disabled by default)
+    governor: bool = field(default=False)
+    governor_profiles: List[Tuple[str, float, int, int]] = field(
+        default_factory=lambda: list(DEFAULT_GOVERNOR_PROFILES)
+    )
+    governor_temp_high: float = field(default=75.0)
+    governor_temp_low: float = field(default=65.0)
+    governor_load_high: float = field(default=0.95)
+    governor_load_low: float = field(default=0.7)
+    governor_hold_seconds: float = field(default=30.0)
+    governor_step_seconds: float = field(default=10.0)
+    governor_interval: float = field(default=2.0)
+    governor_temp_path: str = field(default="/sys/class/thermal/thermal_zone0/temp")
+    governor_stat_path: str = field(default="/proc/stat")
+    # Thread pools: 0 (torch) / -1 (OpenCV) keep the library default; OpenCV 0 runs single-threaded
+    torch_threads: int = field(default=0)
+    torch_interop_threads: int = field(default=0)
+    cv2_threads: int = field(default=-1)
+    # CPUs the detection, capture and stream encode threads are pinned to (unpinned when empty)
+    detection_cpus: Tuple[int, ...] = field(default=())
+    capture_cpus: Tuple[int, ...] = field(default=())
+    encode_cpus: Tuple[int, ...] = field(default=())
+    # JPEG encoder: auto (fastest at startup) | turbojpeg | opencv; stream quality is jpeg_quality
+    jpeg_backend: str = field(default="auto")
+    jpeg_subsampling: str = field(default="420")
+    jpeg_fast_dct: bool = field(default=True)
+    jpeg_turbo_per_thread: bool = field(default=True)
+    crop_jpeg_quality: int = field(default=85)
+    crop_jpeg_subsampling: str = field(default="420")
+    # Model input size WxH or N for a square, may be rectangular (unset keeps the model default), and its autotuner:
+    # the largest of autotune_sizes whose latency fits the budget, cached per model and host
+    infer_size: Optional[Tuple[int, int]] = field(default=None)
+    autotune: bool = field(default=False)
+    autotune_budget_ms: float = field(default=200.0)
+    autotune_sizes: List[Tuple[int, int]] = field(default_factory=lambda: list(DEFAULT_AUTOTUNE_SIZES))
+    autotune_runs: int = field(default=5)
+    autotune_cache: Optional[str] = field(default=None)
+    # Raw detection recording for offline tracker tuning (disabled when unset)
+    detection_log_dir: Optional[str] = field(default=None)
+    # Shared secret for /debug/* profiling endpoints (disabled when unset)
+    debug_token: Optional[str] = field(default=None)
 
     @classmethod
     def from_env(cls) -> "RuntimeConfig":
         defaults = cls()
         return cls(
             port=int(os.environ.get("PORT", defaults.port)),
+            server_mode=os.environ.get("SERVER_MODE", defaults.server_mode).strip().lower(),
             confidence_threshold=float(os.environ.get("CONFIDENCE_THRESHOLD", defaults.confidence_threshold)),
             infer_fps=float(os.environ.get("INFER_FPS", defaults.infer_fps)),
             jpeg_quality=int(os.environ.get("JPEG_QUALITY", defaults.jpeg_quality)),
             camera_indices=_parse_camera_indices(os.environ.get("CAMERA_INDEX")),
+            camera_probe_timeout=float(os.environ.get("CAMERA_PROBE_TIMEOUT", defaults.camera_probe_timeout)),
+            camera_cache_file=os.environ.get("CAMERA_CACHE_FILE") or defaults.camera_cache_file,
+            camera_stall_timeout=float(os.environ.get("CAMERA_STALL_TIMEOUT", defaults.camera_stall_timeout)),
+            camera_max_failures=int(os.environ.get("CAMERA_MAX_FAILURES", defaults.camera_max_failures)),
+            camera_reconnect_max_backoff=float(
+                os.environ.get("CAMERA_RECONNECT_MAX_BACKOFF", defaults.camera_reconnect_max_backoff)
+            ),
+            detection_stall_timeout=float(os.environ.get("DETECTION_STALL_TIMEOUT", defaults.detection_stall_timeout)),
+            watchdog_interval=float(os.environ.get("WATCHDOG_INTERVAL", defaults.watchdog_interval)),
+            picamera_main_size=_parse_size(os.environ.get("PICAMERA_MAIN_SIZE"), defaults.picamera_main_size)
+            or defaults.picamera_main_size,
+            picamera_lores_size=_parse_size(os.environ.get("PICAMERA_LORES_SIZE"), defaults.picamera_lores_size),
+            stream_variants=_parse_stream_variants(os.environ.get("STREAM_VARIANTS")),
+            stream_variant_idle_seconds=float(
+                os.environ.get("STREAM_VARIANT_IDLE_SECONDS", defaults.stream_variant_idle_seconds)
+            ),
+            cameras=_parse_camera_list(os.environ.get("CAMERAS")),
             tracker_iou_threshold=float(os.environ.get("TRACKER_IOU_THRESHOLD", defaults.tracker_iou_threshold)),
             tracker_max_age=int(os.environ.get("TRACKER_MAX_AGE", defaults.tracker_max_age)),
             tracker_min_hits=int(os.environ.get("TRACKER_MIN_HITS", defaults.tracker_min_hits)),
+            camera_source=os.environ.get("CAMERA_SOURCE") or defaults.camera_source,
+            camera_source_pace=os.environ.get("CAMERA_SOURCE_PACE", defaults.camera_source_pace).strip().lower(),
+            camera_source_fps=float(os.environ.get("CAMERA_SOURCE_FPS", defaults.camera_source_fps)),
+            camera_source_loop=_parse_bool(os.environ.get("CAMERA_SOURCE_LOOP"), defaults.camera_source_loop),
+            clip_dir=os.environ.get("CLIP_DIR") or defaults.clip_dir,
+            clip_labels=_parse_labels(os.environ.get("CLIP_LABELS")),
+            clip_on_target=_parse_bool(os.environ.get("CLIP_ON_TARGET"), defaults.clip_on_target),
+            clip_pre_roll_seconds=float(os.environ.get("CLIP_PRE_ROLL_SECONDS", defaults.clip_pre_roll_seconds)),
+            clip_post_roll_seconds=float(os.environ.get("CLIP_POST_ROLL_SECONDS", defaults.clip_post_roll_seconds)),
+            clip_max_seconds=float(os.environ.get("CLIP_MAX_SECONDS", defaults.clip_max_seconds)),
+            clip_max_disk_mb=float(os.environ.get("CLIP_MAX_DISK_MB", defaults.clip_max_disk_mb)),
+            clip_buffer_mb=float(os.environ.get("CLIP_BUFFER_MB", defaults.clip_buffer_mb)),
+            clip_source=os.environ.get("CLIP_SOURCE", defaults.clip_source).strip().lower(),
+            frame_bus=os.environ.get("FRAME_BUS") or defaults.frame_bus,
+            frame_bus_slots=int(os.environ.get("FRAME_BUS_SLOTS", defaults.frame_bus_slots)),
+            events_url=os.environ.get("EVENTS_URL") or defaults.events_url,
+            events_queue_size=int(os.environ.get("EVENTS_QUEUE_SIZE", defaults.events_queue_size)),
+            events_batch_size=int(os.environ.get("EVENTS_BATCH_SIZE", defaults.events_batch_size)),
+            events_flush_interval=float(os.environ.get("EVENTS_FLUSH_INTERVAL", defaults.events_flush_interval)),
+            history_db=os.environ.get("HISTORY_DB") or defaults.history_db,
+            history_crops=_parse_bool(os.environ.get("HISTORY_CROPS"), defaults.history_crops),
+            history_flush_interval=float(os.environ.get("HISTORY_FLUSH_INTERVAL", defaults.history_flush_interval)),
+            trajectory_points=int(os.environ.get("TRAJECTORY_POINTS", defaults.trajectory_points)),
+            trajectory_tolerance=float(os.environ.get("TRAJECTORY_TOLERANCE", defaults.trajectory_tolerance)),
+            trajectory_tracks=int(os.environ.get("TRAJECTORY_TRACKS", defaults.trajectory_tracks)),
+            heatmap_grid=_parse_size(os.environ.get("HEATMAP_GRID"), defaults.heatmap_grid),
+            heatmap_half_life=float(os.environ.get("HEATMAP_HALF_LIFE", defaults.heatmap_half_life)),
+            heatmap_path=os.environ.get("HEATMAP_PATH") or defaults.heatmap_path,
+            heatmap_save_interval=float(os.environ.get("HEATMAP_SAVE_INTERVAL", defaults.heatmap_save_interval)),
+            governor=_parse_bool(os.environ.get("GOVERNOR"), defaults.governor),
+            governor_profiles=_parse_governor_profiles(os.environ.get("GOVERNOR_PROFILES")),
+            governor_temp_high=float(os.environ.get("GOVERNOR_TEMP_HIGH", defaults.governor_temp_high)),
+            governor_temp_low=float(os.environ.get("GOVERNOR_TEMP_LOW", defaults.governor_temp_low)),
+            governor_load_high=float(os.environ.get("GOVERNOR_LOAD_HIGH", defaults.governor_load_high)),
+            governor_load_low=float(os.environ.get("GOVERNOR_LOAD_LOW", defaults.governor_load_low)),
+            governor_hold_seconds=float(os.environ.get("GOVERNOR_HOLD_SECONDS", defaults.governor_hold_seconds)),
+            governor_step_seconds=float(os.environ.get("GOVERNOR_STEP_SECONDS", defaults.governor_step_seconds)),
+            governor_interval=float(os.environ.get("GOVERNOR_INTERVAL", defaults.governor_interval)),
+            governor_temp_path=os.environ.get("GOVERNOR_TEMP_PATH") or defaults.governor_temp_path,
+            governor_stat_path=os.environ.get("GOVERNOR_STAT_PATH") or defaults.governor_stat_path,
+            torch_threads=int(os.environ.get("TORCH_THREADS", defaults.torch_threads)),
+            torch_interop_threads=int(os.environ.get("TORCH_INTEROP_THREADS", defaults.torch_interop_threads)),
+            cv2_threads=int(os.environ.get("CV2_THREADS", defaults.cv2_threads)),
+            detection_cpus=_parse_cpu_list(os.environ.get("DETECTION_CPUS")),
+            capture_cpus=_parse_cpu_list(os.environ.get("CAPTURE_CPUS")),
+            encode_cpus=_parse_cpu_list(os.environ.get("ENCODE_CPUS")),
+            jpeg_backend=os.environ.get("JPEG_BACKEND", defaults.jpeg_backend).strip().lower(),
+            jpeg_subsampling=os.environ.get("JPEG_SUBSAMPLING", defaults.jpeg_subsampling).strip().lower(),
+            jpeg_fast_dct=_parse_bool(os.environ.get("JPEG_FAST_DCT"), defaults.jpeg_fast_dct),
+            jpeg_turbo_per_thread=_parse_bool(os.environ.get("JPEG_TURBO_PER_THREAD"), defaults.jpeg_turbo_per_thread),
+            crop_jpeg_quality=int(os.environ.get("CROP_JPEG_QUALITY", defaults.crop_jpeg_quality)),
+            crop_jpeg_subsampling=os.environ.get("CROP_JPEG_SUBSAMPLING", defaults.crop_jpeg_subsampling).strip().lower(),
+            infer_size=_parse_size(os.environ.get("INFER_SIZE"), defaults.infer_size, square=True),
+            autotune=_parse_bool(os.environ.get("AUTOTUNE"), defaults.autotune),
+            autotune_budget_ms=float(os.environ.get("AUTOTUNE_BUDGET_MS", defaults.autotune_budget_ms)),
+            autotune_sizes=_parse_size_list(os.environ.get("AUTOTUNE_SIZES")),
+            autotune_runs=int(os.environ.get("AUTOTUNE_RUNS", defaults.autotune_runs)),
+            autotune_cache=os.environ.get("AUTOTUNE_CACHE") or defaults.autotune_cache,
+            detection_log_dir=os.environ.get("DETECTION_LOG_DIR") or defaults.detection_log_dir,
+            debug_token=os.environ.get("DEBUG_TOKEN") or defaults.debug_token,
         )
 
 
@@ -1,5 +1,5 @@
 """Detection inference modules"""
+from .autotune import InputSizeTuner, fit_input_size
 from .inference import InferenceEngine
 
-__all__ = ['InferenceEngine']
-
+__all__ = ['InferenceEngine', 'InputSizeTuner', 'fit_input_size']
@@ -0,0 +1,202 @@
+"""Model input-size selection: rectangular sizes and a latency-budget autotuner.
+
+Ultralytics letterboxes every frame into a 640 square by default, so a 16:9
+frame spends about 40% of the model's work on padding. Inference can instead
+run at a rectangular ``WxH`` size (both multiples of the model stride). The
+tuner times each candidate size on the loaded model, smallest first, and
+keeps the largest one whose median latency fits the per-frame budget. The
+choice is cached per model file and host in a small JSON file, so restarts
+reuse it; the cache entry is also keyed by the budget and candidates, and a
+change to either triggers a new measurement.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = Path.home() / ".cache" / "dc-detector" / "input_size.json"
+CACHE_DISABLED_VALUES = ("off", "none", "false", "0")
+# YOLO models downsample by 32; other sizes are rounded up by ultralytics with a warning
+STRIDE = 32
+
+Size = Tuple[int, int]  # (width, height)
+# What ultralytics takes as ``imgsz``: a square side or (height, width)
+ImgSz = Union[int, Tuple[int, int]]
+
+
+def resolve_cache_path(value: Optional[str]) -> Optional[Path]:
+    """``AUTOTUNE_CACHE``: unset → default path, ``off`` → no cache."""
+    if value is None or value.strip() == "":
+        return DEFAULT_CACHE_PATH
+    if value.strip().lower() in CACHE_DISABLED_VALUES:
+        return None
+    return Path(value).expanduser()
+
+
+def size_label(size: Size) -> str:
+    return f"{size[0]}x{size[1]}"
+
+
+def _round_to_stride(value: float) -> int:
+    return max(STRIDE, int(round(value / STRIDE)) * STRIDE)
+
+
+def fit_input_size(size: Optional[Size], limit: Optional[int]) -> Optional[ImgSz]:
+    """``imgsz`` for the model call: ``size`` shrunk (aspect kept) so its long side is at most ``limit``.
+
+    ``limit`` is the square side of a governor profile; without a size it is
+    passed on as is, without either the model default is used.
+    """
+    if size is None:
+        return limit
+    width, height = size
+    if limit and max(width, height) > limit:
+        scale = limit / max(width, height)
+        width, height = _round_to_stride(width * scale), _round_to_stride(height * scale)
+    return (height, width)
+
+
+def host_key() -> str:
+    torch = sys.modules.get("torch")
+    parts = [platform.node(), platform.machine(), str(os.cpu_count())]
+    if torch is not None:
+        parts.append(f"torch {torch.__version__}")
+    return "|".join(parts)
+
+
+def model_key(model_manager) -> str:
+    """Model name plus file size and mtime, so replacing the weights invalidates the entry."""
+    name = model_manager.get_active_model() or "unknown"
+    path = getattr(model_manager, "model_path", None)
+    if path is not None:
+        try:
+            stat = Path(path).stat()
+            return f"{name}:{stat.st_size}:{int(stat.st_mtime)}"
+        except OSError:
+            pass
+    return name
+
+
+class InputSizeTuner:
+    """Times candidate sizes and picks the largest one within ``budget_ms``."""
+
+    def __init__(
+        self,
+        candidates: Sequence[Size],
+        budget_ms: float,
+        runs: int = 5,
+        cache_path: Optional[Path] = None,
+    ):
+        if not candidates:
+            raise ValueError("at least one candidate size is required")
+        # Smallest first: once a size is over budget every larger one is too
+        self.candidates: List[Size] = sorted({tuple(size) for size in candidates}, key=lambda s: (s[0] * s[1], s))
+        self.budget_ms = budget_ms
+        self.runs = max(1, runs)
+        self.cache_path = cache_path
+        self.result: Optional[dict] = None
+
+    def _cache_entry_matches(self, entry) -> bool:
+        return (
+            isinstance(entry, dict)
+            and entry.get("budget_ms") == self.budget_ms
+            and entry.get("candidates") == [size_label(size) for size in self.candidates]
+            and isinstance(entry.get("size"), list)
+        )
+
+    def _load(self, key: str) -> Optional[dict]:
+        if self.cache_path is None:
+            return None
+        try:
+            with self.cache_path.open("r", encoding="utf-8") as fh:
+                entry = json.load(fh).get(key)
+        except (OSError, ValueError, AttributeError):
+            return None
+        return entry if self._cache_entry_matches(entry) else None
+
+    def _save(self, key: str, entry: dict) -> None:
+        if self.cache_path is None:
+            return
+        try:
+            try:
+                with self.cache_path.open("r", encoding="utf-8") as fh:
+                    data = json.load(fh)
+                if not isinstance(data, dict):
+                    data = {}
+            except (OSError, ValueError):
+                data = {}
+            data[key] = entry
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.cache_path.with_name(self.cache_path.name + ".tmp")
+            with tmp_path.open("w", encoding="utf-8") as fh:
+                json.dump(data, fh, indent=2)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as exc:
+            logger.debug("Не удалось сохранить кэш размера входа %s: %s", self.cache_path, exc)
+
+    def measure(self, run: Callable[[Size], None]) -> Dict[str, float]:
+        """Median milliseconds per candidate; ``run(size)`` performs one inference at that size.
+
+        The first call per size is a warm-up (ultralytics rebuilds its letterbox
+        and, on some backends, the graph for a new shape). Candidates past the
+        first one over budget are skipped.
+        """
+        latencies: Dict[str, float] = {}
+        for size in self.candidates:
+            run(size)
+            timings = []
+            for _ in range(self.runs):
+                started = time.perf_counter()
+                run(size)
+                timings.append((time.perf_counter() - started) * 1000)
+            latencies[size_label(size)] = round(statistics.median(timings), 3)
+            if latencies[size_label(size)] > self.budget_ms:
+                break
+        return latencies
+
+    def tune(self, model: str, run: Callable[[Size], None], force: bool = False) -> dict:
+        """Cached choice for ``model`` on this host, measuring when there is none (or ``force``)."""
+        key = f"{model}|{host_key()}"
+        entry = None if force else self._load(key)
+        source = "cache"
+        if entry is None:
+            latencies = self.measure(run)
+            within = [size for size in self.candidates if latencies.get(size_label(size), float("inf")) <= self.budget_ms]
+            chosen = within[-1] if within else self.candidates[0]
+            entry = {
+                "size": list(chosen),
+                "within_budget": bool(within),
+                "budget_ms": self.budget_ms,
+                "candidates": [size_label(size) for size in self.candidates],
+                "latencies_ms": latencies,
+                "measured_at": time.time(),
+            }
+            self._save(key, entry)
+            source = "measured"
+        self.result = {**entry, "model": model, "source": source}
+        logger.info(
+            "Размер входа модели %s: %s (%s, бюджет %.0f мс%s)",
+            model, size_label(tuple(entry["size"])), "из кэша" if source == "cache" else "измерено",
+            self.budget_ms, "" if entry["within_budget"] else ", не укладывается",
+        )
+        return self.result
+
+    @property
+    def size(self) -> Optional[Size]:
+        return tuple(self.result["size"]) if self.result else None
+
+    def stats(self) -> dict:
+        return {
+            "budget_ms": self.budget_ms,
+            "candidates": [size_label(size) for size in self.candidates],
+            "result": self.result,
+        }
@@ -1,7 +1,7 @@
 """Detection inference module"""
 import logging
 import time
-from typing import List, Optional, Tuple
+from typing import Callable, List, Optional, Sequence, Tuple, Union
 
 import cv2
 import numpy as np
@@ -11,14 +11,38 @@ from ..tracking.sort_tracker import SortTracker
 logger = logging.getLogger(__name__)
 
 
+def scale_detections(detections: List[dict], scale: Tuple[float, float]) -> List[dict]:
+    """Maps detection boxes from the inference image onto the full-size frame."""
+    sx, sy = scale
+    if sx == 1.0 and sy == 1.0:
+        return detections
+    scaled = []
+    for detection in detections:
+        x1, y1, x2, y2 = detection['bbox']
+        scaled.append({**detection, 'bbox': [x1 * sx, y1 * sy, x2 * sx, y2 * sy]})
+    return scaled
+
+
 class InferenceEngine:
     """Класс для инференса детекций"""
     
-    def __init__(self, model_manager, tracker: SortTracker, tracker_lock, confidence_threshold: Optional[float] = None):
+    def __init__(
+        self,
+        model_manager,
+        tracker: SortTracker,
+        tracker_lock,
+        confidence_threshold: Optional[float] = None,
+        detection_sink: Optional[Callable[[float, List[dict]], None]] = None,
+    ):
         self.model_manager = model_manager
         self.tracker = tracker
         self.tracker_lock = tracker_lock
         self.confidence_threshold = confidence_threshold or CONFIDENCE_THRESHOLD
+        # Receives (timestamp, raw_detections) for every inferred frame, e.g. DetectionLogWriter.write
+        self.detection_sink = detection_sink
+        # Model input size: square side or (height, width); None keeps the model's default.
+        # Set by the service from INFER_SIZE / the autotuner, capped by the performance governor
+        self.imgsz: Optional[Union[int, Tuple[int, int]]] = None
     
     def _label_for_class(self, class_id: Optional[int], model) -> str:
         """Получает метку класса"""
@@ -31,51 +55,106 @@ class InferenceEngine:
     
     def infer(self, frame: np.ndarray, timestamp: float) -> Tuple[List[dict], np.ndarray, List[dict]]:
         """Выполняет инференс на кадре"""
+        raw_detections = self.detect_batch([frame])[0]
+        return self.track(frame, raw_detections, timestamp)
+
+    def track(
+        self,
+        frame: np.ndarray,
+        raw_detections: List[dict],
+        timestamp: float,
+        tracker: Optional[SortTracker] = None,
+        tracker_lock=None,
+        detection_sink: Optional[Callable[[float, List[dict]], None]] = None,
+        annotate: bool = True,
+    ) -> Tuple[List[dict], Optional[np.ndarray], List[dict]]:
+        """Feeds detections of one frame to a tracker and draws the result.
+
+        Defaults to the engine's own tracker; the multi-camera loop passes the
+        tracker of the camera the frame came from. With ``annotate=False`` the
+        caller draws (and times) the overlay itself and ``None`` is returned.
+        """
+        tracker = tracker if tracker is not None else self.tracker
+        tracker_lock = tracker_lock if tracker_lock is not None else self.tracker_lock
+        sink = detection_sink if detection_sink is not None else self.detection_sink
+        if sink is not None:
+            try:
+                sink(timestamp, raw_detections)
+            except Exception as exc:
+                logger.warning('Не удалось записать детекции: %s', exc)
+
+        with tracker_lock:
+            tracked = tracker.update(raw_detections, timestamp=timestamp)
+            stable_tracks = self._collect_stable_tracks_locked(tracker)
+
+        annotated = self.annotate(frame, tracked) if annotate else None
+        return tracked, annotated, stable_tracks
+
+    def detect_batch(self, frames: Sequence[np.ndarray]) -> List[List[dict]]:
+        """Runs the model once over several frames and returns raw detections per frame."""
         model = self.model_manager.get_model()
         if model is None:
             raise RuntimeError('Модель не загружена')
-        
-        results = model(frame, conf=self.confidence_threshold, verbose=False)
-        annotated = frame.copy()
-        raw_detections: List[dict] = []
-        
-        for result in results:
-            boxes = result.boxes
-            for box in boxes:
-                x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                confidence = float(box.conf[0].cpu().numpy())
-                class_id = None
-                if hasattr(box, 'cls') and box.cls is not None:
-                    class_values = box.cls.cpu().numpy()
-                    if class_values.size:
-                        class_id = int(class_values[0])
-                label = self._label_for_class(class_id, model)
-                raw_detections.append({
-                    'bbox': [float(x1), float(y1), float(x2), float(y2)],
-                    'confidence': confidence,
-                    'class_id': class_id,
-                    'label': label
-                })
-        
-        with self.tracker_lock:
-            tracked = self.tracker.update(raw_detections, timestamp=timestamp)
-            stable_tracks = self._collect_stable_tracks_locked()
-        
-        # Draw detections
+        if not frames:
+            return []
+
+        source = frames[0] if len(frames) == 1 else list(frames)
+        options = {'imgsz': self.imgsz} if self.imgsz else {}
+        results = model(source, conf=self.confidence_threshold, verbose=False, **options)
+        detections = [self._extract_detections(result, model) for result in results]
+        # Ultralytics returns one result per input image; pad defensively for odd backends.
+        while len(detections) < len(frames):
+            detections.append([])
+        return detections
+
+    def annotate(self, frame: np.ndarray, tracked: List[dict], out: Optional[np.ndarray] = None) -> np.ndarray:
+        """Draws tracked boxes on a copy of the frame (written into ``out`` when given)."""
+        if out is not None and out.shape == frame.shape and out.dtype == frame.dtype:
+            np.copyto(out, frame)
+            annotated = out
+        else:
+            annotated = frame.copy()
         for track in tracked:
             x1, y1, x2, y2 = map(int, track['bbox'])
             track_label = track.get('label') or 'object'
             caption = f"{track_label}#{track['trackId']} {track.get('confidence', 0.0):.2f}"
             cv2.rectangle(annotated, (x1, y1), (x2, y2), (0, 200, 70), 2)
             cv2.putText(annotated, caption, (x1, max(y1 - 10, 20)), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 200, 70), 2)
-        
-        return tracked, annotated, stable_tracks
+        return annotated
+
+    def _extract_detections(self, result, model) -> List[dict]:
+        """Converts one ultralytics result into detection dicts.
+
+        Box tensors are moved to host memory once per result instead of once per box.
+        """
+        boxes = getattr(result, 'boxes', None)
+        if boxes is None or len(boxes) == 0:
+            return []
+
+        xyxy = boxes.xyxy.cpu().numpy().reshape(-1, 4)
+        confidences = boxes.conf.cpu().numpy().reshape(-1)
+        class_ids = None
+        if getattr(boxes, 'cls', None) is not None:
+            class_ids = boxes.cls.cpu().numpy().reshape(-1)
+
+        raw_detections: List[dict] = []
+        for index in range(xyxy.shape[0]):
+            x1, y1, x2, y2 = xyxy[index]
+            class_id = int(class_ids[index]) if class_ids is not None and class_ids.size > index else None
+            raw_detections.append({
+                'bbox': [float(x1), float(y1), float(x2), float(y2)],
+                'confidence': float(confidences[index]),
+                'class_id': class_id,
+                'label': self._label_for_class(class_id, model)
+            })
+        return raw_detections
 
-    def _collect_stable_tracks_locked(self) -> List[dict]:
+    def _collect_stable_tracks_locked(self, tracker: Optional[SortTracker] = None) -> List[dict]:
+        tracker = tracker if tracker is not None else self.tracker
         stable_tracks: List[dict] = []
         try:
-            for t in getattr(self.tracker, 'tracks', []) or []:
-                if getattr(t, 'hits', 0) >= getattr(self.tracker, 'min_hits', 1) and getattr(t, 'misses', 0) <= getattr(self.tracker, 'max_age', 5):
+            for t in getattr(tracker, 'tracks', []) or []:
+                if getattr(t, 'hits', 0) >= getattr(tracker, 'min_hits', 1) and getattr(t, 'misses', 0) <= getattr(tracker, 'max_age', 5):
                     stable_tracks.append(t.to_dict())
         except Exception:
             return []
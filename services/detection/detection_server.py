@@ -7,6 +7,7 @@ import signal
 import sys
 import time
 from pathlib import Path
+from typing import Optional
 
 # Настройка кодировки для Windows
 if sys.platform == 'win32':
@@ -33,8 +34,10 @@ if str(PROJECT_ROOT) not in sys.path:
     sys.path.append(str(PROJECT_ROOT))
 
 from services.detection.config.runtime import RuntimeConfig
+from services.detection.monitoring.profiler import ProfilerBusyError, debug_token_valid
 from services.detection.service import DetectionService
-from services.detection.streaming.generators import mjpeg_generator_raw
+from services.detection.streaming.generators import mjpeg_generator_detections, sse_generator
+from services.detection.streaming.variants import mjpeg_generator_variant, parse_variant_query
 
 # Настройка логирования
 logging.basicConfig(
@@ -100,19 +103,87 @@ def health():
     })
 
 
+@app.route('/ready', methods=['GET'])
+def ready():
+    """Готовность детекции: модель загружена и прогрета (503 пока идёт загрузка)"""
+    if detection_service is None:
+        return jsonify({'ready': False, 'error': 'Service not initialized'}), 503
+
+    payload = detection_service.get_ready_payload()
+    return jsonify(payload), 200 if payload['ready'] else 503
+
+
+def _raw_stream_response(camera_id: Optional[str], stream: str):
+    """Сырой MJPEG поток варианта, выбранного по ?width=&quality=&fps="""
+    try:
+        variant = detection_service.stream_variants.select(**parse_variant_query(request.args))
+    except ValueError as exc:
+        return jsonify({'error': f'Invalid stream parameters: {exc}'}), 400
+
+    return Response(
+        mjpeg_generator_variant(detection_service.stream_variants, detection_service.get_pipeline(camera_id),
+                                variant, metrics=detection_service.metrics, stream=stream),
+        mimetype='multipart/x-mixed-replace; boundary=frame'
+    )
+
+
 @app.route('/video_feed_raw', methods=['GET'])
 @app.route('/stream.mjpeg', methods=['GET'])
 def video_feed_raw():
-    """MJPEG stream без детекции"""
+    """MJPEG stream без детекции (?width=&quality=&fps= выбирают вариант потока)"""
     if detection_service is None:
         return jsonify({'error': 'Service not initialized'}), 503
-    
+
+    return _raw_stream_response(None, 'raw')
+
+
+@app.route('/cameras', methods=['GET'])
+def list_cameras():
+    """Список камер"""
+    if detection_service is None:
+        return jsonify({'cameras': [], 'error': 'Service not initialized'}), 503
+
+    return jsonify(detection_service.list_cameras_payload())
+
+
+@app.route('/cameras/<camera_id>/stream.mjpeg', methods=['GET'])
+def camera_stream(camera_id: str):
+    """MJPEG поток конкретной камеры без детекции"""
+    if detection_service is None:
+        return jsonify({'error': 'Service not initialized'}), 503
+    if detection_service.get_pipeline(camera_id) is None:
+        return jsonify({'error': 'Camera not found'}), 404
+
+    return _raw_stream_response(camera_id, f'raw/{camera_id}')
+
+
+@app.route('/cameras/<camera_id>/detections.mjpeg', methods=['GET'])
+def camera_detections_stream(camera_id: str):
+    """MJPEG поток конкретной камеры с наложенными детекциями"""
+    if detection_service is None:
+        return jsonify({'error': 'Service not initialized'}), 503
+    if detection_service.get_pipeline(camera_id) is None:
+        return jsonify({'error': 'Camera not found'}), 404
+
     return Response(
-        mjpeg_generator_raw(detection_service.capture_raw_jpeg, interval=0.033),
+        mjpeg_generator_detections(lambda: detection_service.capture_annotated_jpeg(camera_id),
+                                   metrics=detection_service.metrics, stream=f'detections/{camera_id}',
+                                   timestamp_getter=lambda: detection_service.stream_timestamp(camera_id, annotated=True)),
         mimetype='multipart/x-mixed-replace; boundary=frame'
     )
 
 
+@app.route('/cameras/<camera_id>/trackers', methods=['GET'])
+def camera_trackers(camera_id: str):
+    """Активные трекеры конкретной камеры"""
+    if detection_service is None:
+        return jsonify({'trackers': [], 'error': 'Service not initialized'}), 503
+    if detection_service.get_pipeline(camera_id) is None:
+        return jsonify({'trackers': [], 'error': 'Camera not found'}), 404
+
+    return jsonify(detection_service.list_trackers(camera_id))
+
+
 @app.route('/api/detection', methods=['GET'])
 def detection_status():
     """Статус детекции"""
@@ -122,6 +193,76 @@ def detection_status():
     return jsonify(detection_service.get_status_payload())
 
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Метрики в формате Prometheus"""
+    if detection_service is None:
+        return Response('', status=503, mimetype='text/plain')
+
+    return Response(detection_service.render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def _debug_authorized() -> bool:
+    expected = detection_service.config.debug_token if detection_service is not None else None
+    return debug_token_valid(expected, request.headers)
+
+
+@app.route('/debug/stacks', methods=['GET'])
+def debug_stacks():
+    """Стеки всех потоков (детекция, захват, стримы)"""
+    if detection_service is None:
+        return jsonify({'error': 'Service not initialized'}), 503
+    if not _debug_authorized():
+        return jsonify({'error': 'Not found'}), 404
+
+    if request.args.get('format') == 'text':
+        return Response(detection_service.thread_stacks(text=True), mimetype='text/plain')
+    return jsonify(detection_service.thread_stacks())
+
+
+@app.route('/debug/profile', methods=['GET'])
+def debug_profile():
+    """Профилирование на N секунд: ?seconds=10&mode=sample|cprofile&interval=0.005&thread=detection"""
+    if detection_service is None:
+        return jsonify({'error': 'Service not initialized'}), 503
+    if not _debug_authorized():
+        return jsonify({'error': 'Not found'}), 404
+
+    try:
+        seconds = float(request.args.get('seconds', 5))
+        interval = float(request.args.get('interval', 0.005))
+    except ValueError:
+        return jsonify({'error': 'seconds and interval must be numbers'}), 400
+    mode = request.args.get('mode', 'sample')
+
+    try:
+        result = detection_service.profile(seconds, mode, interval, request.args.get('thread') or None)
+    except ProfilerBusyError as exc:
+        return jsonify({'error': str(exc)}), 409
+    except ValueError as exc:
+        return jsonify({'error': str(exc)}), 400
+    except RuntimeError as exc:
+        return jsonify({'error': str(exc)}), 503
+    return Response(result, mimetype='text/plain')
+
+
+@app.route('/api/trackers/stream', methods=['GET'])
+def trackers_stream():
+    """SSE поток трекеров: событие после каждого обработанного кадра (?camera=<id>)"""
+    if detection_service is None:
+        return jsonify({'error': 'Service not initialized'}), 503
+    camera_id = request.args.get('camera') or None
+    if camera_id is not None and detection_service.get_pipeline(camera_id) is None:
+        return jsonify({'error': 'Camera not found'}), 404
+
+    return Response(
+        sse_generator(lambda: detection_service.list_trackers(camera_id),
+                      lambda: detection_service.processed_version(camera_id), event='trackers'),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache'},
+    )
+
+
 @app.route('/api/trackers', methods=['GET'])
 def list_trackers():
     """Список активных трекеров"""
@@ -174,6 +315,61 @@ def tracker_frames(track_id: int):
     return jsonify(detection_service.get_tracker_frames_payload(track_id))
 
 
+@app.route('/api/history', methods=['GET'])
+def history():
+    """История завершённых треков (?since=&until=&label=&track_id=&camera=&limit=&cursor=)"""
+    if detection_service is None:
+        return jsonify({'error': 'Service not initialized'}), 503
+    try:
+        payload = detection_service.query_history(request.args)
+    except ValueError as exc:
+        return jsonify({'error': f'Invalid query: {exc}'}), 400
+    if payload is None:
+        return jsonify({'error': 'History is disabled (HISTORY_DB)'}), 404
+    return jsonify(payload)
+
+
+@app.route('/api/history/<int:record_id>/crop', methods=['GET'])
+def history_crop(record_id: int):
+    """Сохранённый кроп завершённого трека"""
+    if detection_service is None:
+        return jsonify({'error': 'Service not initialized'}), 503
+    crop = detection_service.get_history_crop(record_id)
+    if crop is None:
+        return jsonify({'error': 'Crop not found'}), 404
+    return Response(crop, mimetype='image/jpeg')
+
+
+@app.route('/api/trajectories', methods=['GET'])
+def trajectories():
+    """Траектории треков (?track_id=1,2&camera=&points=&limit=)"""
+    if detection_service is None:
+        return jsonify({'error': 'Service not initialized'}), 503
+    try:
+        payload = detection_service.query_trajectories(request.args)
+    except ValueError as exc:
+        return jsonify({'error': f'Invalid query: {exc}'}), 400
+    if payload is None:
+        return jsonify({'error': 'Trajectories are disabled (TRAJECTORY_POINTS=0)'}), 404
+    return jsonify(payload)
+
+
+@app.route('/api/heatmap', methods=['GET'])
+def heatmap():
+    """Тепловая карта детекций (?camera=&label=&format=png|json&width=)"""
+    if detection_service is None:
+        return jsonify({'error': 'Service not initialized'}), 503
+    try:
+        rendered = detection_service.render_heatmap(request.args)
+    except ValueError as exc:
+        return jsonify({'error': f'Invalid query: {exc}'}), 400
+    if rendered is None:
+        return jsonify({'error': 'Heatmap is disabled or has no data yet'}), 404
+    if isinstance(rendered, dict):
+        return jsonify(rendered)
+    return Response(rendered, mimetype='image/png')
+
+
 @app.route('/models', methods=['GET'])
 def list_models():
     """Список доступных моделей"""
@@ -209,6 +405,18 @@ def switch_model():
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/models/autotune', methods=['POST'])
+def autotune_models():
+    """Подбор размера входа модели под бюджет задержки (замер заново)"""
+    if detection_service is None:
+        return jsonify({'error': 'Service not initialized'}), 503
+
+    try:
+        return jsonify(detection_service.autotune_input_size())
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 503
+
+
 @app.route('/', methods=['GET'])
 def index():
     """Главная страница с видео потоком"""
@@ -246,8 +454,14 @@ def main():
     
     # Загружаем конфигурацию из переменных окружения
     config = RuntimeConfig.from_env()
-    logger.info("Конфигурация: port=%d, confidence=%.2f, infer_fps=%.1f", 
-                config.port, config.confidence_threshold, config.infer_fps)
+    logger.info("Конфигурация: port=%d, confidence=%.2f, infer_fps=%.1f, server=%s",
+                config.port, config.confidence_threshold, config.infer_fps, config.server_mode)
+
+    if config.server_mode == 'async':
+        from services.detection.async_server import run_async_server
+
+        run_async_server(config)
+        return
     
     # Создаем приложение
     create_app(config)
@@ -0,0 +1,10 @@
+"""Inter-process frame sharing modules"""
+from .frame_bus import BusFrame, FrameBus, FrameBusReader, FrameBusWriter, bus_name
+
+__all__ = [
+    'BusFrame',
+    'FrameBus',
+    'FrameBusReader',
+    'FrameBusWriter',
+    'bus_name',
+]
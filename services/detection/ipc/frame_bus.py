@@ -0,0 +1,347 @@
+"""Shared-memory frame bus for consumers running on the same machine.
+
+Each camera publishes its captured frames into a named shared-memory segment
+of fixed slots, so a local process (clip recorder, second model, thumbnailer)
+can map the newest frame as a NumPy array instead of pulling MJPEG over HTTP
+and decoding it. Detection results are attached to the slot of the frame they
+were computed on.
+
+Every slot has two sequence locks: the frame counter guards the pixels and
+frame header, the metadata counter guards the detections attached later. The
+writer makes a counter odd, writes, then makes it even again; a reader
+accepts a slot only if both counters were even and unchanged around its read.
+``BusFrame.valid()`` repeats the frame check later, because zero-copy views
+are overwritten once the writer comes around to the same slot again;
+attaching detections to the frame does not invalidate it.
+
+Reader usage::
+
+    reader = FrameBusReader("dc_frames_0")
+    frame = reader.latest()
+    if frame is not None:
+        process(frame.image)  # read-only view into shared memory
+        if not frame.valid():
+            ...  # overwritten meanwhile, drop the result
+    reader.close()
+"""
+from __future__ import annotations
+
+import json
+import logging
+import re
+import struct
+import sys
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"DCFB"
+VERSION = 2
+DEFAULT_SLOTS = 4
+DEFAULT_META_CAPACITY = 64 * 1024
+COLOR_CODES = {"bgr": 0, "rgb": 1}
+COLOR_NAMES = {code: name for name, code in COLOR_CODES.items()}
+# magic, version, slots, frame capacity, metadata capacity, padding, frames written, write count of the last detected frame
+_HEADER = struct.Struct("<4sIIIIIQQ")
+_HEADER_SIZE = 64
+_WRITE_COUNT_OFFSET = 24
+_DETECTED_COUNT_OFFSET = 32
+# seqlock, frame seq, capture time, height, width, channels, colour, metadata length
+_SLOT = struct.Struct("<QQdIIIII")
+_SLOT_HEADER_SIZE = 64
+_META_LEN_OFFSET = _SLOT.size - 4
+# Metadata seqlock, in the slot header padding after _SLOT
+_META_SEQ_OFFSET = 48
+_U64 = struct.Struct("<Q")
+_U32 = struct.Struct("<I")
+_READ_RETRIES = 8
+
+
+def bus_name(prefix: str, camera_id: str) -> str:
+    """Segment name of one camera: ``<prefix>_<camera id>`` with unsafe characters replaced."""
+    return re.sub(r"[^A-Za-z0-9_]+", "_", f"{prefix}_{camera_id}")
+
+
+def _slot_stride(frame_capacity: int, meta_capacity: int) -> int:
+    size = _SLOT_HEADER_SIZE + frame_capacity + meta_capacity
+    return (size + 63) // 64 * 64
+
+
+def _json_default(value: Any):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class FrameBusWriter:
+    """Owner of one camera's segment; created on the first frame, sized for it."""
+
+    def __init__(self, name: str, slots: int = DEFAULT_SLOTS, meta_capacity: int = DEFAULT_META_CAPACITY):
+        if slots < 2:
+            raise ValueError("slots must be at least 2")
+        self.name = name
+        self.slots = slots
+        self.meta_capacity = meta_capacity
+        self.frame_capacity = 0
+        self.frames_published = 0
+        self.frames_skipped = 0
+        self.detections_published = 0
+        self._shm: Optional[shared_memory.SharedMemory] = None
+        self._stride = 0
+        # frame seq -> write count, for the frames still held by a slot
+        self._counts: "OrderedDict[int, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def active(self) -> bool:
+        return self._shm is not None
+
+    def _create(self, frame_capacity: int) -> None:
+        self.frame_capacity = frame_capacity
+        self._stride = _slot_stride(frame_capacity, self.meta_capacity)
+        size = _HEADER_SIZE + self._stride * self.slots
+        try:
+            self._shm = shared_memory.SharedMemory(name=self.name, create=True, size=size)
+        except FileExistsError:
+            # Left behind by a crashed run
+            stale = shared_memory.SharedMemory(name=self.name)
+            stale.close()
+            stale.unlink()
+            self._shm = shared_memory.SharedMemory(name=self.name, create=True, size=size)
+        self._shm.buf[:_HEADER_SIZE] = bytes(_HEADER_SIZE)
+        _HEADER.pack_into(self._shm.buf, 0, MAGIC, VERSION, self.slots, frame_capacity, self.meta_capacity, 0, 0, 0)
+        logger.info("Шина кадров %s создана: %d слотов по %d байт", self.name, self.slots, self._stride)
+
+    def _slot_offset(self, count: int) -> int:
+        return _HEADER_SIZE + ((count - 1) % self.slots) * self._stride
+
+    def publish(self, image: np.ndarray, frame_seq: int, timestamp: float, color: str = "bgr") -> bool:
+        """Copies one frame into the next slot; False if it does not fit the segment."""
+        if image.dtype != np.uint8:
+            return False
+        height, width = image.shape[:2]
+        channels = image.shape[2] if image.ndim == 3 else 1
+        with self._lock:
+            if self._shm is None:
+                self._create(image.nbytes)
+            if image.nbytes > self.frame_capacity:
+                if self.frames_skipped == 0:
+                    logger.warning("Кадр %dx%d не помещается в шину %s", width, height, self.name)
+                self.frames_skipped += 1
+                return False
+            buf = self._shm.buf
+            count = _U64.unpack_from(buf, _WRITE_COUNT_OFFSET)[0] + 1
+            offset = self._slot_offset(count)
+            lock_seq = _U64.unpack_from(buf, offset)[0]
+            _U64.pack_into(buf, offset, lock_seq + 1)
+            target = np.ndarray((image.nbytes,), dtype=np.uint8, buffer=buf, offset=offset + _SLOT_HEADER_SIZE)
+            np.copyto(target.reshape(image.shape), image)
+            del target
+            _SLOT.pack_into(buf, offset, lock_seq + 1, frame_seq, timestamp, height, width, channels,
+                            COLOR_CODES.get(color, 0), 0)
+            _U64.pack_into(buf, offset, lock_seq + 2)
+            _U64.pack_into(buf, _WRITE_COUNT_OFFSET, count)
+            self._counts[frame_seq] = count
+            while len(self._counts) > self.slots:
+                self._counts.popitem(last=False)
+            self.frames_published += 1
+            return True
+
+    def publish_detections(self, frame_seq: int, payload: dict) -> bool:
+        """Attaches JSON metadata to the slot still holding ``frame_seq``; False if it was overwritten."""
+        data = json.dumps(payload, separators=(",", ":"), default=_json_default).encode("utf-8")
+        with self._lock:
+            if self._shm is None:
+                return False
+            count = self._counts.get(frame_seq)
+            buf = self._shm.buf
+            if count is None or len(data) > self.meta_capacity:
+                return False
+            offset = self._slot_offset(count)
+            # Own counter, so readers of the frame keep seeing it as valid
+            meta_seq = _U64.unpack_from(buf, offset + _META_SEQ_OFFSET)[0]
+            _U64.pack_into(buf, offset + _META_SEQ_OFFSET, meta_seq + 1)
+            meta_offset = offset + _SLOT_HEADER_SIZE + self.frame_capacity
+            buf[meta_offset:meta_offset + len(data)] = data
+            _U32.pack_into(buf, offset + _META_LEN_OFFSET, len(data))
+            _U64.pack_into(buf, offset + _META_SEQ_OFFSET, meta_seq + 2)
+            _U64.pack_into(buf, _DETECTED_COUNT_OFFSET, count)
+            self.detections_published += 1
+            return True
+
+    def close(self) -> None:
+        with self._lock:
+            if self._shm is None:
+                return
+            self._shm.close()
+            try:
+                self._shm.unlink()
+            except FileNotFoundError:
+                pass
+            self._shm = None
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "active": self.active,
+            "slots": self.slots,
+            "slot_bytes": self._stride,
+            "frames_published": self.frames_published,
+            "frames_skipped": self.frames_skipped,
+            "detections_published": self.detections_published,
+        }
+
+
+class FrameBus:
+    """One ``FrameBusWriter`` per camera, fed by pipeline listeners."""
+
+    def __init__(self, prefix: str, slots: int = DEFAULT_SLOTS, meta_capacity: int = DEFAULT_META_CAPACITY):
+        self.prefix = prefix
+        self.slots = slots
+        self.meta_capacity = meta_capacity
+        self.writers: Dict[str, FrameBusWriter] = {}
+
+    def attach(self, pipeline) -> None:
+        self.writers.setdefault(
+            pipeline.camera_id, FrameBusWriter(bus_name(self.prefix, pipeline.camera_id), self.slots, self.meta_capacity)
+        )
+        pipeline.add_listener(self._on_pipeline_frame)
+
+    def _on_pipeline_frame(self, pipeline, kind: str) -> None:
+        if kind != "raw":
+            return
+        writer = self.writers.get(pipeline.camera_id)
+        frame = pipeline.current_frame
+        if writer is not None and frame is not None:
+            writer.publish(frame.data, frame.seq, frame.timestamp, frame.color)
+
+    def publish_detections(self, camera_id: str, frame_seq: int, tracked: List[dict], timestamp: float) -> bool:
+        writer = self.writers.get(camera_id)
+        if writer is None:
+            return False
+        return writer.publish_detections(
+            frame_seq, {"frameSeq": frame_seq, "timestamp": timestamp, "detections": tracked}
+        )
+
+    def close(self) -> None:
+        for writer in self.writers.values():
+            writer.close()
+
+    def stats(self) -> dict:
+        return {camera_id: writer.stats() for camera_id, writer in self.writers.items()}
+
+
+@dataclass
+class BusFrame:
+    """A frame read from the bus; ``image`` is a read-only view unless copied."""
+
+    image: np.ndarray
+    frame_seq: int
+    timestamp: float
+    color: str
+    detections: Optional[dict]
+    _reader: "FrameBusReader"
+    _offset: int
+    _lock_seq: int
+
+    def valid(self) -> bool:
+        """True while the writer has not started overwriting this frame's pixels (detections may still be attached)."""
+        return self._reader._lock_seq(self._offset) == self._lock_seq
+
+
+class FrameBusReader:
+    """Client side: attaches to an existing segment by name."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._shm = shared_memory.SharedMemory(name=name)
+        if sys.version_info < (3, 13):
+            # Attaching registers the segment with this process' resource tracker,
+            # which would unlink it (under the writer) when the reader exits
+            try:
+                from multiprocessing import resource_tracker
+
+                resource_tracker.unregister(self._shm._name, "shared_memory")  # type: ignore[attr-defined]
+            except Exception:  # pragma: no cover - tracker internals differ between versions
+                pass
+        magic, version, self.slots, self.frame_capacity, self.meta_capacity, _, _, _ = _HEADER.unpack_from(
+            self._shm.buf, 0
+        )
+        if magic != MAGIC or version != VERSION:
+            self._shm.close()
+            raise ValueError(f"{name} is not a frame bus segment (version {VERSION})")
+        self._stride = _slot_stride(self.frame_capacity, self.meta_capacity)
+
+    def _lock_seq(self, offset: int) -> int:
+        return _U64.unpack_from(self._shm.buf, offset)[0]
+
+    @property
+    def frames_written(self) -> int:
+        return _U64.unpack_from(self._shm.buf, _WRITE_COUNT_OFFSET)[0]
+
+    def latest(self, copy: bool = False) -> Optional[BusFrame]:
+        """Newest frame, or None if nothing was published yet (or the writer kept racing us)."""
+        return self._read(_WRITE_COUNT_OFFSET, copy)
+
+    def latest_detected(self, copy: bool = False) -> Optional[BusFrame]:
+        """Newest frame that has detection metadata attached."""
+        return self._read(_DETECTED_COUNT_OFFSET, copy)
+
+    def wait(self, after_seq: int = 0, timeout: float = 1.0, poll: float = 0.002) -> Optional[BusFrame]:
+        """Polls until a frame newer than ``after_seq`` is published."""
+        deadline = time.monotonic() + timeout
+        while True:
+            frame = self.latest()
+            if frame is not None and frame.frame_seq > after_seq:
+                return frame
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(poll)
+
+    def _read(self, count_offset: int, copy: bool) -> Optional[BusFrame]:
+        buf = self._shm.buf
+        for _ in range(_READ_RETRIES):
+            count = _U64.unpack_from(buf, count_offset)[0]
+            if count == 0:
+                return None
+            offset = _HEADER_SIZE + ((count - 1) % self.slots) * self._stride
+            meta_seq = _U64.unpack_from(buf, offset + _META_SEQ_OFFSET)[0]
+            lock_seq, frame_seq, timestamp, height, width, channels, color, meta_len = _SLOT.unpack_from(buf, offset)
+            if lock_seq % 2 or meta_seq % 2:
+                continue  # being written
+            shape = (height, width, channels) if channels > 1 else (height, width)
+            image = np.ndarray(shape, dtype=np.uint8, buffer=buf, offset=offset + _SLOT_HEADER_SIZE)
+            image.flags.writeable = False
+            if copy:
+                image = image.copy()
+            meta_offset = offset + _SLOT_HEADER_SIZE + self.frame_capacity
+            meta = bytes(buf[meta_offset:meta_offset + meta_len]) if meta_len else None
+            if self._lock_seq(offset) != lock_seq or _U64.unpack_from(buf, offset + _META_SEQ_OFFSET)[0] != meta_seq:
+                continue  # overwritten while reading
+            return BusFrame(
+                image=image,
+                frame_seq=frame_seq,
+                timestamp=timestamp,
+                color=COLOR_NAMES.get(color, "bgr"),
+                detections=json.loads(meta) if meta else None,
+                _reader=self,
+                _offset=offset,
+                _lock_seq=lock_seq,
+            )
+        return None
+
+    def close(self) -> None:
+        """Detaches; views returned by ``latest()`` must be dropped first."""
+        try:
+            self._shm.close()
+        except BufferError:
+            logger.debug("Шина кадров %s: остались ссылки на кадры", self.name)
@@ -2,9 +2,10 @@
 import glob
 import logging
 from pathlib import Path
-from typing import List, Optional
+from typing import TYPE_CHECKING, List, Optional
 
-from ultralytics import YOLO
+if TYPE_CHECKING:  # ultralytics pulls in torch; import it only when a model is loaded
+    from ultralytics import YOLO
 
 logger = logging.getLogger(__name__)
 
@@ -16,7 +17,7 @@ class ModelManager:
         self.models_dir = models_dir
         self.base_dir = base_dir
         self._model_lock = None  # Будет установлен извне
-        self.model: Optional[YOLO] = None
+        self.model: Optional["YOLO"] = None
         self.model_path: Optional[Path] = None
         self.model_name: Optional[str] = None
         self._available_models: List[str] = []
@@ -66,6 +67,8 @@ class ModelManager:
             raise FileNotFoundError(f'Не удалось найти модель: {model_path}')
         
         logger.info('🔍 Загрузка модели YOLO: %s', resolved)
+        from ultralytics import YOLO
+
         model = YOLO(str(resolved))
         
         if self._model_lock:
@@ -84,7 +87,7 @@ class ModelManager:
             available.sort()
             self._available_models = available
     
-    def get_model(self) -> Optional[YOLO]:
+    def get_model(self) -> Optional["YOLO"]:
         """Получает текущую модель"""
         if self._model_lock:
             with self._model_lock:
@@ -0,0 +1,23 @@
+"""Monitoring modules"""
+from .cpu_layout import CpuLayout
+from .governor import PerformanceGovernor, PerformanceProfile, build_profiles
+from .metrics import Counter, Gauge, Histogram, MetricsRegistry, RateMeter, process_rss_bytes
+from .profiler import ProfilerBusyError, ThreadProfileHook, debug_token_valid, dump_thread_stacks, sample_stacks
+
+__all__ = [
+    'Counter',
+    'CpuLayout',
+    'Gauge',
+    'Histogram',
+    'MetricsRegistry',
+    'PerformanceGovernor',
+    'PerformanceProfile',
+    'build_profiles',
+    'RateMeter',
+    'process_rss_bytes',
+    'ProfilerBusyError',
+    'ThreadProfileHook',
+    'debug_token_valid',
+    'dump_thread_stacks',
+    'sample_stacks',
+]
@@ -0,0 +1,188 @@
+"""Explicit thread-pool sizes and CPU affinity for the hot threads.
+
+Left alone, torch, OpenCV and the HTTP server each size their pools for every
+core of the box, so on a 4-core Pi the stream encoders and inference preempt
+each other. ``CpuLayout`` sets the torch intra/inter-op and OpenCV pool sizes
+once, before the model loads, and pins the detection, capture and stream
+encode threads to their own CPU sets. Pinning is per thread
+(``sched_setaffinity`` with pid 0). Threads the service owns (detection loop,
+capture threads, the async server's encode pool) are pinned for good with
+``pin``; shared threads such as HTTP request threads or the default executor
+only take a role for the duration of a ``pinned`` block and get their previous
+CPU set back afterwards, so later unrelated work does not stay confined to,
+say, the encode cores. torch's OpenMP workers are spawned by the detection
+thread and inherit its CPU set.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import sys
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Mapping, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+ROLES = ("detection", "capture", "encode")
+
+
+def available_cpus() -> List[int]:
+    """CPUs this process may run on."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+class CpuLayout:
+    """Library thread counts plus a CPU set per role (``detection``, ``capture``, ``encode``)."""
+
+    def __init__(
+        self,
+        torch_threads: int = 0,
+        torch_interop_threads: int = 0,
+        cv2_threads: int = -1,
+        affinity: Optional[Mapping[str, Sequence[int]]] = None,
+    ):
+        self.torch_threads = torch_threads
+        self.torch_interop_threads = torch_interop_threads
+        self.cv2_threads = cv2_threads
+        self.affinity: Dict[str, tuple] = {}
+        for role, cpus in (affinity or {}).items():
+            if role not in ROLES:
+                raise ValueError(f"unknown role: {role}")
+            if cpus:
+                self.affinity[role] = tuple(sorted(set(cpus)))
+        self.errors: List[str] = []
+        # Thread name -> role it was pinned for
+        self.threads: Dict[str, str] = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config) -> "CpuLayout":
+        return cls(
+            torch_threads=config.torch_threads,
+            torch_interop_threads=config.torch_interop_threads,
+            cv2_threads=config.cv2_threads,
+            affinity={
+                "detection": config.detection_cpus,
+                "capture": config.capture_cpus,
+                "encode": config.encode_cpus,
+            },
+        )
+
+    # Library pools -------------------------------------------------------------------
+
+    def configure_libraries(self) -> None:
+        """Applies the torch/OpenCV pool sizes; call before the model loads.
+
+        torch is imported only when a torch setting is given, and only if it is
+        installed. The inter-op pool can be sized once per process, before any
+        parallel work; later attempts are reported, not raised.
+        """
+        if self.cv2_threads >= 0:
+            try:
+                import cv2
+
+                cv2.setNumThreads(self.cv2_threads)
+            except Exception as exc:
+                self._error(f"opencv: {exc}")
+        if self.torch_threads > 0 or self.torch_interop_threads > 0:
+            try:
+                import torch
+            except ImportError:
+                self._error("torch is not installed")
+                return
+            if self.torch_threads > 0:
+                torch.set_num_threads(self.torch_threads)
+            if self.torch_interop_threads > 0:
+                try:
+                    torch.set_num_interop_threads(self.torch_interop_threads)
+                except RuntimeError as exc:
+                    self._error(f"torch inter-op threads: {exc}")
+
+    def _error(self, message: str) -> None:
+        self.errors.append(message)
+        logger.warning("Раскладка потоков: %s", message)
+
+    # Affinity ------------------------------------------------------------------------
+
+    def _set_affinity(self, role: str) -> bool:
+        cpus = self.affinity.get(role)
+        if not cpus or not hasattr(os, "sched_setaffinity"):
+            return False
+        try:
+            os.sched_setaffinity(0, cpus)
+        except OSError as exc:
+            # CPUs outside the cgroup/cpuset: run unpinned rather than fail the thread
+            self.affinity.pop(role, None)
+            self._error(f"{role} cpus {list(cpus)}: {exc}")
+            return False
+        return True
+
+    def pin(self, role: str) -> bool:
+        """Pins the calling thread to the CPUs of ``role`` for good; True if it is pinned.
+
+        Only for threads the service owns; shared threads use ``pinned``.
+        """
+        if getattr(self._local, "role", None) == role:
+            return True
+        if not self._set_affinity(role):
+            return False
+        self._local.role = role
+        with self._lock:
+            self.threads[threading.current_thread().name] = role
+        return True
+
+    @contextmanager
+    def pinned(self, role: str) -> Iterator[bool]:
+        """Runs the block on the CPUs of ``role`` and restores the thread's previous CPU set.
+
+        A no-op in threads already pinned to ``role``; yields whether the block runs pinned.
+        """
+        current = getattr(self._local, "role", None)
+        if current == role:
+            yield True
+            return
+        previous = os.sched_getaffinity(0) if self.affinity.get(role) and hasattr(os, "sched_getaffinity") else None
+        if previous is None or not self._set_affinity(role):
+            yield False
+            return
+        self._local.role = role
+        try:
+            yield True
+        finally:
+            os.sched_setaffinity(0, previous)
+            self._local.role = current
+
+    # Report --------------------------------------------------------------------------
+
+    def report(self) -> dict:
+        """Effective layout: CPUs, library pool sizes and the pinned threads."""
+        torch = sys.modules.get("torch")
+        cv2 = sys.modules.get("cv2")
+        with self._lock:
+            threads = dict(self.threads)
+        return {
+            "cpu_count": os.cpu_count(),
+            "available_cpus": available_cpus(),
+            "torch_threads": torch.get_num_threads() if torch is not None else None,
+            "torch_interop_threads": torch.get_num_interop_threads() if torch is not None else None,
+            "opencv_threads": cv2.getNumThreads() if cv2 is not None else None,
+            "affinity": {role: list(self.affinity.get(role, ())) for role in ROLES},
+            "pinned_threads": threads,
+            "errors": list(self.errors),
+        }
+
+    def describe(self) -> str:
+        """One-line summary for the startup log."""
+        report = self.report()
+        roles = " ".join(
+            f"{role}={','.join(map(str, cpus)) if cpus else 'any'}" for role, cpus in report["affinity"].items()
+        )
+        return (
+            f"cpus={report['cpu_count']} available={','.join(map(str, report['available_cpus']))} "
+            f"torch={report['torch_threads']}/{report['torch_interop_threads']} "
+            f"opencv={report['opencv_threads']} {roles}"
+        )
@@ -0,0 +1,250 @@
+"""Thermal- and load-aware performance governor.
+
+The governor samples the SoC temperature (``/sys/class/thermal``) and CPU
+utilisation (``/proc/stat``) every ``interval`` seconds and walks an ordered
+list of profiles, from full quality to the lightest one. It steps one profile
+down as soon as a reading crosses its high threshold, i.e. before the
+firmware starts throttling, and one profile back up only after readings stayed
+below the (lower) low thresholds for ``hold_seconds``; further steps down
+wait ``step_seconds`` for the previous one to take effect. The gap between the
+thresholds plus the hold time is the hysteresis that keeps it from
+oscillating. Each profile sets the detection rate, the model input size and
+the JPEG quality of the raw and annotated streams.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Deque, List, Optional, Sequence, Tuple
+
+from .metrics import MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TEMP_PATH = "/sys/class/thermal/thermal_zone0/temp"
+DEFAULT_STAT_PATH = "/proc/stat"
+# Transitions kept for the status payload
+TRANSITION_HISTORY = 20
+
+
+@dataclass(frozen=True)
+class PerformanceProfile:
+    """``imgsz`` None keeps the model's default input size."""
+
+    name: str
+    infer_fps: float
+    imgsz: Optional[int]
+    jpeg_quality: int
+
+    def to_dict(self) -> dict:
+        return {"name": self.name, "infer_fps": self.infer_fps, "imgsz": self.imgsz, "jpeg_quality": self.jpeg_quality}
+
+
+def build_profiles(
+    specs: Sequence[Tuple[str, float, int, int]], infer_fps: float, jpeg_quality: int
+) -> List[PerformanceProfile]:
+    """Profiles from ``(name, fps, imgsz, quality)`` config tuples.
+
+    0 means the configured ``INFER_FPS`` / model default / ``JPEG_QUALITY``; a
+    profile never runs faster or at a higher quality than the configuration.
+    """
+    profiles = [
+        PerformanceProfile(
+            str(name),
+            min(float(fps), infer_fps) if fps else infer_fps,
+            int(imgsz) or None,
+            min(int(quality), jpeg_quality) if quality else jpeg_quality,
+        )
+        for name, fps, imgsz, quality in specs
+    ]
+    return profiles or [PerformanceProfile("full", infer_fps, None, jpeg_quality)]
+
+
+def read_temperature(path: str) -> Optional[float]:
+    """Degrees Celsius from a sysfs thermal zone (millidegrees); None if unavailable."""
+    try:
+        raw = Path(path).read_text().strip()
+        value = float(raw)
+    except (OSError, ValueError):
+        return None
+    return value / 1000.0 if value > 1000 else value
+
+
+class CpuLoadSampler:
+    """Share of non-idle CPU time between two reads of ``/proc/stat``."""
+
+    def __init__(self, path: str = DEFAULT_STAT_PATH):
+        self.path = path
+        self._previous: Optional[Tuple[int, int]] = None
+
+    def _read(self) -> Optional[Tuple[int, int]]:
+        try:
+            with open(self.path, "r", encoding="ascii") as handle:
+                fields = handle.readline().split()
+        except OSError:
+            return None
+        if not fields or fields[0] != "cpu":
+            return None
+        values = [int(value) for value in fields[1:]]
+        # idle + iowait
+        idle = values[3] + (values[4] if len(values) > 4 else 0)
+        return sum(values), idle
+
+    def sample(self) -> Optional[float]:
+        current = self._read()
+        previous, self._previous = self._previous, current
+        if current is None or previous is None:
+            return None
+        total = current[0] - previous[0]
+        if total <= 0:
+            return None
+        return max(0.0, min(1.0, 1.0 - (current[1] - previous[1]) / total))
+
+
+class PerformanceGovernor:
+    """Steps through ``profiles`` (index 0 = full quality) based on temperature and CPU load."""
+
+    def __init__(
+        self,
+        profiles: Sequence[PerformanceProfile],
+        apply: Callable[[PerformanceProfile], None],
+        metrics: MetricsRegistry,
+        temp_path: str = DEFAULT_TEMP_PATH,
+        stat_path: str = DEFAULT_STAT_PATH,
+        temp_high: float = 75.0,
+        temp_low: float = 65.0,
+        load_high: float = 0.95,
+        load_low: float = 0.7,
+        hold_seconds: float = 30.0,
+        step_seconds: float = 10.0,
+        interval: float = 2.0,
+    ):
+        if not profiles:
+            raise ValueError("at least one profile is required")
+        self.profiles = list(profiles)
+        self.apply = apply
+        self.temp_path = temp_path
+        self.load_sampler = CpuLoadSampler(stat_path)
+        self.temp_high = temp_high
+        self.temp_low = temp_low
+        self.load_high = load_high
+        self.load_low = load_low
+        self.hold_seconds = hold_seconds
+        self.step_seconds = step_seconds
+        self.interval = interval
+        self.index = 0
+        self.temperature: Optional[float] = None
+        self.load: Optional[float] = None
+        # Since when readings have been below the low thresholds (None while they are not)
+        self._calm_since: Optional[float] = None
+        # A lighter profile takes a while to show in the temperature, so steps down are spaced out
+        self._changed_at: Optional[float] = None
+        self.transitions: Deque[dict] = deque(maxlen=TRANSITION_HISTORY)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.metrics = metrics
+        metrics.gauge("governor_profile_index", "Active performance profile (0 = full quality)", fn=lambda: self.index)
+        metrics.gauge(
+            "cpu_temperature_celsius", "SoC temperature seen by the governor",
+            fn=lambda: self.temperature if self.temperature is not None else float("nan"),
+        )
+
+    @property
+    def profile(self) -> PerformanceProfile:
+        return self.profiles[self.index]
+
+    # Decisions -----------------------------------------------------------------------
+
+    def evaluate(self, temperature: Optional[float], load: Optional[float], now: Optional[float] = None) -> bool:
+        """Feeds one reading; returns True if the profile changed."""
+        now = time.monotonic() if now is None else now
+        self.temperature = temperature
+        self.load = load
+        hot = temperature is not None and temperature >= self.temp_high
+        busy = load is not None and load >= self.load_high
+        if hot or busy:
+            self._calm_since = None
+            settled = self._changed_at is None or now - self._changed_at >= self.step_seconds
+            if self.index < len(self.profiles) - 1 and settled:
+                reason = f"temperature {temperature:.1f}C" if hot else f"load {load:.0%}"
+                return self._switch(self.index + 1, reason, now)
+            return False
+        calm = (temperature is None or temperature <= self.temp_low) and (load is None or load <= self.load_low)
+        if not calm:
+            self._calm_since = None
+            return False
+        if self._calm_since is None:
+            self._calm_since = now
+            return False
+        if self.index > 0 and now - self._calm_since >= self.hold_seconds:
+            self._calm_since = now  # the next step up needs another full hold period
+            return self._switch(self.index - 1, f"calm for {self.hold_seconds:g}s", now)
+        return False
+
+    def _switch(self, index: int, reason: str, now: float) -> bool:
+        direction = "down" if index > self.index else "up"
+        self._changed_at = now
+        previous = self.profile
+        self.index = index
+        profile = self.profile
+        self.transitions.append({
+            "time": time.time(),
+            "from": previous.name,
+            "to": profile.name,
+            "reason": reason,
+            "temperature": self.temperature,
+            "load": round(self.load, 3) if self.load is not None else None,
+        })
+        self.metrics.counter(
+            "governor_transitions_total", "Performance profile changes",
+            direction=direction,
+        ).inc()
+        logger.warning("Профиль производительности %s -> %s (%s)", previous.name, profile.name, reason)
+        self.apply(profile)
+        return True
+
+    # Sampling thread -----------------------------------------------------------------
+
+    def sample(self, now: Optional[float] = None) -> bool:
+        return self.evaluate(read_temperature(self.temp_path), self.load_sampler.sample(), now)
+
+    def start(self) -> None:
+        self.apply(self.profile)
+        self.load_sampler.sample()  # baseline for the first load reading
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="perf-governor", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 3.0) -> None:
+        self._stop.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=timeout)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.sample()
+            except Exception as exc:  # pragma: no cover - defensive
+                logger.debug("Ошибка опроса датчиков: %s", exc)
+
+    def stats(self) -> dict:
+        return {
+            "profile": self.profile.to_dict(),
+            "profile_index": self.index,
+            "profiles": [profile.name for profile in self.profiles],
+            "temperature": self.temperature,
+            "load": round(self.load, 3) if self.load is not None else None,
+            "thresholds": {
+                "temp_high": self.temp_high,
+                "temp_low": self.temp_low,
+                "load_high": self.load_high,
+                "load_low": self.load_low,
+                "hold_seconds": self.hold_seconds,
+                "step_seconds": self.step_seconds,
+            },
+            "transitions": list(self.transitions),
+        }
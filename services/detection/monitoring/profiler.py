@@ -0,0 +1,179 @@
+"""On-demand profiling: thread stack dumps, a sampling profiler and cProfile sessions.
+
+Nothing here runs unless a session is requested. The sampling profiler is a
+short-lived thread reading ``sys._current_frames()``; the cProfile session is
+picked up by the profiled thread itself through ``ThreadProfileHook.checkpoint``,
+which costs a single attribute read per call while idle.
+"""
+from __future__ import annotations
+
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import traceback
+from collections import Counter as _TallyCounter
+from typing import Dict, List, Mapping, Optional
+
+MAX_PROFILE_SECONDS = 60.0
+MIN_SAMPLE_INTERVAL = 0.001
+
+
+class ProfilerBusyError(RuntimeError):
+    """Raised when another profiling session is already running."""
+
+
+# Only one session at a time keeps the overhead on a Pi predictable
+_session_lock = threading.Lock()
+
+
+def debug_token_valid(expected: Optional[str], headers: Mapping[str, str]) -> bool:
+    """Checks the shared secret from ``X-Debug-Token`` or ``Authorization: Bearer``.
+
+    Always False when no token is configured, so debug endpoints stay hidden.
+    """
+    if not expected:
+        return False
+    supplied = headers.get('X-Debug-Token', '')
+    auth = headers.get('Authorization', '')
+    if not supplied and auth.startswith('Bearer '):
+        supplied = auth[len('Bearer '):]
+    return hmac.compare_digest(supplied.encode(), expected.encode())
+
+
+def _thread_names() -> Dict[int, str]:
+    return {thread.ident: thread.name for thread in threading.enumerate() if thread.ident is not None}
+
+
+def dump_thread_stacks() -> List[dict]:
+    """Current stack of every live thread, innermost frame last."""
+    names = _thread_names()
+    threads = {thread.ident: thread for thread in threading.enumerate()}
+    result = []
+    for ident, frame in sys._current_frames().items():
+        thread = threads.get(ident)
+        result.append({
+            'name': names.get(ident, f'thread-{ident}'),
+            'ident': ident,
+            'daemon': thread.daemon if thread is not None else None,
+            'stack': [line.rstrip('\n') for line in traceback.format_stack(frame)],
+        })
+    result.sort(key=lambda entry: entry['name'])
+    return result
+
+
+def format_thread_stacks(stacks: List[dict]) -> str:
+    lines = []
+    for entry in stacks:
+        lines.append(f"--- {entry['name']} (ident={entry['ident']}, daemon={entry['daemon']})")
+        lines.extend(entry['stack'])
+        lines.append('')
+    return '\n'.join(lines)
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})'
+
+
+def sample_stacks(seconds: float, interval: float = 0.005, thread_filter: Optional[str] = None) -> Dict[str, int]:
+    """Samples all (or matching) threads for ``seconds``; returns collapsed stacks with counts.
+
+    Keys use the ``flamegraph.pl`` collapsed format: ``thread;outer;...;inner``.
+    """
+    seconds = min(max(seconds, 0.0), MAX_PROFILE_SECONDS)
+    interval = max(interval, MIN_SAMPLE_INTERVAL)
+    if not _session_lock.acquire(blocking=False):
+        raise ProfilerBusyError('Profiling session already running')
+    try:
+        own_ident = threading.get_ident()
+        tally: _TallyCounter = _TallyCounter()
+        deadline = time.monotonic() + seconds
+        names = _thread_names()
+        while True:
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                name = names.get(ident)
+                if name is None:
+                    names = _thread_names()
+                    name = names.get(ident, f'thread-{ident}')
+                if thread_filter and thread_filter not in name:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.append(name)
+                tally[';'.join(reversed(stack))] += 1
+            if time.monotonic() >= deadline:
+                break
+            time.sleep(interval)
+        return dict(tally)
+    finally:
+        _session_lock.release()
+
+
+def format_collapsed(stacks: Dict[str, int]) -> str:
+    return ''.join(f'{stack} {count}\n' for stack, count in sorted(stacks.items(), key=lambda item: -item[1]))
+
+
+def format_pstats(profile: cProfile.Profile, sort: str = 'cumulative', limit: int = 80) -> str:
+    buffer = io.StringIO()
+    stats = pstats.Stats(profile, stream=buffer)
+    stats.sort_stats(sort).print_stats(limit)
+    return buffer.getvalue()
+
+
+class ThreadProfileHook:
+    """Runs ``cProfile`` inside a long-lived loop thread on request.
+
+    The loop calls ``checkpoint()`` once per iteration; ``profile()`` is called
+    from another thread (an HTTP handler) and blocks until the session ends.
+    """
+
+    def __init__(self):
+        self._request: Optional[dict] = None
+        self._profile: Optional[cProfile.Profile] = None
+
+    def checkpoint(self) -> None:
+        request = self._request
+        if request is None:
+            if self._profile is not None:
+                # The requester gave up waiting; stop profiling
+                self._profile.disable()
+                self._profile = None
+            return
+        if self._profile is None:
+            self._profile = cProfile.Profile()
+            request['started'] = time.monotonic()
+            self._profile.enable()
+        elif time.monotonic() - request['started'] >= request['seconds']:
+            self._finish(request)
+
+    def _finish(self, request: dict) -> None:
+        profile, self._profile = self._profile, None
+        if profile is not None:
+            profile.disable()
+        request['profile'] = profile
+        self._request = None
+        request['done'].set()
+
+    def profile(self, seconds: float, timeout: Optional[float] = None) -> Optional[cProfile.Profile]:
+        """Profiles the hooked thread for ``seconds``; None if the loop never reached a checkpoint."""
+        seconds = min(max(seconds, 0.0), MAX_PROFILE_SECONDS)
+        if not _session_lock.acquire(blocking=False):
+            raise ProfilerBusyError('Profiling session already running')
+        try:
+            request = {'seconds': seconds, 'done': threading.Event(), 'profile': None}
+            self._request = request
+            if not request['done'].wait(seconds + (timeout if timeout is not None else 5.0)):
+                # The loop is stuck or stopped; withdraw the request (profile may be partial)
+                self._request = None
+            return request['profile']
+        finally:
+            _session_lock.release()
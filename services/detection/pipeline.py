@@ -0,0 +1,405 @@
+"""Per-camera capture pipeline."""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from contextlib import nullcontext
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+from .camera.frames import Frame, FramePool
+from .camera.manager import CameraManager
+from .config.runtime import RuntimeConfig
+from .monitoring.cpu_layout import CpuLayout
+from .monitoring.metrics import MetricsRegistry
+from .streaming.jpeg import encode_jpeg
+from .tracking.detection_log import DetectionLogWriter
+from .tracking.sort_tracker import SortTracker
+
+logger = logging.getLogger(__name__)
+
+# First delay between camera reconnect attempts; doubles up to ``camera_reconnect_max_backoff``
+RECONNECT_INITIAL_DELAY = 0.5
+
+
+class CameraPipeline:
+    """State owned by one camera: capture thread, latest frames and tracker.
+
+    The capture thread keeps only the newest frame as an immutable ``Frame``;
+    the shared detection loop picks it up by sequence number, so a slow model
+    never queues stale frames, and streams and crops read the same buffer.
+    A hardware camera that stops delivering frames is torn down and
+    re-initialized in a background thread with exponential backoff.
+    """
+
+    def __init__(
+        self,
+        camera_id: str,
+        camera: CameraManager,
+        config: RuntimeConfig,
+        metrics: Optional[MetricsRegistry] = None,
+    ):
+        self.camera_id = camera_id
+        self.camera = camera
+        self.config = config
+        # Raw stream JPEG quality; lowered by the performance governor
+        self.jpeg_quality = config.jpeg_quality
+        self.metrics = metrics if metrics is not None else MetricsRegistry()
+        self._capture_seconds = self.metrics.histogram(
+            "stage_seconds", "Time spent per pipeline stage", stage="capture", camera=camera_id
+        )
+        self._captured_total = self.metrics.counter(
+            "frames_captured_total", "Frames delivered by the camera", camera=camera_id
+        )
+        self._failures_total = self.metrics.counter(
+            "capture_failures_total", "Camera reads that returned no frame", camera=camera_id
+        )
+        self._encode_seconds = self.metrics.histogram(
+            "stage_seconds", "Time spent per pipeline stage", stage="encode_raw", camera=camera_id
+        )
+        self.tracker: Optional[SortTracker] = None
+        self.tracker_lock = threading.RLock()
+        self.frame_lock = threading.Lock()
+        self.frame_ready = threading.Condition(self.frame_lock)
+        self.detection_log: Optional[DetectionLogWriter] = None
+        self.capture_thread: Optional[threading.Thread] = None
+        self.on_frame: Optional[Callable[["CameraPipeline"], None]] = None
+        # Set by the service; pins the capture thread and the threads encoding viewer JPEGs
+        self.cpu_layout: Optional[CpuLayout] = None
+        # Called with (pipeline, "raw" | "annotated") whenever a new frame is published
+        self._listeners: List[Callable[["CameraPipeline", str], None]] = []
+
+        self.current_frame: Optional[Frame] = None
+        # Scratch buffers the detection loop draws the overlay into
+        self.annotate_pool = FramePool(capacity=2)
+        self.last_annotated_frame: Optional[bytes] = None
+        self.annotated_timestamp: Optional[float] = None
+        self.frame_seq = 0
+        self.processed_seq = 0
+        self.frames_captured = 0
+        self.capture_failures = 0
+
+        self._raw_jpeg: Optional[bytes] = None
+        self._raw_jpeg_seq = -1
+        self._raw_jpeg_timestamp: Optional[float] = None
+
+        # Watchdog state; bumping the generation retires the current capture thread
+        self._health_lock = threading.Lock()
+        self._generation = 0
+        self.reconnect_thread: Optional[threading.Thread] = None
+        self.reconnecting = False
+        self.consecutive_failures = 0
+        self.last_frame_at: Optional[float] = None  # time.monotonic()
+        self.outage_started: Optional[float] = None
+        self.outage_reason: Optional[str] = None
+        self.outages = 0
+        self.reconnects = 0
+        self.last_outage_seconds: Optional[float] = None
+        self.total_outage_seconds = 0.0
+        self._outages_total = self.metrics.counter(
+            "camera_outages_total", "Camera outages detected by the watchdog", camera=camera_id
+        )
+        self._reconnects_total = self.metrics.counter(
+            "camera_reconnects_total", "Successful camera re-initializations", camera=camera_id
+        )
+        self.metrics.gauge(
+            "camera_outage_seconds", "Duration of the current camera outage", fn=self.outage_seconds, camera=camera_id
+        )
+
+    # Properties ----------------------------------------------------------------------
+
+    @property
+    def camera_type(self) -> Optional[str]:
+        return self.camera.camera_type
+
+    @property
+    def last_raw_frame(self) -> Optional[np.ndarray]:
+        """Read-only pixels of the newest frame."""
+        frame = self.current_frame
+        return frame.data if frame is not None else None
+
+    @property
+    def frame_timestamp(self) -> Optional[float]:
+        frame = self.current_frame
+        return frame.timestamp if frame is not None else None
+
+    @property
+    def consumer_paced(self) -> bool:
+        """True when the source should only advance once detection consumed a frame."""
+        source = getattr(self.camera, "source", None)
+        return source is not None and getattr(source, "pace", None) == "fast"
+
+    @property
+    def supervised(self) -> bool:
+        """Only hardware cameras are reconnected: a replay source may legitimately run out."""
+        return getattr(self.camera, "source", None) is None
+
+    # Listeners -----------------------------------------------------------------------
+
+    def add_listener(self, listener: Callable[["CameraPipeline", str], None]) -> None:
+        self._listeners = self._listeners + [listener]
+
+    def remove_listener(self, listener: Callable[["CameraPipeline", str], None]) -> None:
+        self._listeners = [item for item in self._listeners if item is not listener]
+
+    def _publish(self, kind: str) -> None:
+        # The list is replaced, never mutated, so iterating without a lock is safe
+        for listener in self._listeners:
+            try:
+                listener(self, kind)
+            except Exception as exc:  # pragma: no cover - defensive
+                logger.debug("Ошибка обработчика кадра камеры %s: %s", self.camera_id, exc)
+
+    # Capture -------------------------------------------------------------------------
+
+    def start_capture(self, stop_event: threading.Event) -> None:
+        if self.camera_type is None:
+            return
+        self._start_capture_thread(stop_event, self._generation)
+
+    def _start_capture_thread(self, stop_event: threading.Event, generation: int) -> None:
+        self.last_frame_at = time.monotonic()
+        self.capture_thread = threading.Thread(
+            target=self._capture_loop,
+            args=(stop_event, generation),
+            name=f"capture-{self.camera_id}",
+            daemon=True,
+        )
+        self.capture_thread.start()
+
+    def join(self, timeout: float) -> None:
+        if self.reconnect_thread and self.reconnect_thread.is_alive():
+            self.reconnect_thread.join(timeout=timeout)
+        if self.capture_thread and self.capture_thread.is_alive():
+            with self.frame_ready:
+                self.frame_ready.notify_all()
+            self.capture_thread.join(timeout=timeout)
+
+    def latest_frame(self) -> Tuple[int, Optional[np.ndarray]]:
+        """Returns ``(sequence, frame)`` of the newest captured frame."""
+        frame = self.current_frame
+        return (frame.seq, frame.data) if frame is not None else (self.frame_seq, None)
+
+    def latest_frame_timestamped(self) -> Tuple[int, Optional[np.ndarray], Optional[float]]:
+        """Like ``latest_frame`` plus the wall-clock capture time of that frame."""
+        frame = self.current_frame
+        return (frame.seq, frame.data, frame.timestamp) if frame is not None else (self.frame_seq, None, None)
+
+    def has_new_frame(self) -> bool:
+        return self.frame_seq > self.processed_seq
+
+    def mark_processed(self, seq: int) -> None:
+        with self.frame_ready:
+            if seq > self.processed_seq:
+                self.processed_seq = seq
+            self.frame_ready.notify_all()
+
+    def _capture_loop(self, stop_event: threading.Event, generation: int = 0) -> None:
+        if self.cpu_layout is not None:
+            self.cpu_layout.pin("capture")
+        while not stop_event.is_set() and generation == self._generation:
+            if self.consumer_paced:
+                with self.frame_ready:
+                    # Replay sources in "fast" mode advance at the consumer's pace.
+                    self.frame_ready.wait_for(
+                        lambda: self.processed_seq >= self.frame_seq or stop_event.is_set(), timeout=0.5
+                    )
+            started = time.perf_counter()
+            try:
+                frame = self.camera.capture_raw()
+            except Exception as exc:
+                logger.debug("Ошибка захвата кадра с камеры %s: %s", self.camera_id, exc)
+                frame = None
+            if generation != self._generation:
+                # A reconnect replaced this thread while it was blocked in the driver
+                return
+            if frame is None:
+                self.capture_failures += 1
+                self.consecutive_failures += 1
+                self._failures_total.inc()
+                if self.supervised and self.consecutive_failures >= self.config.camera_max_failures:
+                    if self.begin_reconnect(stop_event, f"{self.consecutive_failures} read errors in a row"):
+                        return
+                time.sleep(0.1)
+                continue
+            # Picamera2 dual stream: the lores image of the same request feeds the model
+            inference = self.camera.last_lores if getattr(self.camera, "dual_stream", False) is True else None
+            self.consecutive_failures = 0
+            self.last_frame_at = time.monotonic()
+            if self.outage_started is not None:
+                self._end_outage()
+            self._capture_seconds.observe(time.perf_counter() - started)
+            self._captured_total.inc()
+
+            with self.frame_ready:
+                # Published by reference: readers get a read-only view, never a copy
+                self.frame_seq += 1
+                self.current_frame = Frame.wrap(frame, self.frame_seq, time.time(), inference=inference)
+                self.frames_captured += 1
+                self.frame_ready.notify_all()
+            if self.on_frame is not None:
+                self.on_frame(self)
+            if self._listeners:
+                self._publish("raw")
+
+    # Watchdog ------------------------------------------------------------------------
+
+    def outage_seconds(self) -> float:
+        started = self.outage_started
+        return time.monotonic() - started if started is not None else 0.0
+
+    def check_health(self, stop_event: threading.Event, now: Optional[float] = None) -> bool:
+        """Called periodically by the service watchdog; reconnects a stalled camera.
+
+        Covers drivers that block inside ``read()`` forever, which the capture
+        loop itself cannot notice. Returns True when a reconnect was started.
+        """
+        if not self.supervised or self.reconnecting or self.consumer_paced:
+            return False
+        last_frame_at = self.last_frame_at
+        if last_frame_at is None:
+            return False
+        age = (now if now is not None else time.monotonic()) - last_frame_at
+        if age < self.config.camera_stall_timeout:
+            return False
+        return self.begin_reconnect(stop_event, f"no frame for {age:.1f}s")
+
+    def begin_reconnect(self, stop_event: threading.Event, reason: str) -> bool:
+        """Retires the capture thread and re-initializes the camera in the background."""
+        with self._health_lock:
+            if self.reconnecting or stop_event.is_set():
+                return False
+            self.reconnecting = True
+            self._generation += 1
+            if self.outage_started is None:
+                self.outage_started = time.monotonic()
+                self.outages += 1
+                self._outages_total.inc()
+            self.outage_reason = reason
+        logger.warning("Камера %s: %s, переподключение...", self.camera_id, reason)
+        self.reconnect_thread = threading.Thread(
+            target=self._reconnect_loop,
+            args=(stop_event,),
+            name=f"camera-reconnect-{self.camera_id}",
+            daemon=True,
+        )
+        self.reconnect_thread.start()
+        return True
+
+    def _reconnect_loop(self, stop_event: threading.Event) -> None:
+        delay = RECONNECT_INITIAL_DELAY
+        attempt = 0
+        try:
+            while not stop_event.is_set():
+                attempt += 1
+                try:
+                    # Releasing the device also unblocks a capture thread stuck in read()
+                    self.camera.shutdown()
+                except Exception as exc:
+                    logger.debug("Ошибка освобождения камеры %s: %s", self.camera_id, exc)
+                try:
+                    self.camera.start()
+                except Exception as exc:
+                    logger.warning(
+                        "Камера %s: попытка переподключения %d не удалась (%s), повтор через %.1f с",
+                        self.camera_id, attempt, exc, delay,
+                    )
+                    if stop_event.wait(delay):
+                        return
+                    delay = min(delay * 2, self.config.camera_reconnect_max_backoff)
+                    continue
+                self.reconnects += 1
+                self._reconnects_total.inc()
+                self.consecutive_failures = 0
+                logger.info("Камера %s переподключена (попытка %d): %s", self.camera_id, attempt, self.camera_type)
+                self.reconnecting = False
+                self._start_capture_thread(stop_event, self._generation)
+                return
+        finally:
+            self.reconnecting = False
+
+    def _end_outage(self) -> None:
+        with self._health_lock:
+            if self.outage_started is None:
+                return
+            duration = time.monotonic() - self.outage_started
+            self.outage_started = None
+            self.last_outage_seconds = round(duration, 3)
+            self.total_outage_seconds += duration
+        logger.info("Камера %s: кадры снова поступают, простой %.1f с", self.camera_id, duration)
+
+    def health_payload(self) -> dict:
+        if self.reconnecting:
+            state = "reconnecting"
+        elif self.outage_started is not None:
+            state = "outage"
+        elif self.camera_type is None:
+            state = "unavailable"
+        else:
+            state = "ok"
+        last_frame_at = self.last_frame_at
+        return {
+            "state": state,
+            "reason": self.outage_reason,
+            "outages": self.outages,
+            "reconnects": self.reconnects,
+            "outage_seconds": round(self.outage_seconds(), 3),
+            "last_outage_seconds": self.last_outage_seconds,
+            "total_outage_seconds": round(self.total_outage_seconds, 3),
+            "last_frame_age": round(time.monotonic() - last_frame_at, 3) if last_frame_at is not None else None,
+        }
+
+    # Output --------------------------------------------------------------------------
+
+    def capture_raw_jpeg(self) -> Optional[bytes]:
+        """JPEG of the newest raw frame, encoded once per frame and shared by all viewers."""
+        seq, frame, captured_at = self.latest_frame_timestamped()
+        if frame is None:
+            return None
+        if seq == self._raw_jpeg_seq:
+            return self._raw_jpeg
+        # Request or executor thread: on the encode CPUs only while encoding
+        affinity = self.cpu_layout.pinned("encode") if self.cpu_layout is not None else nullcontext()
+        with self._encode_seconds.time(), affinity:
+            data = encode_jpeg(frame, quality=self.jpeg_quality)
+        if data is None:
+            return None
+        with self.frame_lock:
+            if seq > self._raw_jpeg_seq:
+                self._raw_jpeg = data
+                self._raw_jpeg_seq = seq
+                self._raw_jpeg_timestamp = captured_at
+        return data
+
+    def cached_raw_jpeg(self) -> Optional[bytes]:
+        """The shared raw JPEG if it is still the newest frame, without encoding."""
+        with self.frame_lock:
+            return self._raw_jpeg if self._raw_jpeg_seq == self.frame_seq else None
+
+    def shared_raw_jpeg(self) -> Tuple[int, Optional[bytes], Optional[float]]:
+        """``(seq, jpeg, captured_at)`` of the raw JPEG last encoded for viewers, never encoding."""
+        with self.frame_lock:
+            return self._raw_jpeg_seq, self._raw_jpeg, self._raw_jpeg_timestamp
+
+    @property
+    def raw_jpeg_timestamp(self) -> Optional[float]:
+        """Capture time of the frame behind the latest ``capture_raw_jpeg`` result."""
+        return self._raw_jpeg_timestamp
+
+    def capture_annotated_jpeg(self) -> Optional[bytes]:
+        with self.frame_lock:
+            return self.last_annotated_frame
+
+    def set_annotated_jpeg(self, data: bytes, captured_at: Optional[float] = None) -> None:
+        with self.frame_lock:
+            self.last_annotated_frame = data
+            self.annotated_timestamp = captured_at
+        if self._listeners:
+            self._publish("annotated")
+
+    def shutdown(self) -> None:
+        self.camera.shutdown()
+        if self.detection_log is not None:
+            self.detection_log.close()
@@ -0,0 +1,10 @@
+"""Event clip recording modules"""
+from .avi import MjpegAviWriter, jpeg_size
+from .clips import ClipRecorder, JpegRing
+
+__all__ = [
+    'ClipRecorder',
+    'JpegRing',
+    'MjpegAviWriter',
+    'jpeg_size',
+]
@@ -0,0 +1,112 @@
+"""Minimal MJPEG AVI writer that stores already-encoded JPEG frames as they are.
+
+``cv2.VideoWriter`` only accepts raw frames and would decode and re-encode
+every JPEG; this writer appends the bytes the streams produced into an
+OpenAVI 1.0 RIFF container (one ``MJPG`` video stream plus an ``idx1``
+index). The headers are patched with the real frame count and rate on close.
+"""
+from __future__ import annotations
+
+import struct
+from pathlib import Path
+from typing import BinaryIO, List, Optional, Tuple
+
+AVIF_HASINDEX = 0x10
+AVIIF_KEYFRAME = 0x10
+_AVIH = struct.Struct('<10I16x')
+_STRH = struct.Struct('<4s4sIHHIIIIIIIIhhhh')
+_STRF = struct.Struct('<IiiHH4sIiiII')
+# Start-of-frame markers that carry the image size (baseline, extended, progressive, lossless)
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def jpeg_size(data: bytes) -> Optional[Tuple[int, int]]:
+    """``(width, height)`` from the SOF segment of a JPEG, without decoding it."""
+    if len(data) < 4 or data[0] != 0xFF or data[1] != 0xD8:
+        return None
+    position = 2
+    while position + 9 <= len(data):
+        if data[position] != 0xFF:
+            return None
+        marker = data[position + 1]
+        if marker == 0xFF:
+            position += 1
+            continue
+        length = struct.unpack_from('>H', data, position + 2)[0]
+        if marker in _SOF_MARKERS:
+            height, width = struct.unpack_from('>HH', data, position + 5)
+            return width, height
+        position += 2 + length
+    return None
+
+
+class MjpegAviWriter:
+    """Writes JPEG frames into ``path``; call ``close()`` to finalize headers and index."""
+
+    def __init__(self, path: Path, fps: float = 10.0):
+        self.path = Path(path)
+        self.fps = fps
+        self.frames = 0
+        self.size: Optional[Tuple[int, int]] = None
+        self._max_frame = 0
+        self._index: List[Tuple[int, int]] = []
+        self._fh: Optional[BinaryIO] = self.path.open('wb')
+        self._write_headers(0, 0)
+        self._movi_start = self._fh.tell()
+        self._fh.write(b'LIST\0\0\0\0movi')
+
+    def _write_headers(self, width: int, height: int) -> None:
+        fh = self._fh
+        rate = max(int(round(self.fps * 1000)), 1)
+        fh.write(b'RIFF\0\0\0\0AVI ')
+        strl = (
+            b'strh' + struct.pack('<I', _STRH.size)
+            + _STRH.pack(b'vids', b'MJPG', 0, 0, 0, 0, 1000, rate, 0, self.frames, self._max_frame,
+                         0xFFFFFFFF, 0, 0, 0, width, height)
+            + b'strf' + struct.pack('<I', _STRF.size)
+            + _STRF.pack(_STRF.size, width, height, 1, 24, b'MJPG', width * height * 3, 0, 0, 0, 0)
+        )
+        hdrl = (
+            b'avih' + struct.pack('<I', _AVIH.size)
+            + _AVIH.pack(int(1_000_000 / max(self.fps, 0.001)), 0, 0, AVIF_HASINDEX, self.frames, 0, 1,
+                         self._max_frame, width, height)
+            + b'LIST' + struct.pack('<I', len(strl) + 4) + b'strl' + strl
+        )
+        fh.write(b'LIST' + struct.pack('<I', len(hdrl) + 4) + b'hdrl' + hdrl)
+
+    def write(self, jpeg: bytes) -> None:
+        if self._fh is None:
+            raise ValueError('Writer is closed')
+        if self.size is None:
+            self.size = jpeg_size(jpeg)
+        # idx1 offsets are relative to the 'movi' fourcc
+        self._index.append((self._fh.tell() - (self._movi_start + 8), len(jpeg)))
+        self._fh.write(b'00dc' + struct.pack('<I', len(jpeg)))
+        self._fh.write(jpeg)
+        if len(jpeg) % 2:
+            self._fh.write(b'\0')
+        self.frames += 1
+        self._max_frame = max(self._max_frame, len(jpeg))
+
+    def close(self, fps: Optional[float] = None) -> int:
+        """Writes the index and the final headers; returns the file size."""
+        if self._fh is None:
+            return self.path.stat().st_size
+        if fps is not None and fps > 0:
+            self.fps = fps
+        fh = self._fh
+        movi_end = fh.tell()
+        fh.write(b'idx1' + struct.pack('<I', 16 * len(self._index)))
+        fh.write(b''.join(struct.pack('<4sIII', b'00dc', AVIIF_KEYFRAME, offset, length)
+                          for offset, length in self._index))
+        file_size = fh.tell()
+        fh.seek(self._movi_start + 4)
+        fh.write(struct.pack('<I', movi_end - self._movi_start - 8))
+        fh.seek(0)
+        width, height = self.size or (0, 0)
+        self._write_headers(width, height)
+        fh.seek(4)
+        fh.write(struct.pack('<I', file_size - 8))
+        fh.close()
+        self._fh = None
+        return file_size
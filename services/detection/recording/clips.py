@@ -0,0 +1,358 @@
+"""Event clips: pre-roll ring buffers of encoded JPEGs and a background clip writer.
+
+Every camera keeps its last few seconds of JPEG frames (the bytes the
+annotated stream already produced) in one preallocated byte arena. A trigger
+(a new track with a watched label, or the operator selecting a target) marks a
+time window; the writer thread copies pre-roll plus post-roll frames out of
+the ring into an MJPEG AVI, so the detection loop only pays for a memcpy and a
+dict lookup. Finished clips are rotated oldest-first to stay under the disk cap.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Deque, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from ..monitoring.metrics import MetricsRegistry
+from .avi import MjpegAviWriter
+
+logger = logging.getLogger(__name__)
+
+CLIP_SOURCES = ("annotated", "raw")
+# Track ids remembered per camera to tell new tracks from old ones
+SEEN_TRACKS_LIMIT = 1024
+# Writer thread poll interval while a clip is recording
+WRITER_INTERVAL = 0.25
+_UNSAFE_NAME = re.compile(r"[^A-Za-z0-9_.-]+")
+
+
+class JpegRing:
+    """Fixed-size arena of JPEG frames; the oldest frames are overwritten first.
+
+    Frames are stored contiguously. A frame that does not fit before the end
+    of the arena wraps to offset 0, dropping whatever it overlaps (and the few
+    frames left in the unused tail). Nothing is allocated after construction.
+    """
+
+    def __init__(self, capacity_bytes: int, max_frames: Optional[int] = None):
+        if capacity_bytes <= 0:
+            raise ValueError("capacity_bytes must be positive")
+        self.capacity = int(capacity_bytes)
+        self.max_frames = max_frames
+        self._arena = bytearray(self.capacity)
+        # (seq, timestamp, offset, length), oldest first
+        self._entries: Deque[Tuple[int, float, int, int]] = deque()
+        self._write = 0
+        self._seq = 0
+        self._used = 0
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def append(self, data: bytes, timestamp: float) -> Optional[int]:
+        """Stores one frame; returns its sequence number (None if it can never fit)."""
+        size = len(data)
+        if size == 0 or size > self.capacity:
+            self.dropped += 1
+            return None
+        with self._lock:
+            entries = self._entries
+            start = self._write
+            if start + size > self.capacity:
+                start = 0
+                # Frames left in the tail belong to the previous lap and are the oldest ones
+                while entries and entries[0][2] >= self._write:
+                    self._used -= entries.popleft()[3]
+            while entries and entries[0][2] < start + size and entries[0][2] + entries[0][3] > start:
+                self._used -= entries.popleft()[3]
+            while self.max_frames and len(entries) >= self.max_frames:
+                self._used -= entries.popleft()[3]
+            self._arena[start:start + size] = data
+            self._seq += 1
+            entries.append((self._seq, timestamp, start, size))
+            self._write = start + size
+            self._used += size
+            return self._seq
+
+    def frames(self, after_seq: int = 0, since: Optional[float] = None,
+               until: Optional[float] = None) -> List[Tuple[int, float, bytes]]:
+        """Copies of the stored frames newer than ``after_seq`` within ``[since, until]``."""
+        with self._lock:
+            return [
+                (seq, timestamp, bytes(self._arena[offset:offset + length]))
+                for seq, timestamp, offset, length in self._entries
+                if seq > after_seq
+                and (since is None or timestamp >= since)
+                and (until is None or timestamp <= until)
+            ]
+
+    def stats(self) -> dict:
+        with self._lock:
+            span = self._entries[-1][1] - self._entries[0][1] if len(self._entries) > 1 else 0.0
+            return {
+                "frames": len(self._entries),
+                "bytes": self._used,
+                "capacity_bytes": self.capacity,
+                "seconds": round(span, 3),
+                "dropped": self.dropped,
+            }
+
+
+@dataclass
+class _ClipJob:
+    camera_id: str
+    reason: str
+    start: float
+    end: float
+    limit: float
+    path: Optional[Path] = None
+    writer: Optional[MjpegAviWriter] = None
+    last_seq: int = 0
+    first_ts: Optional[float] = None
+    last_ts: Optional[float] = None
+    triggers: List[str] = field(default_factory=list)
+
+
+class ClipRecorder:
+    """Per-camera pre-roll rings plus the thread that turns triggers into AVI clips."""
+
+    def __init__(
+        self,
+        directory: Path,
+        metrics: MetricsRegistry,
+        labels: Sequence[str] = (),
+        pre_roll: float = 5.0,
+        post_roll: float = 10.0,
+        max_seconds: float = 60.0,
+        max_disk_bytes: int = 1024 * 1024 * 1024,
+        buffer_bytes: int = 32 * 1024 * 1024,
+        source: str = "annotated",
+    ):
+        if source not in CLIP_SOURCES:
+            raise ValueError(f"source must be one of {CLIP_SOURCES}")
+        self.directory = Path(directory)
+        self.metrics = metrics
+        self.labels = {label.strip().lower() for label in labels if label.strip()}
+        self.pre_roll = max(0.0, pre_roll)
+        self.post_roll = max(0.0, post_roll)
+        self.max_seconds = max(max_seconds, self.pre_roll + self.post_roll)
+        self.max_disk_bytes = max_disk_bytes
+        self.buffer_bytes = buffer_bytes
+        self.source = source
+        self._rings: Dict[str, JpegRing] = {}
+        self._raw_seq: Dict[str, int] = {}
+        self._seen: Dict[str, "OrderedDict[int, None]"] = {}
+        self._jobs: Dict[str, _ClipJob] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.last_clip: Optional[str] = None
+        self._clips_total = metrics.counter("clips_written_total", "Event clips written to disk")
+        self._frames_total = metrics.counter("clip_frames_written_total", "Frames written into event clips")
+        self._write_seconds = metrics.histogram("clip_write_seconds", "Time to flush pending frames into a clip")
+
+    # Buffering -----------------------------------------------------------------------
+
+    def attach(self, pipeline) -> None:
+        """Buffers the pipeline's encoded frames from now on."""
+        with self._lock:
+            self._rings.setdefault(pipeline.camera_id, JpegRing(self.buffer_bytes))
+        pipeline.add_listener(self._on_pipeline_frame)
+
+    def detach(self, pipeline) -> None:
+        pipeline.remove_listener(self._on_pipeline_frame)
+
+    def _on_pipeline_frame(self, pipeline, kind: str) -> None:
+        ring = self._rings.get(pipeline.camera_id)
+        if ring is None or kind != self.source:
+            return
+        if kind == "annotated":
+            data, timestamp = pipeline.last_annotated_frame, pipeline.annotated_timestamp
+        else:
+            # Only frames a raw viewer already had encoded; recording never encodes on its own
+            seq, data, timestamp = pipeline.shared_raw_jpeg()
+            if data is None or seq == self._raw_seq.get(pipeline.camera_id):
+                return
+            self._raw_seq[pipeline.camera_id] = seq
+        if data:
+            ring.append(data, timestamp if timestamp is not None else time.time())
+
+    # Triggers ------------------------------------------------------------------------
+
+    def observe(self, camera_id: str, tracked: Iterable[dict], timestamp: Optional[float] = None) -> None:
+        """Triggers a clip for every track id seen for the first time with a watched label."""
+        seen = self._seen.setdefault(camera_id, OrderedDict())
+        reason = None
+        for track in tracked:
+            track_id = track.get("trackId")
+            if track_id is None or track_id in seen:
+                continue
+            seen[track_id] = None
+            if len(seen) > SEEN_TRACKS_LIMIT:
+                seen.popitem(last=False)
+            label = str(track.get("label") or "").lower()
+            if not self.labels or label in self.labels:
+                reason = reason or f"track{track_id}_{label or 'object'}"
+        if reason is not None:
+            self.trigger(camera_id, reason, timestamp)
+
+    def trigger(self, camera_id: str, reason: str, timestamp: Optional[float] = None) -> bool:
+        """Starts a clip around ``timestamp`` or extends the running one; False if untracked camera."""
+        if camera_id not in self._rings:
+            return False
+        now = timestamp if timestamp is not None else time.time()
+        with self._lock:
+            job = self._jobs.get(camera_id)
+            if job is None:
+                start = now - self.pre_roll
+                job = self._jobs[camera_id] = _ClipJob(
+                    camera_id, reason, start, now + self.post_roll, start + self.max_seconds
+                )
+                logger.info("Запись клипа камеры %s: %s", camera_id, reason)
+            else:
+                job.end = min(max(job.end, now + self.post_roll), job.limit)
+            job.triggers.append(reason)
+        self.metrics.counter("clip_triggers_total", "Event clip triggers", camera=camera_id).inc()
+        self._wake.set()
+        return True
+
+    # Writer thread -------------------------------------------------------------------
+
+    def start(self) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.rotate()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._writer_loop, name="clip-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 3.0) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=timeout)
+
+    def _writer_loop(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(WRITER_INTERVAL)
+            self._wake.clear()
+            self.flush()
+        # Clips in progress keep what was buffered so far
+        self.flush(force=True)
+
+    def flush(self, now: Optional[float] = None, force: bool = False) -> int:
+        """Writes pending frames of every job and finishes the ones past their end; returns clips finished."""
+        now = now if now is not None else time.time()
+        with self._lock:
+            jobs = list(self._jobs.values())
+        finished = 0
+        for job in jobs:
+            try:
+                with self._write_seconds.time():
+                    self._write_pending(job)
+            except OSError as exc:
+                logger.warning("Ошибка записи клипа камеры %s: %s", job.camera_id, exc)
+                self._abort(job)
+                continue
+            if force or now >= job.end:
+                with self._lock:
+                    if not force and now < job.end:
+                        continue  # extended meanwhile
+                    self._jobs.pop(job.camera_id, None)
+                if self._finish(job):
+                    finished += 1
+        return finished
+
+    def _write_pending(self, job: _ClipJob) -> None:
+        frames = self._rings[job.camera_id].frames(after_seq=job.last_seq, since=job.start, until=job.end)
+        if not frames:
+            return
+        if job.writer is None:
+            stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(frames[0][1]))
+            name = _UNSAFE_NAME.sub("_", f"{job.camera_id}_{stamp}_{job.reason}")
+            job.path = self.directory / f"{name}.avi"
+            job.writer = MjpegAviWriter(job.path.with_name(job.path.name + ".part"))
+            job.first_ts = frames[0][1]
+        for seq, timestamp, data in frames:
+            job.writer.write(data)
+            job.last_seq, job.last_ts = seq, timestamp
+        self._frames_total.inc(len(frames))
+
+    def _finish(self, job: _ClipJob) -> bool:
+        if job.writer is None:
+            logger.info("Клип камеры %s пропущен: нет кадров в буфере", job.camera_id)
+            return False
+        span = (job.last_ts or 0.0) - (job.first_ts or 0.0)
+        fps = (job.writer.frames - 1) / span if job.writer.frames > 1 and span > 0 else None
+        try:
+            size = job.writer.close(fps)
+            os.replace(job.writer.path, job.path)
+        except OSError as exc:
+            logger.warning("Не удалось завершить клип %s: %s", job.path, exc)
+            return False
+        self.last_clip = job.path.name
+        self._clips_total.inc()
+        logger.info("Клип сохранен: %s (%d кадров, %.1f с, %d байт)", job.path.name, job.writer.frames, span, size)
+        self.rotate(keep=job.path)
+        return True
+
+    def _abort(self, job: _ClipJob) -> None:
+        with self._lock:
+            self._jobs.pop(job.camera_id, None)
+        if job.writer is not None:
+            try:
+                job.writer.close()
+                job.writer.path.unlink()
+            except OSError:
+                pass
+
+    def rotate(self, keep: Optional[Path] = None) -> int:
+        """Deletes the oldest clips while the directory exceeds ``max_disk_bytes``; returns how many."""
+        try:
+            clips = sorted(
+                (entry.stat().st_mtime, entry.stat().st_size, entry)
+                for entry in self.directory.glob("*.avi") if entry.is_file()
+            )
+        except OSError:
+            return 0
+        total = sum(size for _, size, _ in clips)
+        removed = 0
+        for _, size, path in clips:
+            if total <= self.max_disk_bytes:
+                break
+            if keep is not None and path == keep:
+                continue
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+            logger.info("Старый клип удален: %s", path.name)
+        return removed
+
+    def disk_usage(self) -> int:
+        try:
+            return sum(entry.stat().st_size for entry in self.directory.glob("*.avi") if entry.is_file())
+        except OSError:
+            return 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            recording = {camera_id: job.reason for camera_id, job in self._jobs.items()}
+        return {
+            "directory": str(self.directory),
+            "source": self.source,
+            "labels": sorted(self.labels),
+            "recording": recording,
+            "clips_written": int(self._clips_total.value),
+            "last_clip": self.last_clip,
+            "disk_bytes": self.disk_usage(),
+            "max_disk_bytes": self.max_disk_bytes,
+            "buffers": {camera_id: ring.stats() for camera_id, ring in self._rings.items()},
+        }
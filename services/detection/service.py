@@ -4,21 +4,47 @@ from __future__ import annotations
 import logging
 import threading
 import time
-from typing import Optional
+from dataclasses import replace
+from pathlib import Path
+from typing import Callable, Dict, Mapping, Optional, Tuple
 
 import numpy as np
 
 from .camera.manager import CameraInitializationError, CameraManager
 from .camera.servo_controller import ServoController
 from .config.runtime import RuntimeConfig
-from .detection.inference import InferenceEngine
+from .detection.autotune import InputSizeTuner, fit_input_size, model_key, resolve_cache_path
+from .detection.inference import InferenceEngine, scale_detections
+from .ipc.frame_bus import FrameBus
 from .models.manager import ModelManager
+from .monitoring.cpu_layout import CpuLayout
+from .monitoring.governor import PerformanceGovernor, PerformanceProfile, build_profiles
+from .monitoring.metrics import Histogram, MetricsRegistry, RateMeter, process_rss_bytes
+from .monitoring.profiler import (
+    ThreadProfileHook,
+    dump_thread_stacks,
+    format_collapsed,
+    format_pstats,
+    format_thread_stacks,
+    sample_stacks,
+)
+from .pipeline import CameraPipeline
+from .recording.clips import ClipRecorder
+from .streaming.jpeg import JpegEncoder, JpegSettings, build_encoder, encode_jpeg, set_encoder
+from .streaming.variants import StreamVariantHub, build_variants
+from .tracking.detection_log import DetectionLogWriter
+from .tracking.events import TrackEventPusher
+from .tracking.heatmap import DetectionHeatmap, parse_heatmap_query
+from .tracking.history import TrackHistoryStore, parse_history_query
+from .tracking.trajectories import TrajectoryStore, parse_trajectory_query
 from .tracking.sort_tracker import SortTracker
 from .tracking.trackers import (
     crop_frame_for_tracker,
     get_active_trackers,
     get_tracker_by_id,
+    get_tracker_cache_stats,
     get_tracker_frames,
+    get_tracker_last_crop,
     update_tracker_cache,
 )
 
@@ -26,62 +52,274 @@ logger = logging.getLogger(__name__)
 
 
 class DetectionService:
-    """Coordinates camera capture, inference and tracker state."""
+    """Coordinates camera capture, inference and tracker state.
+
+    Every configured camera gets a ``CameraPipeline`` (capture thread, tracker,
+    latest frames); a single detection thread batches the newest frame of each
+    camera into one model call. The first pipeline is the primary camera that
+    backs the legacy single-camera API and the servo.
+    """
 
     def __init__(self, config: RuntimeConfig):
         self.config = config
-        self.camera = CameraManager(config)
         self.model_lock = threading.RLock()
-        self.tracker_lock = threading.RLock()
-        self.frame_lock = threading.Lock()
         self.stop_event = threading.Event()
+        # Set by capture threads whenever any camera publishes a frame
+        self.frame_event = threading.Event()
+        self.metrics = MetricsRegistry()
+        self.detection_rate = RateMeter()
+        # cProfile sessions on the detection thread, idle unless requested
+        self.detection_profile_hook = ThreadProfileHook()
+        self._stage_histograms: Dict[tuple, Histogram] = {}
+        self._register_metrics()
+
+        # One encoder for streams, the annotated frame and tracker crops; module-level callers share it
+        self.jpeg_encoder: JpegEncoder = self._build_jpeg_encoder()
+        set_encoder(self.jpeg_encoder)
+
+        self.pipelines: Dict[str, CameraPipeline] = self._build_pipelines()
+        self.primary: CameraPipeline = next(iter(self.pipelines.values()))
+        # Scaled / re-encoded MJPEG variants, shared by their viewers
+        self.stream_variants = StreamVariantHub(
+            build_variants(config.stream_variants, config.jpeg_quality),
+            self.metrics,
+            native_quality=config.jpeg_quality,
+            idle_seconds=config.stream_variant_idle_seconds,
+        )
+        self.clip_recorder: Optional[ClipRecorder] = self._build_clip_recorder()
+        # Raw frames and detections in shared memory for co-located processes
+        self.frame_bus: Optional[FrameBus] = (
+            FrameBus(config.frame_bus, slots=config.frame_bus_slots) if config.frame_bus else None
+        )
+        # Track lifecycle events pushed to the backend instead of it polling /api/trackers
+        self.track_events: Optional[TrackEventPusher] = (
+            TrackEventPusher(
+                config.events_url,
+                self.metrics,
+                queue_size=config.events_queue_size,
+                batch_size=config.events_batch_size,
+                flush_interval=config.events_flush_interval,
+            )
+            if config.events_url
+            else None
+        )
+        self.history: Optional[TrackHistoryStore] = self._build_history()
+        self.trajectories: Optional[TrajectoryStore] = (
+            TrajectoryStore(
+                self.metrics,
+                max_points=config.trajectory_points,
+                tolerance=config.trajectory_tolerance,
+                max_tracks=config.trajectory_tracks,
+            )
+            if config.trajectory_points > 0
+            else None
+        )
+        self.heatmap: Optional[DetectionHeatmap] = (
+            DetectionHeatmap(
+                self.metrics,
+                grid_size=config.heatmap_grid,
+                half_life=config.heatmap_half_life,
+                path=Path(config.heatmap_path).expanduser() if config.heatmap_path else None,
+                save_interval=config.heatmap_save_interval,
+            )
+            if config.heatmap_grid
+            else None
+        )
+
+        # Thread-pool sizes and per-role CPU sets; pipelines pin their capture and encode threads
+        self.cpu_layout = CpuLayout.from_config(config)
+        for pipeline in self.pipelines.values():
+            pipeline.cpu_layout = self.cpu_layout
+
+        # Effective detection rate and annotated JPEG quality; the governor lowers them under heat/load
+        self.infer_fps = config.infer_fps
+        self.jpeg_quality = config.jpeg_quality
+        self.governor: Optional[PerformanceGovernor] = self._build_governor()
+        # Model input size (width, height): INFER_SIZE until the autotuner picks one; the governor caps it
+        self.input_size: Optional[Tuple[int, int]] = config.infer_size
+        self.input_tuner = InputSizeTuner(
+            config.autotune_sizes,
+            config.autotune_budget_ms,
+            runs=config.autotune_runs,
+            cache_path=resolve_cache_path(config.autotune_cache),
+        )
+        # Held by the detection loop around model calls and by the tuner while it measures
+        self.inference_gate = threading.Lock()
+        # Re-tune after a model switch, off the request thread
+        self.autotune_thread: Optional[threading.Thread] = None
+        self.autotune_error: Optional[str] = None
 
         self.model_manager: Optional[ModelManager] = None
-        self.tracker: Optional[SortTracker] = None
         self.inference_engine: Optional[InferenceEngine] = None
         self.detection_thread: Optional[threading.Thread] = None
+        self.watchdog_thread: Optional[threading.Thread] = None
+        # Bumped to retire a wedged detection thread; the heartbeat is refreshed every iteration
+        self._detection_generation = 0
+        self._detection_heartbeat: Optional[float] = None
+        self.detection_restarts = 0
+        self.model_thread: Optional[threading.Thread] = None
+        self.model_loading = False
+        # Set once background model loading finished, successfully or not
+        self.models_loaded = threading.Event()
+
+        # Seconds since start() for each startup milestone
+        self._started_at: Optional[float] = None
+        self.startup_timings: Dict[str, float] = {}
 
-        self.last_raw_frame: Optional[np.ndarray] = None
-        self.last_annotated_frame: Optional[bytes] = None
         self.servo = ServoController()
         self.target_track_id: Optional[int] = None
 
     # Lifecycle -----------------------------------------------------------------------
 
     def start(self) -> None:
-        """Start camera and detection thread."""
-        try:
-            self.camera.start()
-            logger.info("Камера инициализирована: %s", self.camera.camera_type)
-        except CameraInitializationError:
-            logger.warning("Камера не инициализирована. Видео поток будет недоступен.")
+        """Start cameras and capture threads; the model loads in the background.
 
-        self._init_models()
-        if self.inference_engine:
-            self.detection_thread = threading.Thread(target=self._detection_loop, name="detection-loop", daemon=True)
-            self.detection_thread.start()
+        The detection thread starts once the model is loaded and warmed up, so the
+        HTTP server can bind and serve ``/health`` and raw streams right away.
+        """
+        self._started_at = time.monotonic()
+        for pipeline in self.pipelines.values():
+            try:
+                pipeline.camera.start()
+                logger.info("Камера %s инициализирована: %s", pipeline.camera_id, pipeline.camera_type)
+            except CameraInitializationError:
+                logger.warning("Камера %s не инициализирована. Видео поток будет недоступен.", pipeline.camera_id)
+            pipeline.on_frame = self._on_frame
+            if self.clip_recorder is not None:
+                self.clip_recorder.attach(pipeline)
+            if self.frame_bus is not None:
+                self.frame_bus.attach(pipeline)
+            pipeline.start_capture(self.stop_event)
+        self._mark_startup("cameras_started")
+        if self.clip_recorder is not None:
+            self.clip_recorder.start()
+        if self.track_events is not None:
+            self.track_events.start()
+        if self.history is not None:
+            self.history.start()
+        if self.heatmap is not None:
+            self.heatmap.start()
+        if self.governor is not None:
+            self.governor.start()
+
+        if self.config.watchdog_interval > 0:
+            self.watchdog_thread = threading.Thread(target=self._watchdog_loop, name="watchdog", daemon=True)
+            self.watchdog_thread.start()
+
+        self.model_loading = True
+        self.model_thread = threading.Thread(target=self._load_models, name="model-loader", daemon=True)
+        self.model_thread.start()
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """Blocks until background model loading finished; returns ``ready``."""
+        self.models_loaded.wait(timeout)
+        return self.ready
+
+    @property
+    def ready(self) -> bool:
+        """Model loaded, warmed up and the detection thread running."""
+        return (
+            not self.model_loading
+            and self.detection_thread is not None
+            and self.detection_thread.is_alive()
+        )
 
     def stop(self) -> None:
         """Stop threads and release resources."""
         self.stop_event.set()
+        self.frame_event.set()
+        if self.model_thread and self.model_thread.is_alive():
+            self.model_thread.join(timeout=3)
+        if self.watchdog_thread and self.watchdog_thread.is_alive():
+            self.watchdog_thread.join(timeout=3)
         if self.detection_thread and self.detection_thread.is_alive():
             self.detection_thread.join(timeout=3)
-        self.camera.shutdown()
+        for pipeline in self.pipelines.values():
+            pipeline.join(timeout=1)
+            pipeline.shutdown()
+        if self.clip_recorder is not None:
+            self.clip_recorder.stop()
+        if self.frame_bus is not None:
+            self.frame_bus.close()
+        if self.track_events is not None:
+            self.track_events.stop()
+        if self.history is not None:
+            self.history.stop()
+        if self.heatmap is not None:
+            self.heatmap.stop()
+        if self.governor is not None:
+            self.governor.stop()
 
     # Properties ----------------------------------------------------------------------
 
+    @property
+    def camera(self) -> CameraManager:
+        return self.primary.camera
+
     @property
     def camera_type(self) -> Optional[str]:
-        return self.camera.camera_type
+        return self.primary.camera_type
+
+    @property
+    def tracker(self) -> Optional[SortTracker]:
+        return self.primary.tracker
+
+    @tracker.setter
+    def tracker(self, value: Optional[SortTracker]) -> None:
+        self.primary.tracker = value
+
+    @property
+    def tracker_lock(self) -> threading.RLock:
+        return self.primary.tracker_lock
+
+    @property
+    def frame_lock(self) -> threading.Lock:
+        return self.primary.frame_lock
+
+    @property
+    def last_raw_frame(self) -> Optional[np.ndarray]:
+        return self.primary.last_raw_frame
+
+    @property
+    def last_annotated_frame(self) -> Optional[bytes]:
+        return self.primary.last_annotated_frame
 
     # Public API ----------------------------------------------------------------------
 
-    def capture_raw_jpeg(self) -> Optional[bytes]:
-        return self.camera.capture_jpeg()
+    def get_pipeline(self, camera_id: Optional[str] = None) -> Optional[CameraPipeline]:
+        if camera_id is None:
+            return self.primary
+        return self.pipelines.get(str(camera_id))
+
+    def capture_raw_jpeg(self, camera_id: Optional[str] = None) -> Optional[bytes]:
+        pipeline = self.get_pipeline(camera_id)
+        return pipeline.capture_raw_jpeg() if pipeline else None
+
+    def capture_annotated_jpeg(self, camera_id: Optional[str] = None) -> Optional[bytes]:
+        pipeline = self.get_pipeline(camera_id)
+        return pipeline.capture_annotated_jpeg() if pipeline else None
+
+    def stream_timestamp(self, camera_id: Optional[str] = None, annotated: bool = False) -> Optional[float]:
+        """Capture time of the frame currently served on the raw or annotated stream."""
+        pipeline = self.get_pipeline(camera_id)
+        if pipeline is None:
+            return None
+        return pipeline.annotated_timestamp if annotated else pipeline.raw_jpeg_timestamp
+
+    def get_ready_payload(self) -> dict:
+        return {
+            "ready": self.ready,
+            "model_loading": self.model_loading,
+            "active_model": self.model_manager.get_active_model() if self.model_manager else None,
+            "startup": dict(self.startup_timings),
+        }
 
-    def capture_annotated_jpeg(self) -> Optional[bytes]:
-        with self.frame_lock:
-            return self.last_annotated_frame
+    def processed_version(self, camera_id: Optional[str] = None) -> tuple:
+        """Changes whenever detection finished a frame of the camera (or of any camera)."""
+        if camera_id is not None:
+            pipeline = self.get_pipeline(camera_id)
+            return (pipeline.processed_seq,) if pipeline else ()
+        return tuple(pipeline.processed_seq for pipeline in self.pipelines.values())
 
     def get_status_payload(self) -> dict:
         detection_enabled = self.inference_engine is not None
@@ -95,13 +333,30 @@ class DetectionService:
             "camera_available": self.camera_type is not None,
             "camera_type": self.camera_type,
             "model_loaded": model_loaded,
+            "model_loading": self.model_loading,
+            "ready": self.ready,
+            "startup": dict(self.startup_timings),
             "active_model": self.model_manager.get_active_model() if self.model_manager else None,
             "tracker_active": tracker_active,
             "detection_thread_running": detection_thread_running,
+            "detection_restarts": self.detection_restarts,
             "confidence_threshold": self.config.confidence_threshold,
-            "infer_fps": self.config.infer_fps,
+            "infer_fps": self.infer_fps,
             "target_track_id": self.target_track_id,
             "servo": self.servo.get_state(),
+            "cameras": self.list_cameras_payload()["cameras"],
+            "streams": self.stream_variants.stats(),
+            "clips": self.clip_recorder.stats() if self.clip_recorder is not None else None,
+            "frame_bus": self.frame_bus.stats() if self.frame_bus is not None else None,
+            "track_events": self.track_events.stats() if self.track_events is not None else None,
+            "history": self.history.stats() if self.history is not None else None,
+            "trajectories": self.trajectories.stats() if self.trajectories is not None else None,
+            "heatmap": self.heatmap.stats() if self.heatmap is not None else None,
+            "governor": self.governor.stats() if self.governor is not None else None,
+            "cpu_layout": self.cpu_layout.report(),
+            "jpeg": self.jpeg_encoder.stats(),
+            "achieved_fps": round(self.detection_rate.rate(), 2),
+            "metrics": self.metrics.summary(),
         }
 
         if tracker_active:
@@ -116,11 +371,75 @@ class DetectionService:
 
         return payload
 
-    def list_trackers(self) -> dict:
-        if not self.tracker:
+    def profile(self, seconds: float, mode: str = "sample", interval: float = 0.005,
+                thread_filter: Optional[str] = None) -> str:
+        """Profiles the running service; returns collapsed stacks (``sample``) or pstats text (``cprofile``).
+
+        ``cprofile`` instruments only the detection thread. Raises ``ProfilerBusyError``
+        when another session is running and ``ValueError`` for an unknown mode.
+        """
+        if mode == "sample":
+            return format_collapsed(sample_stacks(seconds, interval, thread_filter))
+        if mode == "cprofile":
+            if self.detection_thread is None or not self.detection_thread.is_alive():
+                raise RuntimeError("Detection thread is not running")
+            profile = self.detection_profile_hook.profile(seconds)
+            if profile is None:
+                raise RuntimeError("Detection thread did not reach a checkpoint")
+            return format_pstats(profile)
+        raise ValueError(f"Unknown profiling mode: {mode}")
+
+    def thread_stacks(self, text: bool = False):
+        """Stack traces of all threads (detection, capture, streaming, ...)."""
+        stacks = dump_thread_stacks()
+        return format_thread_stacks(stacks) if text else {"threads": stacks}
+
+    def render_metrics(self) -> str:
+        """Prometheus text exposition of all service metrics."""
+        return self.metrics.render_prometheus()
+
+    def list_cameras_payload(self) -> dict:
+        cameras = []
+        for pipeline in self.pipelines.values():
+            entry = {
+                "id": pipeline.camera_id,
+                "camera_type": pipeline.camera_type,
+                "camera_available": pipeline.camera_type is not None,
+                "tracker_active": pipeline.tracker is not None,
+                "frames_captured": pipeline.frames_captured,
+                "frames_processed": pipeline.processed_seq,
+                "active_trackers_count": 0,
+                "probe": getattr(pipeline.camera, "probe", None),
+                "health": pipeline.health_payload(),
+                "frame_pool": pipeline.camera.frame_pool.stats() if hasattr(pipeline.camera, "frame_pool") else None,
+            }
+            if pipeline.tracker is not None:
+                with pipeline.tracker_lock:
+                    entry["active_trackers_count"] = len(get_active_trackers(pipeline.tracker))
+            cameras.append(entry)
+        return {"cameras": cameras}
+
+    def list_trackers(self, camera_id: Optional[str] = None) -> dict:
+        """Active trackers of one camera, or of all cameras when ``camera_id`` is None."""
+        if camera_id is None:
+            pipelines = list(self.pipelines.values())
+        else:
+            pipeline = self.get_pipeline(camera_id)
+            if pipeline is None:
+                return {"trackers": [], "error": "Camera not found"}
+            pipelines = [pipeline]
+
+        pipelines = [pipeline for pipeline in pipelines if pipeline.tracker is not None]
+        if not pipelines:
             return {"trackers": [], "error": "Tracker not initialized"}
-        with self.tracker_lock:
-            trackers = get_active_trackers(self.tracker)
+
+        trackers = []
+        for pipeline in pipelines:
+            with pipeline.tracker_lock:
+                camera_trackers = get_active_trackers(pipeline.tracker)
+            for tracker in camera_trackers:
+                tracker["cameraId"] = pipeline.camera_id
+            trackers.extend(camera_trackers)
         for tracker in trackers:
             if tracker.get("trackId") == self.target_track_id:
                 tracker["isTarget"] = True
@@ -129,22 +448,47 @@ class DetectionService:
         return {"trackers": trackers, "target_track_id": self.target_track_id}
 
     def get_tracker_crop(self, track_id: int) -> Optional[bytes]:
-        if not self.tracker:
-            return None
-        with self.frame_lock:
-            frame = self.last_raw_frame.copy() if self.last_raw_frame is not None else None
-        if frame is None:
-            return None
-        with self.tracker_lock:
-            track = get_tracker_by_id(track_id, self.tracker)
-        if track is None or "bbox" not in track:
-            return None
-        return crop_frame_for_tracker(frame, track["bbox"])
+        for pipeline in self.pipelines.values():
+            if pipeline.tracker is None:
+                continue
+            with pipeline.tracker_lock:
+                track = get_tracker_by_id(track_id, pipeline.tracker)
+            if track is None or "bbox" not in track:
+                continue
+            # Frames are immutable, so the crop reads the shared buffer without a copy
+            frame = pipeline.last_raw_frame
+            if frame is None:
+                return None
+            return crop_frame_for_tracker(frame, track["bbox"])
+        return None
 
     def get_tracker_frames_payload(self, track_id: int) -> dict:
         frames = get_tracker_frames(track_id)
         return {"track_id": track_id, "frames": frames}
 
+    def query_history(self, args: Mapping[str, str]) -> Optional[dict]:
+        """Finalized tracks matching ``/api/history`` query parameters; None if history is disabled."""
+        if self.history is None:
+            return None
+        return self.history.query(**parse_history_query(args))
+
+    def get_history_crop(self, record_id: int) -> Optional[bytes]:
+        return self.history.crop(record_id) if self.history is not None else None
+
+    def query_trajectories(self, args: Mapping[str, str]) -> Optional[dict]:
+        """Trajectories matching ``/api/trajectories`` query parameters; None if they are disabled."""
+        if self.trajectories is None:
+            return None
+        return {"trajectories": self.trajectories.query(**parse_trajectory_query(args))}
+
+    def render_heatmap(self, args: Mapping[str, str]):
+        """PNG bytes or a JSON-ready dict for ``/api/heatmap``; None if disabled or there is no data yet."""
+        if self.heatmap is None:
+            return None
+        query = parse_heatmap_query(args)
+        camera_id = query.pop("camera", None) or self.primary.camera_id
+        return self.heatmap.render(camera_id, now=time.time(), **query)
+
     def list_models_payload(self) -> dict:
         if not self.model_manager:
             return {
@@ -155,7 +499,7 @@ class DetectionService:
         try:
             available = self.model_manager.get_available_models()
             active = self.model_manager.get_active_model()
-            return {"available_models": available, "active_model": active}
+            return {"available_models": available, "active_model": active, "input_size": self._input_size_payload()}
         except Exception as exc:  # pragma: no cover - defensive
             return {"available_models": [], "active_model": None, "error": str(exc)}
 
@@ -167,26 +511,174 @@ class DetectionService:
             previous = self.model_manager.get_active_model()
             new_model = self.model_manager.switch_model(model_name)
             if new_model != previous and self.tracker:
-                self.inference_engine = InferenceEngine(
-                    self.model_manager,
-                    self.tracker,
-                    self.tracker_lock,
-                    confidence_threshold=self.config.confidence_threshold,
-                )
+                self.inference_engine = self._build_inference_engine()
+                self._apply_input_size()
+        if new_model != previous and self.config.autotune and self.inference_engine is not None:
+            # Cached per model, so switching back and forth measures each model once; progress is in /models
+            self._start_autotune_thread()
         return {"success": True, "active_model": new_model, "previous_model": previous}
 
+    def _start_autotune_thread(self) -> None:
+        def tune() -> None:
+            try:
+                self.autotune_input_size(force=False)
+            except Exception as exc:
+                self.autotune_error = str(exc)
+                logger.warning("Подбор размера входа модели не удался: %s", exc)
+
+        self.autotune_error = None
+        self.autotune_thread = threading.Thread(target=tune, name="input-autotune", daemon=True)
+        self.autotune_thread.start()
+
+    def autotune_input_size(self, force: bool = True) -> dict:
+        """Times the candidate input sizes on the active model and switches to the chosen one.
+
+        The detection loop is paused while measuring, so timings are not skewed
+        by its own inference (the tuner keeps the detection heartbeat fresh, so
+        the watchdog does not restart the waiting loop), and the calling thread (an HTTP or executor thread
+        for ``/models/autotune``) runs on the detection CPUs for the duration;
+        ``force=False`` reuses a cached choice.
+        """
+        engine = self.inference_engine
+        if engine is None or self.model_manager is None or self.model_manager.get_model() is None:
+            raise RuntimeError("Model not loaded")
+        frame = self._sample_inference_frame()
+
+        def run(size: Tuple[int, int]) -> None:
+            self._detection_heartbeat = time.monotonic()
+            engine.imgsz = fit_input_size(size, None)
+            engine.detect_batch([frame])
+
+        with self.inference_gate, self.cpu_layout.pinned("detection"):
+            try:
+                self.input_tuner.tune(model_key(self.model_manager), run, force=force)
+                self.input_size = self.input_tuner.size
+            finally:
+                self._apply_input_size()
+        return self._input_size_payload()
+
+    def _input_size_payload(self) -> dict:
+        imgsz = self.inference_engine.imgsz if self.inference_engine is not None else None
+        return {
+            "size": list(self.input_size) if self.input_size else None,
+            # As passed to the model: square side or [height, width]
+            "imgsz": list(imgsz) if isinstance(imgsz, tuple) else imgsz,
+            "autotune": {
+                **self.input_tuner.stats(),
+                "running": self.autotune_thread is not None and self.autotune_thread.is_alive(),
+                "error": self.autotune_error,
+            },
+        }
+
     def set_target_track(self, track_id: Optional[int]) -> dict:
+        previous = self.target_track_id
         if track_id is None:
             self.target_track_id = None
             self.servo.reset()
+            if self.track_events is not None and previous is not None:
+                self.track_events.emit(self.primary.camera_id, "target", trackId=None, previous=previous)
             return {"target_track_id": None, "servo": self.servo.get_state()}
         if not isinstance(track_id, int):
             raise ValueError("track_id must be int")
         self.target_track_id = track_id
+        if self.track_events is not None and previous != track_id:
+            self.track_events.emit(self._camera_for_track(track_id), "target", trackId=track_id, previous=previous)
+        if self.clip_recorder is not None and self.config.clip_on_target:
+            self.clip_recorder.trigger(self._camera_for_track(track_id), f"target{track_id}")
         return {"target_track_id": track_id, "servo": self.servo.get_state()}
 
     # Internal logic ------------------------------------------------------------------
 
+    def _mark_startup(self, milestone: str) -> None:
+        if milestone in self.startup_timings or self._started_at is None:
+            return
+        elapsed = time.monotonic() - self._started_at
+        self.startup_timings[milestone] = round(elapsed, 3)
+        self.metrics.gauge("startup_seconds", "Seconds from start() to a startup milestone",
+                           milestone=milestone).set(elapsed)
+        logger.info("Старт: %s через %.2f с", milestone, elapsed)
+
+    def _load_models(self) -> None:
+        """Background thread: load the model, warm it up, then start the detection thread."""
+        try:
+            # Pool sizes must be set before torch does any parallel work
+            self.cpu_layout.configure_libraries()
+            self._init_models()
+            logger.info("Раскладка потоков: %s", self.cpu_layout.describe())
+            if self.track_events is not None or self.history is not None or self.trajectories is not None:
+                for pipeline in self.pipelines.values():
+                    if pipeline.tracker is not None:
+                        pipeline.tracker.on_event = self._track_event_sink(pipeline.camera_id)
+            if self.config.autotune and self.inference_engine is not None and not self.stop_event.is_set():
+                try:
+                    self.autotune_input_size(force=False)
+                except Exception as exc:
+                    logger.warning("Подбор размера входа модели не удался: %s", exc)
+            self._apply_input_size()
+            if self.model_manager is not None and self.model_manager.get_model() is not None:
+                self._mark_startup("model_loaded")
+            if self.inference_engine and not self.stop_event.is_set():
+                self._warm_up()
+                self._start_detection_thread()
+        except Exception as exc:
+            logger.error("Ошибка фоновой загрузки модели: %s", exc, exc_info=True)
+        finally:
+            self.model_loading = False
+            self.models_loaded.set()
+
+    def _start_detection_thread(self) -> None:
+        self._detection_generation += 1
+        self._detection_heartbeat = time.monotonic()
+        self.detection_thread = threading.Thread(
+            target=self._detection_loop, args=(self._detection_generation,), name="detection-loop", daemon=True
+        )
+        self.detection_thread.start()
+
+    def _watchdog_loop(self) -> None:
+        """Reconnects stalled cameras and restarts a dead or wedged detection thread."""
+        while not self.stop_event.wait(self.config.watchdog_interval):
+            for pipeline in self.pipelines.values():
+                try:
+                    pipeline.check_health(self.stop_event)
+                except Exception as exc:  # pragma: no cover - defensive
+                    logger.debug("Ошибка проверки камеры %s: %s", pipeline.camera_id, exc)
+            self._check_detection_thread()
+            self.stream_variants.reap()
+
+    def _check_detection_thread(self, now: Optional[float] = None) -> bool:
+        thread = self.detection_thread
+        if thread is None or self.stop_event.is_set() or not self.inference_engine or not self.tracker:
+            return False
+        if not thread.is_alive():
+            reason = "thread exited"
+        else:
+            age = (now if now is not None else time.monotonic()) - (self._detection_heartbeat or 0.0)
+            if age < self.config.detection_stall_timeout:
+                return False
+            reason = f"no progress for {age:.1f}s"
+        # A blocked Python thread cannot be killed: it is abandoned and exits once it unblocks
+        logger.error("Поток детекции не отвечает (%s), перезапуск", reason)
+        self.detection_restarts += 1
+        self.metrics.counter("detection_restarts_total", "Detection threads restarted by the watchdog").inc()
+        self._start_detection_thread()
+        return True
+
+    def _sample_inference_frame(self) -> np.ndarray:
+        """The newest inference image of the primary camera, or a blank one before the first frame."""
+        current = self.primary.current_frame
+        frame = current.inference_data if current is not None else None
+        return frame if frame is not None else np.zeros((480, 640, 3), dtype=np.uint8)
+
+    def _warm_up(self) -> None:
+        """One inference on a camera frame (or a blank one) so the first real frame is not slow."""
+        frame = self._sample_inference_frame()
+        try:
+            self.inference_engine.detect_batch([frame])
+        except Exception as exc:
+            logger.warning("Прогрев модели не удался: %s", exc)
+            return
+        self._mark_startup("model_warmed_up")
+
     def _init_models(self) -> None:
         try:
             base_dir = self._base_dir()
@@ -209,91 +701,292 @@ class DetectionService:
                 logger.warning("Модель не найдена, детекция отключена")
                 return
 
-            self.tracker = SortTracker(
-                iou_threshold=self.config.tracker_iou_threshold,
-                max_age=self.config.tracker_max_age,
-                min_hits=self.config.tracker_min_hits,
-            )
+            for pipeline in self.pipelines.values():
+                pipeline.tracker = SortTracker(
+                    iou_threshold=self.config.tracker_iou_threshold,
+                    max_age=self.config.tracker_max_age,
+                    min_hits=self.config.tracker_min_hits,
+                )
+                if self.config.detection_log_dir:
+                    log_dir = Path(self.config.detection_log_dir)
+                    if len(self.pipelines) > 1:
+                        log_dir = log_dir / pipeline.camera_id
+                    pipeline.detection_log = DetectionLogWriter(log_dir)
             logger.info(
-                "Tracker инициализирован: iou=%.2f, max_age=%d, min_hits=%d",
+                "Tracker инициализирован для %d камер: iou=%.2f, max_age=%d, min_hits=%d",
+                len(self.pipelines),
                 self.config.tracker_iou_threshold,
                 self.config.tracker_max_age,
                 self.config.tracker_min_hits,
             )
-            self.inference_engine = InferenceEngine(
-                self.model_manager,
-                self.tracker,
-                self.tracker_lock,
-                confidence_threshold=self.config.confidence_threshold,
-            )
+            self.inference_engine = self._build_inference_engine()
             logger.info("Inference engine инициализирован")
         except Exception as exc:
             logger.error("Ошибка инициализации детекции: %s", exc, exc_info=True)
 
-    def _detection_loop(self) -> None:
+    def _build_inference_engine(self) -> InferenceEngine:
+        return InferenceEngine(
+            self.model_manager,
+            self.tracker,
+            self.tracker_lock,
+            confidence_threshold=self.config.confidence_threshold,
+        )
+
+    def _build_clip_recorder(self) -> Optional[ClipRecorder]:
+        config = self.config
+        if not config.clip_dir:
+            return None
+        return ClipRecorder(
+            Path(config.clip_dir).expanduser(),
+            self.metrics,
+            labels=config.clip_labels,
+            pre_roll=config.clip_pre_roll_seconds,
+            post_roll=config.clip_post_roll_seconds,
+            max_seconds=config.clip_max_seconds,
+            max_disk_bytes=int(config.clip_max_disk_mb * 1024 * 1024),
+            buffer_bytes=int(config.clip_buffer_mb * 1024 * 1024),
+            source=config.clip_source,
+        )
+
+    def _build_history(self) -> Optional[TrackHistoryStore]:
+        config = self.config
+        if not config.history_db:
+            return None
+        path = Path(config.history_db).expanduser()
+        return TrackHistoryStore(
+            path,
+            self.metrics,
+            crops_dir=path.with_name(f"{path.stem}_crops") if config.history_crops else None,
+            flush_interval=config.history_flush_interval,
+        )
+
+    def _build_jpeg_encoder(self) -> JpegEncoder:
+        config = self.config
+        return build_encoder(
+            config.jpeg_backend,
+            {
+                "stream": JpegSettings(config.jpeg_quality, config.jpeg_subsampling, config.jpeg_fast_dct),
+                "crop": JpegSettings(config.crop_jpeg_quality, config.crop_jpeg_subsampling, config.jpeg_fast_dct),
+            },
+            turbo_per_thread=config.jpeg_turbo_per_thread,
+        )
+
+    def _build_governor(self) -> Optional[PerformanceGovernor]:
+        config = self.config
+        if not config.governor:
+            return None
+        return PerformanceGovernor(
+            build_profiles(config.governor_profiles, config.infer_fps, config.jpeg_quality),
+            self._apply_profile,
+            self.metrics,
+            temp_path=config.governor_temp_path,
+            stat_path=config.governor_stat_path,
+            temp_high=config.governor_temp_high,
+            temp_low=config.governor_temp_low,
+            load_high=config.governor_load_high,
+            load_low=config.governor_load_low,
+            hold_seconds=config.governor_hold_seconds,
+            step_seconds=config.governor_step_seconds,
+            interval=config.governor_interval,
+        )
+
+    def _apply_profile(self, profile: PerformanceProfile) -> None:
+        """Governor callback; every setting is read per frame, so it applies from the next one."""
+        self.infer_fps = profile.infer_fps
+        self.jpeg_quality = profile.jpeg_quality
+        for pipeline in self.pipelines.values():
+            pipeline.jpeg_quality = profile.jpeg_quality
+        self._apply_input_size()
+
+    def _apply_input_size(self) -> None:
+        """The configured or tuned input size, shrunk to the governor profile's side if it has one."""
+        if self.inference_engine is None:
+            return
+        limit = self.governor.profile.imgsz if self.governor is not None else None
+        self.inference_engine.imgsz = fit_input_size(self.input_size, limit)
+
+    def _track_event_sink(self, camera_id: str) -> Callable[[str, dict], None]:
+        """``SortTracker.on_event`` for one camera: backend push and, for lost tracks, history and trajectories."""
+        push = self.track_events.sink(camera_id) if self.track_events is not None else None
+        history = self.history
+        trajectories = self.trajectories
+
+        def _on_event(kind: str, track: dict) -> None:
+            if push is not None:
+                push(kind, track)
+            if kind == "lost":
+                if history is not None:
+                    history.add(camera_id, track, get_tracker_last_crop(track.get("trackId")))
+                if trajectories is not None:
+                    trajectories.finish(track.get("trackId"))
+
+        return _on_event
+
+    def _camera_for_track(self, track_id: int) -> str:
+        """Camera whose tracker currently holds ``track_id`` (the primary one if none does)."""
+        for pipeline in self.pipelines.values():
+            if pipeline.tracker is None:
+                continue
+            with pipeline.tracker_lock:
+                if get_tracker_by_id(track_id, pipeline.tracker) is not None:
+                    return pipeline.camera_id
+        return self.primary.camera_id
+
+    def _build_pipelines(self) -> Dict[str, CameraPipeline]:
+        if not self.config.cameras:
+            return {"0": CameraPipeline("0", CameraManager(self.config), self.config, self.metrics)}
+        pipelines: Dict[str, CameraPipeline] = {}
+        for index, spec in enumerate(self.config.cameras):
+            camera_id = str(index)
+            pipelines[camera_id] = CameraPipeline(camera_id, self._camera_for_spec(spec), self.config, self.metrics)
+        return pipelines
+
+    def _camera_for_spec(self, spec: str) -> CameraManager:
+        """Creates the camera of one ``CAMERAS`` entry: webcam index, ``picamera2`` or a source spec."""
+        if spec.isdigit():
+            return CameraManager(replace(self.config, camera_indices=[int(spec)], camera_source=None), backends=("webcam",))
+        if spec.lower() == "picamera2":
+            return CameraManager(replace(self.config, camera_source=None), backends=("picamera2",))
+        return CameraManager(replace(self.config, camera_source=spec), backends=())
+
+    def _stage(self, stage: str, camera_id: str = "all") -> Histogram:
+        key = (stage, camera_id)
+        histogram = self._stage_histograms.get(key)
+        if histogram is None:
+            histogram = self.metrics.histogram(
+                "stage_seconds", "Time spent per pipeline stage", stage=stage, camera=camera_id
+            )
+            self._stage_histograms[key] = histogram
+        return histogram
+
+    def _register_metrics(self) -> None:
+        self.metrics.gauge("achieved_fps", "Detection loop iterations per second", fn=self.detection_rate.rate)
+        self.metrics.gauge("process_resident_memory_bytes", "Resident memory of the process", fn=process_rss_bytes)
+        self.metrics.gauge("threads", "Live Python threads", fn=threading.active_count)
+        self.metrics.gauge("process_cpu_seconds", "User and system CPU time of the process", fn=time.process_time)
+        for key in ("tracks", "frames", "bytes"):
+            self.metrics.gauge(
+                f"tracker_cache_{key}",
+                f"Tracker crop cache size ({key})",
+                fn=lambda key=key: get_tracker_cache_stats()[key],
+            )
+
+    def _on_frame(self, pipeline: CameraPipeline) -> None:
+        self.frame_event.set()
+        if "first_frame" not in self.startup_timings:
+            self._mark_startup("first_frame")
+
+    def _detection_loop(self, generation: int = 0) -> None:
         if not self.inference_engine or not self.tracker:
             return
 
-        frame_interval = 1.0 / max(self.config.infer_fps, 0.1)
-        while not self.stop_event.is_set():
-            frame = self.camera.capture_raw()
-            if frame is None:
-                time.sleep(0.1)
+        self.cpu_layout.pin("detection")
+        while not self.stop_event.is_set() and generation == self._detection_generation:
+            self._detection_heartbeat = time.monotonic()
+            self.detection_profile_hook.checkpoint()
+            batch = []
+            for pipeline in self.pipelines.values():
+                if pipeline.tracker is None:
+                    continue
+                frame = pipeline.current_frame
+                if frame is not None and frame.seq > pipeline.processed_seq:
+                    batch.append((pipeline, frame))
+            if not batch:
+                self.frame_event.wait(0.1)
+                self.frame_event.clear()
                 continue
 
-            with self.frame_lock:
-                self.last_raw_frame = frame.copy()
-
             timestamp = time.time()
+            loop_started = time.perf_counter()
             try:
-                tracked, annotated, _ = self.inference_engine.infer(frame, timestamp)
-                for track in tracked:
-                    track_id = track.get("trackId")
-                    bbox = track.get("bbox")
-                    if track_id is not None and bbox:
-                        update_tracker_cache(
-                            track_id,
-                            frame,
-                            bbox,
-                            {
-                                "label": track.get("label"),
-                                "confidence": track.get("confidence"),
-                                "timestamp": timestamp,
-                            },
-                        )
-
-                self._update_servo_target(tracked, frame.shape)
-
-                if annotated is not None:
-                    success, buffer = self._encode_jpeg(annotated)
-                else:
-                    success, buffer = self._encode_jpeg(frame)
-                if success and buffer is not None:
-                    with self.frame_lock:
-                        self.last_annotated_frame = buffer
+                # One model call for the newest frame of every camera
+                with self._stage("inference").time(), self.inference_gate:
+                    detections = self.inference_engine.detect_batch([frame.inference_data for _, frame in batch])
+                for (pipeline, frame), raw_detections in zip(batch, detections):
+                    # Boxes from a lores inference image are mapped back to viewer coordinates
+                    raw_detections = scale_detections(raw_detections, frame.inference_scale)
+                    self._process_frame(
+                        pipeline, frame.data, raw_detections, timestamp, frame.timestamp, frame_seq=frame.seq
+                    )
             except Exception as exc:
+                self.metrics.counter("detection_errors_total", "Exceptions raised by the detection loop").inc()
                 logger.error("Ошибка детекции: %s", exc, exc_info=True)
-
-            time.sleep(frame_interval)
-
-    def _encode_jpeg(self, frame: np.ndarray) -> tuple[bool, Optional[bytes]]:
-        try:
-            import cv2
-
-            success, buffer = cv2.imencode(
-                ".jpg",
+            finally:
+                for pipeline, frame in batch:
+                    pipeline.mark_processed(frame.seq)
+            self._stage("loop").observe(time.perf_counter() - loop_started)
+            self.detection_rate.mark()
+            if "first_detection" not in self.startup_timings:
+                self._mark_startup("first_detection")
+
+            time.sleep(1.0 / max(self.infer_fps, 0.1))
+
+    def _process_frame(
+        self,
+        pipeline: CameraPipeline,
+        frame: np.ndarray,
+        raw_detections: list[dict],
+        timestamp: float,
+        captured_at: Optional[float] = None,
+        frame_seq: Optional[int] = None,
+    ) -> None:
+        camera_id = pipeline.camera_id
+        detection_log = pipeline.detection_log
+        with self._stage("tracker", camera_id).time():
+            tracked, _, _ = self.inference_engine.track(
                 frame,
-                [cv2.IMWRITE_JPEG_QUALITY, self.config.jpeg_quality],
+                raw_detections,
+                timestamp,
+                tracker=pipeline.tracker,
+                tracker_lock=pipeline.tracker_lock,
+                detection_sink=detection_log.write if detection_log is not None else None,
+                annotate=False,
             )
-        except Exception:
-            return False, None
-        if not success:
-            return False, None
-        return True, buffer.tobytes()
+        with self._stage("tracker_cache", camera_id).time():
+            for track in tracked:
+                track_id = track.get("trackId")
+                bbox = track.get("bbox")
+                if track_id is not None and bbox:
+                    update_tracker_cache(
+                        track_id,
+                        frame,
+                        bbox,
+                        {
+                            "label": track.get("label"),
+                            "confidence": track.get("confidence"),
+                            "timestamp": timestamp,
+                            "cameraId": camera_id,
+                        },
+                    )
+
+        if self.clip_recorder is not None:
+            self.clip_recorder.observe(camera_id, tracked, captured_at)
+        if self.trajectories is not None:
+            self.trajectories.observe(camera_id, tracked, timestamp)
+        if self.heatmap is not None:
+            self.heatmap.observe(camera_id, tracked, frame.shape, timestamp)
+        if self.frame_bus is not None and frame_seq is not None:
+            self.frame_bus.publish_detections(camera_id, frame_seq, tracked, timestamp)
+
+        if pipeline is self.primary:
+            # The servo is mounted on the primary camera
+            self._update_servo_target(tracked, frame.shape)
+
+        with self._stage("annotate", camera_id).time():
+            annotated = self.inference_engine.annotate(
+                frame, tracked, out=pipeline.annotate_pool.acquire(frame.shape, frame.dtype)
+            )
+        with self._stage("encode", camera_id).time():
+            success, buffer = self._encode_jpeg(annotated)
+        if success and buffer is not None:
+            pipeline.set_annotated_jpeg(buffer, captured_at)
+        self.metrics.counter("frames_processed_total", "Frames run through detection", camera=camera_id).inc()
 
-    def _base_dir(self):
-        from pathlib import Path
+    def _encode_jpeg(self, frame: np.ndarray) -> tuple[bool, Optional[bytes]]:
+        data = encode_jpeg(frame, quality=self.jpeg_quality)
+        return data is not None, data
 
+    def _base_dir(self) -> Path:
         return Path(__file__).resolve().parent
 
     def _update_servo_target(self, tracked: list[dict], frame_shape: tuple[int, ...]) -> None:
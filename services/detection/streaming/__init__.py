@@ -1,5 +1,41 @@
 """Streaming generators modules"""
-from .generators import mjpeg_generator_raw, mjpeg_generator_detections
-
-__all__ = ['mjpeg_generator_raw', 'mjpeg_generator_detections']
+from .generators import (
+    MJPEG_CONTENT_TYPE,
+    mjpeg_generator_detections,
+    mjpeg_generator_raw,
+    mjpeg_part,
+    sse_event,
+    sse_generator,
+)
+from .jpeg import JpegEncoder, JpegSettings, build_encoder, encode_jpeg, get_encoder, set_encoder
+from .variants import (
+    StreamVariant,
+    StreamVariantHub,
+    VariantEncoder,
+    build_variants,
+    mjpeg_generator_variant,
+    parse_variant_query,
+    select_variant,
+)
 
+__all__ = [
+    'MJPEG_CONTENT_TYPE',
+    'mjpeg_generator_raw',
+    'mjpeg_generator_detections',
+    'mjpeg_part',
+    'sse_event',
+    'sse_generator',
+    'JpegEncoder',
+    'JpegSettings',
+    'build_encoder',
+    'encode_jpeg',
+    'get_encoder',
+    'set_encoder',
+    'StreamVariant',
+    'StreamVariantHub',
+    'VariantEncoder',
+    'build_variants',
+    'mjpeg_generator_variant',
+    'parse_variant_query',
+    'select_variant',
+]
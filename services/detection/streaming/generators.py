@@ -1,41 +1,98 @@
-"""MJPEG stream generators"""
+"""MJPEG and server-sent event stream generators"""
+import json
 import logging
 import time
-from typing import Callable, Optional
+from typing import Callable, Hashable, Optional
+
+from ..monitoring.metrics import MetricsRegistry
 
 logger = logging.getLogger(__name__)
 
+MJPEG_CONTENT_TYPE = 'multipart/x-mixed-replace; boundary=frame'
+SSE_KEEPALIVE_SECONDS = 15.0
+
+
+def mjpeg_part(frame: bytes, timestamp: Optional[float] = None) -> bytes:
+    # X-Timestamp carries the capture time so clients can measure end-to-end latency
+    timestamp_header = b'X-Timestamp: %.6f\r\n' % timestamp if timestamp is not None else b''
+    return (
+        b'--frame' + b"\r\n"
+        + b'Content-Type: image/jpeg\r\n'
+        + timestamp_header
+        + b'Content-Length: ' + str(len(frame)).encode() + b"\r\n\r\n"
+        + frame + b"\r\n"
+    )
+
 
-def mjpeg_generator_raw(frame_getter: Callable[[], Optional[bytes]], interval: float = 0.01):
+def _mjpeg_stream(frame_getter: Callable[[], Optional[bytes]], interval: float,
+                  metrics: Optional[MetricsRegistry], stream: str,
+                  timestamp_getter: Optional[Callable[[], Optional[float]]] = None,
+                  version_getter: Optional[Callable[[], Hashable]] = None):
+    # With ``version_getter`` a frame is sent only once; otherwise it repeats every ``interval``
+    last_version = object()
+    subscribers = bytes_total = frames_total = None
+    if metrics is not None:
+        subscribers = metrics.gauge('stream_subscribers', 'Connected MJPEG clients', stream=stream)
+        bytes_total = metrics.counter('stream_bytes_total', 'Bytes sent to MJPEG clients', stream=stream)
+        frames_total = metrics.counter('stream_frames_total', 'Frames sent to MJPEG clients', stream=stream)
+        subscribers.inc()
+    try:
+        while True:
+            frame = frame_getter()
+            if frame is not None and version_getter is not None:
+                version = version_getter()
+                if version == last_version:
+                    time.sleep(min(interval, 0.02))
+                    continue
+                last_version = version
+            if frame is not None:
+                part = mjpeg_part(frame, timestamp_getter() if timestamp_getter is not None else None)
+                if bytes_total is not None:
+                    bytes_total.inc(len(part))
+                    frames_total.inc()
+                yield part
+                time.sleep(interval)
+            else:
+                time.sleep(0.2)
+    finally:
+        # Runs when the server closes the generator after the client disconnects
+        if subscribers is not None:
+            subscribers.dec()
+
+
+def mjpeg_generator_raw(frame_getter: Callable[[], Optional[bytes]], interval: float = 0.01,
+                        metrics: Optional[MetricsRegistry] = None, stream: str = 'raw',
+                        timestamp_getter: Optional[Callable[[], Optional[float]]] = None):
     """Генератор сырого MJPEG потока"""
-    boundary = b'--frame'
-    while True:
-        frame = frame_getter()
-        if frame is not None:
-            yield (
-                boundary + b"\r\n"
-                + b'Content-Type: image/jpeg\r\n'
-                + b'Content-Length: ' + str(len(frame)).encode() + b"\r\n\r\n"
-                + frame + b"\r\n"
-            )
-            time.sleep(interval)
-        else:
-            time.sleep(0.2)
-
-
-def mjpeg_generator_detections(frame_getter: Callable[[], Optional[bytes]], interval: float = 0.1):
+    return _mjpeg_stream(frame_getter, interval, metrics, stream, timestamp_getter)
+
+
+def mjpeg_generator_detections(frame_getter: Callable[[], Optional[bytes]], interval: float = 0.1,
+                               metrics: Optional[MetricsRegistry] = None, stream: str = 'detections',
+                               timestamp_getter: Optional[Callable[[], Optional[float]]] = None):
     """Генератор MJPEG потока с детекциями"""
-    boundary = b'--frame'
-    while True:
-        frame = frame_getter()
-        if frame is not None:
-            yield (
-                boundary + b"\r\n"
-                + b'Content-Type: image/jpeg\r\n'
-                + b'Content-Length: ' + str(len(frame)).encode() + b"\r\n\r\n"
-                + frame + b"\r\n"
-            )
-            time.sleep(interval)
-        else:
-            time.sleep(0.2)
+    return _mjpeg_stream(frame_getter, interval, metrics, stream, timestamp_getter)
+
 
+def sse_event(payload: dict, event: Optional[str] = None) -> bytes:
+    """Encodes one server-sent event with a JSON ``data`` field."""
+    head = f'event: {event}\n' if event else ''
+    return (head + 'data: ' + json.dumps(payload, ensure_ascii=False, separators=(',', ':')) + '\n\n').encode('utf-8')
+
+
+def sse_generator(payload_getter: Callable[[], dict], version_getter: Callable[[], Hashable],
+                  event: Optional[str] = None, interval: float = 0.1,
+                  keepalive: float = SSE_KEEPALIVE_SECONDS):
+    """Генератор SSE: отправляет payload при каждом изменении версии (например, номера кадра)"""
+    last_version = object()
+    last_sent = time.monotonic()
+    while True:
+        version = version_getter()
+        if version != last_version:
+            last_version = version
+            last_sent = time.monotonic()
+            yield sse_event(payload_getter(), event)
+        elif time.monotonic() - last_sent >= keepalive:
+            last_sent = time.monotonic()
+            yield b': keep-alive\n\n'
+        time.sleep(interval)
@@ -0,0 +1,255 @@
+"""JPEG encoding shared by the streams, the annotated frame and tracker crops.
+
+Two backends: libjpeg-turbo through PyTurboJPEG (``pip install PyTurboJPEG``,
+needs the system ``libturbojpeg``) with the fast integer DCT and explicit
+chroma subsampling, and OpenCV's ``imencode``, which is always there. With
+``auto`` every available backend encodes a synthetic frame a few times at
+startup and the fastest one is kept. Settings are per use: ``stream`` (raw,
+annotated and variant MJPEG) and ``crop`` (tracker crops); callers whose
+quality changes at runtime (governor, stream variants) pass it per call.
+"""
+from __future__ import annotations
+
+import logging
+import statistics
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Mapping, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+try:
+    import cv2
+    CV2_AVAILABLE = True
+except ImportError:  # pragma: no cover - OpenCV might be unavailable on CI
+    cv2 = None  # type: ignore[assignment]
+    CV2_AVAILABLE = False
+
+try:
+    import turbojpeg
+    TURBOJPEG_AVAILABLE = True
+except ImportError:
+    turbojpeg = None  # type: ignore[assignment]
+    TURBOJPEG_AVAILABLE = False
+
+BACKENDS = ("turbojpeg", "opencv")
+SUBSAMPLING = ("444", "422", "420", "gray")
+USES = ("stream", "crop")
+# Startup micro-benchmark: frame size and timed encodes per backend
+PROBE_SIZE = (640, 360)
+PROBE_REPEATS = 5
+
+
+@dataclass(frozen=True)
+class JpegSettings:
+    """``fast_dct`` only applies to libjpeg-turbo; OpenCV always uses the accurate DCT."""
+
+    quality: int = 85
+    subsampling: str = "420"
+    fast_dct: bool = True
+
+    def __post_init__(self):
+        if self.subsampling not in SUBSAMPLING:
+            raise ValueError(f"subsampling must be one of {', '.join(SUBSAMPLING)}")
+
+
+class OpenCVBackend:
+    name = "opencv"
+
+    def __init__(self):
+        if not CV2_AVAILABLE:
+            raise RuntimeError("OpenCV is not installed")
+        # IMWRITE_JPEG_SAMPLING_FACTOR appeared in OpenCV 4.5.5; older builds always write 4:2:0
+        self._sampling = {}
+        if hasattr(cv2, "IMWRITE_JPEG_SAMPLING_FACTOR"):
+            self._sampling = {
+                "444": cv2.IMWRITE_JPEG_SAMPLING_FACTOR_444,
+                "422": cv2.IMWRITE_JPEG_SAMPLING_FACTOR_422,
+                "420": cv2.IMWRITE_JPEG_SAMPLING_FACTOR_420,
+            }
+
+    def encode(self, image: np.ndarray, settings: JpegSettings, quality: int) -> Optional[bytes]:
+        params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+        if settings.subsampling == "gray":
+            if image.ndim == 3:
+                image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        elif settings.subsampling in self._sampling:
+            params += [cv2.IMWRITE_JPEG_SAMPLING_FACTOR, self._sampling[settings.subsampling]]
+        success, buffer = cv2.imencode(".jpg", image, params)
+        return buffer.tobytes() if success else None
+
+
+class TurboJpegBackend:
+    """PyTurboJPEG; with ``per_thread`` each encoding thread keeps its own ``TurboJPEG`` instance."""
+
+    name = "turbojpeg"
+
+    def __init__(self, per_thread: bool = True, lib_path: Optional[str] = None):
+        if not TURBOJPEG_AVAILABLE:
+            raise RuntimeError("PyTurboJPEG is not installed")
+        self.per_thread = per_thread
+        self.lib_path = lib_path
+        # Loads libturbojpeg; raises here, not on the first frame, if the library is missing
+        self._shared = turbojpeg.TurboJPEG(lib_path)
+        self._local = threading.local()
+        self._subsampling = {
+            "444": turbojpeg.TJSAMP_444,
+            "422": turbojpeg.TJSAMP_422,
+            "420": turbojpeg.TJSAMP_420,
+            "gray": turbojpeg.TJSAMP_GRAY,
+        }
+
+    def _instance(self):
+        if not self.per_thread:
+            return self._shared
+        instance = getattr(self._local, "instance", None)
+        if instance is None:
+            instance = self._local.instance = turbojpeg.TurboJPEG(self.lib_path)
+        return instance
+
+    def encode(self, image: np.ndarray, settings: JpegSettings, quality: int) -> Optional[bytes]:
+        if image.ndim == 2:
+            pixel_format = turbojpeg.TJPF_GRAY
+        elif image.shape[2] == 4:
+            pixel_format = turbojpeg.TJPF_BGRX
+        else:
+            pixel_format = turbojpeg.TJPF_BGR
+        if not image.flags.c_contiguous:
+            image = np.ascontiguousarray(image)
+        flags = turbojpeg.TJFLAG_FASTDCT if settings.fast_dct else 0
+        subsampling = self._subsampling[settings.subsampling]
+        if pixel_format == turbojpeg.TJPF_GRAY:
+            subsampling = turbojpeg.TJSAMP_GRAY
+        return self._instance().encode(
+            image, quality=quality, pixel_format=pixel_format, jpeg_subsample=subsampling, flags=flags
+        )
+
+
+def create_backend(name: str, turbo_per_thread: bool = True):
+    if name == "turbojpeg":
+        return TurboJpegBackend(per_thread=turbo_per_thread)
+    if name == "opencv":
+        return OpenCVBackend()
+    raise ValueError(f"unknown JPEG backend: {name}")
+
+
+def probe_frame(width: int = PROBE_SIZE[0], height: int = PROBE_SIZE[1]) -> np.ndarray:
+    """Blocky random BGR frame, so the timing resembles real footage rather than a flat image."""
+    rng = np.random.default_rng(0)
+    blocks = rng.integers(0, 255, size=(height // 8 + 1, width // 8 + 1, 3), dtype=np.uint8)
+    return np.ascontiguousarray(np.repeat(np.repeat(blocks, 8, axis=0), 8, axis=1)[:height, :width])
+
+
+def time_backend(backend, settings: JpegSettings, frame: np.ndarray, repeats: int = PROBE_REPEATS) -> float:
+    """Median seconds per encode of ``frame`` (after one warm-up encode)."""
+    backend.encode(frame, settings, settings.quality)
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        backend.encode(frame, settings, settings.quality)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+class JpegEncoder:
+    """Encodes with one backend and per-use settings; failures return None like ``cv2.imencode``."""
+
+    def __init__(self, backend, settings: Optional[Mapping[str, JpegSettings]] = None,
+                 timings: Optional[Mapping[str, float]] = None):
+        self.backend = backend
+        self.settings: Dict[str, JpegSettings] = {use: JpegSettings() for use in USES}
+        self.settings.update(settings or {})
+        # Startup micro-benchmark, seconds per probe frame and backend
+        self.timings: Dict[str, float] = dict(timings or {})
+
+    @property
+    def backend_name(self) -> str:
+        return self.backend.name
+
+    def encode(self, image: np.ndarray, use: str = "stream", quality: Optional[int] = None) -> Optional[bytes]:
+        settings = self.settings[use]
+        try:
+            return self.backend.encode(image, settings, quality or settings.quality)
+        except Exception as exc:
+            logger.debug("Ошибка кодирования JPEG (%s): %s", self.backend.name, exc)
+            return None
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend.name,
+            "probe_ms": {name: round(seconds * 1000, 3) for name, seconds in self.timings.items()},
+            "settings": {use: asdict(settings) for use, settings in self.settings.items()},
+        }
+
+
+def build_encoder(backend: str = "auto", settings: Optional[Mapping[str, JpegSettings]] = None,
+                  turbo_per_thread: bool = True) -> JpegEncoder:
+    """``backend`` ``auto`` picks the fastest available one; a named one that fails to load falls back."""
+    if backend != "auto" and backend not in BACKENDS:
+        raise ValueError(f"unknown JPEG backend: {backend}")
+    names = BACKENDS if backend == "auto" else (backend,)
+    available = []
+    for name in names:
+        try:
+            available.append(create_backend(name, turbo_per_thread))
+        except Exception as exc:
+            level = logging.DEBUG if backend == "auto" else logging.WARNING
+            logger.log(level, "JPEG-кодер %s недоступен: %s", name, exc)
+    if not available and backend != "opencv":
+        available.append(OpenCVBackend())
+    if not available:
+        raise RuntimeError("no JPEG backend available")
+    timings: Dict[str, float] = {}
+    if len(available) > 1:
+        stream = (settings or {}).get("stream", JpegSettings())
+        frame = probe_frame()
+        for candidate in available:
+            try:
+                timings[candidate.name] = time_backend(candidate, stream, frame)
+            except Exception as exc:
+                logger.warning("JPEG-кодер %s не прошёл замер: %s", candidate.name, exc)
+        available = [candidate for candidate in available if candidate.name in timings] or available[-1:]
+        available.sort(key=lambda candidate: timings.get(candidate.name, float("inf")))
+    encoder = JpegEncoder(available[0], settings, timings)
+    if timings:
+        logger.info("JPEG-кодер: %s (%s)", encoder.backend_name,
+                    ", ".join(f"{name} {seconds * 1000:.2f} мс" for name, seconds in timings.items()))
+    else:
+        logger.info("JPEG-кодер: %s", encoder.backend_name)
+    return encoder
+
+
+_encoder: Optional[JpegEncoder] = None
+_encoder_lock = threading.Lock()
+
+
+def get_encoder() -> JpegEncoder:
+    """The process-wide encoder; OpenCV with default settings until ``set_encoder`` is called."""
+    global _encoder
+    if _encoder is None:
+        with _encoder_lock:
+            if _encoder is None:
+                _encoder = JpegEncoder(OpenCVBackend())
+    return _encoder
+
+
+def set_encoder(encoder: JpegEncoder) -> None:
+    global _encoder
+    _encoder = encoder
+
+
+def encode_jpeg(image: np.ndarray, use: str = "stream", quality: Optional[int] = None) -> Optional[bytes]:
+    """Encodes ``image`` (BGR, BGRX or grayscale) with the process-wide encoder."""
+    return get_encoder().encode(image, use, quality)
+
+
+def available_backends() -> List[str]:
+    names = []
+    if TURBOJPEG_AVAILABLE:
+        names.append("turbojpeg")
+    if CV2_AVAILABLE:
+        names.append("opencv")
+    return names
@@ -0,0 +1,265 @@
+"""Stream variants: scaled / re-encoded MJPEG streams shared by their subscribers.
+
+Clients pick a stream with ``?width=``, ``?quality=`` and ``?fps=``; the
+request is mapped onto one of a few configured variants, so arbitrary query
+strings cannot multiply encoder work. Each ``(camera, variant)`` pair has one
+``VariantEncoder`` that downscales and encodes a source frame at most once
+and at most ``fps`` times a second, no matter how many viewers it has.
+Encoders are created on the first subscriber and dropped after
+``idle_seconds`` without one.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from contextlib import nullcontext
+from dataclasses import dataclass
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+from ..monitoring.metrics import MetricsRegistry
+from .generators import _mjpeg_stream
+from .jpeg import encode_jpeg
+
+logger = logging.getLogger(__name__)
+
+try:
+    import cv2
+    CV2_AVAILABLE = True
+except ImportError:  # pragma: no cover - OpenCV might be unavailable on CI
+    cv2 = None  # type: ignore[assignment]
+    CV2_AVAILABLE = False
+
+# Width used for "native" when comparing variants
+_NATIVE_WIDTH = 1 << 30
+# Encoding may run this much ahead of the nominal frame interval (pull jitter)
+_INTERVAL_SLACK = 0.9
+
+
+@dataclass(frozen=True)
+class StreamVariant:
+    """``width`` 0 keeps the camera resolution."""
+
+    width: int
+    quality: int
+    fps: float
+
+    @property
+    def name(self) -> str:
+        return f"{self.width or 'native'}w_q{self.quality}_{self.fps:g}fps"
+
+    @property
+    def interval(self) -> float:
+        return 1.0 / max(self.fps, 0.1)
+
+    def to_dict(self) -> dict:
+        return {"name": self.name, "width": self.width, "quality": self.quality, "fps": self.fps}
+
+
+def build_variants(specs: Sequence[Tuple[int, int, float]], default_quality: int) -> List[StreamVariant]:
+    """Variants from ``(width, quality, fps)`` config tuples; quality 0 means ``jpeg_quality``."""
+    variants = [
+        StreamVariant(int(width), int(quality) or int(default_quality), float(fps))
+        for width, quality, fps in specs
+    ]
+    return variants or [StreamVariant(0, int(default_quality), 30.0)]
+
+
+def parse_variant_query(args: Mapping[str, str]) -> Dict[str, Optional[float]]:
+    """``width``/``quality``/``fps`` query parameters; raises ``ValueError`` on bad values."""
+    result: Dict[str, Optional[float]] = {}
+    for key in ("width", "quality", "fps"):
+        value = args.get(key)
+        if value in (None, ""):
+            result[key] = None
+            continue
+        number = float(value)
+        if number <= 0:
+            raise ValueError(f"{key} must be positive")
+        result[key] = number
+    return result
+
+
+def select_variant(
+    variants: Sequence[StreamVariant],
+    width: Optional[float] = None,
+    quality: Optional[float] = None,
+    fps: Optional[float] = None,
+) -> StreamVariant:
+    """Nearest configured variant; without parameters the first one (the default stream).
+
+    Width decides first: the narrowest variant at least as wide as requested,
+    else the widest one. Quality and then FPS break ties.
+    """
+    if width is None and quality is None and fps is None:
+        return variants[0]
+    wanted = width if width is not None else _NATIVE_WIDTH
+
+    def cost(variant: StreamVariant):
+        variant_width = variant.width or _NATIVE_WIDTH
+        width_cost = (0, variant_width - wanted) if variant_width >= wanted else (1, wanted - variant_width)
+        return (
+            width_cost,
+            abs(variant.quality - quality) if quality is not None else 0,
+            abs(variant.fps - fps) if fps is not None else 0,
+        )
+
+    return min(variants, key=cost)
+
+
+class VariantEncoder:
+    """Newest JPEG of one camera in one variant, shared by all of its subscribers."""
+
+    def __init__(self, pipeline, variant: StreamVariant, metrics: MetricsRegistry, native_quality: int):
+        self.pipeline = pipeline
+        self.variant = variant
+        self.subscribers = 0
+        self.idle_since: Optional[float] = time.monotonic()
+        # The default stream reuses the pipeline's shared raw JPEG instead of encoding again
+        self.passthrough = variant.width == 0 and variant.quality == native_quality
+        self._lock = threading.Lock()
+        self._seq = -1
+        self._jpeg: Optional[bytes] = None
+        self._timestamp: Optional[float] = None
+        self._encoded_at = 0.0
+        labels = {"camera": pipeline.camera_id, "variant": variant.name}
+        self._encode_seconds = metrics.histogram(
+            "stream_variant_encode_seconds", "Scale + JPEG encode time per stream variant frame", **labels
+        )
+        self._frames_total = metrics.counter(
+            "stream_variant_frames_total", "Frames encoded per stream variant", **labels
+        )
+        self._subscribers_gauge = metrics.gauge(
+            "stream_variant_subscribers", "Clients subscribed to a stream variant", **labels
+        )
+
+    def _is_current(self, seq: int) -> bool:
+        return seq == self._seq or time.monotonic() - self._encoded_at < self.variant.interval * _INTERVAL_SLACK
+
+    def cached(self) -> Tuple[Optional[bytes], Optional[float]]:
+        """The current JPEG if no encode is due; ``(None, None)`` otherwise (never blocks)."""
+        frame = self.pipeline.current_frame
+        if self._jpeg is not None and (frame is None or self._is_current(frame.seq)):
+            return self._jpeg, self._timestamp
+        return None, None
+
+    def frame(self) -> Tuple[Optional[bytes], Optional[float]]:
+        """``(jpeg, capture_timestamp)`` of the newest frame, encoding it if due."""
+        frame = self.pipeline.current_frame
+        if frame is None or self._is_current(frame.seq):
+            return self._jpeg, self._timestamp
+        with self._lock:
+            if self._is_current(frame.seq):
+                return self._jpeg, self._timestamp
+            with self._encode_seconds.time():
+                data = self._encode(frame)
+            if data is not None:
+                self._jpeg, self._seq, self._timestamp = data, frame.seq, frame.timestamp
+                self._encoded_at = time.monotonic()
+                self._frames_total.inc()
+            return self._jpeg, self._timestamp
+
+    def jpeg(self) -> Optional[bytes]:
+        return self.frame()[0]
+
+    def timestamp(self) -> Optional[float]:
+        return self._timestamp
+
+    def version(self) -> int:
+        return self._seq
+
+    def _encode(self, frame) -> Optional[bytes]:
+        if self.passthrough:
+            return self.pipeline.capture_raw_jpeg()
+        if not CV2_AVAILABLE:
+            return None
+        layout = self.pipeline.cpu_layout
+        with layout.pinned("encode") if layout is not None else nullcontext():
+            image = frame.data
+            height, width = image.shape[:2]
+            if self.variant.width and self.variant.width < width:
+                target_height = max(1, round(height * self.variant.width / width))
+                image = cv2.resize(image, (self.variant.width, target_height), interpolation=cv2.INTER_AREA)
+            return encode_jpeg(image, quality=self.variant.quality)
+
+    def stats(self) -> dict:
+        return {
+            "camera": self.pipeline.camera_id,
+            **self.variant.to_dict(),
+            "subscribers": self.subscribers,
+            "frames_encoded": int(self._frames_total.value),
+            "encode_ms_p50": round(self._encode_seconds.percentiles((0.5,)).get("p50", 0.0) * 1000, 3),
+        }
+
+
+class StreamVariantHub:
+    """Lazily created ``VariantEncoder`` per (camera, variant), reaped when idle."""
+
+    def __init__(self, variants: Sequence[StreamVariant], metrics: MetricsRegistry, native_quality: int,
+                 idle_seconds: float = 10.0):
+        self.variants = list(variants)
+        self.metrics = metrics
+        self.native_quality = native_quality
+        self.idle_seconds = idle_seconds
+        self._encoders: Dict[Tuple[str, StreamVariant], VariantEncoder] = {}
+        self._lock = threading.Lock()
+
+    def select(self, width=None, quality=None, fps=None) -> StreamVariant:
+        return select_variant(self.variants, width, quality, fps)
+
+    def subscribe(self, pipeline, variant: StreamVariant) -> VariantEncoder:
+        with self._lock:
+            key = (pipeline.camera_id, variant)
+            encoder = self._encoders.get(key)
+            if encoder is None or encoder.pipeline is not pipeline:
+                encoder = self._encoders[key] = VariantEncoder(pipeline, variant, self.metrics, self.native_quality)
+                logger.info("Создан вариант потока %s для камеры %s", variant.name, pipeline.camera_id)
+            encoder.subscribers += 1
+            encoder.idle_since = None
+            encoder._subscribers_gauge.set(encoder.subscribers)
+        self.reap()
+        return encoder
+
+    def unsubscribe(self, encoder: VariantEncoder) -> None:
+        with self._lock:
+            encoder.subscribers = max(0, encoder.subscribers - 1)
+            encoder._subscribers_gauge.set(encoder.subscribers)
+            if encoder.subscribers == 0:
+                encoder.idle_since = time.monotonic()
+        self.reap()
+
+    def reap(self, now: Optional[float] = None) -> int:
+        """Drops encoders (and their cached JPEG) idle for ``idle_seconds``; returns how many."""
+        now = now if now is not None else time.monotonic()
+        with self._lock:
+            idle = [
+                key for key, encoder in self._encoders.items()
+                if encoder.subscribers == 0 and encoder.idle_since is not None
+                and now - encoder.idle_since >= self.idle_seconds
+            ]
+            for key in idle:
+                del self._encoders[key]
+        for camera_id, variant in idle:
+            logger.info("Вариант потока %s камеры %s остановлен (нет зрителей)", variant.name, camera_id)
+        return len(idle)
+
+    def active(self) -> List[VariantEncoder]:
+        with self._lock:
+            return list(self._encoders.values())
+
+    def stats(self) -> dict:
+        return {
+            "variants": [variant.to_dict() for variant in self.variants],
+            "active": [encoder.stats() for encoder in self.active()],
+        }
+
+
+def mjpeg_generator_variant(hub: StreamVariantHub, pipeline, variant: StreamVariant,
+                            metrics: Optional[MetricsRegistry] = None, stream: str = 'raw'):
+    """Генератор MJPEG потока варианта: каждый кадр кодируется один раз для всех зрителей"""
+    encoder = hub.subscribe(pipeline, variant)
+    try:
+        yield from _mjpeg_stream(encoder.jpeg, variant.interval, metrics, stream, encoder.timestamp,
+                                 version_getter=encoder.version)
+    finally:
+        hub.unsubscribe(encoder)
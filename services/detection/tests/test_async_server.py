@@ -0,0 +1,109 @@
+"""Tests for the aiohttp serving mode"""
+import asyncio
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+ROOT_DIR = Path(__file__).resolve().parents[3]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+pytest.importorskip('aiohttp')
+cv2 = pytest.importorskip('cv2')
+from aiohttp.test_utils import TestClient, TestServer
+
+from services.detection.async_server import create_async_app
+from services.detection.config.runtime import RuntimeConfig
+from services.detection.service import DetectionService
+from services.detection.tools.fakes import FakeModel, attach_fake_model
+
+
+@pytest.fixture
+def service():
+    config = RuntimeConfig(infer_fps=30.0, camera_source='synthetic:96x64', camera_source_pace='fixed',
+                           camera_source_fps=30.0)
+    service = DetectionService(config)
+    service._init_models = lambda: attach_fake_model(service, FakeModel(boxes=2))
+    service.start()
+    assert service.wait_ready(5)
+    yield service
+    service.stop()
+
+
+async def _read_parts(response, count):
+    parts = []
+    while len(parts) < count:
+        line = await response.content.readline()
+        if not line.startswith(b'--frame'):
+            continue
+        headers = {}
+        while True:
+            line = (await response.content.readline()).strip()
+            if not line:
+                break
+            name, _, value = line.decode().partition(':')
+            headers[name.lower()] = value.strip()
+        body = await response.content.readexactly(int(headers['content-length']))
+        parts.append((headers, body))
+    return parts
+
+
+def test_async_routes_match_threaded_server(service):
+    async def scenario():
+        async with TestClient(TestServer(create_async_app(service))) as client:
+            response = await client.get('/health')
+            assert (await response.json())['status'] == 'ok'
+            assert response.headers['Access-Control-Allow-Origin'] == '*'
+
+            response = await client.options('/api/trackers')
+            assert response.status == 204
+
+            response = await client.get('/cameras/9/trackers')
+            assert response.status == 404
+
+            response = await client.get('/metrics')
+            assert response.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+
+            response = await client.get('/stream.mjpeg')
+            assert response.headers['Content-Type'].startswith('multipart/x-mixed-replace')
+            parts = await asyncio.wait_for(_read_parts(response, 3), 5)
+            assert all(body.startswith(b'\xff\xd8') for _, body in parts)
+            timestamps = [float(headers['x-timestamp']) for headers, _ in parts]
+            assert timestamps == sorted(set(timestamps))
+            response.close()
+
+            response = await client.get('/cameras/0/detections.mjpeg')
+            parts = await asyncio.wait_for(_read_parts(response, 2), 5)
+            assert parts[0][1] is not parts[1][1]
+            response.close()
+
+            response = await client.get('/api/trackers/stream')
+            assert response.headers['Content-Type'].startswith('text/event-stream')
+            assert await asyncio.wait_for(response.content.readline(), 5) == b'event: trackers\n'
+            assert (await response.content.readline()).startswith(b'data: {"trackers"')
+            response.close()
+
+            payload = await (await client.get('/api/detection')).json()
+            assert payload['detection_thread_running'] is True
+
+    asyncio.run(scenario())
+
+
+def test_async_stream_variants(service):
+    async def scenario():
+        async with TestClient(TestServer(create_async_app(service))) as client:
+            response = await client.get('/stream.mjpeg?quality=-1')
+            assert response.status == 400
+
+            response = await client.get('/cameras/0/stream.mjpeg?width=48')
+            headers, body = (await asyncio.wait_for(_read_parts(response, 1), 5))[0]
+            assert 'x-timestamp' in headers
+            image = cv2.imdecode(np.frombuffer(body, dtype=np.uint8), cv2.IMREAD_COLOR)
+            assert image.shape[1] == 96  # 320 px variant, never upscaled
+            active = service.stream_variants.active()
+            assert [(encoder.variant.width, encoder.subscribers) for encoder in active] == [(320, 1)]
+            response.close()
+
+    asyncio.run(scenario())
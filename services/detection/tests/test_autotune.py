@@ -0,0 +1,171 @@
+"""Tests for rectangular model input sizes and the latency-budget autotuner"""
+import sys
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[3]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+from services.detection import detection_server
+from services.detection.config.runtime import RuntimeConfig
+from services.detection.detection.autotune import InputSizeTuner, fit_input_size, resolve_cache_path
+from services.detection.service import DetectionService
+from services.detection.tools.fakes import FakeModel, attach_fake_model
+
+# Simulated seconds per inference at each size
+LATENCY = {(320, 192): 0.001, (448, 256): 0.003, (640, 384): 0.03, (800, 448): 0.05}
+
+
+def _runner():
+    calls = []
+
+    def run(size):
+        calls.append(size)
+        time.sleep(LATENCY[size])
+    return run, calls
+
+
+def test_fit_input_size():
+    assert fit_input_size(None, None) is None
+    assert fit_input_size(None, 320) == 320
+    assert fit_input_size((640, 384), None) == (384, 640)
+    assert fit_input_size((640, 384), 640) == (384, 640)
+    # Shrunk to the governor's side, aspect kept, rounded to the model stride
+    assert fit_input_size((640, 384), 320) == (192, 320)
+    assert resolve_cache_path('off') is None
+
+
+def test_picks_the_largest_size_within_budget(tmp_path):
+    tuner = InputSizeTuner(list(LATENCY)[::-1], budget_ms=15.0, runs=2, cache_path=tmp_path / 'sizes.json')
+    run, calls = _runner()
+    result = tuner.tune('yolo.pt', run)
+
+    assert tuner.size == (448, 256) and result['within_budget'] and result['source'] == 'measured'
+    # Smallest first; stops after the first size over budget, 800x448 is never run
+    assert set(result['latencies_ms']) == {'320x192', '448x256', '640x384'}
+    assert (800, 448) not in calls and len(calls) == 3 * 3
+
+    nothing_fits = InputSizeTuner([(640, 384), (448, 256)], budget_ms=0.5, runs=1).tune('yolo.pt', _runner()[0])
+    assert nothing_fits['size'] == [448, 256] and not nothing_fits['within_budget']
+
+
+def test_choice_is_cached_per_model_and_budget(tmp_path):
+    cache = tmp_path / 'sizes.json'
+    InputSizeTuner(list(LATENCY), budget_ms=15.0, runs=1, cache_path=cache).tune('yolo.pt', _runner()[0])
+
+    run, calls = _runner()
+    cached = InputSizeTuner(list(LATENCY), budget_ms=15.0, runs=1, cache_path=cache).tune('yolo.pt', run)
+    assert cached['source'] == 'cache' and cached['size'] == [448, 256] and calls == []
+
+    # Another model, a new budget or force measure again
+    assert InputSizeTuner(list(LATENCY), budget_ms=15.0, runs=1, cache_path=cache).tune('fire.pt', run)['source'] == 'measured'
+    relaxed = InputSizeTuner(list(LATENCY), budget_ms=40.0, runs=1, cache_path=cache).tune('yolo.pt', run)
+    assert relaxed['source'] == 'measured' and relaxed['size'] == [640, 384]
+    forced = InputSizeTuner(list(LATENCY), budget_ms=15.0, runs=1, cache_path=cache).tune('yolo.pt', run, force=True)
+    assert forced['source'] == 'measured'
+
+
+def test_service_tunes_at_startup_and_on_demand(tmp_path):
+    config = RuntimeConfig(
+        infer_fps=50.0,
+        camera_source='synthetic:64x48',
+        camera_source_pace='fast',
+        autotune=True,
+        autotune_sizes=[(320, 192), (640, 384)],
+        autotune_budget_ms=1000.0,
+        autotune_runs=1,
+        autotune_cache=str(tmp_path / 'sizes.json'),
+    )
+    service = DetectionService(config)
+    model = FakeModel(boxes=1)
+    service._init_models = lambda: attach_fake_model(service, model)
+    service.start()
+    detection_server.detection_service = service
+    try:
+        assert service.wait_ready(5)
+        deadline = time.monotonic() + 5
+        while model.last_options.get('imgsz') != (384, 640) and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert model.last_options == {'imgsz': (384, 640)}
+
+        client = detection_server.app.test_client()
+        payload = client.get('/models').get_json()['input_size']
+        assert payload['size'] == [640, 384] and payload['imgsz'] == [384, 640]
+        assert payload['autotune']['result']['source'] == 'measured'
+        assert set(payload['autotune']['result']['latencies_ms']) == {'320x192', '640x384'}
+
+        response = client.post('/models/autotune')
+        assert response.status_code == 200 and response.get_json()['autotune']['result']['size'] == [640, 384]
+    finally:
+        detection_server.detection_service = None
+        service.stop()
+
+
+def test_on_demand_tune_keeps_the_detection_heartbeat_fresh(tmp_path):
+    config = RuntimeConfig(
+        infer_fps=50.0,
+        camera_source='synthetic:64x48',
+        camera_source_pace='fast',
+        autotune_sizes=[(320, 192), (640, 384)],
+        autotune_runs=3,
+        autotune_cache=str(tmp_path / 'sizes.json'),
+        detection_stall_timeout=0.2,
+    )
+    service = DetectionService(config)
+    service._init_models = lambda: attach_fake_model(service, FakeModel(boxes=1, latency=0.05))
+    service.start()
+    try:
+        assert service.wait_ready(5)
+        checks = []
+        measure = service.input_tuner.measure
+
+        def run_and_check(size):
+            checks.append(service._check_detection_thread(now=time.monotonic() + 0.1))
+        # 2 sizes x 4 runs x 50 ms, longer than the stall timeout, with the detection loop waiting
+        service.input_tuner.measure = lambda run: measure(lambda size: (run(size), run_and_check(size)))
+        service.autotune_input_size()
+        assert checks and not any(checks) and service.detection_restarts == 0
+    finally:
+        service.stop()
+
+
+def test_switch_tunes_in_the_background_without_tripping_the_watchdog(tmp_path):
+    config = RuntimeConfig(
+        infer_fps=50.0,
+        camera_source='synthetic:64x48',
+        camera_source_pace='fast',
+        autotune=True,
+        autotune_sizes=[(320, 192), (640, 384)],
+        autotune_budget_ms=1000.0,
+        autotune_runs=3,
+        autotune_cache=str(tmp_path / 'sizes.json'),
+        detection_stall_timeout=0.2,
+    )
+    service = DetectionService(config)
+    service._init_models = lambda: attach_fake_model(service, FakeModel(boxes=1, latency=0.05))
+    service.start()
+    try:
+        assert service.wait_ready(5)
+        manager = service.model_manager
+
+        def switch(name):
+            manager.model_name = name
+            return name
+        manager.switch_model = switch
+
+        started = time.monotonic()
+        assert service.switch_model('other.pt')['active_model'] == 'other.pt'
+        # 2 sizes x 4 runs x 50 ms are measured after the switch returned
+        assert time.monotonic() - started < 0.3
+        assert service.list_models_payload()['input_size']['autotune']['running']
+
+        deadline = time.monotonic() + 5
+        while service.autotune_thread.is_alive() and time.monotonic() < deadline:
+            assert service._check_detection_thread() is False
+            time.sleep(0.02)
+        payload = service.list_models_payload()['input_size']['autotune']
+        assert not payload['running'] and payload['error'] is None
+        assert payload['result']['model'].startswith('other.pt') and service.detection_restarts == 0
+    finally:
+        service.stop()
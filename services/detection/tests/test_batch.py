@@ -0,0 +1,113 @@
+"""Tests for the offline batch processing tool"""
+import json
+import shutil
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+ROOT_DIR = Path(__file__).resolve().parents[3]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+cv2 = pytest.importorskip('cv2')
+
+from services.detection.tools import batch
+
+
+class _FakeEngine:
+    """Returns one box per frame that drifts to the right."""
+
+    def __init__(self):
+        self.calls = []
+
+    def detect_batch(self, frames):
+        self.calls.append(len(frames))
+        return [
+            [{'bbox': [10.0, 10.0, 50.0, 50.0], 'confidence': 0.9, 'class_id': 0, 'label': 'fire'}]
+            for _ in frames
+        ]
+
+
+@pytest.fixture
+def image_dir(tmp_path):
+    frames_dir = tmp_path / 'frames'
+    frames_dir.mkdir()
+    for index in range(5):
+        cv2.imwrite(str(frames_dir / f'{index:03d}.jpg'), np.zeros((64, 64, 3), dtype=np.uint8))
+    return frames_dir
+
+
+@pytest.fixture
+def fake_engine(monkeypatch):
+    engine = _FakeEngine()
+    monkeypatch.setattr(batch, '_get_engine', lambda options: engine)
+    return engine
+
+
+def test_process_file_jsonl(image_dir, tmp_path, fake_engine):
+    options = batch.BatchOptions(model='fake.pt', output_dir=str(tmp_path / 'out'), batch_size=2)
+    stats = batch.process_file(str(image_dir), options)
+
+    assert stats.error is None
+    assert stats.frames == 5
+    assert fake_engine.calls == [2, 2, 1]
+    lines = Path(stats.output).read_text(encoding='utf-8').splitlines()
+    records = [json.loads(line) for line in lines]
+    assert [r['frame'] for r in records] == [0, 1, 2, 3, 4]
+    # The same box every frame keeps a single track id
+    assert len({r['tracks'][0]['trackId'] for r in records}) == 1
+    assert stats.tracks == 1
+
+
+def test_process_file_columnar(image_dir, tmp_path, fake_engine):
+    options = batch.BatchOptions(model='fake.pt', output_dir=str(tmp_path / 'out'), output_format='columnar')
+    stats = batch.process_file(str(image_dir), options)
+
+    data = np.load(stats.output)
+    assert list(data['labels']) == ['fire']
+    assert data['det_bbox'].shape == (5, 4)
+    assert data['trk_track_id'].shape == (5,)
+    assert (data['det_label'] == 0).all()
+
+
+def test_output_names_are_unique(tmp_path):
+    assert batch.output_names(['a/cam.mp4', 'b/yard.mp4']) == ['cam', 'yard']
+    assert batch.output_names([str(tmp_path / 'a' / 'cam.mp4'), str(tmp_path / 'b' / 'cam.mp4'), 'gate.mp4']) == [
+        'a__cam', 'b__cam', 'gate'
+    ]
+    assert batch.output_names(['a/cam.mp4', 'a/cam.avi']) == ['cam.mp4', 'cam.avi']
+    assert batch.output_names(['cam.mp4', 'cam.mp4']) == ['cam.mp4', 'cam.mp4-2']
+
+
+def test_same_stem_inputs_do_not_overwrite_each_other(image_dir, tmp_path, fake_engine):
+    other = tmp_path / 'other' / 'frames'
+    shutil.copytree(image_dir, other)
+    options = batch.BatchOptions(model='fake.pt', output_dir=str(tmp_path / 'out'))
+
+    outputs = [stats.output for stats in batch.process_files([str(image_dir), str(other)], options)]
+    assert [Path(output).name for output in outputs] == ['frames.jsonl', 'other__frames.jsonl']
+    assert all(Path(output).exists() for output in outputs)
+
+
+def test_process_file_missing_video(tmp_path, fake_engine):
+    options = batch.BatchOptions(model='fake.pt', output_dir=str(tmp_path / 'out'))
+    stats = batch.process_file(str(tmp_path / 'missing.mp4'), options)
+    assert stats.error is not None
+    assert stats.frames == 0
+
+
+def test_model_and_output_errors_are_reported_per_file(image_dir, tmp_path, monkeypatch):
+    def missing_model(options):
+        raise FileNotFoundError(options.model)
+    monkeypatch.setattr(batch, '_get_engine', missing_model)
+    options = batch.BatchOptions(model='missing.pt', output_dir=str(tmp_path / 'out'))
+    results = list(batch.process_files([str(image_dir), str(image_dir)], options))
+    assert len(results) == 2 and all('missing.pt' in stats.error for stats in results)
+
+    monkeypatch.setattr(batch, '_get_engine', lambda options: _FakeEngine())
+    blocker = tmp_path / 'not-a-dir'
+    blocker.write_text('')
+    stats = batch.process_file(str(image_dir), batch.BatchOptions(model='fake.pt', output_dir=str(blocker)))
+    assert stats.error is not None and stats.frames == 0
@@ -0,0 +1,68 @@
+"""Tests for the benchmark suite"""
+import json
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[3]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+from services.detection.tools.benchmark import (
+    compare, main, parse_layout, run_layouts, run_suite, save_results, selected_names
+)
+from services.detection.tools.fakes import FakeModel, make_frame
+
+
+def test_fake_model_boxes_follow_frame_size():
+    model = FakeModel(boxes=4)
+    result = model([make_frame(64, 48), make_frame(64, 48)])
+
+    assert len(result) == 2 and model.batch_sizes == [2]
+    boxes = result[0].boxes.xyxy.numpy()
+    assert boxes.shape == (4, 4)
+    assert boxes[:, 2].max() <= 64 and boxes[:, 3].max() <= 48
+
+
+def test_filter_selects_cases():
+    names = selected_names(['tracker.update*'])
+    assert names and all(name.startswith('tracker.update') for name in names)
+
+
+def test_quick_run_and_save(tmp_path):
+    results = run_suite(['tracker.update[1]', 'inference.postprocess[5]'], budget=0.05)
+
+    assert [r.name for r in results] == ['tracker.update[1]', 'inference.postprocess[5]']
+    assert all(r.median_us > 0 and r.ops > 0 for r in results)
+
+    path = tmp_path / 'bench.json'
+    save_results(path, results)
+    payload = json.loads(path.read_text(encoding='utf-8'))
+    assert set(payload['results']) == {'tracker.update[1]', 'inference.postprocess[5]'}
+    assert 'python' in payload['environment']
+
+
+def test_compare_flags_regressions(tmp_path):
+    baseline = {'a': {'median_us': 100.0}, 'b': {'median_us': 100.0}}
+    current = {'a': {'median_us': 110.0}, 'b': {'median_us': 130.0}, 'c': {'median_us': 5.0}}
+
+    rows = {row['name']: row for row in compare(baseline, current, threshold=0.15)}
+    assert not rows['a']['regression']
+    assert rows['b']['regression']
+    assert rows['c']['ratio'] is None and not rows['c']['regression']
+
+    for name, data in (('base.json', baseline), ('current.json', current)):
+        (tmp_path / name).write_text(json.dumps({'results': data}), encoding='utf-8')
+    args = ['compare', str(tmp_path / 'base.json'), str(tmp_path / 'current.json')]
+    assert main(args) == 1
+    assert main(args + ['--threshold', '0.5']) == 0
+
+
+def test_layout_sweep():
+    assert parse_layout('torch=2;cv2=1;detection=2-3;encode=0,1') == {
+        'torch_threads': 2, 'cv2_threads': 1, 'detection_cpus': (2, 3), 'encode_cpus': (0, 1)
+    }
+    assert main(['layouts', '--layout', 'gpu=1']) == 2
+
+    rows = run_layouts(['', 'cv2=1;detection=0'], budget=0.3, source='synthetic:64x48', viewers=1, compute=0.0)
+    assert [row['layout'] for row in rows] == ['default', 'cv2=1;detection=0']
+    assert all(row['fps'] > 0 and row['latency_p95_ms'] >= row['latency_p50_ms'] for row in rows)
@@ -0,0 +1,125 @@
+"""Tests for concurrent webcam probing and the camera cache"""
+import json
+import sys
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+ROOT_DIR = Path(__file__).resolve().parents[3]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+cv2 = pytest.importorskip('cv2')
+
+from services.detection.camera import discovery
+from services.detection.camera.manager import CameraManager
+from services.detection.config.runtime import RuntimeConfig
+
+
+class FakeCapture:
+    """VideoCapture stand-in: ``devices`` maps index -> (open delay, delivers frames)."""
+
+    devices = {}
+    opened = []
+    lock = threading.Lock()
+
+    def __init__(self, index, api=None):
+        self.index = index
+        delay, self.working = self.devices.get(index, (0.0, None))
+        time.sleep(delay)
+        self.released = False
+        with self.lock:
+            self.opened.append(index)
+
+    def isOpened(self):
+        return self.working is not None
+
+    def set(self, prop, value):
+        return True
+
+    def read(self):
+        if self.working:
+            return True, np.zeros((48, 64, 3), dtype=np.uint8)
+        return False, None
+
+    def release(self):
+        self.released = True
+
+
+@pytest.fixture
+def fake_capture(monkeypatch):
+    FakeCapture.devices = {}
+    FakeCapture.opened = []
+    monkeypatch.setattr(discovery.cv2, 'VideoCapture', FakeCapture)
+    return FakeCapture
+
+
+def test_resolve_cache_path(tmp_path):
+    assert discovery.resolve_cache_path(None) == discovery.DEFAULT_CACHE_PATH
+    assert discovery.resolve_cache_path('off') is None
+    assert discovery.resolve_cache_path(str(tmp_path / 'c.json')) == tmp_path / 'c.json'
+
+
+def test_discover_probes_indices_concurrently(fake_capture):
+    # Index 0 missing, 1 slow to open but working, 2 working at once
+    fake_capture.devices = {1: (0.3, True), 2: (0.0, True), 3: (0.3, False)}
+    started = time.monotonic()
+    capture, chosen, results = discovery.discover_webcam([0, 1, 2, 3], [cv2.CAP_ANY], timeout=2.0)
+    elapsed = time.monotonic() - started
+
+    assert chosen.index == 1  # lowest working index wins, as with sequential probing
+    assert capture.index == 1 and not capture.released
+    assert elapsed < 0.55  # slow devices were opened in parallel
+    assert [r.index for r in results] == [0, 1, 2, 3]
+    assert results[0].error == 'not opened'
+
+
+def test_discover_respects_global_timeout(fake_capture):
+    fake_capture.devices = {0: (1.0, True)}
+    started = time.monotonic()
+    capture, chosen, results = discovery.discover_webcam([0], [cv2.CAP_ANY], timeout=0.2)
+
+    assert time.monotonic() - started < 0.6
+    assert capture is None and chosen is None
+    assert results[0].error == 'timeout'
+
+
+def test_manager_caches_last_working_camera(fake_capture, tmp_path):
+    cache_file = tmp_path / 'camera.json'
+    fake_capture.devices = {2: (0.0, True)}
+    config = RuntimeConfig(camera_indices=[0, 1, 2], camera_cache_file=str(cache_file))
+
+    first = CameraManager(config, backends=('webcam',))
+    first.start()
+    assert first.camera_type == 'webcam'
+    assert first.probe['from_cache'] is False
+    entry = next(iter(json.loads(cache_file.read_text()).values()))
+    assert entry['index'] == 2 and entry['width'] == 64 and entry['height'] == 48
+    first.shutdown()
+
+    fake_capture.opened = []
+    second = CameraManager(config, backends=('webcam',))
+    second.start()
+    assert second.probe['from_cache'] is True
+    assert fake_capture.opened == [2]  # no discovery of the other indices
+    assert second.probe['results'][0]['cached'] is True
+    second.shutdown()
+
+
+def test_stale_cache_falls_back_to_discovery(fake_capture, tmp_path):
+    cache_file = tmp_path / 'camera.json'
+    config = RuntimeConfig(camera_indices=[0, 1], camera_cache_file=str(cache_file), camera_probe_timeout=1.0)
+    key = discovery.cache_key(('webcam',), [0, 1])
+    discovery.save_cached_camera(cache_file, key, discovery.ProbeResult(backend='webcam', index=1, api=cv2.CAP_ANY))
+    fake_capture.devices = {0: (0.0, True)}
+
+    manager = CameraManager(config, backends=('webcam',))
+    manager.start()
+
+    assert manager.probe['from_cache'] is False
+    assert manager.webcam.index == 0
+    assert discovery.load_cached_camera(cache_file, key)['index'] == 0
+    manager.shutdown()
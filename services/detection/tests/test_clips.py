@@ -0,0 +1,181 @@
+"""Tests for event clip recording"""
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+ROOT_DIR = Path(__file__).resolve().parents[3]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+cv2 = pytest.importorskip('cv2')
+
+from services.detection.config.runtime import RuntimeConfig
+from services.detection.monitoring.metrics import MetricsRegistry
+from services.detection.recording import ClipRecorder, JpegRing, MjpegAviWriter, jpeg_size
+from services.detection.service import DetectionService
+from services.detection.tools.fakes import FakeModel, attach_fake_model
+
+
+def _jpeg(value, width=64, height=48):
+    success, buffer = cv2.imencode('.jpg', np.full((height, width, 3), value, dtype=np.uint8))
+    assert success
+    return buffer.tobytes()
+
+
+def _read_avi(path):
+    capture = cv2.VideoCapture(str(path))
+    frames = []
+    while True:
+        ok, frame = capture.read()
+        if not ok:
+            break
+        frames.append(frame)
+    fps = capture.get(cv2.CAP_PROP_FPS)
+    capture.release()
+    return frames, fps
+
+
+class StubPipeline:
+    def __init__(self, camera_id='0'):
+        self.camera_id = camera_id
+        self.listeners = []
+        self.last_annotated_frame = None
+        self.annotated_timestamp = None
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self.listeners.remove(listener)
+
+    def publish(self, data, timestamp):
+        self.last_annotated_frame, self.annotated_timestamp = data, timestamp
+        for listener in self.listeners:
+            listener(self, 'annotated')
+
+
+def test_ring_keeps_newest_frames_intact_across_wraps():
+    ring = JpegRing(capacity_bytes=1000)
+    payloads = {}
+    for index in range(200):
+        data = bytes([index % 256]) * (37 + index % 90)
+        seq = ring.append(data, float(index))
+        payloads[seq] = data
+
+    frames = ring.frames()
+    assert frames, 'ring must hold the newest frames'
+    assert [seq for seq, _, _ in frames] == list(range(frames[0][0], 201))
+    assert all(data == payloads[seq] for seq, _, data in frames)
+    assert ring.stats()['bytes'] == sum(len(data) for _, _, data in frames) <= 1000
+    assert ring.append(b'x' * 1001, 0.0) is None and ring.stats()['dropped'] == 1
+    assert [seq for seq, _, _ in ring.frames(after_seq=198)] == [199, 200]
+    assert [ts for _, ts, _ in ring.frames(since=197.0, until=198.0)] == [197.0, 198.0]
+
+
+def test_avi_writer_stores_jpegs_readable_by_opencv(tmp_path):
+    path = tmp_path / 'clip.avi'
+    writer = MjpegAviWriter(path)
+    for value in (0, 80, 160, 240, 120):
+        writer.write(_jpeg(value))
+    size = writer.close(fps=12.5)
+
+    assert jpeg_size(_jpeg(0)) == (64, 48)
+    assert size == path.stat().st_size
+    frames, fps = _read_avi(path)
+    assert len(frames) == 5 and frames[0].shape == (48, 64, 3)
+    assert fps == pytest.approx(12.5, abs=0.01)
+    assert abs(int(frames[1].mean()) - 80) < 5
+
+
+def test_clip_contains_pre_and_post_roll(tmp_path):
+    recorder = ClipRecorder(tmp_path, MetricsRegistry(), labels=['fire'], pre_roll=1.0, post_roll=1.0)
+    pipeline = StubPipeline()
+    recorder.attach(pipeline)
+    for index in range(30):  # 3 s at 10 fps before the event
+        pipeline.publish(_jpeg(index * 8), 100.0 + index * 0.1)
+
+    recorder.observe('0', [{'trackId': 1, 'label': 'fire'}], 102.9)
+    assert recorder.stats()['recording'] == {'0': 'track1_fire'}
+    for index in range(30, 50):
+        pipeline.publish(_jpeg(index * 4), 100.0 + index * 0.1)
+    recorder.flush(now=103.5)
+    assert recorder.flush(now=104.5) == 1
+
+    clips = list(tmp_path.glob('*.avi'))
+    assert len(clips) == 1 and 'track1_fire' in clips[0].name
+    assert not list(tmp_path.glob('*.part'))
+    frames, fps = _read_avi(clips[0])
+    # 1.9..3.9 s: pre-roll from the ring plus the post-roll frames
+    assert len(frames) == 21
+    assert fps == pytest.approx(10.0, rel=0.05)
+    assert recorder.stats()['clips_written'] == 1
+
+
+def test_only_new_tracks_of_watched_labels_trigger(tmp_path):
+    recorder = ClipRecorder(tmp_path, MetricsRegistry(), labels=['fire'], pre_roll=0.5, post_roll=0.5)
+    recorder.attach(StubPipeline())
+
+    recorder.observe('0', [{'trackId': 1, 'label': 'smoke'}], 10.0)
+    assert recorder.stats()['recording'] == {}
+    recorder.observe('0', [{'trackId': 2, 'label': 'Fire'}], 10.0)
+    assert recorder.stats()['recording'] == {'0': 'track2_fire'}
+    recorder.flush(now=20.0)
+
+    recorder.observe('0', [{'trackId': 2, 'label': 'fire'}], 21.0)
+    assert recorder.stats()['recording'] == {}
+    assert recorder.trigger('unknown', 'target1') is False
+
+
+def test_repeated_triggers_extend_the_clip_up_to_max_seconds(tmp_path):
+    recorder = ClipRecorder(tmp_path, MetricsRegistry(), pre_roll=1.0, post_roll=2.0, max_seconds=5.0)
+    recorder.attach(StubPipeline())
+    recorder.trigger('0', 'a', 10.0)
+    recorder.trigger('0', 'b', 11.0)
+    assert recorder._jobs['0'].end == 13.0
+    recorder.trigger('0', 'c', 20.0)
+    assert recorder._jobs['0'].end == 14.0
+
+
+def test_rotation_deletes_oldest_clips(tmp_path):
+    for index, name in enumerate(('a.avi', 'b.avi', 'c.avi')):
+        path = tmp_path / name
+        path.write_bytes(b'\0' * 400)
+        os.utime(path, (1000 + index, 1000 + index))
+    (tmp_path / 'notes.txt').write_bytes(b'\0' * 4000)
+    recorder = ClipRecorder(tmp_path, MetricsRegistry(), max_disk_bytes=900)
+
+    assert recorder.rotate() == 1
+    assert sorted(path.name for path in tmp_path.glob('*.avi')) == ['b.avi', 'c.avi']
+    assert recorder.disk_usage() == 800
+
+
+def test_service_records_clip_on_new_track(tmp_path):
+    config = RuntimeConfig(
+        infer_fps=50.0,
+        camera_source='synthetic:64x48',
+        camera_source_pace='fixed',
+        camera_source_fps=30.0,
+        clip_dir=str(tmp_path),
+        clip_labels=['fire'],
+        clip_pre_roll_seconds=0.2,
+        clip_post_roll_seconds=0.3,
+    )
+    service = DetectionService(config)
+    service._init_models = lambda: attach_fake_model(service, FakeModel(boxes=2))
+    service.start()
+    try:
+        deadline = time.monotonic() + 10
+        while not list(tmp_path.glob('*.avi')) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        clips = list(tmp_path.glob('*.avi'))
+        assert clips and '_fire' in clips[0].name
+        frames, _ = _read_avi(clips[0])
+        assert frames and frames[0].shape == (48, 64, 3)
+        status = service.get_status_payload()['clips']
+        assert status['clips_written'] >= 1 and status['buffers']['0']['frames'] > 0
+    finally:
+        service.stop()
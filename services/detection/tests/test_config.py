@@ -9,7 +9,7 @@ ROOT_DIR = Path(__file__).resolve().parents[3]
 if str(ROOT_DIR) not in sys.path:
     sys.path.append(str(ROOT_DIR))
 
-from services.detection.config.runtime import RuntimeConfig, _parse_camera_indices
+from services.detection.config.runtime import RuntimeConfig, _parse_camera_indices, _parse_camera_list
 
 
 def test_default_config():
@@ -23,6 +23,13 @@ def test_default_config():
     assert config.tracker_max_age == 5
     assert config.tracker_min_hits == 1
     assert len(config.camera_indices) == 5
+    assert config.camera_source is None
+    assert config.camera_source_pace == 'realtime'
+    assert config.camera_source_loop is True
+    assert config.server_mode == 'threaded'
+    assert config.debug_token is None
+    assert config.camera_probe_timeout == 5.0
+    assert config.camera_cache_file is None
 
 
 def test_config_from_env():
@@ -60,3 +67,199 @@ def test_parse_camera_indices():
     assert _parse_camera_indices('invalid') == list(range(5))
     assert _parse_camera_indices('0,invalid,2') == [0, 2]
 
+
+
+def test_camera_source_from_env(monkeypatch):
+    """Test file-backed camera source settings"""
+    monkeypatch.setenv('CAMERA_SOURCE', 'file:/tmp/clip.mp4')
+    monkeypatch.setenv('CAMERA_SOURCE_PACE', 'Fast')
+    monkeypatch.setenv('CAMERA_SOURCE_FPS', '12.5')
+    monkeypatch.setenv('CAMERA_SOURCE_LOOP', 'false')
+
+    config = RuntimeConfig.from_env()
+    assert config.camera_source == 'file:/tmp/clip.mp4'
+    assert config.camera_source_pace == 'fast'
+    assert config.camera_source_fps == 12.5
+    assert config.camera_source_loop is False
+
+
+def test_parse_camera_list():
+    """Test parsing the multi-camera list"""
+    assert _parse_camera_list(None) == []
+    assert _parse_camera_list('0, 2,picamera2') == ['0', '2', 'picamera2']
+    assert _parse_camera_list('file:/a.mp4,synthetic:640x480') == ['file:/a.mp4', 'synthetic:640x480']
+
+
+def test_server_mode_and_debug_token_from_env(monkeypatch):
+    monkeypatch.setenv('SERVER_MODE', ' Async ')
+    monkeypatch.setenv('DEBUG_TOKEN', 'secret')
+    config = RuntimeConfig.from_env()
+
+    assert config.server_mode == 'async'
+    assert config.debug_token == 'secret'
+
+
+def test_camera_discovery_from_env(monkeypatch):
+    monkeypatch.setenv('CAMERA_PROBE_TIMEOUT', '1.5')
+    monkeypatch.setenv('CAMERA_CACHE_FILE', 'off')
+    config = RuntimeConfig.from_env()
+
+    assert config.camera_probe_timeout == 1.5
+    assert config.camera_cache_file == 'off'
+
+
+def test_watchdog_from_env(monkeypatch):
+    monkeypatch.setenv('CAMERA_STALL_TIMEOUT', '2.5')
+    monkeypatch.setenv('CAMERA_MAX_FAILURES', '7')
+    monkeypatch.setenv('DETECTION_STALL_TIMEOUT', '10')
+    monkeypatch.setenv('WATCHDOG_INTERVAL', '0')
+    config = RuntimeConfig.from_env()
+
+    assert config.camera_stall_timeout == 2.5
+    assert config.camera_max_failures == 7
+    assert config.camera_reconnect_max_backoff == 30.0
+    assert config.detection_stall_timeout == 10.0
+    assert config.watchdog_interval == 0.0
+
+
+def test_picamera_stream_sizes_from_env(monkeypatch):
+    assert RuntimeConfig().picamera_lores_size == (640, 360)
+    monkeypatch.setenv('PICAMERA_MAIN_SIZE', '1920x1080')
+    monkeypatch.setenv('PICAMERA_LORES_SIZE', 'off')
+    config = RuntimeConfig.from_env()
+
+    assert config.picamera_main_size == (1920, 1080)
+    assert config.picamera_lores_size is None
+
+
+def test_stream_variants_from_env(monkeypatch):
+    assert RuntimeConfig().stream_variants[0] == (0, 0, 30.0)
+    monkeypatch.setenv('STREAM_VARIANTS', '0:0:25, 480:65:10, bad')
+    config = RuntimeConfig.from_env()
+
+    assert config.stream_variants == [(0, 0, 25.0), (480, 65, 10.0)]
+
+
+def test_clip_recording_from_env(monkeypatch):
+    assert RuntimeConfig().clip_dir is None
+    monkeypatch.setenv('CLIP_DIR', '/tmp/clips')
+    monkeypatch.setenv('CLIP_LABELS', 'Fire, smoke,')
+    monkeypatch.setenv('CLIP_ON_TARGET', 'no')
+    monkeypatch.setenv('CLIP_PRE_ROLL_SECONDS', '3')
+    monkeypatch.setenv('CLIP_MAX_DISK_MB', '256')
+    config = RuntimeConfig.from_env()
+
+    assert config.clip_dir == '/tmp/clips'
+    assert config.clip_labels == ['fire', 'smoke']
+    assert config.clip_on_target is False
+    assert config.clip_pre_roll_seconds == 3.0 and config.clip_post_roll_seconds == 10.0
+    assert config.clip_max_disk_mb == 256.0
+
+
+def test_frame_bus_from_env(monkeypatch):
+    assert RuntimeConfig().frame_bus is None
+    monkeypatch.setenv('FRAME_BUS', 'dc_frames')
+    monkeypatch.setenv('FRAME_BUS_SLOTS', '6')
+    config = RuntimeConfig.from_env()
+
+    assert config.frame_bus == 'dc_frames' and config.frame_bus_slots == 6
+
+
+def test_track_events_from_env(monkeypatch):
+    assert RuntimeConfig().events_url is None
+    monkeypatch.setenv('EVENTS_URL', 'http://localhost:8080/internal/track-events')
+    monkeypatch.setenv('EVENTS_BATCH_SIZE', '50')
+    config = RuntimeConfig.from_env()
+
+    assert config.events_url == 'http://localhost:8080/internal/track-events'
+    assert config.events_batch_size == 50 and config.events_queue_size == 1000
+
+
+def test_history_from_env(monkeypatch):
+    assert RuntimeConfig().history_db is None
+    monkeypatch.setenv('HISTORY_DB', '/var/lib/dc/history.db')
+    monkeypatch.setenv('HISTORY_CROPS', '0')
+    config = RuntimeConfig.from_env()
+
+    assert config.history_db == '/var/lib/dc/history.db'
+    assert config.history_crops is False and config.history_flush_interval == 1.0
+
+
+def test_trajectories_from_env(monkeypatch):
+    assert RuntimeConfig().trajectory_points == 256
+    monkeypatch.setenv('TRAJECTORY_POINTS', '0')
+    monkeypatch.setenv('TRAJECTORY_TOLERANCE', '1.5')
+    config = RuntimeConfig.from_env()
+
+    assert config.trajectory_points == 0 and config.trajectory_tolerance == 1.5
+    assert config.trajectory_tracks == 1000
+
+
+def test_heatmap_from_env(monkeypatch):
+    assert RuntimeConfig().heatmap_grid == (64, 36)
+    monkeypatch.setenv('HEATMAP_GRID', '32x18')
+    monkeypatch.setenv('HEATMAP_PATH', '/var/lib/dc/heatmap.npz')
+    config = RuntimeConfig.from_env()
+
+    assert config.heatmap_grid == (32, 18) and config.heatmap_path == '/var/lib/dc/heatmap.npz'
+    monkeypatch.setenv('HEATMAP_GRID', 'off')
+    assert RuntimeConfig.from_env().heatmap_grid is None
+
+
+def test_governor_from_env(monkeypatch):
+    assert RuntimeConfig().governor is False
+    monkeypatch.setenv('GOVERNOR', '1')
+    monkeypatch.setenv('GOVERNOR_PROFILES', 'full:0:0:0, eco:2:320:60, broken:x')
+    monkeypatch.setenv('GOVERNOR_TEMP_PATH', '/tmp/fake_temp')
+    config = RuntimeConfig.from_env()
+
+    assert config.governor is True
+    assert config.governor_profiles == [('full', 0.0, 0, 0), ('eco', 2.0, 320, 60)]
+    assert config.governor_temp_path == '/tmp/fake_temp' and config.governor_stat_path == '/proc/stat'
+    assert config.governor_temp_high == 75.0 and config.governor_hold_seconds == 30.0
+
+
+def test_cpu_layout_from_env(monkeypatch):
+    assert RuntimeConfig().cv2_threads == -1 and RuntimeConfig().detection_cpus == ()
+    monkeypatch.setenv('TORCH_THREADS', '2')
+    monkeypatch.setenv('CV2_THREADS', '1')
+    monkeypatch.setenv('DETECTION_CPUS', '2-3')
+    monkeypatch.setenv('ENCODE_CPUS', '1, 0,x,3-2')
+    config = RuntimeConfig.from_env()
+
+    assert config.torch_threads == 2 and config.torch_interop_threads == 0 and config.cv2_threads == 1
+    assert config.detection_cpus == (2, 3) and config.encode_cpus == (0, 1) and config.capture_cpus == ()
+
+
+def test_jpeg_encoder_from_env(monkeypatch):
+    assert RuntimeConfig().jpeg_backend == 'auto' and RuntimeConfig().crop_jpeg_quality == 85
+    monkeypatch.setenv('JPEG_BACKEND', 'TurboJPEG')
+    monkeypatch.setenv('JPEG_SUBSAMPLING', '422')
+    monkeypatch.setenv('JPEG_FAST_DCT', '0')
+    monkeypatch.setenv('CROP_JPEG_QUALITY', '70')
+    config = RuntimeConfig.from_env()
+
+    assert config.jpeg_backend == 'turbojpeg' and config.jpeg_subsampling == '422'
+    assert config.jpeg_fast_dct is False and config.jpeg_turbo_per_thread is True
+    assert config.crop_jpeg_quality == 70 and config.crop_jpeg_subsampling == '420'
+
+
+def test_input_size_from_env(monkeypatch):
+    assert RuntimeConfig().infer_size is None and RuntimeConfig().autotune is False
+    assert RuntimeConfig().autotune_sizes[-1] == (640, 384)
+    monkeypatch.setenv('INFER_SIZE', '640x384')
+    monkeypatch.setenv('AUTOTUNE', 'on')
+    monkeypatch.setenv('AUTOTUNE_SIZES', '320x192, bad, 512x288')
+    monkeypatch.setenv('AUTOTUNE_BUDGET_MS', '120')
+    config = RuntimeConfig.from_env()
+
+    assert config.infer_size == (640, 384) and config.autotune is True
+    assert config.autotune_sizes == [(320, 192), (512, 288)] and config.autotune_budget_ms == 120.0
+    assert config.autotune_runs == 5 and config.autotune_cache is None
+    # A bare side is a square input
+    monkeypatch.setenv('INFER_SIZE', '640')
+    monkeypatch.setenv('AUTOTUNE_SIZES', '320, 640x384')
+    config = RuntimeConfig.from_env()
+    assert config.infer_size == (640, 640) and config.autotune_sizes == [(320, 320), (640, 384)]
+    monkeypatch.setenv('HEATMAP_GRID', '64')
+    assert RuntimeConfig.from_env().heatmap_grid == (64, 36)
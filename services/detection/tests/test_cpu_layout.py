@@ -0,0 +1,143 @@
+"""Tests for thread-pool sizing and per-role CPU pinning"""
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+ROOT_DIR = Path(__file__).resolve().parents[3]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+from services.detection.config.runtime import RuntimeConfig
+from services.detection.monitoring.cpu_layout import CpuLayout, available_cpus
+from services.detection.service import DetectionService
+from services.detection.tools.fakes import FakeModel, attach_fake_model
+
+pytestmark = pytest.mark.skipif(not hasattr(os, 'sched_setaffinity'), reason='needs sched_setaffinity')
+
+
+def _in_thread(fn, name):
+    """Runs ``fn`` in a fresh thread so pinning never leaks into the test runner's threads."""
+    result = {}
+    thread = threading.Thread(target=lambda: result.update(value=fn()), name=name)
+    thread.start()
+    thread.join()
+    return result['value']
+
+
+def test_pins_the_calling_thread_once():
+    cpu = available_cpus()[-1]
+    layout = CpuLayout(affinity={'encode': [cpu]})
+
+    def work():
+        return layout.pin('encode'), layout.pin('encode'), layout.pin('capture'), sorted(os.sched_getaffinity(0))
+
+    assert _in_thread(work, 'viewer-1') == (True, True, False, [cpu])
+    report = layout.report()
+    assert report['pinned_threads'] == {'viewer-1': 'encode'}
+    assert report['affinity'] == {'detection': [], 'capture': [], 'encode': [cpu]}
+    with pytest.raises(ValueError):
+        CpuLayout(affinity={'gpu': [0]})
+
+
+def test_pinned_block_restores_the_previous_cpu_set():
+    cpus = available_cpus()
+    layout = CpuLayout(affinity={'encode': [cpus[-1]], 'detection': [cpus[0]]})
+
+    def work():
+        with layout.pinned('encode') as pinned:
+            during = sorted(os.sched_getaffinity(0))
+            with layout.pinned('encode') as nested:
+                pass
+        after = sorted(os.sched_getaffinity(0))
+        layout.pin('detection')
+        with layout.pinned('encode'):
+            pass
+        return pinned, nested, during, after, sorted(os.sched_getaffinity(0)), layout.pin('detection')
+
+    assert _in_thread(work, 'executor-1') == (True, True, [cpus[-1]], cpus, [cpus[0]], True)
+    assert layout.report()['pinned_threads'] == {'executor-1': 'detection'}
+    with layout.pinned('capture') as pinned:
+        assert not pinned
+
+
+def test_unavailable_cpus_leave_the_thread_unpinned():
+    layout = CpuLayout(affinity={'capture': [max(available_cpus()) + 1000]})
+
+    assert _in_thread(lambda: (layout.pin('capture'), sorted(os.sched_getaffinity(0))), 'capture-x') == (
+        False, available_cpus()
+    )
+    assert layout.report()['affinity']['capture'] == [] and layout.errors
+
+
+def test_configure_libraries(monkeypatch):
+    cv2 = pytest.importorskip('cv2')
+    previous = cv2.getNumThreads()
+    monkeypatch.setitem(sys.modules, 'torch', None)  # torch missing: reported, not raised
+    layout = CpuLayout(torch_threads=2, cv2_threads=1)
+    try:
+        layout.configure_libraries()
+        assert cv2.getNumThreads() == 1
+        assert layout.errors == ['torch is not installed']
+        assert 'opencv=1' in layout.describe()
+    finally:
+        cv2.setNumThreads(previous)
+
+
+def test_service_pins_detection_capture_and_encode_threads():
+    pytest.importorskip('cv2')
+    cpus = tuple(available_cpus()[:1])
+    config = RuntimeConfig(
+        infer_fps=50.0,
+        camera_source='synthetic:64x48',
+        camera_source_pace='fast',
+        detection_cpus=cpus,
+        capture_cpus=cpus,
+        encode_cpus=cpus,
+    )
+    service = DetectionService(config)
+    service._init_models = lambda: attach_fake_model(service, FakeModel(boxes=1))
+    service.start()
+    try:
+        assert service.wait_ready(5)
+        deadline = time.monotonic() + 5
+        while service.primary.frame_seq < 2 and time.monotonic() < deadline:
+            time.sleep(0.02)
+        # Request threads are on the encode CPUs only while encoding
+        data, after = _in_thread(lambda: (service.capture_raw_jpeg(), sorted(os.sched_getaffinity(0))), 'viewer-1')
+        assert data and after == available_cpus()
+
+        layout = service.get_status_payload()['cpu_layout']
+        assert layout['pinned_threads'] == {'detection-loop': 'detection', 'capture-0': 'capture'}
+        assert layout['affinity']['detection'] == list(cpus)
+    finally:
+        service.stop()
+
+
+def test_on_demand_autotune_measures_on_the_detection_cpus(tmp_path):
+    cpus = available_cpus()
+    config = RuntimeConfig(
+        camera_source='synthetic:64x48',
+        detection_cpus=(cpus[0],),
+        encode_cpus=(cpus[-1],),
+        autotune_sizes=[(320, 192)],
+        autotune_runs=1,
+        autotune_cache=str(tmp_path / 'sizes.json'),
+    )
+    service = DetectionService(config)
+    attach_fake_model(service, FakeModel(boxes=1))
+    measure = service.input_tuner.measure
+    seen = []
+    service.input_tuner.measure = lambda run: (seen.append(sorted(os.sched_getaffinity(0))), measure(run))[1]
+
+    def request():
+        # Even a thread pinned to another role measures on the detection CPUs and gets its own back
+        service.cpu_layout.pin('encode')
+        service.autotune_input_size()
+        return sorted(os.sched_getaffinity(0))
+
+    assert _in_thread(request, 'executor-2') == [cpus[-1]]
+    assert seen == [[cpus[0]]]
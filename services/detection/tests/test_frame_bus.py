@@ -0,0 +1,146 @@
+"""Tests for the shared-memory frame bus"""
+import os
+import subprocess
+import sys
+import time
+import uuid
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+ROOT_DIR = Path(__file__).resolve().parents[3]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+from services.detection.config.runtime import RuntimeConfig
+from services.detection.ipc import FrameBusReader, FrameBusWriter, bus_name
+from services.detection.service import DetectionService
+from services.detection.tools.fakes import FakeModel, attach_fake_model
+
+
+@pytest.fixture
+def writer():
+    bus = FrameBusWriter(f'dc_test_{uuid.uuid4().hex[:8]}', slots=3, meta_capacity=1024)
+    yield bus
+    bus.close()
+
+
+def _image(value, height=24, width=32):
+    return np.full((height, width, 3), value, dtype=np.uint8)
+
+
+def test_reader_sees_latest_frame_and_detections(writer):
+    writer.publish(_image(1), frame_seq=1, timestamp=10.0)
+    reader = FrameBusReader(writer.name)
+    try:
+        assert reader.latest_detected() is None
+        writer.publish(_image(2), frame_seq=2, timestamp=11.0, color='rgb')
+        assert writer.publish_detections(1, {'detections': [{'trackId': 5, 'bbox': np.array([1.0, 2.0])}]})
+
+        frame = reader.latest()
+        assert frame.frame_seq == 2 and frame.timestamp == 11.0 and frame.color == 'rgb'
+        assert frame.image.shape == (24, 32, 3) and int(frame.image[0, 0, 0]) == 2
+        assert not frame.image.flags.writeable
+        assert frame.detections is None
+
+        detected = reader.latest_detected()
+        assert detected.frame_seq == 1 and int(detected.image.max()) == 1
+        assert detected.detections == {'detections': [{'trackId': 5, 'bbox': [1.0, 2.0]}]}
+        del frame, detected
+    finally:
+        reader.close()
+
+
+def test_zero_copy_view_is_invalidated_when_slot_is_reused(writer):
+    writer.publish(_image(1), frame_seq=1, timestamp=1.0)
+    reader = FrameBusReader(writer.name)
+    try:
+        view = reader.latest()
+        copy = reader.latest(copy=True)
+        writer.publish(_image(2), frame_seq=2, timestamp=2.0)
+        writer.publish(_image(3), frame_seq=3, timestamp=3.0)
+        assert view.valid()
+        writer.publish(_image(4), frame_seq=4, timestamp=4.0)  # wraps onto slot of frame 1
+
+        assert not view.valid()
+        assert int(copy.image.max()) == 1
+        assert not writer.publish_detections(1, {'late': True})
+        del view, copy
+    finally:
+        reader.close()
+
+
+def test_attaching_detections_keeps_the_frame_valid(writer):
+    writer.publish(_image(1), frame_seq=1, timestamp=1.0)
+    reader = FrameBusReader(writer.name)
+    try:
+        frame = reader.latest()
+        assert frame.detections is None
+        assert writer.publish_detections(1, {'detections': []})
+
+        assert frame.valid()
+        again = reader.latest()
+        assert again.detections == {'detections': []} and again.valid()
+        del frame, again
+    finally:
+        reader.close()
+
+
+def test_oversized_frames_are_skipped(writer):
+    assert writer.publish(_image(1), frame_seq=1, timestamp=1.0)
+    assert writer.publish(_image(2, height=12, width=16), frame_seq=2, timestamp=2.0)
+    assert not writer.publish(_image(3, height=48, width=64), frame_seq=3, timestamp=3.0)
+    assert writer.stats()['frames_skipped'] == 1
+
+    reader = FrameBusReader(writer.name)
+    try:
+        frame = reader.latest()
+        assert frame.frame_seq == 2 and frame.image.shape == (12, 16, 3)
+        del frame
+    finally:
+        reader.close()
+
+
+def test_reader_in_another_process(writer):
+    writer.publish(_image(7), frame_seq=9, timestamp=1.0)
+    code = (
+        'import sys; sys.path.insert(0, sys.argv[2]);'
+        'from services.detection.ipc import FrameBusReader;'
+        'reader = FrameBusReader(sys.argv[1]); frame = reader.latest();'
+        'print(frame.frame_seq, int(frame.image.sum()))'
+    )
+    result = subprocess.run(
+        [sys.executable, '-c', code, writer.name, str(ROOT_DIR)], capture_output=True, text=True, check=True
+    )
+    assert result.stdout.split() == ['9', str(7 * 24 * 32 * 3)]
+    # The reader exiting must not unlink the writer's segment
+    reader = FrameBusReader(writer.name)
+    reader.close()
+
+
+@pytest.mark.skipif(not os.path.isdir('/dev/shm'), reason='POSIX shared memory required')
+def test_service_publishes_frames_and_detections():
+    prefix = f'dc_test_{uuid.uuid4().hex[:8]}'
+    config = RuntimeConfig(
+        infer_fps=50.0, camera_source='synthetic:64x48', camera_source_pace='fast', frame_bus=prefix
+    )
+    service = DetectionService(config)
+    service._init_models = lambda: attach_fake_model(service, FakeModel(boxes=2))
+    service.start()
+    try:
+        assert service.wait_ready(5)
+        deadline = time.monotonic() + 5
+        detected = None
+        while detected is None and time.monotonic() < deadline:
+            time.sleep(0.05)
+            if service.frame_bus.writers['0'].active:
+                reader = FrameBusReader(bus_name(prefix, '0'))
+                detected = reader.latest_detected(copy=True)
+                reader.close()
+        assert detected is not None and detected.image.shape == (48, 64, 3)
+        assert detected.detections['frameSeq'] == detected.frame_seq
+        assert len(detected.detections['detections']) == 2
+        assert service.get_status_payload()['frame_bus']['0']['frames_published'] > 0
+    finally:
+        service.stop()
@@ -0,0 +1,101 @@
+"""Tests for immutable frames and the frame buffer pool"""
+import sys
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+ROOT_DIR = Path(__file__).resolve().parents[3]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+cv2 = pytest.importorskip('cv2')
+
+from services.detection.camera.frames import Frame, FramePool
+from services.detection.camera.manager import CameraManager
+from services.detection.config.runtime import RuntimeConfig
+from services.detection.detection.inference import InferenceEngine
+from services.detection.pipeline import CameraPipeline
+
+
+class BufferFillingWebcam:
+    """VideoCapture stand-in that decodes into the caller's buffer like OpenCV does."""
+
+    def __init__(self, shape=(48, 64, 3)):
+        self.shape = shape
+        self.count = 0
+
+    def read(self, image=None):
+        self.count += 1
+        if image is None or image.shape != self.shape:
+            image = np.empty(self.shape, dtype=np.uint8)
+        image[...] = self.count % 255
+        return True, image
+
+    def release(self):
+        pass
+
+
+def test_frame_is_read_only_view():
+    array = np.zeros((4, 4, 3), dtype=np.uint8)
+    frame = Frame.wrap(array, seq=1, timestamp=10.0)
+
+    assert frame.data.base is array
+    with pytest.raises(ValueError):
+        frame.data[0, 0, 0] = 1
+    copy = frame.writable_copy()
+    copy[0, 0, 0] = 1
+    assert array[0, 0, 0] == 0
+
+
+def test_pool_reuses_buffers_once_unreferenced():
+    pool = FramePool(capacity=2)
+    first = pool.acquire((4, 4, 3))
+    view = Frame.wrap(first, 1, 0.0).data[1:3]
+    del first
+
+    second = pool.acquire((4, 4, 3))
+    assert not np.shares_memory(second, view)  # a live view pins its buffer
+    del view
+    third = pool.acquire((4, 4, 3))
+
+    assert pool.stats()['allocations'] == 2 and pool.stats()['reuses'] == 1
+    assert not np.shares_memory(second, third)
+    assert pool.acquire((8, 8, 3)).shape == (8, 8, 3)  # new resolution resets the pool
+
+
+def test_webcam_frames_use_pool_buffers():
+    manager = CameraManager(RuntimeConfig(), backends=())
+    manager.camera_type = 'webcam'
+    manager.webcam = BufferFillingWebcam()
+    pipeline = CameraPipeline('0', manager, RuntimeConfig())
+    stop_event = threading.Event()
+    pipeline.start_capture(stop_event)
+    try:
+        deadline = time.monotonic() + 5
+        while pipeline.frames_captured < 200 and time.monotonic() < deadline:
+            time.sleep(0.001)
+        assert pipeline.frames_captured >= 200
+        frame = pipeline.last_raw_frame
+        assert frame is not None and frame.flags.writeable is False
+        stats = manager.frame_pool.stats()
+        # First frame sizes the pool, every later frame lands in a recycled buffer
+        assert stats['allocations'] <= manager.frame_pool.capacity + 1
+        assert stats['reuses'] >= 190
+    finally:
+        stop_event.set()
+        pipeline.join(timeout=1)
+
+
+def test_annotate_draws_into_scratch_buffer():
+    engine = InferenceEngine(None, None, threading.RLock(), confidence_threshold=0.5)
+    frame = Frame.wrap(np.zeros((48, 64, 3), dtype=np.uint8), 1, 0.0).data
+    out = np.empty_like(frame)
+    tracked = [{'bbox': [4, 4, 30, 30], 'trackId': 1, 'label': 'fire', 'confidence': 0.9}]
+
+    annotated = engine.annotate(frame, tracked, out=out)
+
+    assert annotated is out
+    assert annotated.any() and not frame.any()
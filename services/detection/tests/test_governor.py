@@ -0,0 +1,136 @@
+"""Tests for the thermal/load performance governor"""
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+ROOT_DIR = Path(__file__).resolve().parents[3]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+from services.detection import detection_server
+from services.detection.config.runtime import RuntimeConfig
+from services.detection.monitoring.governor import (
+    CpuLoadSampler, PerformanceGovernor, PerformanceProfile, build_profiles, read_temperature
+)
+from services.detection.monitoring.metrics import MetricsRegistry
+from services.detection.service import DetectionService
+from services.detection.tools.fakes import FakeModel, attach_fake_model
+
+PROFILES = build_profiles(
+    [('full', 0, 0, 0), ('warm', 3.0, 480, 75), ('hot', 1.0, 320, 50)], infer_fps=5.0, jpeg_quality=85
+)
+
+
+def _governor(**kwargs):
+    applied = []
+    governor = PerformanceGovernor(
+        PROFILES, applied.append, MetricsRegistry(), temp_high=75.0, temp_low=65.0, load_high=0.95, load_low=0.7,
+        hold_seconds=30.0, step_seconds=10.0, **kwargs
+    )
+    return governor, applied
+
+
+def _write_stat(path, busy, idle):
+    path.write_text(f'cpu  {busy} 0 0 {idle} 0 0 0 0 0 0\ncpu0 1 2 3 4\n')
+
+
+def test_build_profiles_never_exceed_configuration():
+    assert PROFILES[0] == PerformanceProfile('full', 5.0, None, 85)
+    assert PROFILES[1] == PerformanceProfile('warm', 3.0, 480, 75)
+    slow = build_profiles([('warm', 10.0, 0, 95)], infer_fps=2.0, jpeg_quality=80)
+    assert slow == [PerformanceProfile('warm', 2.0, None, 80)]
+
+
+def test_steps_down_when_hot_and_spaces_steps_out():
+    governor, applied = _governor()
+    assert governor.evaluate(76.0, 0.5, now=0.0)
+    assert governor.profile.name == 'warm' and applied[-1].imgsz == 480
+    assert not governor.evaluate(78.0, 0.5, now=5.0)  # previous step has not taken effect yet
+    assert governor.evaluate(78.0, 0.5, now=10.0)
+    assert governor.profile.name == 'hot'
+    assert not governor.evaluate(80.0, 0.5, now=30.0)  # already the lightest profile
+    assert governor.evaluate(60.0, 0.99, now=100.0) is False  # busy, but nowhere lower to go
+    assert [t['to'] for t in governor.transitions] == ['warm', 'hot']
+    assert governor.transitions[0]['reason'] == 'temperature 76.0C'
+
+
+def test_steps_up_only_after_holding_below_low_thresholds():
+    governor, _ = _governor()
+    governor.evaluate(76.0, None, now=0.0)
+    # Between the thresholds: stays on the lighter profile indefinitely
+    for now in range(10, 100, 10):
+        assert not governor.evaluate(70.0, None, now=float(now))
+    assert not governor.evaluate(64.0, 0.5, now=100.0)
+    assert not governor.evaluate(64.0, 0.8, now=120.0)  # load above load_low resets the hold
+    assert not governor.evaluate(64.0, 0.5, now=125.0)
+    assert not governor.evaluate(64.0, 0.5, now=150.0)
+    assert governor.evaluate(64.0, 0.5, now=155.0)
+    assert governor.profile.name == 'full'
+    assert governor.transitions[-1]['reason'] == 'calm for 30s'
+
+
+def test_reads_sysfs_temperature_and_proc_stat_load(tmp_path):
+    temp = tmp_path / 'temp'
+    temp.write_text('71234\n')
+    assert read_temperature(str(temp)) == pytest.approx(71.234)
+    assert read_temperature(str(tmp_path / 'missing')) is None
+
+    stat = tmp_path / 'stat'
+    sampler = CpuLoadSampler(str(stat))
+    _write_stat(stat, busy=100, idle=100)
+    assert sampler.sample() is None  # needs two readings
+    _write_stat(stat, busy=190, idle=110)
+    assert sampler.sample() == pytest.approx(0.9)
+
+    governor, applied = _governor(temp_path=str(temp), stat_path=str(stat))
+    temp.write_text('80000\n')
+    governor.start()
+    try:
+        assert applied == [PROFILES[0]]
+        _write_stat(stat, busy=200, idle=200)
+        assert governor.sample(now=0.0) and governor.profile.name == 'warm'
+        assert governor.stats()['temperature'] == 80.0
+    finally:
+        governor.stop()
+
+
+def test_service_applies_profile_and_reports_it(tmp_path):
+    temp = tmp_path / 'temp'
+    temp.write_text('50000\n')
+    config = RuntimeConfig(
+        infer_fps=20.0,
+        camera_source='synthetic:64x48',
+        camera_source_pace='fast',
+        governor=True,
+        governor_interval=0.05,
+        governor_step_seconds=0.0,
+        governor_temp_path=str(temp),
+        governor_stat_path=str(tmp_path / 'missing'),
+    )
+    service = DetectionService(config)
+    model = FakeModel(boxes=1)
+    service._init_models = lambda: attach_fake_model(service, model)
+    service.start()
+    detection_server.detection_service = service
+    try:
+        assert service.wait_ready(5)
+        assert model.last_options == {}
+        temp.write_text('90000\n')
+        deadline = time.monotonic() + 5
+        while service.governor.profile.name != 'critical' and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert service.infer_fps == 1.0 and service.jpeg_quality == 50
+        assert service.primary.jpeg_quality == 50 and service.inference_engine.imgsz == 320
+        while model.last_options.get('imgsz') != 320 and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert model.last_options == {'imgsz': 320}
+
+        payload = detection_server.app.test_client().get('/api/detection').get_json()
+        assert payload['infer_fps'] == 1.0
+        assert payload['governor']['profile']['name'] == 'critical'
+        assert [t['to'] for t in payload['governor']['transitions']] == ['warm', 'hot', 'critical']
+    finally:
+        detection_server.detection_service = None
+        service.stop()
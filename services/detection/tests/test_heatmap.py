@@ -0,0 +1,136 @@
+"""Tests for the decaying detection heatmap"""
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+ROOT_DIR = Path(__file__).resolve().parents[3]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+from services.detection import detection_server
+from services.detection.config.runtime import RuntimeConfig
+from services.detection.monitoring.metrics import MetricsRegistry
+from services.detection.service import DetectionService
+from services.detection.tools.fakes import FakeModel, attach_fake_model
+from services.detection.tracking.heatmap import DetectionHeatmap, parse_heatmap_query
+
+FRAME = (100, 200, 3)  # 200x100 pixels -> 10x5 grid of 20 px cells
+
+
+def _heatmap(**kwargs):
+    return DetectionHeatmap(MetricsRegistry(), grid_size=(10, 5), **kwargs)
+
+
+def test_boxes_add_frame_time_to_covered_cells():
+    heatmap = _heatmap(half_life=1e9)
+    fire = {'bbox': [20, 20, 60, 40], 'label': 'fire'}
+    smoke = {'bbox': [190, 90, 200, 100], 'label': 'smoke'}
+    heatmap.observe('0', [fire, smoke], FRAME, 100.0)
+    for step in range(1, 11):
+        heatmap.observe('0', [fire], FRAME, 100.0 + step * 0.5)
+
+    values, version, as_of = heatmap.grid('0', 'fire')
+    expected = np.zeros((5, 10))
+    expected[1, 1:3] = 0.1 + 10 * 0.5
+    np.testing.assert_allclose(values, expected, atol=1e-6)
+    assert version == 11 and as_of == 105.0
+
+    smoke_values, _, _ = heatmap.grid('0', 'smoke')
+    assert smoke_values[4, 9] == pytest.approx(0.1) and smoke_values.sum() == pytest.approx(0.1)
+    assert heatmap.grid('0')[0].sum() == pytest.approx(values.sum() + 0.1)
+    assert heatmap.labels('0') == ['fire', 'smoke'] and heatmap.grid('1') is None
+
+
+def test_decay_halves_old_contributions_and_survives_renormalization():
+    heatmap = _heatmap(half_life=10.0)
+    box = [{'bbox': [0, 0, 20, 20], 'label': 'fire'}]
+    heatmap.observe('0', box, FRAME, 0.0)
+    heatmap.observe('0', box, FRAME, 0.5)
+    heatmap.observe('0', [], FRAME, 9.0)
+    heatmap.observe('0', box, FRAME, 10.5)  # 1.5 s gap is capped at MAX_STEP
+    assert heatmap.grid('0')[0][0, 0] == pytest.approx(0.1 * 0.5 ** 1.05 + 0.5 * 0.5 + 1.0)
+
+    # Far beyond the renormalization threshold, old weight has decayed away entirely
+    heatmap.observe('0', box, FRAME, 10.5 + 10 * 40)
+    assert heatmap.grid('0')[0][0, 0] == pytest.approx(1.0)
+
+
+def test_idle_camera_keeps_fading():
+    pytest.importorskip('cv2')
+    heatmap = _heatmap(half_life=10.0)
+    box = [{'bbox': [0, 0, 20, 20], 'label': 'fire'}]
+    heatmap.observe('0', box, FRAME, 1000.0)
+    heatmap.observe('0', box, FRAME, 1001.0)
+    peak = 0.1 * 0.5 ** 0.1 + 1.0
+    assert heatmap.render('0', fmt='json')['max'] == pytest.approx(peak)
+
+    # Frames without boxes move the reference time on
+    heatmap.observe('0', [], FRAME, 1011.0)
+    values, version, as_of = heatmap.grid('0')
+    assert values.max() == pytest.approx(peak / 2) and as_of == 1011.0 and version == 2
+    # So does the reader's clock when no frames arrive at all, and the cached render is redrawn
+    assert heatmap.grid('0', now=5000.0)[0].max() < 1e-100
+    assert heatmap.render('0', fmt='json', now=5000.0)['max'] < 1e-100
+
+
+def test_render_is_cached_until_the_grid_changes():
+    pytest.importorskip('cv2')
+    heatmap = _heatmap()
+    box = [{'bbox': [0, 0, 100, 50], 'label': 'fire'}]
+    heatmap.observe('0', box, FRAME, 1.0)
+
+    png = heatmap.render('0', width=40)
+    assert png.startswith(b'\x89PNG') and heatmap.render('0', width=40) is png
+    payload = heatmap.render('0', fmt='json')
+    assert payload['columns'] == 10 and payload['frameSize'] == [200, 100]
+    assert payload['max'] == pytest.approx(0.1)
+
+    heatmap.observe('0', box, FRAME, 1.5)
+    assert heatmap.render('0', width=40) is not png
+    assert heatmap.render('0', label='smoke') is None
+
+
+def test_grids_are_saved_and_loaded(tmp_path):
+    path = tmp_path / 'heatmap.npz'
+    heatmap = _heatmap(half_life=60.0, path=path)
+    heatmap.observe('0', [{'bbox': [20, 20, 40, 40], 'label': 'fire'}], FRAME, 1000.0)
+    assert heatmap.save() and not heatmap.save()  # unchanged grids are not rewritten
+
+    restored = _heatmap(half_life=60.0, path=path)
+    np.testing.assert_allclose(restored.grid('0', 'fire')[0], heatmap.grid('0', 'fire')[0])
+    # A different grid size starts from scratch
+    assert DetectionHeatmap(MetricsRegistry(), grid_size=(8, 4), path=path).grid('0') is None
+
+
+def test_parse_heatmap_query():
+    assert parse_heatmap_query({'label': 'fire', 'width': '5000'}) == {'label': 'fire', 'fmt': 'png', 'width': 1920}
+    with pytest.raises(ValueError):
+        parse_heatmap_query({'format': 'gif'})
+
+
+def test_service_serves_heatmap():
+    pytest.importorskip('cv2')
+    config = RuntimeConfig(infer_fps=50.0, camera_source='synthetic:64x48', camera_source_pace='fast')
+    service = DetectionService(config)
+    service._init_models = lambda: attach_fake_model(service, FakeModel(boxes=2))
+    service.start()
+    detection_server.detection_service = service
+    try:
+        assert service.wait_ready(5)
+        deadline = time.monotonic() + 5
+        while service.heatmap.grid('0') is None and time.monotonic() < deadline:
+            time.sleep(0.02)
+
+        client = detection_server.app.test_client()
+        response = client.get('/api/heatmap?width=128')
+        assert response.status_code == 200 and response.mimetype == 'image/png'
+        payload = client.get('/api/heatmap?format=json').get_json()
+        assert payload['max'] > 0 and payload['labels']
+        assert client.get('/api/heatmap?camera=9').status_code == 404
+        assert client.get('/api/heatmap?format=bmp').status_code == 400
+    finally:
+        detection_server.detection_service = None
+        service.stop()
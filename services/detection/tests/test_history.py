@@ -0,0 +1,154 @@
+"""Tests for the finalized track history store"""
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+ROOT_DIR = Path(__file__).resolve().parents[3]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+from services.detection import detection_server
+from services.detection.config.runtime import RuntimeConfig
+from services.detection.monitoring.metrics import MetricsRegistry
+from services.detection.service import DetectionService
+from services.detection.tools.fakes import FakeModel, attach_fake_model
+from services.detection.tracking.history import TrackHistoryStore, parse_history_query
+from services.detection.tracking.sort_tracker import SortTracker
+
+
+def _summary(track_id, first_seen, last_seen, label='fire', confidence=0.8):
+    return {
+        'trackId': track_id,
+        'label': label,
+        'firstSeen': first_seen,
+        'lastSeen': last_seen,
+        'hits': 3,
+        'confidence': confidence - 0.1,
+        'bestConfidence': confidence,
+        'bbox': [10, 10, 20, 20],
+        'firstBbox': [0, 0, 10, 10],
+        'bestBbox': [5, 5, 15, 15],
+    }
+
+
+@pytest.fixture
+def store(tmp_path):
+    history = TrackHistoryStore(tmp_path / 'history.db', MetricsRegistry(), crops_dir=tmp_path / 'crops', batch_size=50)
+    yield history
+    history.stop()
+
+
+def test_records_are_written_in_batches_and_queried(store):
+    for index in range(120):
+        store.add('0' if index % 2 else '1', _summary(index, 1000.0 + index, 1005.0 + index,
+                                                     label='fire' if index % 3 else 'smoke'))
+    assert store.count() == 0  # nothing touches the disk until the writer flushes
+    assert store.flush() == 120
+    assert store.count() == 120
+
+    page = store.query(since=1100, label='fire', limit=5)
+    assert [record['trackId'] for record in page['records']] == [119, 118, 116, 115, 113]
+    record = page['records'][0]
+    assert record['bestConfidence'] == 0.8 and record['duration'] == 5.0
+    assert record['firstBbox'] == [0, 0, 10, 10] and record['lastBbox'] == [10, 10, 20, 20]
+
+    cursor = parse_history_query({'cursor': page['next_cursor']})['cursor']
+    rest = store.query(since=1100, label='fire', limit=100, cursor=cursor)
+    assert [record['trackId'] for record in rest['records']][:2] == [112, 110]
+    assert rest['next_cursor'] is None
+    assert len(page['records']) + len(rest['records']) == 17
+
+    assert [r['trackId'] for r in store.query(until=1002)['records']] == [2, 1, 0]
+    assert [r['trackId'] for r in store.query(track_id=7)['records']] == [7]
+    assert {r['camera'] for r in store.query(camera='1', limit=1000)['records']} == {'1'}
+
+
+def test_queries_use_indexes(store):
+    assert 'idx_tracks_label' in store.explain(label='fire', since=1.0)
+    assert 'idx_tracks_last_seen' in store.explain(since=1.0)
+    assert 'idx_tracks_track_id' in store.explain(track_id=3)
+    assert 'idx_tracks_camera' in store.explain(camera='0')
+    # "alive within [since, until]" is a bounded range on last_seen, not a scan to the oldest row
+    assert 'last_seen>? AND last_seen<?' in store.explain(since=1.0, until=2.0)
+
+
+def test_until_bound_covers_longest_track(store, tmp_path):
+    store.add('0', _summary(1, 100.0, 500.0))
+    store.add('0', _summary(2, 450.0, 460.0))
+    store.flush()
+    assert store.max_duration == 400.0
+    assert [r['trackId'] for r in store.query(since=120, until=200)['records']] == [1]
+    store.stop()
+    reopened = TrackHistoryStore(tmp_path / 'history.db', MetricsRegistry())
+    assert reopened.max_duration == 400.0
+    reopened.stop()
+
+
+def test_crop_reference_is_saved(store):
+    store.add('0', _summary(5, 1.0, 2.0), crop=b'\xff\xd8jpeg')
+    store.add('0', _summary(6, 1.0, 3.0))
+    store.flush()
+    records = {record['trackId']: record for record in store.query()['records']}
+    assert records[5]['crop'] and records[6]['crop'] is None
+    assert store.crop(records[5]['id']) == b'\xff\xd8jpeg'
+    assert store.crop(records[6]['id']) is None
+
+
+def test_parse_history_query():
+    assert parse_history_query({'since': '10', 'label': 'fire', 'limit': '5000'}) == {
+        'since': 10.0, 'label': 'fire', 'limit': 1000
+    }
+    with pytest.raises(ValueError):
+        parse_history_query({'track_id': 'x'})
+    with pytest.raises(ValueError):
+        parse_history_query({'limit': '0'})
+
+
+def test_lost_track_summary_keeps_lifetime_best():
+    events = []
+    tracker = SortTracker(max_age=0, on_event=lambda kind, track: events.append((kind, track)))
+    tracker.update([{'bbox': [0, 0, 10, 10], 'label': 'fire', 'confidence': 0.5}], 1.0)
+    tracker.update([{'bbox': [1, 1, 11, 11], 'label': 'fire', 'confidence': 0.9}], 2.0)
+    tracker.update([{'bbox': [2, 2, 12, 12], 'label': 'fire', 'confidence': 0.6}], 3.0)
+    tracker.update([], 4.0)
+
+    kind, summary = events[-1]
+    assert kind == 'lost'
+    assert summary['bestConfidence'] == 0.9 and summary['bestBbox'] == [1.0, 1.0, 11.0, 11.0]
+    assert summary['firstBbox'] == [0.0, 0.0, 10.0, 10.0] and summary['bbox'] == [2.0, 2.0, 12.0, 12.0]
+
+
+def test_service_records_lost_tracks(tmp_path):
+    config = RuntimeConfig(
+        infer_fps=50.0,
+        camera_source='synthetic:64x48',
+        camera_source_pace='fast',
+        tracker_max_age=0,
+        history_db=str(tmp_path / 'history.db'),
+        history_flush_interval=0.05,
+    )
+    service = DetectionService(config)
+    model = FakeModel(boxes=2)
+    service._init_models = lambda: attach_fake_model(service, model)
+    service.start()
+    detection_server.detection_service = service
+    try:
+        assert service.wait_ready(5)
+        model.boxes = 0  # every track is lost on the next frame
+        deadline = time.monotonic() + 5
+        while service.history.count() < 2 and time.monotonic() < deadline:
+            time.sleep(0.02)
+
+        client = detection_server.app.test_client()
+        payload = client.get('/api/history?label=fire').get_json()
+        assert payload['records'] and payload['records'][0]['label'] == 'fire'
+        assert client.get('/api/history?since=abc').status_code == 400
+        record_id = payload['records'][0]['id']
+        response = client.get(f'/api/history/{record_id}/crop')
+        assert response.status_code == 200 and response.data.startswith(b'\xff\xd8')
+        assert service.get_status_payload()['history']['written'] >= 2
+    finally:
+        detection_server.detection_service = None
+        service.stop()
@@ -0,0 +1,101 @@
+"""Tests for the shared JPEG encoder"""
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+ROOT_DIR = Path(__file__).resolve().parents[3]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+cv2 = pytest.importorskip('cv2')
+
+from services.detection.config.runtime import RuntimeConfig
+from services.detection.service import DetectionService
+from services.detection.streaming import jpeg
+from services.detection.streaming.jpeg import JpegEncoder, JpegSettings, OpenCVBackend, build_encoder, probe_frame
+from services.detection.tracking.trackers import crop_frame_for_tracker
+
+
+def _luma_sampling(data):
+    """Sampling factors (HxV) of the first component from the SOF0 marker."""
+    index = data.index(b'\xff\xc0')
+    factors = data[index + 11]
+    return factors >> 4, factors & 0x0F
+
+
+def test_settings_are_per_use_and_quality_can_be_overridden():
+    encoder = JpegEncoder(OpenCVBackend(), {
+        'stream': JpegSettings(quality=80, subsampling='420'),
+        'crop': JpegSettings(quality=95, subsampling='444'),
+    })
+    frame = probe_frame(160, 96)
+
+    stream = encoder.encode(frame)
+    crop = encoder.encode(frame, use='crop')
+    assert _luma_sampling(stream) == (2, 2) and _luma_sampling(crop) == (1, 1)
+    assert len(encoder.encode(frame, quality=40)) < len(stream)
+    gray = JpegEncoder(OpenCVBackend(), {'stream': JpegSettings(subsampling='gray')}).encode(frame)
+    assert cv2.imdecode(np.frombuffer(gray, np.uint8), cv2.IMREAD_UNCHANGED).ndim == 2
+    with pytest.raises(ValueError):
+        JpegSettings(subsampling='411')
+
+
+def test_failed_encode_returns_none():
+    encoder = JpegEncoder(OpenCVBackend())
+    assert encoder.encode(np.zeros((0, 0, 3), dtype=np.uint8)) is None
+
+
+class _SlowBackend:
+    name = 'turbojpeg'
+
+    def encode(self, image, settings, quality):
+        time.sleep(0.005)
+        return b'\xff\xd8slow'
+
+
+def test_auto_keeps_the_fastest_backend(monkeypatch):
+    monkeypatch.setattr(jpeg, 'create_backend',
+                        lambda name, per_thread=True: _SlowBackend() if name == 'turbojpeg' else OpenCVBackend())
+    encoder = build_encoder('auto')
+    assert encoder.backend_name == 'opencv'
+    assert set(encoder.timings) == {'turbojpeg', 'opencv'}
+    assert encoder.timings['turbojpeg'] > encoder.timings['opencv']
+    assert encoder.stats()['settings']['crop']['quality'] == 85
+
+
+def test_missing_backend_falls_back_to_opencv(monkeypatch):
+    monkeypatch.setattr(jpeg, 'TURBOJPEG_AVAILABLE', False)
+    assert build_encoder('turbojpeg').backend_name == 'opencv'
+    assert build_encoder('auto').timings == {}
+    with pytest.raises(ValueError):
+        build_encoder('png')
+
+
+def test_turbojpeg_backend_encodes_crops():
+    pytest.importorskip('turbojpeg')
+    try:
+        backend = jpeg.TurboJpegBackend()
+    except Exception as exc:  # PyTurboJPEG without libturbojpeg
+        pytest.skip(str(exc))
+    frame = probe_frame(160, 96)
+    data = backend.encode(frame[10:70, 20:100], JpegSettings(subsampling='422'), 85)
+    assert _luma_sampling(data) == (2, 1)
+    assert cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR).shape == (60, 80, 3)
+
+
+def test_service_installs_the_configured_encoder():
+    config = RuntimeConfig(camera_source='synthetic:64x48', jpeg_backend='opencv', crop_jpeg_quality=60,
+                           crop_jpeg_subsampling='444')
+    previous = jpeg.get_encoder()
+    try:
+        service = DetectionService(config)
+        assert jpeg.get_encoder() is service.jpeg_encoder
+        status = service.get_status_payload()['jpeg']
+        assert status['backend'] == 'opencv' and status['settings']['crop']['quality'] == 60
+        crop = crop_frame_for_tracker(probe_frame(160, 96), [10, 10, 90, 70])
+        assert _luma_sampling(crop) == (1, 1)
+    finally:
+        jpeg.set_encoder(previous)
@@ -0,0 +1,39 @@
+"""Tests for the HTTP load-test harness"""
+import sys
+import threading
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[3]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+from services.detection import detection_server
+from services.detection.tools.loadtest import build_fake_service, parse_prometheus, run_load, start_server
+
+
+def test_parse_prometheus():
+    text = '# TYPE dc_detection_threads gauge\ndc_detection_threads 7\ndc_detection_x{stage="a b"} 0.5\n'
+    assert parse_prometheus(text) == {'dc_detection_threads': 7.0, 'dc_detection_x{stage="a b"}': 0.5}
+
+
+def test_run_load_against_fake_server():
+    """Stream clients receive timestamped frames and pollers get JSON while the server reports itself"""
+    service = build_fake_service('synthetic:160x120', fps=30.0, boxes=2, model_latency=0.0)
+    server = start_server('127.0.0.1', 0, service)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        report = run_load(f'http://127.0.0.1:{server.server_port}', clients=1, slow_clients=1, slow_delay=0.2,
+                          duration=1.5, polls=['/api/trackers:10'], warmup=0.3)
+    finally:
+        server.shutdown()
+        server.server_close()
+        service.stop()
+        detection_server.detection_service = None
+
+    fast, slow = report['streams']
+    assert fast['fps'] > slow['fps'] > 0
+    assert fast['latency_p50_ms'] is not None and fast['errors'] == 0
+    poll = report['polls'][0]
+    assert poll['errors'] == 0 and poll['p99_ms'] is not None
+    assert report['server']['threads_max'] and report['server']['cpu_percent'] is not None
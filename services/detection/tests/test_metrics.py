@@ -0,0 +1,71 @@
+"""Tests for metrics and their Prometheus exposition"""
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[3]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+from services.detection.monitoring.metrics import MetricsRegistry
+from services.detection.streaming.generators import mjpeg_generator_raw, sse_generator
+
+
+def test_histogram_buckets_and_percentiles():
+    registry = MetricsRegistry(prefix='t_')
+    histogram = registry.histogram('stage_seconds', 'Stage time', buckets=(0.01, 0.1), stage='model')
+    for value in [0.005] * 90 + [0.05] * 9 + [0.5]:
+        histogram.observe(value)
+
+    text = registry.render_prometheus()
+    assert '# TYPE t_stage_seconds histogram' in text
+    assert 't_stage_seconds_bucket{stage="model",le="0.01"} 90' in text
+    assert 't_stage_seconds_bucket{stage="model",le="0.1"} 99' in text
+    assert 't_stage_seconds_bucket{stage="model",le="+Inf"} 100' in text
+    assert 't_stage_seconds_count{stage="model"} 100' in text
+
+    percentiles = histogram.percentiles()
+    assert percentiles['p50'] == 0.005
+    assert percentiles['p95'] == 0.05
+    assert percentiles['p99'] == 0.5
+
+
+def test_counter_gauge_and_summary():
+    registry = MetricsRegistry(prefix='t_')
+    registry.counter('frames_total', camera='0').inc(3)
+    registry.gauge('queue_depth', fn=lambda: 7)
+    assert registry.counter('frames_total', camera='0').value == 3
+
+    text = registry.render_prometheus()
+    assert 't_frames_total{camera="0"} 3' in text
+    assert 't_queue_depth 7' in text
+
+    summary = registry.summary()
+    assert summary['frames_total'] == [{'camera': '0', 'value': 3.0}]
+    assert summary['queue_depth'] == [{'value': 7.0}]
+
+
+def test_stream_generator_tracks_subscribers_and_bytes():
+    registry = MetricsRegistry()
+    stream = mjpeg_generator_raw(lambda: b'jpeg', interval=0, metrics=registry, stream='raw')
+
+    part = next(stream)
+    assert registry.gauge('stream_subscribers', stream='raw').value == 1
+    assert registry.counter('stream_bytes_total', stream='raw').value == len(part)
+
+    stream.close()
+    assert registry.gauge('stream_subscribers', stream='raw').value == 0
+
+
+def test_stream_parts_carry_capture_timestamp():
+    stream = mjpeg_generator_raw(lambda: b'jpeg', interval=0, timestamp_getter=lambda: 12.5)
+    part = next(stream)
+    assert b'X-Timestamp: 12.500000\r\n' in part
+    assert part.endswith(b'jpeg\r\n')
+
+
+def test_sse_generator_emits_on_version_change():
+    versions = iter([1, 1, 2])
+    stream = sse_generator(lambda: {'trackers': []}, lambda: next(versions), event='trackers', interval=0)
+
+    assert next(stream) == b'event: trackers\ndata: {"trackers":[]}\n\n'
+    assert next(stream) == b'event: trackers\ndata: {"trackers":[]}\n\n'
@@ -0,0 +1,96 @@
+"""Tests for the Picamera2 main + lores dual-stream capture"""
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+ROOT_DIR = Path(__file__).resolve().parents[3]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+cv2 = pytest.importorskip('cv2')
+
+from services.detection.camera import manager as manager_module
+from services.detection.camera.manager import CameraManager
+from services.detection.config.runtime import RuntimeConfig
+from services.detection.detection.inference import scale_detections
+from services.detection.pipeline import CameraPipeline
+from services.detection.tools.fakes import FakePicamera2
+
+
+def start_picamera(monkeypatch, camera, **config):
+    monkeypatch.setattr(manager_module, 'PICAMERA2_AVAILABLE', True)
+    monkeypatch.setattr(manager_module, 'Picamera2', lambda: camera)
+    manager = CameraManager(RuntimeConfig(camera_cache_file='off', **config), backends=('picamera2',))
+    manager.start()
+    return manager
+
+
+def test_dual_stream_feeds_lores_without_conversion(monkeypatch):
+    camera = FakePicamera2()
+    manager = start_picamera(monkeypatch, camera)
+
+    assert manager.camera_type == 'picamera2' and manager.dual_stream
+    assert manager.lores_format == 'RGB888'
+    assert camera.configured['main'] == {'size': (1280, 720), 'format': 'RGB888'}
+    main = manager.capture_raw()
+    assert main.shape == (720, 1280, 3)
+    assert manager.last_lores.shape == (360, 640, 3)
+    assert manager.probe['results'][0]['width'] == 1280
+    manager.shutdown()
+    assert camera.closed
+
+
+def test_yuv_lores_fallback(monkeypatch):
+    manager = start_picamera(monkeypatch, FakePicamera2(yuv_only_lores=True))
+
+    assert manager.lores_format == 'YUV420'
+    manager.capture_raw()
+    lores = manager.last_lores
+    assert lores.shape == (360, 640, 3)
+    # The bright square of the Y plane survives the conversion at the same place
+    assert lores[120, 200].mean() > 200 and lores[10, 10].mean() < 200
+    manager.shutdown()
+
+
+def test_single_stream_when_lores_disabled(monkeypatch):
+    camera = FakePicamera2()
+    manager = start_picamera(monkeypatch, camera, picamera_lores_size=None)
+
+    assert not manager.dual_stream
+    assert camera.configured['lores'] is None
+    assert manager.capture_raw().shape == (720, 1280, 3)
+    assert manager.last_lores is None
+    manager.shutdown()
+
+
+def test_pipeline_frames_carry_lores_for_inference(monkeypatch):
+    manager = start_picamera(monkeypatch, FakePicamera2())
+    pipeline = CameraPipeline('0', manager, manager.config)
+    stop_event = threading.Event()
+    pipeline.start_capture(stop_event)
+    try:
+        deadline = time.monotonic() + 5
+        while pipeline.current_frame is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        frame = pipeline.current_frame
+        assert frame.data.shape == (720, 1280, 3)
+        assert frame.inference_data.shape == (360, 640, 3)
+        assert frame.inference_scale == (2.0, 2.0)
+        assert frame.inference.flags.writeable is False
+    finally:
+        stop_event.set()
+        pipeline.join(timeout=1)
+        pipeline.shutdown()
+
+
+def test_scale_detections_maps_lores_boxes_to_main():
+    detections = [{'bbox': [10.0, 20.0, 30.0, 40.0], 'label': 'fire', 'confidence': 0.9}]
+
+    scaled = scale_detections(detections, (2.0, 2.0))
+
+    assert scaled[0]['bbox'] == [20.0, 40.0, 60.0, 80.0]
+    assert detections[0]['bbox'] == [10.0, 20.0, 30.0, 40.0]
+    assert scale_detections(detections, (1.0, 1.0)) is detections
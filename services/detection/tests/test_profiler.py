@@ -0,0 +1,100 @@
+"""Tests for on-demand profiling and stack dumps"""
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+ROOT_DIR = Path(__file__).resolve().parents[3]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+from services.detection import detection_server
+from services.detection.config.runtime import RuntimeConfig
+from services.detection.monitoring.profiler import (
+    ThreadProfileHook,
+    dump_thread_stacks,
+    format_pstats,
+    sample_stacks,
+)
+from services.detection.service import DetectionService
+from services.detection.tools.fakes import FakeModel, attach_fake_model
+
+
+def _busy_work(stop):
+    while not stop.is_set():
+        sum(range(200))
+
+
+@pytest.fixture
+def worker():
+    stop = threading.Event()
+    thread = threading.Thread(target=_busy_work, args=(stop,), name='busy-worker', daemon=True)
+    thread.start()
+    yield thread
+    stop.set()
+    thread.join()
+
+
+def test_dump_and_sample_named_thread(worker):
+    names = [entry['name'] for entry in dump_thread_stacks()]
+    assert 'busy-worker' in names
+
+    stacks = sample_stacks(0.2, interval=0.005, thread_filter='busy-worker')
+    assert stacks and all(stack.startswith('busy-worker;') for stack in stacks)
+    assert any('_busy_work' in stack for stack in stacks)
+
+
+def test_thread_profile_hook_profiles_loop_thread():
+    hook = ThreadProfileHook()
+    stop = threading.Event()
+
+    def loop():
+        while not stop.is_set():
+            hook.checkpoint()
+            sum(range(1000))
+            time.sleep(0.001)
+
+    thread = threading.Thread(target=loop, daemon=True)
+    thread.start()
+    try:
+        profile = hook.profile(0.2)
+    finally:
+        stop.set()
+        thread.join()
+
+    assert profile is not None
+    assert 'builtins.sum' in format_pstats(profile)
+
+
+def test_debug_endpoints_require_token():
+    config = RuntimeConfig(infer_fps=50.0, camera_source='synthetic:64x48', camera_source_pace='fast',
+                           debug_token='s3cret')
+    service = DetectionService(config)
+    service._init_models = lambda: attach_fake_model(service, FakeModel(boxes=1))
+    service.start()
+    assert service.wait_ready(5)
+    detection_server.detection_service = service
+    client = detection_server.app.test_client()
+    try:
+        assert client.get('/debug/stacks').status_code == 404
+        assert client.get('/debug/stacks', headers={'X-Debug-Token': 'wrong'}).status_code == 404
+
+        response = client.get('/debug/stacks', headers={'Authorization': 'Bearer s3cret'})
+        assert response.status_code == 200
+        assert 'detection-loop' in [entry['name'] for entry in response.get_json()['threads']]
+
+        response = client.get('/debug/profile?seconds=0.3&mode=cprofile', headers={'X-Debug-Token': 's3cret'})
+        assert response.status_code == 200
+        assert '_process_frame' in response.get_data(as_text=True)
+
+        response = client.get('/debug/profile?seconds=0.2&thread=detection-loop',
+                              headers={'X-Debug-Token': 's3cret'})
+        assert response.status_code == 200
+        assert response.get_data(as_text=True).startswith('detection-loop;')
+
+        assert client.get('/debug/profile?mode=bogus', headers={'X-Debug-Token': 's3cret'}).status_code == 400
+    finally:
+        service.stop()
+        detection_server.detection_service = None
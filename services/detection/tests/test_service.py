@@ -1,5 +1,7 @@
 """Tests for DetectionService"""
+import subprocess
 import sys
+import time
 from pathlib import Path
 from unittest.mock import MagicMock, patch
 
@@ -12,6 +14,7 @@ if str(ROOT_DIR) not in sys.path:
 from services.detection.config.runtime import RuntimeConfig
 from services.detection.service import DetectionService
 from services.detection.camera.manager import CameraInitializationError
+from services.detection.tools.fakes import FakeModel, attach_fake_model
 
 
 @pytest.fixture
@@ -124,3 +127,77 @@ def test_list_models_without_manager(config, mock_camera_manager):
     assert result['active_model'] is None
     assert 'error' in result
 
+
+
+def test_multi_camera_shares_one_batched_model(monkeypatch):
+    """Each camera gets its own tracker while frames are batched into one model call"""
+    model = FakeModel(boxes=1)
+    monkeypatch.setattr(DetectionService, '_init_models', lambda self: attach_fake_model(self, model))
+    config = RuntimeConfig(
+        infer_fps=100.0,
+        cameras=['synthetic:64x48', 'synthetic:64x48'],
+        camera_source_pace='fast',
+    )
+    service = DetectionService(config)
+    assert list(service.pipelines) == ['0', '1']
+
+    service.start()
+    try:
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            if all(p.processed_seq >= 3 for p in service.pipelines.values()):
+                break
+            time.sleep(0.01)
+
+        assert all(p.processed_seq >= 3 for p in service.pipelines.values())
+        assert max(model.batch_sizes) == 2
+        assert service.pipelines['0'].tracker is not service.pipelines['1'].tracker
+
+        trackers = service.list_trackers()['trackers']
+        assert {t['cameraId'] for t in trackers} == {'0', '1'}
+        assert [t['cameraId'] for t in service.list_trackers('1')['trackers']] == ['1']
+        assert service.capture_raw_jpeg('1').startswith(b'\xff\xd8')
+        assert service.capture_annotated_jpeg('0') is not None
+        assert service.list_trackers('missing')['error'] == 'Camera not found'
+    finally:
+        service.stop()
+
+
+def test_model_loads_in_background(monkeypatch):
+    """start() returns before the model is loaded; readiness and startup timings follow"""
+    model = FakeModel(boxes=1)
+
+    def _slow_init(self):
+        time.sleep(0.3)
+        attach_fake_model(self, model)
+
+    monkeypatch.setattr(DetectionService, '_init_models', _slow_init)
+    config = RuntimeConfig(infer_fps=50.0, camera_source='synthetic:64x48', camera_source_pace='fast')
+    service = DetectionService(config)
+
+    service.start()
+    try:
+        status = service.get_status_payload()
+        assert status['model_loading'] is True
+        assert status['ready'] is False
+
+        assert service.wait_ready(5)
+        deadline = time.monotonic() + 5
+        while 'first_detection' not in service.startup_timings and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        payload = service.get_ready_payload()
+        assert payload['ready'] is True and payload['model_loading'] is False
+        timings = payload['startup']
+        assert {'cameras_started', 'first_frame', 'model_loaded', 'model_warmed_up', 'first_detection'} <= set(timings)
+        assert timings['model_loaded'] >= 0.3
+        assert timings['first_detection'] >= timings['model_warmed_up']
+    finally:
+        service.stop()
+
+
+def test_service_import_does_not_load_ultralytics():
+    """Heavy ML imports are deferred until a model is loaded"""
+    code = 'import sys; import services.detection.service; print("ultralytics" in sys.modules, "torch" in sys.modules)'
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT_DIR, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == 'False False'
@@ -0,0 +1,147 @@
+"""Tests for multi-variant MJPEG streams"""
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+ROOT_DIR = Path(__file__).resolve().parents[3]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+cv2 = pytest.importorskip('cv2')
+
+from services.detection import detection_server
+from services.detection.camera.frames import Frame
+from services.detection.config.runtime import RuntimeConfig
+from services.detection.monitoring.metrics import MetricsRegistry
+from services.detection.service import DetectionService
+from services.detection.streaming.variants import (
+    StreamVariant,
+    StreamVariantHub,
+    build_variants,
+    parse_variant_query,
+    select_variant,
+)
+
+VARIANTS = build_variants([(0, 0, 30.0), (640, 70, 15.0), (320, 60, 5.0)], default_quality=85)
+
+
+class StubPipeline:
+    camera_id = '0'
+    cpu_layout = None
+
+    def __init__(self):
+        self.current_frame = None
+        self.raw_encodes = 0
+
+    def push(self, seq, width=1280, height=720):
+        self.current_frame = Frame.wrap(np.full((height, width, 3), seq % 255, dtype=np.uint8), seq, float(seq))
+
+    def capture_raw_jpeg(self):
+        self.raw_encodes += 1
+        return b'\xff\xd8shared'
+
+
+def _jpeg_width(data):
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR).shape[1]
+
+
+def test_select_variant_maps_queries_onto_configured_set():
+    assert select_variant(VARIANTS) == StreamVariant(0, 85, 30.0)
+    assert select_variant(VARIANTS, width=300).width == 320
+    assert select_variant(VARIANTS, width=400).width == 640
+    assert select_variant(VARIANTS, width=4000).width == 0
+    assert select_variant(VARIANTS, width=100, fps=30).width == 320  # width decides first
+    assert select_variant(VARIANTS, quality=50) == VARIANTS[0]
+
+
+def test_parse_variant_query():
+    assert parse_variant_query({'width': '320', 'fps': '5'}) == {'width': 320.0, 'quality': None, 'fps': 5.0}
+    with pytest.raises(ValueError):
+        parse_variant_query({'width': 'wide'})
+    with pytest.raises(ValueError):
+        parse_variant_query({'fps': '0'})
+
+
+def test_variant_encodes_once_per_frame_for_all_subscribers():
+    metrics = MetricsRegistry()
+    hub = StreamVariantHub(VARIANTS, metrics, native_quality=85)
+    pipeline = StubPipeline()
+    pipeline.push(1)
+    variant = VARIANTS[1]
+    encoders = [hub.subscribe(pipeline, variant) for _ in range(3)]
+
+    assert encoders[0] is encoders[1] is encoders[2]
+    frames = [encoder.jpeg() for encoder in encoders]
+    assert frames[0] is frames[1] is frames[2]
+    assert _jpeg_width(frames[0]) == 640
+    labels = {'camera': '0', 'variant': variant.name}
+    assert metrics.counter('stream_variant_frames_total', **labels).value == 1
+    assert metrics.gauge('stream_variant_subscribers', **labels).value == 3
+    assert metrics.histogram('stream_variant_encode_seconds', **labels).count == 1
+
+
+def test_variant_fps_limits_encoding():
+    hub = StreamVariantHub(VARIANTS, MetricsRegistry(), native_quality=85)
+    pipeline = StubPipeline()
+    encoder = hub.subscribe(pipeline, VARIANTS[2])  # 5 fps
+    pipeline.push(1)
+    first = encoder.jpeg()
+    pipeline.push(2)
+    assert encoder.jpeg() is first  # next frame arrived before the 0.2 s interval
+    encoder._encoded_at -= 1.0
+    assert encoder.jpeg() is not first
+    assert encoder.version() == 2
+
+
+def test_native_variant_reuses_shared_raw_jpeg():
+    hub = StreamVariantHub(VARIANTS, MetricsRegistry(), native_quality=85)
+    pipeline = StubPipeline()
+    pipeline.push(1)
+    encoder = hub.subscribe(pipeline, VARIANTS[0])
+
+    assert encoder.passthrough
+    assert encoder.jpeg() == b'\xff\xd8shared'
+    assert encoder.jpeg() == b'\xff\xd8shared'
+    assert pipeline.raw_encodes == 1
+
+
+def test_idle_variants_are_torn_down():
+    hub = StreamVariantHub(VARIANTS, MetricsRegistry(), native_quality=85, idle_seconds=5.0)
+    pipeline = StubPipeline()
+    encoder = hub.subscribe(pipeline, VARIANTS[2])
+    hub.unsubscribe(encoder)
+
+    assert hub.reap() == 0  # grace period for reconnecting viewers
+    assert hub.subscribe(pipeline, VARIANTS[2]) is encoder
+    hub.unsubscribe(encoder)
+    assert hub.reap(now=time.monotonic() + 6) == 1
+    assert hub.active() == []
+    assert hub.subscribe(pipeline, VARIANTS[2]) is not encoder
+
+
+def test_threaded_server_serves_variant_by_query():
+    config = RuntimeConfig(camera_source='synthetic:640x360', camera_source_pace='fixed', camera_source_fps=30.0)
+    service = DetectionService(config)
+    service._init_models = lambda: None
+    service.start()
+    detection_server.detection_service = service
+    try:
+        client = detection_server.app.test_client()
+        assert client.get('/stream.mjpeg?width=abc').status_code == 400
+
+        response = client.get('/cameras/0/stream.mjpeg?width=320&fps=5', buffered=False)
+        chunks = response.response
+        part = next(chunks)
+        head, _, body = part.partition(b'\r\n\r\n')
+        assert b'X-Timestamp' in head
+        assert _jpeg_width(body[:-2]) == 320
+        streams = service.get_status_payload()['streams']
+        assert streams['active'][0]['width'] == 320 and streams['active'][0]['subscribers'] == 1
+        response.close()
+        assert service.stream_variants.active()[0].subscribers == 0
+    finally:
+        detection_server.detection_service = None
+        service.stop()
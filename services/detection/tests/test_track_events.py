@@ -0,0 +1,185 @@
+"""Tests for batched track lifecycle events"""
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+ROOT_DIR = Path(__file__).resolve().parents[3]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+from services.detection.config.runtime import RuntimeConfig
+from services.detection.monitoring.metrics import MetricsRegistry
+from services.detection.service import DetectionService
+from services.detection.tools.fakes import FakeModel, attach_fake_model
+from services.detection.tracking.events import TrackEventPusher, TrackEventQueue
+from services.detection.tracking.sort_tracker import SortTracker
+
+
+class StubReceiver:
+    """Keep-alive HTTP server recording posted batches; ``statuses`` are answered first."""
+
+    def __init__(self, statuses=()):
+        self.batches = []
+        self.statuses = list(statuses)
+        self.connections = set()
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                receiver.connections.add(self.client_address)
+                status = receiver.statuses.pop(0) if receiver.statuses else 200
+                if status == 200:
+                    receiver.batches.append(json.loads(body))
+                self.send_response(status)
+                self.send_header('Content-Length', '2')
+                self.end_headers()
+                self.wfile.write(b'{}')
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/internal/track-events'
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def events(self):
+        return [event for batch in self.batches for event in batch['events']]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def receiver():
+    stub = StubReceiver()
+    yield stub
+    stub.close()
+
+
+def _event(kind, track_id, camera='0', **extra):
+    return {'type': kind, 'camera': camera, 'trackId': track_id, **extra}
+
+
+def test_queue_coalesces_updates_and_drops_summaries_first():
+    queue = TrackEventQueue(capacity=3)
+    queue.put(_event('created', 1))
+    queue.put(_event('updated', 1, hits=2))
+    queue.put(_event('updated', 1, hits=3))
+    assert len(queue) == 2 and queue.coalesced == 1
+
+    queue.put(_event('created', 2))
+    queue.put(_event('created', 3))  # full: evicts the pending summary, not a lifecycle event
+    assert not queue.put(_event('updated', 2))
+    batch, dropped = queue.take(10)
+    assert [(event['type'], event['trackId']) for _, event in batch] == [('created', 1), ('created', 2), ('created', 3)]
+    assert dropped == {'updated': 2}
+
+
+def test_lost_event_replaces_pending_update_and_requeue_keeps_order():
+    queue = TrackEventQueue(capacity=10)
+    queue.put(_event('updated', 7))
+    queue.put(_event('lost', 7))
+    batch, _ = queue.take(10)
+    assert [event['type'] for _, event in batch] == ['lost']
+
+    queue.put(_event('created', 8))
+    queue.requeue(batch, {'updated': 4})
+    again, dropped = queue.take(10)
+    assert [event['type'] for _, event in again] == ['lost', 'created']
+    assert dropped == {'updated': 4}
+
+
+def test_tracker_reports_lifecycle():
+    events = []
+    tracker = SortTracker(max_age=1, min_hits=2, on_event=lambda kind, track: events.append((kind, track['trackId'])))
+    detection = {'bbox': [10, 10, 50, 50], 'label': 'fire', 'confidence': 0.9}
+
+    tracker.update([detection], 1.0)
+    assert events == []  # not confirmed yet
+    tracker.update([detection], 2.0)
+    tracker.update([detection], 3.0)
+    track_id = events[0][1]
+    assert events == [('created', track_id), ('updated', track_id)]
+    tracker.update([], 4.0)
+    tracker.update([], 5.0)
+    assert events[-1] == ('lost', track_id)
+
+
+def test_pusher_batches_events_over_one_connection(receiver):
+    pusher = TrackEventPusher(receiver.url, MetricsRegistry(), batch_size=2, flush_interval=0.01)
+    for track_id in range(5):
+        pusher.emit('0', 'created', {'trackId': track_id, 'label': 'fire'})
+    while len(pusher.queue):
+        assert pusher.flush()
+
+    assert [len(batch['events']) for batch in receiver.batches] == [2, 2, 1]
+    assert [event['trackId'] for event in receiver.events()] == [0, 1, 2, 3, 4]
+    assert receiver.batches[0]['source'] == 'detection'
+    assert len(receiver.connections) == 1 and pusher.connections_opened == 1
+    assert pusher.stats()['sent'] == 5
+
+
+def test_pusher_retries_with_backoff_and_reports_drops():
+    receiver = StubReceiver(statuses=[503])
+    try:
+        pusher = TrackEventPusher(receiver.url, MetricsRegistry(), queue_size=2)
+        pusher.emit('0', 'created', {'trackId': 1})
+        assert not pusher.flush()
+        assert pusher.backoff == 0.5 and pusher.stats()['last_error'] == 'HTTP 503'
+
+        pusher.emit('0', 'created', {'trackId': 2})
+        pusher.emit('0', 'lost', {'trackId': 2})  # overflows: the oldest event is dropped
+        assert pusher.flush()
+        assert pusher.backoff == 0.0
+        batch = receiver.batches[0]
+        assert [event['type'] for event in batch['events']] == ['created', 'lost']
+        assert batch['dropped'] == {'created': 1}
+    finally:
+        receiver.close()
+
+
+def test_unreachable_backend_keeps_events_queued():
+    pusher = TrackEventPusher('http://127.0.0.1:9/events', MetricsRegistry(), timeout=0.5)
+    pusher.emit('0', 'created', {'trackId': 1})
+    assert not pusher.flush()
+    assert len(pusher.queue) == 1 and pusher.stats()['last_error']
+
+
+def test_service_pushes_track_events(receiver):
+    config = RuntimeConfig(
+        infer_fps=50.0,
+        camera_source='synthetic:64x48',
+        camera_source_pace='fast',
+        events_url=receiver.url,
+        events_flush_interval=0.05,
+    )
+    service = DetectionService(config)
+    service._init_models = lambda: attach_fake_model(service, FakeModel(boxes=2))
+    service.start()
+    try:
+        assert service.wait_ready(5)
+        deadline = time.monotonic() + 5
+        while len([e for e in receiver.events() if e['type'] == 'created']) < 2 and time.monotonic() < deadline:
+            time.sleep(0.02)
+        created = [event for event in receiver.events() if event['type'] == 'created']
+        assert len(created) >= 2 and created[0]['camera'] == '0' and created[0]['track']['label'] in ('fire', 'smoke')
+
+        service.set_target_track(created[0]['trackId'])
+        deadline = time.monotonic() + 5
+        while not any(e['type'] == 'target' for e in receiver.events()) and time.monotonic() < deadline:
+            time.sleep(0.02)
+        target = next(event for event in receiver.events() if event['type'] == 'target')
+        assert target['trackId'] == created[0]['trackId'] and target['previous'] is None
+        assert service.get_status_payload()['track_events']['sent'] >= 3
+    finally:
+        service.stop()
@@ -0,0 +1,69 @@
+"""Tests for detection logs and the tracker parameter sweep"""
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[3]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+from services.detection.tools.tracker_sweep import TrackerParams, build_grid, replay, sweep
+from services.detection.tracking.detection_log import DetectionLogWriter, load_log_detections
+
+
+def _write_log(directory, frames):
+    writer = DetectionLogWriter(directory)
+    for timestamp, detections in frames:
+        writer.write(timestamp, detections)
+    writer.close()
+    return writer.path
+
+
+def _moving_box(index, gap=None):
+    if gap is not None and index in gap:
+        return []
+    x = 10.0 + index * 4
+    return [{'bbox': [x, 20.0, x + 40.0, 60.0], 'confidence': 0.9, 'class_id': 1, 'label': 'smoke'}]
+
+
+def test_detection_log_roundtrip(tmp_path):
+    frames = [
+        (1.0, [{'bbox': [1, 2, 3, 4], 'confidence': 0.5, 'class_id': 0, 'label': 'fire'}]),
+        (1.2, []),
+        (1.4, [{'bbox': [5, 6, 7, 8], 'confidence': 0.25, 'class_id': None, 'label': None},
+               {'bbox': [1, 1, 2, 2], 'confidence': 1.0, 'class_id': 3, 'label': 'пламя'}]),
+    ]
+    loaded = load_log_detections(_write_log(tmp_path, frames))
+
+    assert [ts for ts, _ in loaded] == [1.0, 1.2, 1.4]
+    assert loaded[0][1] == [{'bbox': [1.0, 2.0, 3.0, 4.0], 'confidence': 0.5, 'class_id': 0, 'label': 'fire'}]
+    assert loaded[1][1] == []
+    assert loaded[2][1][0]['class_id'] is None and loaded[2][1][0]['label'] is None
+    assert loaded[2][1][1]['label'] == 'пламя'
+
+
+def test_detection_log_ignores_truncated_tail(tmp_path):
+    path = _write_log(tmp_path, [(float(i), _moving_box(i)) for i in range(3)])
+    data = path.read_bytes()
+    path.write_bytes(data[:-5])
+    assert len(load_log_detections(path)) == 2
+
+
+def test_replay_counts_fragments():
+    frames = [(i * 0.2, _moving_box(i, gap={5, 6})) for i in range(12)]
+    # max_age=5 keeps the track alive across the gap, so it comes back once
+    result = replay(frames, TrackerParams(iou_threshold=0.1, max_age=5, min_hits=1))
+    assert result.frames == 12
+    assert result.tracks == 1
+    assert result.fragments == 1
+    assert result.id_switches == 0
+
+
+def test_sweep_grid(tmp_path):
+    _write_log(tmp_path, [(i * 0.2, _moving_box(i)) for i in range(20)])
+    grid = build_grid([0.1, 0.9], [5], [1, 2])
+    results = list(sweep(sorted(tmp_path.glob('*.dlog')), grid))
+
+    assert [(r.iou_threshold, r.min_hits) for r in results] == [(0.1, 1), (0.1, 2), (0.9, 1), (0.9, 2)]
+    assert results[0].tracks == 1
+    # A strict threshold cannot follow the moving box and keeps spawning tracks
+    assert results[2].tracks > 1
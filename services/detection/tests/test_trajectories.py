@@ -0,0 +1,137 @@
+"""Tests for simplified per-track trajectories"""
+import math
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT_DIR = Path(__file__).resolve().parents[3]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+from services.detection import detection_server
+from services.detection.config.runtime import RuntimeConfig
+from services.detection.monitoring.metrics import MetricsRegistry
+from services.detection.service import DetectionService
+from services.detection.tools.fakes import FakeModel, attach_fake_model
+from services.detection.tracking.trajectories import (
+    Trajectory, TrajectoryStore, parse_trajectory_query, simplify
+)
+
+
+def _distance_to_polyline(point, polyline):
+    best = math.inf
+    for a, b in zip(polyline[:-1], polyline[1:]):
+        ab = b - a
+        length = float(ab @ ab)
+        u = 0.0 if length == 0 else min(1.0, max(0.0, float((point - a) @ ab) / length))
+        best = min(best, float(np.linalg.norm(point - (a + u * ab))))
+    return best
+
+
+def test_straight_motion_collapses_to_endpoints():
+    trajectory = Trajectory(1, '0', t0=1000.0, tolerance=2.0)
+    for index in range(100):
+        trajectory.append(1000.0 + index * 0.1, 10 + index * 3, 20 + index * 1.5, 30, 40)
+
+    assert trajectory.count == 2 and trajectory.samples == 100
+    assert trajectory.points.dtype == np.float32
+    points = trajectory.to_dict()['points']
+    assert points[0] == [1000.0, 10.0, 20.0, 30.0, 40.0]
+    assert points[-1][0] == 1009.9 and points[-1][1:3] == [307.0, 168.5]
+
+
+def test_curve_stays_within_tolerance():
+    trajectory = Trajectory(2, '0', t0=0.0, max_points=512, tolerance=1.0)
+    samples = []
+    for index in range(2000):
+        angle = index * 0.01
+        sample = (200 + 100 * math.cos(angle), 200 + 100 * math.sin(angle))
+        samples.append(sample)
+        trajectory.append(index * 0.04, sample[0], sample[1], 30, 40)
+
+    assert trajectory.count < 100
+    polyline = trajectory.points[:trajectory.count, 1:3].astype(np.float64)
+    worst = max(_distance_to_polyline(np.array(sample), polyline) for sample in samples[::5])
+    assert worst <= 1.0 + 1e-3
+
+
+def test_size_change_keeps_a_point():
+    trajectory = Trajectory(3, '0', t0=0.0, tolerance=2.0)
+    trajectory.append(0.0, 50, 50, 10, 10)
+    trajectory.append(1.0, 50, 50, 10, 10)
+    trajectory.append(2.0, 50, 50, 30, 30)  # object approaches the camera without moving
+    assert trajectory.count == 3
+
+
+def test_memory_is_bounded_and_grows_in_place():
+    rng = np.random.default_rng(0)
+    trajectory = Trajectory(4, '0', t0=0.0, max_points=64, tolerance=0.5)
+    x = y = 0.0
+    buffers = set()
+    for index in range(5000):
+        x += rng.normal(0, 3)
+        y += rng.normal(0, 3)
+        trajectory.append(float(index), x, y, 5, 5)
+        buffers.add(id(trajectory.points))
+
+    assert trajectory.count <= 64 and trajectory.points.shape == (64, 5)
+    assert len(buffers) <= 3  # 16 -> 32 -> 64 rows, then compacted in place
+    assert trajectory.points[0, 0] == 0.0 and trajectory.points[trajectory.count - 1, 0] == 4999.0
+
+    downsampled = trajectory.to_dict(max_points=10)['points']
+    assert len(downsampled) == 10
+    assert downsampled[-1][1:3] == [round(x, 3), round(y, 3)]
+
+
+def test_simplify_keeps_the_corner():
+    points = np.array([[i, i, 0, 1, 1] for i in range(10)] + [[10 + i, 9, i, 1, 1] for i in range(1, 10)],
+                      dtype=np.float32)
+    assert simplify(points, 3).tolist() == [0, 9, 18]
+
+
+def test_store_finishes_and_evicts_tracks():
+    store = TrajectoryStore(MetricsRegistry(), max_tracks=2)
+    for track_id in (1, 2, 3):
+        store.observe('0', [{'trackId': track_id, 'bbox': [0, 0, 10, 10], 'label': 'fire'}], 1.0)
+        store.observe('0', [{'trackId': track_id, 'bbox': [5, 5, 15, 15], 'label': 'fire'}], 2.0)
+        store.finish(track_id)
+
+    assert store.get(1) is None and store.stats()['evicted'] == 1
+    trajectory = store.get(3)
+    assert trajectory['active'] is False and trajectory['label'] == 'fire'
+    assert trajectory['points'] == [[1.0, 5.0, 5.0, 10.0, 10.0], [2.0, 10.0, 10.0, 10.0, 10.0]]
+    assert [t['trackId'] for t in store.query()] == [3, 2]
+    assert [t['trackId'] for t in store.query(track_ids=[2, 99])] == [2]
+    assert parse_trajectory_query({'track_id': '1,2', 'points': '50'}) == {'track_ids': [1, 2], 'max_points': 50}
+
+
+def test_service_serves_trajectories():
+    config = RuntimeConfig(infer_fps=50.0, camera_source='synthetic:64x48', camera_source_pace='fast', tracker_max_age=0)
+    service = DetectionService(config)
+    model = FakeModel(boxes=2)
+    service._init_models = lambda: attach_fake_model(service, model)
+    service.start()
+    detection_server.detection_service = service
+    try:
+        assert service.wait_ready(5)
+        deadline = time.monotonic() + 5
+        while service.trajectories.stats()['samples'] < 10 and time.monotonic() < deadline:
+            time.sleep(0.02)
+        model.boxes = 0
+        while service.trajectories.stats()['finished'] < 2 and time.monotonic() < deadline:
+            time.sleep(0.02)
+
+        client = detection_server.app.test_client()
+        payload = client.get('/api/trajectories?points=5').get_json()
+        assert len(payload['trajectories']) == 2
+        assert all(not t['active'] and 1 <= len(t['points']) <= 5 for t in payload['trajectories'])
+        track_id = payload['trajectories'][0]['trackId']
+        single = client.get(f'/api/trajectories?track_id={track_id}').get_json()
+        assert [t['trackId'] for t in single['trajectories']] == [track_id]
+        assert client.get('/api/trajectories?points=1').status_code == 400
+        assert service.get_status_payload()['trajectories']['finished'] == 2
+    finally:
+        detection_server.detection_service = None
+        service.stop()
@@ -0,0 +1,147 @@
+"""Tests for the camera watchdog and detection thread supervision"""
+import sys
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+ROOT_DIR = Path(__file__).resolve().parents[3]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+from services.detection.camera.manager import CameraInitializationError, CameraManager
+from services.detection.config.runtime import RuntimeConfig
+from services.detection.pipeline import CameraPipeline
+from services.detection.service import DetectionService
+from services.detection.tools.fakes import FakeModel, attach_fake_model
+
+
+class FlakyCamera:
+    """Hardware camera stand-in that can be unplugged or wedged inside ``capture_raw``."""
+
+    def __init__(self):
+        self.camera_type = 'webcam'
+        self.unplugged = False
+        self.wedged = threading.Event()
+        self.released = threading.Event()
+        self.starts = 0
+        self.shutdowns = 0
+
+    def start(self):
+        self.starts += 1
+        if self.unplugged:
+            raise CameraInitializationError('no camera')
+        self.released.clear()
+
+    def shutdown(self):
+        self.shutdowns += 1
+        self.released.set()
+
+    def capture_raw(self):
+        if self.wedged.is_set():
+            # Like a V4L2 read on a vanished device: blocks until the device is released
+            self.released.wait(5)
+            return None
+        time.sleep(0.005)
+        return None if self.unplugged else np.zeros((48, 64, 3), dtype=np.uint8)
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+@pytest.fixture
+def config():
+    return RuntimeConfig(camera_max_failures=3, camera_stall_timeout=0.5, camera_reconnect_max_backoff=0.1)
+
+
+def test_read_errors_trigger_reconnect_with_backoff(config):
+    camera = FlakyCamera()
+    pipeline = CameraPipeline('0', camera, config)
+    stop_event = threading.Event()
+    pipeline.start_capture(stop_event)
+    try:
+        assert wait_for(lambda: pipeline.frames_captured > 0)
+        camera.unplugged = True
+        assert wait_for(lambda: pipeline.reconnecting)
+        assert pipeline.health_payload()['state'] == 'reconnecting'
+        assert wait_for(lambda: camera.starts >= 3)  # failed attempts keep retrying
+
+        camera.unplugged = False
+        captured = pipeline.frames_captured
+        assert wait_for(lambda: pipeline.frames_captured > captured and pipeline.outage_started is None)
+
+        health = pipeline.health_payload()
+        assert health['state'] == 'ok'
+        assert health['outages'] == 1 and health['reconnects'] == 1
+        assert health['last_outage_seconds'] > 0
+        assert pipeline.metrics.counter('camera_reconnects_total', camera='0').value == 1
+    finally:
+        stop_event.set()
+        pipeline.join(timeout=1)
+
+
+def test_stalled_capture_is_replaced(config):
+    camera = FlakyCamera()
+    pipeline = CameraPipeline('0', camera, config)
+    stop_event = threading.Event()
+    pipeline.start_capture(stop_event)
+    try:
+        assert wait_for(lambda: pipeline.frames_captured > 0)
+        camera.wedged.set()
+        time.sleep(0.05)
+        old_thread = pipeline.capture_thread
+        assert pipeline.check_health(stop_event) is False  # not stalled long enough yet
+
+        camera.wedged.clear()
+        assert pipeline.check_health(stop_event, now=time.monotonic() + 1.0) is True
+        assert wait_for(lambda: pipeline.capture_thread is not old_thread and pipeline.outage_started is None)
+        old_thread.join(timeout=1)
+        assert not old_thread.is_alive()
+        assert pipeline.reconnects == 1
+    finally:
+        stop_event.set()
+        pipeline.join(timeout=1)
+
+
+def test_replay_sources_are_not_supervised(config):
+    camera = CameraManager(RuntimeConfig(camera_source='synthetic:64x48'), backends=())
+    camera.start()
+    pipeline = CameraPipeline('0', camera, config)
+    pipeline.last_frame_at = time.monotonic() - 60
+
+    assert pipeline.supervised is False
+    assert pipeline.check_health(threading.Event()) is False
+    camera.shutdown()
+
+
+def test_wedged_detection_thread_is_restarted(monkeypatch):
+    monkeypatch.setattr(DetectionService, '_init_models', lambda self: attach_fake_model(self, FakeModel(boxes=1)))
+    config = RuntimeConfig(infer_fps=50.0, camera_source='synthetic:64x48', camera_source_pace='fast',
+                           detection_stall_timeout=2.0)
+    service = DetectionService(config)
+    service.start()
+    try:
+        assert service.wait_ready(5)
+        old_thread = service.detection_thread
+        assert service._check_detection_thread() is False
+
+        assert service._check_detection_thread(now=time.monotonic() + 10) is True
+        assert service.detection_thread is not old_thread
+        old_thread.join(timeout=1)
+        assert not old_thread.is_alive()
+
+        processed = service.primary.processed_seq
+        assert wait_for(lambda: service.primary.processed_seq > processed)
+        status = service.get_status_payload()
+        assert status['detection_restarts'] == 1
+        assert status['cameras'][0]['health']['state'] == 'ok'
+    finally:
+        service.stop()
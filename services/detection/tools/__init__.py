@@ -0,0 +1 @@
+"""Offline tools built on top of the detection service modules"""
@@ -0,0 +1,388 @@
+"""Offline batch processing of recorded footage.
+
+Runs the same detection + tracking pipeline as the live service over a video
+file or an image directory, as fast as the CPU allows, and writes per-frame
+detections and tracks to disk.
+
+Usage (from the repository root)::
+
+    python -m services.detection.tools.batch footage.mp4 frames_dir/ \\
+        --model yolov8n.pt --output-dir out/ --format jsonl --workers 2
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).resolve().parents[3]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from services.detection.camera.sources import open_source
+from services.detection.tracking.sort_tracker import SortTracker
+
+logger = logging.getLogger(__name__)
+
+SERVICE_DIR = Path(__file__).resolve().parents[1]
+
+
+@dataclass
+class BatchOptions:
+    """Settings shared by every processed input."""
+
+    model: str
+    output_dir: str
+    output_format: str = 'jsonl'
+    batch_size: int = 8
+    prefetch: int = 4
+    fps: float = 25.0
+    confidence_threshold: float = 0.5
+    tracker_iou_threshold: float = 0.3
+    tracker_max_age: int = 5
+    tracker_min_hits: int = 1
+
+
+@dataclass
+class FileStats:
+    """Throughput summary for one processed input."""
+
+    source: str
+    output: str
+    frames: int = 0
+    detections: int = 0
+    tracks: int = 0
+    wall_seconds: float = 0.0
+    decode_wait_seconds: float = 0.0
+    infer_seconds: float = 0.0
+    track_seconds: float = 0.0
+    fps: float = 0.0
+    error: Optional[str] = None
+
+
+# Frame sources -----------------------------------------------------------------------
+
+
+def iter_frames(path: Path, fps: float) -> Iterator[Tuple[int, float, np.ndarray]]:
+    """Yields ``(index, timestamp_seconds, frame)`` from a video file or an image directory."""
+    kind = 'images' if path.is_dir() else 'file'
+    source = open_source(f'{kind}:{path}', pace='fast', fps=fps, loop=False)
+    rate = source.native_fps or fps
+    try:
+        while True:
+            frame = source.read()
+            if frame is None:
+                break
+            yield source.position, source.position / rate, frame
+    finally:
+        source.release()
+
+
+def _decode_worker(path: Path, options: BatchOptions, out: "queue.Queue", stop: threading.Event) -> None:
+    """Decodes frames in a background thread and hands them over in batches."""
+    batch: List[Tuple[int, float, np.ndarray]] = []
+    try:
+        for item in iter_frames(path, options.fps):
+            if stop.is_set():
+                return
+            batch.append(item)
+            if len(batch) >= options.batch_size:
+                out.put(batch)
+                batch = []
+        if batch:
+            out.put(batch)
+        out.put(None)
+    except Exception as exc:
+        out.put(exc)
+
+
+# Writers -----------------------------------------------------------------------------
+
+
+class JsonlWriter:
+    """One JSON object per frame."""
+
+    suffix = '.jsonl'
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._fh = open(path, 'w', encoding='utf-8')
+
+    def write(self, index: int, timestamp: float, detections: List[dict], tracks: List[dict]) -> None:
+        record = {'frame': index, 'timestamp': timestamp, 'detections': detections, 'tracks': tracks}
+        self._fh.write(json.dumps(record, separators=(',', ':')))
+        self._fh.write('\n')
+
+    def close(self) -> None:
+        self._fh.close()
+
+
+class ColumnarWriter:
+    """Column-oriented ``.npz`` output: one flat array per field, one row per box.
+
+    Detections and tracks are stored as two tables (``det_*`` and ``trk_*``) that
+    share a label dictionary, so the file loads straight into NumPy or pandas
+    without per-row parsing.
+    """
+
+    suffix = '.npz'
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._labels: Dict[str, int] = {}
+        self._det: Dict[str, list] = {name: [] for name in ('frame', 'timestamp', 'bbox', 'confidence', 'class_id', 'label')}
+        self._trk: Dict[str, list] = {name: [] for name in ('frame', 'timestamp', 'bbox', 'confidence', 'label', 'track_id')}
+
+    def _label_index(self, label: Optional[str]) -> int:
+        if label is None:
+            return -1
+        return self._labels.setdefault(label, len(self._labels))
+
+    def write(self, index: int, timestamp: float, detections: List[dict], tracks: List[dict]) -> None:
+        for det in detections:
+            self._det['frame'].append(index)
+            self._det['timestamp'].append(timestamp)
+            self._det['bbox'].append(det['bbox'])
+            self._det['confidence'].append(det['confidence'])
+            class_id = det.get('class_id')
+            self._det['class_id'].append(-1 if class_id is None else class_id)
+            self._det['label'].append(self._label_index(det.get('label')))
+        for track in tracks:
+            self._trk['frame'].append(index)
+            self._trk['timestamp'].append(timestamp)
+            self._trk['bbox'].append(track['bbox'])
+            self._trk['confidence'].append(track.get('confidence', 0.0))
+            self._trk['label'].append(self._label_index(track.get('label')))
+            self._trk['track_id'].append(track['trackId'])
+
+    def close(self) -> None:
+        labels = sorted(self._labels, key=self._labels.get)
+        np.savez_compressed(
+            self.path,
+            labels=np.asarray(labels, dtype=str),
+            det_frame=np.asarray(self._det['frame'], dtype=np.int32),
+            det_timestamp=np.asarray(self._det['timestamp'], dtype=np.float64),
+            det_bbox=np.asarray(self._det['bbox'], dtype=np.float32).reshape(-1, 4),
+            det_confidence=np.asarray(self._det['confidence'], dtype=np.float32),
+            det_class_id=np.asarray(self._det['class_id'], dtype=np.int32),
+            det_label=np.asarray(self._det['label'], dtype=np.int32),
+            trk_frame=np.asarray(self._trk['frame'], dtype=np.int32),
+            trk_timestamp=np.asarray(self._trk['timestamp'], dtype=np.float64),
+            trk_bbox=np.asarray(self._trk['bbox'], dtype=np.float32).reshape(-1, 4),
+            trk_confidence=np.asarray(self._trk['confidence'], dtype=np.float32),
+            trk_label=np.asarray(self._trk['label'], dtype=np.int32),
+            trk_track_id=np.asarray(self._trk['track_id'], dtype=np.int64),
+        )
+
+
+WRITERS = {'jsonl': JsonlWriter, 'columnar': ColumnarWriter}
+
+
+# Processing --------------------------------------------------------------------------
+
+# Loaded once per process so pool workers reuse the model across files.
+_engine_cache: Dict[Tuple[str, float], object] = {}
+
+
+def _get_engine(options: BatchOptions):
+    from services.detection.detection.inference import InferenceEngine
+    from services.detection.models.manager import ModelManager
+
+    key = (options.model, options.confidence_threshold)
+    engine = _engine_cache.get(key)
+    if engine is None:
+        model_manager = ModelManager(SERVICE_DIR / 'models', SERVICE_DIR)
+        model_manager.load_model(options.model)
+        engine = InferenceEngine(
+            model_manager,
+            tracker=None,
+            tracker_lock=threading.Lock(),
+            confidence_threshold=options.confidence_threshold,
+        )
+        _engine_cache[key] = engine
+    return engine
+
+
+def output_names(sources: List[str]) -> List[str]:
+    """Result file names (without suffix), unique across ``sources``.
+
+    The input's stem when no other input shares it; otherwise the path relative
+    to the common directory of the clashing inputs, ``a/cam.mp4`` -> ``a__cam``,
+    then with the extension kept, and a ``-N`` counter as the last resort (the
+    same input twice).
+    """
+    paths = [Path(source).resolve() for source in sources]
+    names = [path.stem or path.name for path in paths]
+    if len(set(names)) == len(names):
+        return names
+    root = Path(os.path.commonpath([str(path.parent) for path, name in zip(paths, names) if names.count(name) > 1]))
+    for keep_suffix in (False, True):
+        candidates = []
+        for path, name in zip(paths, names):
+            if names.count(name) == 1:
+                candidates.append(name)
+                continue
+            last = path.name if keep_suffix else (path.stem or path.name)
+            candidates.append('__'.join(path.parent.relative_to(root).parts + (last,)))
+        names = candidates
+        if len(set(names)) == len(names):
+            return names
+    seen: Dict[str, int] = {}
+    unique = []
+    for name in names:
+        seen[name] = seen.get(name, 0) + 1
+        unique.append(name if seen[name] == 1 else f'{name}-{seen[name]}')
+    return unique
+
+
+def process_file(source: str, options: BatchOptions, output_name: Optional[str] = None) -> FileStats:
+    """Runs detection and tracking over one input and writes the result file.
+
+    ``output_name`` defaults to the input's stem; ``process_files`` passes
+    names from ``output_names`` so inputs with the same stem do not overwrite
+    each other's results.
+    """
+    path = Path(source)
+    writer_cls = WRITERS[options.output_format]
+    output_dir = Path(options.output_dir)
+    output_path = output_dir / f'{output_name or path.stem or path.name}{writer_cls.suffix}'
+    stats = FileStats(source=str(path), output=str(output_path))
+
+    tracker = SortTracker(
+        iou_threshold=options.tracker_iou_threshold,
+        max_age=options.tracker_max_age,
+        min_hits=options.tracker_min_hits,
+    )
+    track_ids = set()
+
+    frames_queue: "queue.Queue" = queue.Queue(maxsize=max(options.prefetch, 1))
+    stop = threading.Event()
+    decoder = threading.Thread(
+        target=_decode_worker, args=(path, options, frames_queue, stop), name='batch-decode', daemon=True
+    )
+    writer = None
+    started = time.perf_counter()
+    try:
+        # Model and output errors are reported in the stats like decode errors, not raised
+        engine = _get_engine(options)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        writer = writer_cls(output_path)
+        decoder.start()
+        while True:
+            wait_started = time.perf_counter()
+            batch = frames_queue.get()
+            stats.decode_wait_seconds += time.perf_counter() - wait_started
+            if batch is None:
+                break
+            if isinstance(batch, Exception):
+                raise batch
+
+            infer_started = time.perf_counter()
+            detections_per_frame = engine.detect_batch([frame for _, _, frame in batch])
+            stats.infer_seconds += time.perf_counter() - infer_started
+
+            for (index, timestamp, _), detections in zip(batch, detections_per_frame):
+                track_started = time.perf_counter()
+                tracked = tracker.update(detections, timestamp=timestamp)
+                stats.track_seconds += time.perf_counter() - track_started
+                writer.write(index, timestamp, detections, tracked)
+                stats.frames += 1
+                stats.detections += len(detections)
+                track_ids.update(track['trackId'] for track in tracked)
+    except Exception as exc:
+        stats.error = str(exc)
+        logger.error('Ошибка обработки %s: %s', path, exc, exc_info=True)
+    finally:
+        stop.set()
+        # Unblock the decoder if it is waiting on a full queue.
+        while decoder.is_alive():
+            try:
+                frames_queue.get_nowait()
+            except queue.Empty:
+                decoder.join(timeout=0.05)
+        if writer is not None:
+            writer.close()
+
+    stats.wall_seconds = time.perf_counter() - started
+    stats.tracks = len(track_ids)
+    stats.fps = stats.frames / stats.wall_seconds if stats.wall_seconds > 0 else 0.0
+    return stats
+
+
+def process_files(sources: List[str], options: BatchOptions, workers: int = 1) -> Iterator[FileStats]:
+    """Processes inputs sequentially or across a process pool, yielding stats as files finish."""
+    names = output_names(sources)
+    if workers <= 1 or len(sources) <= 1:
+        for source, name in zip(sources, names):
+            yield process_file(source, options, name)
+        return
+
+    import multiprocessing
+
+    # torch is not fork-safe once its thread pools are up, so workers are spawned.
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        futures = [pool.submit(process_file, source, options, name) for source, name in zip(sources, names)]
+        for future in futures:
+            yield future.result()
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='Offline detection + tracking over recorded footage')
+    parser.add_argument('inputs', nargs='+', help='Video files or directories with images')
+    parser.add_argument('--model', required=True, help='Path or name of the YOLO model (.pt)')
+    parser.add_argument('--output-dir', default='batch_output')
+    parser.add_argument('--format', dest='output_format', choices=sorted(WRITERS), default='jsonl')
+    parser.add_argument('--batch-size', type=int, default=8, help='Frames per model call')
+    parser.add_argument('--prefetch', type=int, default=4, help='Decoded batches kept ahead of inference')
+    parser.add_argument('--workers', type=int, default=1, help='Process pool size for multiple inputs')
+    parser.add_argument('--fps', type=float, default=25.0, help='Timestamp rate for image directories')
+    parser.add_argument('--conf', dest='confidence_threshold', type=float, default=0.5)
+    parser.add_argument('--tracker-iou', dest='tracker_iou_threshold', type=float, default=0.3)
+    parser.add_argument('--tracker-max-age', dest='tracker_max_age', type=int, default=5)
+    parser.add_argument('--tracker-min-hits', dest='tracker_min_hits', type=int, default=1)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    args = build_parser().parse_args(argv)
+    options = BatchOptions(
+        model=args.model,
+        output_dir=args.output_dir,
+        output_format=args.output_format,
+        batch_size=max(args.batch_size, 1),
+        prefetch=args.prefetch,
+        fps=args.fps,
+        confidence_threshold=args.confidence_threshold,
+        tracker_iou_threshold=args.tracker_iou_threshold,
+        tracker_max_age=args.tracker_max_age,
+        tracker_min_hits=args.tracker_min_hits,
+    )
+
+    failed = False
+    total_frames = 0
+    started = time.perf_counter()
+    for stats in process_files(args.inputs, options, workers=args.workers):
+        failed = failed or stats.error is not None
+        total_frames += stats.frames
+        print(json.dumps(asdict(stats), ensure_ascii=False))
+    elapsed = time.perf_counter() - started
+    logger.info('Обработано кадров: %d за %.2f с (%.1f FPS)', total_frames, elapsed,
+                total_frames / elapsed if elapsed > 0 else 0.0)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,559 @@
+"""Reproducible benchmarks for the detection service hot paths.
+
+Everything runs on synthetic frames and a fake model, so results only depend
+on the machine, not on a camera, GPU or model weights.
+
+Usage (from the repository root)::
+
+    python -m services.detection.tools.benchmark run --save bench/baseline.json
+    python -m services.detection.tools.benchmark run --baseline bench/baseline.json
+    python -m services.detection.tools.benchmark compare bench/baseline.json bench/new.json
+    python -m services.detection.tools.benchmark list
+    python -m services.detection.tools.benchmark layouts --viewers 3 \
+        --layout 'torch=2;cv2=1;detection=2-3;capture=1;encode=0'
+
+``run --baseline`` and ``compare`` exit with status 1 when a case got slower
+than the baseline by more than ``--threshold`` (default 15%). ``layouts`` runs
+the end-to-end loop once per thread/CPU layout, with stream viewers pulling
+JPEGs next to it, and prints detection throughput and latency for each.
+"""
+from __future__ import annotations
+
+import argparse
+import fnmatch
+import json
+import platform
+import statistics
+import sys
+import threading
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+PROJECT_ROOT = Path(__file__).resolve().parents[3]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from services.detection.tools.fakes import FakeModel, FakeModelManager, make_detections, make_frame
+
+# name -> factory returning a zero-argument callable that performs one operation
+BENCHMARKS: Dict[str, Callable[[], Callable[[], None]]] = {}
+# name -> function returning a finished result (cases that measure themselves)
+CUSTOM_BENCHMARKS: Dict[str, Callable[[float, str], "BenchResult"]] = {}
+DEFAULT_SOURCE = 'synthetic:1280x720'
+
+
+
+@dataclass
+class BenchResult:
+    name: str
+    median_us: float
+    min_us: float
+    p95_us: float
+    ops: int
+    repeats: int
+
+
+def benchmark(name: str):
+    def decorator(factory):
+        BENCHMARKS[name] = factory
+        return factory
+    return decorator
+
+
+def custom_benchmark(name: str):
+    def decorator(fn):
+        CUSTOM_BENCHMARKS[name] = fn
+        return fn
+    return decorator
+
+
+# Cases -------------------------------------------------------------------------------
+
+
+def _tracker_case(boxes: int):
+    def factory():
+        from services.detection.tracking.sort_tracker import SortTracker
+
+        tracker = SortTracker()
+        frames = [make_detections(boxes, offset=step * 3) for step in range(16)]
+        state = {'index': 0}
+
+        def run():
+            state['index'] += 1
+            tracker.update(frames[state['index'] % len(frames)], timestamp=float(state['index']))
+        return run
+    return factory
+
+
+for _boxes in (1, 5, 20, 50):
+    benchmark(f'tracker.update[{_boxes}]')(_tracker_case(_boxes))
+
+
+@benchmark('trackers.update_tracker_cache')
+def _update_tracker_cache():
+    from services.detection.tracking.trackers import clear_tracker_cache, update_tracker_cache
+
+    frame = make_frame()
+    bbox = [400.0, 200.0, 720.0, 520.0]
+    metadata = {'label': 'fire', 'confidence': 0.9, 'timestamp': 0.0}
+
+    def run():
+        update_tracker_cache(987654321, frame, bbox, metadata)
+    clear_tracker_cache(987654321)
+    return run
+
+
+@benchmark('trackers.crop_frame_for_tracker')
+def _crop_frame_for_tracker():
+    from services.detection.tracking.trackers import crop_frame_for_tracker
+
+    frame = make_frame()
+    bbox = [400.0, 200.0, 720.0, 520.0]
+    return lambda: crop_frame_for_tracker(frame, bbox)
+
+
+def _encode_case(quality: int):
+    """What ``DetectionService._encode_jpeg`` does per annotated frame: the process-wide encoder at ``quality``."""
+    def factory():
+        from services.detection.streaming.jpeg import encode_jpeg
+
+        frame = make_frame()
+        return lambda: encode_jpeg(frame, quality=quality)
+    return factory
+
+
+for _quality in (50, 70, 85, 95):
+    benchmark(f'service.encode_jpeg[q{_quality}]')(_encode_case(_quality))
+
+
+def _jpeg_backend_case(name: str, subsampling: str):
+    def factory():
+        from services.detection.streaming.jpeg import JpegSettings, create_backend
+
+        backend = create_backend(name)
+        settings = JpegSettings(quality=85, subsampling=subsampling)
+        frame = make_frame()
+        return lambda: backend.encode(frame, settings, settings.quality)
+    return factory
+
+
+def _register_jpeg_backends() -> None:
+    """Only the backends importable here, so the case list differs between hosts."""
+    from services.detection.streaming.jpeg import available_backends
+
+    for name in available_backends():
+        for subsampling in ('420', '444'):
+            benchmark(f'jpeg.encode[{name},{subsampling}]')(_jpeg_backend_case(name, subsampling))
+
+
+_register_jpeg_backends()
+
+
+def _postprocess_case(boxes: int):
+    def factory():
+        from services.detection.detection.inference import InferenceEngine
+
+        engine = InferenceEngine(FakeModelManager(FakeModel(boxes=boxes)), None, threading.Lock(), 0.5)
+        frames = [make_frame()]
+        return lambda: engine.detect_batch(frames)
+    return factory
+
+
+for _boxes in (0, 5, 50):
+    benchmark(f'inference.postprocess[{_boxes}]')(_postprocess_case(_boxes))
+
+
+@benchmark('inference.infer[5]')
+def _infer():
+    """Full ``InferenceEngine.infer``: fake model, post-processing, tracking and annotation."""
+    from services.detection.detection.inference import InferenceEngine
+    from services.detection.tracking.sort_tracker import SortTracker
+
+    engine = InferenceEngine(FakeModelManager(FakeModel(boxes=5)), SortTracker(), threading.RLock(), 0.5)
+    frame = make_frame()
+    state = {'timestamp': 0.0}
+
+    def run():
+        state['timestamp'] += 0.033
+        engine.infer(frame, state['timestamp'])
+    return run
+
+
+@custom_benchmark('service.detection_loop[e2e]')
+def _detection_loop(budget: float, source: str = DEFAULT_SOURCE) -> BenchResult:
+    """Time per frame through capture -> fake model -> tracker -> annotate -> encode.
+
+    ``source`` is any ``CAMERA_SOURCE`` spec, so a recorded clip can replace
+    the synthetic camera; it is replayed as fast as the loop consumes it.
+    """
+    from services.detection.config.runtime import RuntimeConfig
+    from services.detection.service import DetectionService
+    from services.detection.tools.fakes import attach_fake_model
+
+    config = RuntimeConfig(infer_fps=10_000.0, camera_source=source, camera_source_pace='fast')
+    service = DetectionService(config)
+    service._init_models = lambda: attach_fake_model(service, FakeModel(boxes=5))
+    service.start()
+    try:
+        service.wait_ready(30)
+        pipeline = service.primary
+        time.sleep(min(0.2, budget / 4))  # warm-up
+        start_seq = pipeline.processed_seq
+        started = time.perf_counter()
+        samples: List[float] = []
+        last_seq, last_time = start_seq, started
+        while time.perf_counter() - started < budget:
+            time.sleep(0.05)
+            seq, now = pipeline.processed_seq, time.perf_counter()
+            if seq > last_seq:
+                samples.append((now - last_time) / (seq - last_seq) * 1e6)
+                last_seq, last_time = seq, now
+        frames = pipeline.processed_seq - start_seq
+        elapsed = time.perf_counter() - started
+    finally:
+        service.stop()
+
+    per_frame = elapsed / frames * 1e6 if frames else float('inf')
+    samples.sort()
+    return BenchResult(
+        name='service.detection_loop[e2e]',
+        median_us=per_frame,
+        min_us=samples[0] if samples else per_frame,
+        p95_us=samples[min(int(len(samples) * 0.95), len(samples) - 1)] if samples else per_frame,
+        ops=frames,
+        repeats=len(samples),
+    )
+
+
+# Thread layouts ----------------------------------------------------------------------
+
+# Layout spec keys -> RuntimeConfig fields
+LAYOUT_KEYS = {
+    'torch': 'torch_threads',
+    'interop': 'torch_interop_threads',
+    'cv2': 'cv2_threads',
+    'detection': 'detection_cpus',
+    'capture': 'capture_cpus',
+    'encode': 'encode_cpus',
+}
+
+
+def parse_layout(spec: str) -> dict:
+    """``torch=2;cv2=1;detection=2-3;capture=1;encode=0`` -> RuntimeConfig overrides."""
+    from services.detection.config.runtime import _parse_cpu_list
+
+    overrides = {}
+    for part in spec.split(';'):
+        if not part.strip():
+            continue
+        key, _, value = part.partition('=')
+        field = LAYOUT_KEYS.get(key.strip())
+        if field is None:
+            raise ValueError(f'unknown layout key: {key.strip()!r} (expected one of {", ".join(LAYOUT_KEYS)})')
+        overrides[field] = _parse_cpu_list(value) if field.endswith('_cpus') else int(value)
+    return overrides
+
+
+def default_layouts() -> List[str]:
+    """Library defaults, single-threaded libraries, and (2+ CPUs) detection split from capture/encode."""
+    from services.detection.monitoring.cpu_layout import available_cpus
+
+    cpus = available_cpus()
+    layouts = ['', 'torch=1;cv2=1']
+    if len(cpus) >= 2:
+        half = len(cpus) // 2
+        io = ','.join(map(str, cpus[:half]))
+        detection = ','.join(map(str, cpus[half:]))
+        layouts.append(f'torch={len(cpus) - half};cv2=1;detection={detection};capture={io};encode={io}')
+    return layouts
+
+
+def run_layout(spec: str, budget: float, source: str = DEFAULT_SOURCE, viewers: int = 2,
+               compute: float = 0.005) -> dict:
+    """One end-to-end run under ``spec`` while ``viewers`` threads pull the raw stream at up to 30 fps."""
+    from services.detection.config.runtime import RuntimeConfig
+    from services.detection.service import DetectionService
+    from services.detection.tools.fakes import attach_fake_model
+
+    config = RuntimeConfig(infer_fps=10_000.0, camera_source=source, camera_source_pace='fast', **parse_layout(spec))
+    service = DetectionService(config)
+    service._init_models = lambda: attach_fake_model(service, FakeModel(boxes=5, compute=compute))
+    stop = threading.Event()
+    delivered = [0] * viewers
+
+    def viewer(index: int) -> None:
+        last = None
+        while not stop.wait(1 / 30):
+            data = service.capture_raw_jpeg()
+            if data is not None and data is not last:
+                delivered[index] += 1
+                last = data
+
+    threads = [threading.Thread(target=viewer, args=(index,), name=f'viewer-{index}', daemon=True)
+               for index in range(viewers)]
+    service.start()
+    try:
+        service.wait_ready(30)
+        pipeline = service.primary
+        time.sleep(min(0.2, budget / 4))  # warm-up
+        for thread in threads:
+            thread.start()
+        start_seq = pipeline.processed_seq
+        started = time.perf_counter()
+        time.sleep(budget)
+        frames = pipeline.processed_seq - start_seq
+        elapsed = time.perf_counter() - started
+        stop.set()
+        for thread in threads:
+            thread.join()
+        latency = service._stage('loop').percentiles((0.5, 0.95))
+        report = service.cpu_layout.report()
+    finally:
+        stop.set()
+        service.stop()
+    return {
+        'layout': spec or 'default',
+        'fps': frames / elapsed,
+        'latency_p50_ms': latency.get('p50', 0.0) * 1000,
+        'latency_p95_ms': latency.get('p95', 0.0) * 1000,
+        'stream_fps': sum(delivered) / max(viewers, 1) / elapsed,
+        'errors': report['errors'],
+    }
+
+
+def run_layouts(specs: List[str], budget: float, source: str = DEFAULT_SOURCE, viewers: int = 2,
+                compute: float = 0.005) -> List[dict]:
+    """Runs every layout; library pool sizes are process-wide, so they are reset around each run."""
+    try:
+        import cv2
+    except ImportError:  # pragma: no cover - OpenCV might be unavailable on CI
+        cv2 = None
+    torch = sys.modules.get('torch')
+    if torch is None and any('torch_threads' in parse_layout(spec) for spec in specs):
+        try:
+            import torch
+        except ImportError:
+            torch = None
+    cv2_default = cv2.getNumThreads() if cv2 is not None else None
+    torch_default = torch.get_num_threads() if torch is not None else None
+
+    def reset() -> None:
+        if cv2 is not None:
+            cv2.setNumThreads(cv2_default)
+        if torch is not None:
+            torch.set_num_threads(torch_default)
+
+    rows = []
+    try:
+        for spec in specs:
+            reset()
+            rows.append(run_layout(spec, budget, source, viewers, compute))
+    finally:
+        reset()
+    return rows
+
+
+def print_layouts(rows: List[dict]) -> None:
+    width = max([len('layout')] + [len(row['layout']) for row in rows])
+    print(f"{'layout':<{width}} {'fps':>8} {'p50 ms':>8} {'p95 ms':>8} {'stream fps':>11}")
+    for row in rows:
+        print(f"{row['layout']:<{width}} {row['fps']:>8.1f} {row['latency_p50_ms']:>8.2f} "
+              f"{row['latency_p95_ms']:>8.2f} {row['stream_fps']:>11.1f}")
+        for error in row['errors']:
+            print(f'  ! {error}')
+
+
+# Runner ------------------------------------------------------------------------------
+
+
+def measure(name: str, factory: Callable[[], Callable[[], None]], budget: float, repeats: int = 7) -> BenchResult:
+    """Auto-calibrates the loop count so each repeat takes about ``budget / repeats`` seconds."""
+    op = factory()
+    op()  # warm-up, also triggers lazy imports
+    target = budget / repeats
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            op()
+        elapsed = time.perf_counter() - started
+        if elapsed >= target * 0.2 or number >= 1_000_000:
+            break
+        number *= 4
+    number = max(1, int(number * target / max(elapsed, 1e-9)))
+
+    timings: List[float] = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        for _ in range(number):
+            op()
+        timings.append((time.perf_counter() - started) / number * 1e6)
+    timings.sort()
+    return BenchResult(
+        name=name,
+        median_us=statistics.median(timings),
+        min_us=timings[0],
+        p95_us=timings[min(int(len(timings) * 0.95), len(timings) - 1)],
+        ops=number * repeats,
+        repeats=repeats,
+    )
+
+
+def selected_names(patterns: Optional[List[str]]) -> List[str]:
+    names = list(BENCHMARKS) + list(CUSTOM_BENCHMARKS)
+    if not patterns:
+        return names
+    # Case names contain brackets, which fnmatch treats as character classes
+    return [name for name in names
+            if any(name == pattern or fnmatch.fnmatchcase(name, pattern) for pattern in patterns)]
+
+
+def run_suite(patterns: Optional[List[str]] = None, budget: float = 1.0,
+              source: str = DEFAULT_SOURCE) -> List[BenchResult]:
+    results = []
+    for name in selected_names(patterns):
+        if name in CUSTOM_BENCHMARKS:
+            results.append(CUSTOM_BENCHMARKS[name](budget, source))
+        else:
+            results.append(measure(name, BENCHMARKS[name], budget))
+    return results
+
+
+def environment_info() -> dict:
+    import numpy
+
+    info = {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'platform': platform.platform(),
+        'node': platform.node(),
+        'numpy': numpy.__version__,
+    }
+    try:
+        import cv2
+
+        info['opencv'] = cv2.__version__
+    except ImportError:  # pragma: no cover - OpenCV might be unavailable on CI
+        pass
+    return info
+
+
+def save_results(path: Path, results: List[BenchResult]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    payload = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'environment': environment_info(),
+        'results': {result.name: asdict(result) for result in results},
+    }
+    path.write_text(json.dumps(payload, indent=2, ensure_ascii=False), encoding='utf-8')
+
+
+def load_results(path: Path) -> Dict[str, dict]:
+    return json.loads(Path(path).read_text(encoding='utf-8'))['results']
+
+
+def compare(baseline: Dict[str, dict], current: Dict[str, dict], threshold: float = 0.15) -> List[dict]:
+    """Per-case ratio current/baseline (median); ``regression`` is set above ``1 + threshold``."""
+    rows = []
+    for name, result in current.items():
+        base = baseline.get(name)
+        if base is None or not base.get('median_us'):
+            rows.append({'name': name, 'baseline_us': None, 'current_us': result['median_us'],
+                         'ratio': None, 'regression': False})
+            continue
+        ratio = result['median_us'] / base['median_us']
+        rows.append({'name': name, 'baseline_us': base['median_us'], 'current_us': result['median_us'],
+                     'ratio': ratio, 'regression': ratio > 1.0 + threshold})
+    return rows
+
+
+def print_results(results: List[BenchResult]) -> None:
+    print(f"{'case':<40} {'median us':>12} {'min us':>12} {'p95 us':>12} {'ops':>9}")
+    for r in results:
+        print(f'{r.name:<40} {r.median_us:>12.1f} {r.min_us:>12.1f} {r.p95_us:>12.1f} {r.ops:>9d}')
+
+
+def print_comparison(rows: List[dict]) -> bool:
+    print(f"{'case':<40} {'baseline us':>12} {'current us':>12} {'change':>8}")
+    regressed = False
+    for row in rows:
+        if row['ratio'] is None:
+            print(f"{row['name']:<40} {'-':>12} {row['current_us']:>12.1f} {'new':>8}")
+            continue
+        flag = '  REGRESSION' if row['regression'] else ''
+        print(f"{row['name']:<40} {row['baseline_us']:>12.1f} {row['current_us']:>12.1f} "
+              f"{(row['ratio'] - 1) * 100:>+7.1f}%{flag}")
+        regressed = regressed or row['regression']
+    return regressed
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='Detection service hot-path benchmarks')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    run = sub.add_parser('run', help='Run benchmarks')
+    run.add_argument('-k', '--filter', action='append', help='Glob over case names, repeatable')
+    run.add_argument('--budget', type=float, default=1.0, help='Seconds per case')
+    run.add_argument('--source', default=DEFAULT_SOURCE,
+                     help='Camera source for the end-to-end case (file, image directory or synthetic spec)')
+    run.add_argument('--save', type=Path, help='Write results as JSON (use as a baseline later)')
+    run.add_argument('--baseline', type=Path, help='Compare against a saved baseline')
+    run.add_argument('--threshold', type=float, default=0.15)
+
+    cmp_parser = sub.add_parser('compare', help='Compare two saved result files')
+    cmp_parser.add_argument('baseline', type=Path)
+    cmp_parser.add_argument('current', type=Path)
+    cmp_parser.add_argument('--threshold', type=float, default=0.15)
+
+    sub.add_parser('list', help='List benchmark cases')
+
+    layouts = sub.add_parser('layouts', help='Sweep thread/CPU layouts over the end-to-end loop')
+    layouts.add_argument('--layout', action='append',
+                         help="e.g. 'torch=2;cv2=1;detection=2-3;capture=1;encode=0', repeatable "
+                              "(default: library defaults, single-threaded libraries, split cores)")
+    layouts.add_argument('--budget', type=float, default=3.0, help='Seconds per layout')
+    layouts.add_argument('--viewers', type=int, default=2, help='Threads pulling the raw MJPEG stream')
+    layouts.add_argument('--compute', type=float, default=0.005,
+                         help='CPU seconds the fake model burns per frame (stands in for inference)')
+    layouts.add_argument('--source', default=DEFAULT_SOURCE)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.command == 'list':
+        for name in selected_names(None):
+            print(name)
+        return 0
+
+    if args.command == 'layouts':
+        specs = args.layout or default_layouts()
+        try:
+            for spec in specs:
+                parse_layout(spec)
+        except ValueError as exc:
+            print(exc, file=sys.stderr)
+            return 2
+        print_layouts(run_layouts(specs, args.budget, args.source, args.viewers, args.compute))
+        return 0
+
+    if args.command == 'compare':
+        rows = compare(load_results(args.baseline), load_results(args.current), args.threshold)
+        return 1 if print_comparison(rows) else 0
+
+    results = run_suite(args.filter, args.budget, args.source)
+    print_results(results)
+    if args.save:
+        save_results(args.save, results)
+    if args.baseline:
+        print()
+        current = {result.name: asdict(result) for result in results}
+        rows = compare(load_results(args.baseline), current, args.threshold)
+        return 1 if print_comparison(rows) else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,213 @@
+"""Deterministic stand-ins for the model, the Picamera2 camera and frames.
+
+Used by the benchmark suite, the load-test harness and tests to run the full
+service on a plain Linux box without a camera, GPU or model weights.
+"""
+from __future__ import annotations
+
+import time
+from types import SimpleNamespace
+from typing import List, Optional
+
+import numpy as np
+
+
+class FakeTensor:
+    """Minimal torch-like tensor: ``.cpu().numpy()``."""
+
+    def __init__(self, values):
+        self._values = np.asarray(values, dtype=np.float32)
+
+    def cpu(self) -> "FakeTensor":
+        return self
+
+    def numpy(self) -> np.ndarray:
+        return self._values
+
+
+class FakeBoxes:
+    """Ultralytics ``Boxes`` subset used by ``InferenceEngine``."""
+
+    def __init__(self, xyxy, conf, cls):
+        self.xyxy = FakeTensor(np.asarray(xyxy, dtype=np.float32).reshape(-1, 4))
+        self.conf = FakeTensor(conf)
+        self.cls = FakeTensor(cls)
+
+    def __len__(self) -> int:
+        return len(self.conf.numpy())
+
+
+class FakeModel:
+    """Ultralytics-like callable emitting ``boxes`` detections per image.
+
+    Boxes form a grid that drifts a few pixels per call, so trackers see stable
+    identities. ``latency`` (seconds per image) simulates model cost by
+    sleeping; ``compute`` (seconds per image) burns CPU in NumPy matrix products
+    instead, which release the GIL like torch does, so it competes for cores.
+    """
+
+    def __init__(self, boxes: int = 3, latency: float = 0.0, names: Optional[dict] = None, compute: float = 0.0):
+        self.boxes = boxes
+        self.latency = latency
+        self.compute = compute
+        self.names = names or {0: 'fire', 1: 'smoke'}
+        self.calls = 0
+        self.batch_sizes: List[int] = []
+        # Extra keyword arguments of the last call (e.g. imgsz)
+        self.last_options: dict = {}
+
+    def __call__(self, source, conf: float = 0.5, verbose: bool = False, **kwargs):
+        frames = source if isinstance(source, list) else [source]
+        self.batch_sizes.append(len(frames))
+        self.last_options = kwargs
+        if self.latency > 0:
+            time.sleep(self.latency * len(frames))
+        if self.compute > 0:
+            _burn_cpu(self.compute * len(frames))
+        results = []
+        for frame in frames:
+            results.append(SimpleNamespace(boxes=self._boxes_for(frame.shape[1], frame.shape[0])))
+        self.calls += 1
+        return results
+
+    def _boxes_for(self, width: int, height: int) -> FakeBoxes:
+        count = self.boxes
+        if count <= 0:
+            return FakeBoxes(np.zeros((0, 4)), [], [])
+        columns = int(np.ceil(np.sqrt(count)))
+        rows = int(np.ceil(count / columns))
+        cell_w, cell_h = width / columns, height / rows
+        drift = (self.calls * 3) % max(int(cell_w * 0.25), 1)
+        index = np.arange(count)
+        x1 = (index % columns) * cell_w + cell_w * 0.1 + drift
+        y1 = (index // columns) * cell_h + cell_h * 0.1
+        xyxy = np.stack([x1, y1, x1 + cell_w * 0.5, y1 + cell_h * 0.5], axis=1)
+        conf = np.full(count, 0.9, dtype=np.float32)
+        cls = (index % len(self.names)).astype(np.float32)
+        return FakeBoxes(xyxy, conf, cls)
+
+
+def _burn_cpu(seconds: float) -> None:
+    matrix = np.full((128, 128), 0.5, dtype=np.float32)
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        np.dot(matrix, matrix)
+
+
+class FakeModelManager:
+    """``ModelManager`` subset backed by a ``FakeModel``."""
+
+    def __init__(self, model: FakeModel, name: str = 'fake.pt'):
+        self.model = model
+        self.model_name = name
+
+    def get_model(self):
+        return self.model
+
+    def get_active_model(self) -> str:
+        return self.model_name
+
+    def get_available_models(self) -> List[str]:
+        return [self.model_name]
+
+    def switch_model(self, model_name: str) -> str:
+        return self.model_name
+
+
+class FakePicamera2:
+    """Picamera2 subset used by ``CameraManager``: multi-stream configuration and capture.
+
+    With ``yuv_only_lores`` it rejects a non-YUV420 lores stream, like the
+    Raspberry Pi 4 ISP does. Main frames carry a bright square whose position
+    matches the one in the lores frame, scaled.
+    """
+
+    def __init__(self, yuv_only_lores: bool = False):
+        self.yuv_only_lores = yuv_only_lores
+        self.configured: Optional[dict] = None
+        self.started = False
+        self.closed = False
+        self.captures = 0
+
+    def create_preview_configuration(self, main=None, lores=None, **kwargs) -> dict:
+        return {"main": dict(main or {"size": (640, 480), "format": "XBGR8888"}),
+                "lores": dict(lores) if lores else None}
+
+    def configure(self, config: dict) -> None:
+        lores = config.get("lores")
+        if lores and self.yuv_only_lores and lores.get("format") != "YUV420":
+            raise RuntimeError("lores stream must be YUV420")
+        self.configured = config
+
+    def start(self) -> None:
+        self.started = True
+
+    def stop(self) -> None:
+        self.started = False
+
+    def close(self) -> None:
+        self.closed = True
+
+    def _stream_array(self, name: str) -> np.ndarray:
+        stream = self.configured[name]
+        width, height = stream["size"]
+        fmt = stream.get("format", "XBGR8888")
+        if fmt == "YUV420":
+            array = np.full((height * 3 // 2, width), 128, dtype=np.uint8)
+            array[height // 4:height // 2, width // 4:width // 2] = 235  # bright square in Y
+            return array
+        channels = 4 if fmt.startswith("X") else 3
+        array = np.zeros((height, width, channels), dtype=np.uint8)
+        array[height // 4:height // 2, width // 4:width // 2, :3] = 235
+        return array
+
+    def capture_array(self, name: str = "main") -> np.ndarray:
+        self.captures += 1
+        return self._stream_array(name)
+
+    def capture_arrays(self, names) -> tuple:
+        self.captures += 1
+        return [self._stream_array(name) for name in names], {"SensorTimestamp": self.captures}
+
+
+def make_frame(width: int = 1280, height: int = 720, seed: int = 0) -> np.ndarray:
+    """Deterministic BGR frame with texture, so JPEG sizes resemble real footage."""
+    rng = np.random.default_rng(seed)
+    frame = rng.integers(0, 255, size=(height // 8, width // 8, 3), dtype=np.uint8)
+    return np.ascontiguousarray(np.repeat(np.repeat(frame, 8, axis=0), 8, axis=1)[:height, :width])
+
+
+def make_detections(count: int, width: int = 1280, height: int = 720, offset: float = 0.0) -> List[dict]:
+    """Raw detections laid out on a grid, shifted by ``offset`` pixels."""
+    model = FakeModel(boxes=count)
+    model.calls = int(offset // 3)
+    boxes = model._boxes_for(width, height)
+    detections = []
+    for bbox, confidence, class_id in zip(boxes.xyxy.numpy().tolist(), boxes.conf.numpy().tolist(),
+                                          boxes.cls.numpy().tolist()):
+        detections.append({'bbox': bbox, 'confidence': confidence, 'class_id': int(class_id),
+                           'label': model.names[int(class_id)]})
+    return detections
+
+
+def attach_fake_model(service, model: Optional[FakeModel] = None, trackers: bool = True) -> FakeModel:
+    """Installs a fake model into a ``DetectionService`` instead of loading weights.
+
+    Intended to replace ``DetectionService._init_models`` before ``start()``::
+
+        service._init_models = lambda: attach_fake_model(service, FakeModel(boxes=5))
+    """
+    from services.detection.tracking.sort_tracker import SortTracker
+
+    model = model or FakeModel()
+    service.model_manager = FakeModelManager(model)
+    if trackers:
+        for pipeline in service.pipelines.values():
+            pipeline.tracker = SortTracker(
+                iou_threshold=service.config.tracker_iou_threshold,
+                max_age=service.config.tracker_max_age,
+                min_hits=service.config.tracker_min_hits,
+            )
+    service.inference_engine = service._build_inference_engine()
+    return model
+
@@ -0,0 +1,480 @@
+"""HTTP load test for the MJPEG streams and the JSON polling endpoints.
+
+By default a detection server backed by a synthetic camera and a fake model
+is started in a child process, so the reported CPU and thread numbers belong
+to the server alone and runs are reproducible on any Linux box::
+
+    python -m services.detection.tools.loadtest run --clients 8 --slow-clients 2 --duration 20
+    python -m services.detection.tools.loadtest run --url http://raspberrypi:8001 --clients 4
+
+Per stream client the report lists delivered and unique FPS, capture-to-client
+latency (from the ``X-Timestamp`` part header) and bytes received; per polled
+endpoint request rate, errors and p50/p95/p99 latency; and server CPU, threads
+and memory scraped from ``/metrics``.
+
+``serve`` runs only the fake-backed server, e.g. to load it from another host.
+"""
+from __future__ import annotations
+
+import argparse
+import http.client
+import json
+import logging
+import subprocess
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+PROJECT_ROOT = Path(__file__).resolve().parents[3]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+READY_MARKER = 'LOADTEST_SERVER_PORT='
+DEFAULT_POLLS = ('/api/trackers:5', '/api/detection:2')
+
+
+def _percentile(values: List[float], quantile: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(int(quantile * len(ordered)), len(ordered) - 1)]
+
+
+def _ms(value: Optional[float]) -> Optional[float]:
+    return None if value is None else round(value * 1000, 2)
+
+
+# Server --------------------------------------------------------------------------------
+
+
+def build_fake_service(source: str = 'synthetic:1280x720', fps: float = 30.0, boxes: int = 5,
+                       model_latency: float = 0.02, infer_fps: float = 30.0):
+    """DetectionService on a replayed or synthetic camera with a fake model (not started)."""
+    from services.detection.config.runtime import RuntimeConfig
+    from services.detection.service import DetectionService
+    from services.detection.tools.fakes import FakeModel, attach_fake_model
+
+    config = RuntimeConfig(
+        infer_fps=infer_fps,
+        camera_source=source,
+        camera_source_pace='fixed',
+        camera_source_fps=fps,
+    )
+    service = DetectionService(config)
+    model = FakeModel(boxes=boxes, latency=model_latency)
+    service._init_models = lambda: attach_fake_model(service, model)
+    return service
+
+
+def start_server(host: str, port: int, service):
+    """Starts ``service`` and returns a threaded WSGI server for the Flask app (not yet serving)."""
+    from werkzeug.serving import make_server
+
+    from services.detection import detection_server
+
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    service.start()
+    service.wait_ready(30)
+    detection_server.detection_service = service
+    return make_server(host, port, detection_server.app, threaded=True)
+
+
+def serve_async(host: str, port: int, service) -> None:
+    """Serves ``service`` with the aiohttp server (``SERVER_MODE=async``) until interrupted."""
+    import asyncio
+
+    from aiohttp import web
+
+    from services.detection.async_server import create_async_app
+
+    async def run():
+        runner = web.AppRunner(create_async_app(service), shutdown_timeout=2.0)
+        await runner.setup()
+        site = web.TCPSite(runner, host, port)
+        await site.start()
+        bound_port = runner.addresses[0][1]
+        print(f'{READY_MARKER}{bound_port}', flush=True)
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await runner.cleanup()
+
+    service.start()
+    service.wait_ready(30)
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.stop()
+
+
+def serve(host: str, port: int, service, mode: str = 'threaded') -> None:
+    """Serves until interrupted, threaded like ``app.run`` in ``detection_server`` or with aiohttp."""
+    if mode == 'async':
+        serve_async(host, port, service)
+        return
+    server = start_server(host, port, service)
+    print(f'{READY_MARKER}{server.server_port}', flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.stop()
+
+
+def spawn_server(args) -> Tuple[subprocess.Popen, str]:
+    command = [
+        sys.executable, '-m', 'services.detection.tools.loadtest', 'serve',
+        '--host', '127.0.0.1', '--port', '0',
+        '--source', args.source, '--fps', str(args.fps), '--boxes', str(args.boxes),
+        '--model-latency', str(args.model_latency), '--infer-fps', str(args.infer_fps),
+        '--server', args.server,
+    ]
+    process = subprocess.Popen(command, cwd=str(PROJECT_ROOT), stdout=subprocess.PIPE, text=True)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        line = process.stdout.readline()
+        if not line:
+            break
+        if line.startswith(READY_MARKER):
+            return process, f'http://127.0.0.1:{int(line[len(READY_MARKER):])}'
+    process.kill()
+    raise RuntimeError('Load-test server did not start')
+
+
+# Clients -------------------------------------------------------------------------------
+
+
+@dataclass
+class StreamStats:
+    name: str
+    path: str
+    slow: bool
+    frames: int = 0
+    unique_frames: int = 0
+    bytes: int = 0
+    errors: int = 0
+    first_frame_s: Optional[float] = None
+    latencies: List[float] = field(default_factory=list, repr=False)
+    started: float = 0.0
+    finished: float = 0.0
+
+    def report(self) -> dict:
+        duration = max(self.finished - self.started, 1e-9)
+        return {
+            'name': self.name,
+            'path': self.path,
+            'slow': self.slow,
+            'fps': round(self.frames / duration, 2),
+            'unique_fps': round(self.unique_frames / duration, 2),
+            'kbytes_per_s': round(self.bytes / duration / 1024, 1),
+            'first_frame_ms': _ms(self.first_frame_s),
+            'latency_p50_ms': _ms(_percentile(self.latencies, 0.5)),
+            'latency_p95_ms': _ms(_percentile(self.latencies, 0.95)),
+            'latency_max_ms': _ms(max(self.latencies) if self.latencies else None),
+            'errors': self.errors,
+        }
+
+
+@dataclass
+class PollStats:
+    path: str
+    rate: float
+    requests: int = 0
+    errors: int = 0
+    latencies: List[float] = field(default_factory=list, repr=False)
+    started: float = 0.0
+    finished: float = 0.0
+
+    def report(self) -> dict:
+        duration = max(self.finished - self.started, 1e-9)
+        return {
+            'path': self.path,
+            'target_rate': self.rate,
+            'achieved_rate': round(self.requests / duration, 2),
+            'errors': self.errors,
+            'p50_ms': _ms(_percentile(self.latencies, 0.5)),
+            'p95_ms': _ms(_percentile(self.latencies, 0.95)),
+            'p99_ms': _ms(_percentile(self.latencies, 0.99)),
+            'max_ms': _ms(max(self.latencies) if self.latencies else None),
+        }
+
+
+def _connection(base_url: str, timeout: float) -> http.client.HTTPConnection:
+    parts = urlsplit(base_url)
+    return http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=timeout)
+
+
+def stream_client(base_url: str, stats: StreamStats, stop: threading.Event, read_delay: float = 0.0) -> None:
+    """Reads multipart JPEG parts until ``stop``; a slow reader sleeps ``read_delay`` per part."""
+    stats.started = time.monotonic()
+    connection = _connection(base_url, timeout=10)
+    last_timestamp = None
+    try:
+        connection.request('GET', stats.path)
+        response = connection.getresponse()
+        if response.status != 200:
+            stats.errors += 1
+            return
+        while not stop.is_set():
+            headers: Dict[str, str] = {}
+            line = response.readline()
+            if not line:
+                break
+            if not line.startswith(b'--'):
+                continue
+            while True:
+                line = response.readline().strip()
+                if not line:
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            length = int(headers.get('content-length', 0))
+            body = response.read(length)
+            arrived = time.time()
+            if len(body) < length:
+                break
+            stats.frames += 1
+            stats.bytes += length
+            if stats.first_frame_s is None:
+                stats.first_frame_s = time.monotonic() - stats.started
+            timestamp = headers.get('x-timestamp')
+            if timestamp is None or timestamp != last_timestamp:
+                stats.unique_frames += 1
+                if timestamp is not None:
+                    stats.latencies.append(arrived - float(timestamp))
+                last_timestamp = timestamp
+            if read_delay:
+                stop.wait(read_delay)
+    except (OSError, http.client.HTTPException, ValueError):
+        if not stop.is_set():
+            stats.errors += 1
+    finally:
+        stats.finished = time.monotonic()
+        connection.close()
+
+
+def poll_client(base_url: str, stats: PollStats, stop: threading.Event) -> None:
+    """Requests ``stats.path`` at ``stats.rate`` per second on a keep-alive connection."""
+    interval = 1.0 / stats.rate if stats.rate > 0 else 0.0
+    stats.started = time.monotonic()
+    connection = _connection(base_url, timeout=10)
+    next_at = time.monotonic()
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            connection.request('GET', stats.path)
+            response = connection.getresponse()
+            response.read()
+            if response.status >= 400:
+                stats.errors += 1
+            if response.will_close:
+                connection.close()
+        except (OSError, http.client.HTTPException):
+            stats.errors += 1
+            connection.close()
+        stats.latencies.append(time.perf_counter() - started)
+        stats.requests += 1
+        next_at += interval
+        delay = next_at - time.monotonic()
+        if delay > 0:
+            stop.wait(delay)
+        else:
+            next_at = time.monotonic()
+    stats.finished = time.monotonic()
+    connection.close()
+
+
+# Server-side numbers ---------------------------------------------------------------------
+
+
+def parse_prometheus(text: str) -> Dict[str, float]:
+    """Flat ``{'name{labels}': value}`` view of a Prometheus text exposition."""
+    values: Dict[str, float] = {}
+    for line in text.splitlines():
+        if not line or line.startswith('#'):
+            continue
+        key, _, value = line.rpartition(' ')
+        try:
+            values[key] = float(value)
+        except ValueError:
+            continue
+    return values
+
+
+def scrape_metrics(base_url: str) -> Optional[Dict[str, float]]:
+    connection = _connection(base_url, timeout=5)
+    try:
+        connection.request('GET', '/metrics')
+        response = connection.getresponse()
+        body = response.read().decode('utf-8', errors='replace')
+        return parse_prometheus(body) if response.status == 200 else None
+    except (OSError, http.client.HTTPException):
+        return None
+    finally:
+        connection.close()
+
+
+def _metric(values: Optional[Dict[str, float]], name: str) -> Optional[float]:
+    if not values:
+        return None
+    return values.get(f'dc_detection_{name}')
+
+
+def _summarize_server(before, after, samples: List[Dict[str, float]], elapsed: float) -> dict:
+    cpu_before, cpu_after = _metric(before, 'process_cpu_seconds'), _metric(after, 'process_cpu_seconds')
+    threads = [value for value in (_metric(sample, 'threads') for sample in samples) if value is not None]
+    rss = [value for value in (_metric(sample, 'process_resident_memory_bytes') for sample in samples)
+           if value is not None]
+    return {
+        'cpu_percent': round((cpu_after - cpu_before) / elapsed * 100, 1)
+        if cpu_before is not None and cpu_after is not None else None,
+        'threads_max': int(max(threads)) if threads else None,
+        'rss_max_mb': round(max(rss) / 2 ** 20, 1) if rss else None,
+        'achieved_fps': _metric(after, 'achieved_fps'),
+    }
+
+
+# Runner --------------------------------------------------------------------------------
+
+
+def parse_poll(spec: str) -> Tuple[str, float]:
+    path, _, rate = spec.rpartition(':')
+    if not path:
+        raise argparse.ArgumentTypeError(f'Expected PATH:RATE, got {spec!r}')
+    return path, float(rate)
+
+
+def run_load(base_url: str, clients: int, slow_clients: int, slow_delay: float, duration: float,
+             stream_path: str = '/stream.mjpeg', polls=DEFAULT_POLLS, warmup: float = 1.0) -> dict:
+    stop = threading.Event()
+    threads: List[threading.Thread] = []
+    streams: List[StreamStats] = []
+    pollers: List[PollStats] = []
+
+    time.sleep(warmup)
+    before = scrape_metrics(base_url)
+    started = time.monotonic()
+
+    for index in range(clients + slow_clients):
+        slow = index >= clients
+        stats = StreamStats(name=f'{"slow" if slow else "client"}-{index}', path=stream_path, slow=slow)
+        streams.append(stats)
+        threads.append(threading.Thread(
+            target=stream_client, args=(base_url, stats, stop, slow_delay if slow else 0.0), daemon=True,
+        ))
+    for spec in polls:
+        path, rate = parse_poll(spec) if isinstance(spec, str) else spec
+        stats = PollStats(path=path, rate=rate)
+        pollers.append(stats)
+        threads.append(threading.Thread(target=poll_client, args=(base_url, stats, stop), daemon=True))
+    for thread in threads:
+        thread.start()
+
+    samples = []
+    while time.monotonic() - started < duration:
+        time.sleep(min(1.0, duration))
+        sample = scrape_metrics(base_url)
+        if sample:
+            samples.append(sample)
+    after = scrape_metrics(base_url)
+    elapsed = time.monotonic() - started
+    stop.set()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    return {
+        'target': base_url,
+        'duration_s': round(elapsed, 2),
+        'streams': [stats.report() for stats in streams],
+        'polls': [stats.report() for stats in pollers],
+        'server': _summarize_server(before, after, samples or [after or {}], elapsed),
+    }
+
+
+def print_report(report: dict) -> None:
+    print(f"target {report['target']}, {report['duration_s']} s")
+    print(f"\n{'stream client':<12} {'fps':>7} {'unique':>7} {'KiB/s':>8} {'lat p50':>8} {'lat p95':>8} {'errors':>6}")
+    for row in report['streams']:
+        print(f"{row['name']:<12} {row['fps']:>7} {row['unique_fps']:>7} {row['kbytes_per_s']:>8} "
+              f"{row['latency_p50_ms'] or '-':>8} {row['latency_p95_ms'] or '-':>8} {row['errors']:>6}")
+    print(f"\n{'endpoint':<24} {'rate':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>6}")
+    for row in report['polls']:
+        print(f"{row['path']:<24} {row['achieved_rate']:>6} {row['p50_ms'] or '-':>8} {row['p95_ms'] or '-':>8} "
+              f"{row['p99_ms'] or '-':>8} {row['errors']:>6}")
+    server = report['server']
+    print(f"\nserver: cpu {server['cpu_percent']}%, threads max {server['threads_max']}, "
+          f"rss max {server['rss_max_mb']} MiB, detection fps {server['achieved_fps']}")
+
+
+def _add_fake_server_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--source', default='synthetic:1280x720', help='Camera source spec for the fake server')
+    parser.add_argument('--fps', type=float, default=30.0, help='Camera frame rate')
+    parser.add_argument('--boxes', type=int, default=5, help='Detections per frame from the fake model')
+    parser.add_argument('--model-latency', type=float, default=0.02, help='Fake model seconds per frame')
+    parser.add_argument('--infer-fps', type=float, default=30.0)
+    parser.add_argument('--server', choices=('threaded', 'async'), default='threaded',
+                        help='Serving mode of the fake server (SERVER_MODE)')
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='Load test for detection service streams and API')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    run = sub.add_parser('run', help='Generate load and print a report')
+    run.add_argument('--url', help='Existing server; by default a fake-backed server is spawned')
+    run.add_argument('--clients', type=int, default=4, help='MJPEG clients reading at full speed')
+    run.add_argument('--slow-clients', type=int, default=1, help='MJPEG clients pausing between parts')
+    run.add_argument('--slow-delay', type=float, default=0.5, help='Seconds a slow client sleeps per part')
+    run.add_argument('--stream', default='/stream.mjpeg', help='Stream path')
+    run.add_argument('--poll', action='append', metavar='PATH:RATE',
+                     help=f'Polled endpoint and requests/s, repeatable (default: {" ".join(DEFAULT_POLLS)})')
+    run.add_argument('--duration', type=float, default=15.0)
+    run.add_argument('--json', type=Path, help='Also write the report as JSON')
+    _add_fake_server_arguments(run)
+
+    serve_parser = sub.add_parser('serve', help='Only run the fake-backed server')
+    serve_parser.add_argument('--host', default='0.0.0.0')
+    serve_parser.add_argument('--port', type=int, default=8001)
+    _add_fake_server_arguments(serve_parser)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.command == 'serve':
+        service = build_fake_service(args.source, args.fps, args.boxes, args.model_latency, args.infer_fps)
+        serve(args.host, args.port, service, args.server)
+        return 0
+
+    process = None
+    base_url = args.url
+    if base_url is None:
+        process, base_url = spawn_server(args)
+    try:
+        report = run_load(base_url, args.clients, args.slow_clients, args.slow_delay, args.duration,
+                          args.stream, args.poll or DEFAULT_POLLS)
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    print_report(report)
+    if args.json:
+        args.json.parent.mkdir(parents=True, exist_ok=True)
+        args.json.write_text(json.dumps(report, indent=2), encoding='utf-8')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
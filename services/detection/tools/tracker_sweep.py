@@ -0,0 +1,221 @@
+"""Tracker-only parameter sweep over recorded detection logs.
+
+Replays ``.dlog`` files written by the service (``DETECTION_LOG_DIR``) through
+``SortTracker`` for every combination of the given parameters, in parallel
+across processes, and reports tracking quality proxies and tracker cost.
+
+Usage (from the repository root)::
+
+    python -m services.detection.tools.tracker_sweep logs/ \\
+        --iou 0.2,0.3,0.4 --max-age 3,5,10 --min-hits 1,2 --workers 4
+
+Metrics (no ground truth is needed):
+
+* ``id_switches`` — a box that overlaps (IoU >= ``--continuity-iou``) an output
+  box of the previous frame but carries a different track id;
+* ``fragments`` — times a track id disappears from the output and comes back;
+* ``tracks`` / ``short_tracks`` — distinct ids, and ids seen for fewer than
+  ``--short-track`` frames;
+* ``mean_active`` — average number of output tracks per frame;
+* ``tracker_us_mean`` / ``tracker_us_p95`` — ``SortTracker.update`` cost per frame.
+"""
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).resolve().parents[3]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from services.detection.tracking.detection_log import load_log_detections
+from services.detection.tracking.sort_tracker import SortTracker, iou
+
+
+@dataclass(frozen=True)
+class TrackerParams:
+    iou_threshold: float
+    max_age: int
+    min_hits: int
+
+
+@dataclass
+class SweepResult:
+    iou_threshold: float
+    max_age: int
+    min_hits: int
+    frames: int = 0
+    tracks: int = 0
+    short_tracks: int = 0
+    id_switches: int = 0
+    fragments: int = 0
+    mean_active: float = 0.0
+    tracker_us_mean: float = 0.0
+    tracker_us_p95: float = 0.0
+    replay_seconds: float = 0.0
+
+
+Frames = List[Tuple[float, List[dict]]]
+
+# Per-process cache so a worker parses each log once for all parameter sets.
+_frames_cache: Dict[Tuple[str, ...], Frames] = {}
+
+
+def collect_log_paths(inputs: Sequence[str]) -> List[Path]:
+    paths: List[Path] = []
+    for item in inputs:
+        path = Path(item)
+        if path.is_dir():
+            paths.extend(sorted(path.glob('*.dlog')))
+        else:
+            paths.append(path)
+    return paths
+
+
+def load_frames(paths: Sequence[Path]) -> Frames:
+    key = tuple(str(p) for p in paths)
+    frames = _frames_cache.get(key)
+    if frames is None:
+        frames = []
+        for path in paths:
+            frames.extend(load_log_detections(path))
+        frames.sort(key=lambda item: item[0])
+        _frames_cache[key] = frames
+    return frames
+
+
+def replay(frames: Frames, params: TrackerParams, continuity_iou: float = 0.5, short_track: int = 3) -> SweepResult:
+    """Runs one parameter set over the frames and computes the sweep metrics."""
+    tracker = SortTracker(iou_threshold=params.iou_threshold, max_age=params.max_age, min_hits=params.min_hits)
+    result = SweepResult(params.iou_threshold, params.max_age, params.min_hits)
+    timings = np.empty(len(frames), dtype=np.float64)
+    seen_frames: Dict[int, int] = {}
+    last_frame_index: Dict[int, int] = {}
+    previous: List[Tuple[int, np.ndarray]] = []
+    active_total = 0
+
+    started = time.perf_counter()
+    for frame_index, (timestamp, detections) in enumerate(frames):
+        tick = time.perf_counter()
+        tracked = tracker.update(detections, timestamp=timestamp)
+        timings[frame_index] = time.perf_counter() - tick
+
+        current = [(track['trackId'], np.asarray(track['bbox'], dtype=float)) for track in tracked]
+        active_total += len(current)
+        for track_id, bbox in current:
+            last = last_frame_index.get(track_id)
+            if last is not None and last != frame_index - 1:
+                result.fragments += 1
+            last_frame_index[track_id] = frame_index
+            seen_frames[track_id] = seen_frames.get(track_id, 0) + 1
+
+            best_iou = 0.0
+            best_id: Optional[int] = None
+            for prev_id, prev_bbox in previous:
+                score = iou(prev_bbox, bbox)
+                if score > best_iou:
+                    best_iou, best_id = score, prev_id
+            if best_id is not None and best_iou >= continuity_iou and best_id != track_id:
+                result.id_switches += 1
+        previous = current
+
+    result.replay_seconds = time.perf_counter() - started
+    result.frames = len(frames)
+    result.tracks = len(seen_frames)
+    result.short_tracks = sum(1 for count in seen_frames.values() if count < short_track)
+    if frames:
+        result.mean_active = active_total / len(frames)
+        result.tracker_us_mean = float(timings.mean() * 1e6)
+        result.tracker_us_p95 = float(np.percentile(timings, 95) * 1e6)
+    return result
+
+
+def _run_one(paths: Tuple[str, ...], params: TrackerParams, continuity_iou: float, short_track: int) -> SweepResult:
+    frames = load_frames([Path(p) for p in paths])
+    return replay(frames, params, continuity_iou=continuity_iou, short_track=short_track)
+
+
+def build_grid(ious: Sequence[float], max_ages: Sequence[int], min_hits: Sequence[int]) -> List[TrackerParams]:
+    return [TrackerParams(i, a, h) for i, a, h in itertools.product(ious, max_ages, min_hits)]
+
+
+def sweep(
+    paths: Sequence[Path],
+    grid: Sequence[TrackerParams],
+    workers: int = 1,
+    continuity_iou: float = 0.5,
+    short_track: int = 3,
+) -> Iterator[SweepResult]:
+    """Evaluates every parameter set, optionally spreading them over a process pool."""
+    key = tuple(str(p) for p in paths)
+    if workers <= 1 or len(grid) <= 1:
+        for params in grid:
+            yield _run_one(key, params, continuity_iou, short_track)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_run_one, key, params, continuity_iou, short_track) for params in grid]
+        for future in futures:
+            yield future.result()
+
+
+def _floats(value: str) -> List[float]:
+    return [float(part) for part in value.split(',') if part.strip()]
+
+
+def _ints(value: str) -> List[int]:
+    return [int(part) for part in value.split(',') if part.strip()]
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='Replay detection logs through SortTracker for a parameter grid')
+    parser.add_argument('logs', nargs='+', help='.dlog files or directories containing them')
+    parser.add_argument('--iou', type=_floats, default=[0.3], help='Comma-separated IoU thresholds')
+    parser.add_argument('--max-age', type=_ints, default=[5], help='Comma-separated max_age values')
+    parser.add_argument('--min-hits', type=_ints, default=[1], help='Comma-separated min_hits values')
+    parser.add_argument('--workers', type=int, default=1, help='Process pool size')
+    parser.add_argument('--continuity-iou', type=float, default=0.5)
+    parser.add_argument('--short-track', type=int, default=3)
+    parser.add_argument('--json', action='store_true', help='Print one JSON object per parameter set')
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    paths = collect_log_paths(args.logs)
+    if not paths:
+        print('Журналы детекций не найдены', file=sys.stderr)
+        return 1
+
+    grid = build_grid(args.iou, args.max_age, args.min_hits)
+    started = time.perf_counter()
+    results = list(sweep(paths, grid, workers=args.workers,
+                         continuity_iou=args.continuity_iou, short_track=args.short_track))
+    elapsed = time.perf_counter() - started
+
+    if args.json:
+        for result in results:
+            print(json.dumps(asdict(result)))
+    else:
+        header = f"{'iou':>5} {'age':>4} {'hits':>4} {'frames':>8} {'tracks':>7} {'short':>6} " \
+                 f"{'idsw':>6} {'frag':>6} {'active':>7} {'us/frm':>8} {'p95us':>8}"
+        print(header)
+        for r in results:
+            print(f'{r.iou_threshold:>5.2f} {r.max_age:>4d} {r.min_hits:>4d} {r.frames:>8d} {r.tracks:>7d} '
+                  f'{r.short_tracks:>6d} {r.id_switches:>6d} {r.fragments:>6d} {r.mean_active:>7.2f} '
+                  f'{r.tracker_us_mean:>8.1f} {r.tracker_us_p95:>8.1f}')
+    print(f'{len(grid)} наборов параметров за {elapsed:.2f} с', file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
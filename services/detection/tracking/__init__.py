@@ -1,10 +1,10 @@
 """Tracking modules"""
 from .trackers import (
     get_active_trackers, get_tracker_by_id, crop_frame_for_tracker,
-    get_tracker_frames, update_tracker_cache, clear_tracker_cache
+    get_tracker_frames, update_tracker_cache, clear_tracker_cache, get_tracker_cache_stats
 )
 
 __all__ = [
     'get_active_trackers', 'get_tracker_by_id', 'crop_frame_for_tracker',
-    'get_tracker_frames', 'update_tracker_cache', 'clear_tracker_cache'
+    'get_tracker_frames', 'update_tracker_cache', 'clear_tracker_cache', 'get_tracker_cache_stats'
 ]
@@ -0,0 +1,190 @@
+"""Compact binary log of raw per-frame detections.
+
+The live service can record every ``raw_detections`` list produced by
+``InferenceEngine`` so tracker parameters can later be tuned offline by
+replaying the log through ``SortTracker`` (see ``tools/tracker_sweep.py``).
+
+File layout (little-endian)::
+
+    header   b'DCDL' u16 version
+    label    b'L' u16 label_index u16 byte_length utf-8 bytes
+    frame    b'F' f8 timestamp u16 count, then ``count`` x DETECTION_DTYPE
+
+Labels are written once, the first time they appear, and referenced by index.
+A detection costs 22 bytes, so a day at 5 FPS with a few boxes per frame is
+tens of megabytes.
+"""
+from __future__ import annotations
+
+import logging
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'DCDL'
+VERSION = 1
+NO_LABEL = 0xFFFF
+NO_CLASS = -1
+
+_HEADER = struct.Struct('<4sH')
+_LABEL = struct.Struct('<cHH')
+_FRAME = struct.Struct('<cdH')
+
+DETECTION_DTYPE = np.dtype([
+    ('bbox', '<f4', (4,)),
+    ('confidence', '<f4'),
+    ('class_id', '<i2'),
+    ('label', '<u2'),
+])
+
+
+class DetectionLogWriter:
+    """Appends frames to ``.dlog`` files in a directory, rotating by size.
+
+    Writes are buffered in memory and flushed in large chunks, so recording a
+    frame costs a few microseconds in the calling thread.
+    """
+
+    def __init__(self, directory: Path, rotate_bytes: int = 64 * 1024 * 1024, flush_bytes: int = 64 * 1024):
+        self.directory = Path(directory)
+        self.rotate_bytes = rotate_bytes
+        self.flush_bytes = flush_bytes
+        self.frames_written = 0
+        self.path: Optional[Path] = None
+        self._lock = threading.Lock()
+        self._buffer = bytearray()
+        self._fh = None
+        self._file_bytes = 0
+        self._labels: Dict[str, int] = {}
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def write(self, timestamp: float, detections: List[dict]) -> None:
+        with self._lock:
+            if self._fh is None:
+                self._open_new_file()
+            rows = np.zeros(len(detections), dtype=DETECTION_DTYPE)
+            for index, det in enumerate(detections):
+                rows[index]['bbox'] = det['bbox']
+                rows[index]['confidence'] = det.get('confidence', 0.0)
+                class_id = det.get('class_id')
+                rows[index]['class_id'] = NO_CLASS if class_id is None else class_id
+                rows[index]['label'] = self._label_index(det.get('label'))
+            self._buffer += _FRAME.pack(b'F', timestamp, len(detections))
+            self._buffer += rows.tobytes()
+            self.frames_written += 1
+            if len(self._buffer) >= self.flush_bytes:
+                self._flush_locked()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_locked()
+
+    def close(self) -> None:
+        with self._lock:
+            self._flush_locked()
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
+
+    def _label_index(self, label: Optional[str]) -> int:
+        if label is None:
+            return NO_LABEL
+        index = self._labels.get(label)
+        if index is None:
+            index = len(self._labels)
+            self._labels[label] = index
+            encoded = label.encode('utf-8')
+            self._buffer += _LABEL.pack(b'L', index, len(encoded)) + encoded
+        return index
+
+    def _open_new_file(self) -> None:
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        path = self.directory / f'detections-{stamp}.dlog'
+        suffix = 1
+        while path.exists():
+            path = self.directory / f'detections-{stamp}-{suffix}.dlog'
+            suffix += 1
+        self._fh = open(path, 'ab')
+        self.path = path
+        self._labels = {}
+        self._buffer = bytearray(_HEADER.pack(MAGIC, VERSION))
+        self._file_bytes = 0
+        logger.info('Запись детекций в %s', path)
+
+    def _flush_locked(self) -> None:
+        if self._fh is None or not self._buffer:
+            return
+        self._fh.write(self._buffer)
+        self._fh.flush()
+        self._file_bytes += len(self._buffer)
+        self._buffer = bytearray()
+        if self._file_bytes >= self.rotate_bytes:
+            self._fh.close()
+            self._fh = None
+
+
+def iter_log_frames(path: Path) -> Iterator[Tuple[float, np.ndarray, List[str]]]:
+    """Yields ``(timestamp, detections, labels)`` per frame.
+
+    ``detections`` is a structured array with ``DETECTION_DTYPE``; ``labels`` is
+    the label table known at that point of the file (shared, do not mutate).
+    """
+    data = Path(path).read_bytes()
+    if len(data) < _HEADER.size:
+        return
+    magic, version = _HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f'Неизвестный формат журнала детекций: {path}')
+
+    labels: List[str] = []
+    offset = _HEADER.size
+    end = len(data)
+    row_size = DETECTION_DTYPE.itemsize
+    while offset < end:
+        kind = data[offset:offset + 1]
+        if kind == b'F':
+            if offset + _FRAME.size > end:
+                break
+            _, timestamp, count = _FRAME.unpack_from(data, offset)
+            offset += _FRAME.size
+            if offset + count * row_size > end:
+                break  # truncated tail from an unclean shutdown
+            rows = np.frombuffer(data, dtype=DETECTION_DTYPE, count=count, offset=offset)
+            offset += count * row_size
+            yield timestamp, rows, labels
+        elif kind == b'L':
+            if offset + _LABEL.size > end:
+                break
+            _, index, length = _LABEL.unpack_from(data, offset)
+            offset += _LABEL.size
+            label = data[offset:offset + length].decode('utf-8')
+            offset += length
+            while len(labels) <= index:
+                labels.append('')
+            labels[index] = label
+        else:
+            raise ValueError(f'Повреждённая запись в {path} по смещению {offset}')
+
+
+def load_log_detections(path: Path) -> List[Tuple[float, List[dict]]]:
+    """Loads a log as ``(timestamp, raw_detections)`` pairs ready for ``SortTracker.update``."""
+    frames: List[Tuple[float, List[dict]]] = []
+    for timestamp, rows, labels in iter_log_frames(path):
+        detections = []
+        for bbox, confidence, class_id, label_index in zip(
+            rows['bbox'].tolist(), rows['confidence'].tolist(), rows['class_id'].tolist(), rows['label'].tolist()
+        ):
+            detections.append({
+                'bbox': bbox,
+                'confidence': confidence,
+                'class_id': None if class_id == NO_CLASS else class_id,
+                'label': None if label_index == NO_LABEL else labels[label_index],
+            })
+        frames.append((timestamp, detections))
+    return frames
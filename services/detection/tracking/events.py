@@ -0,0 +1,301 @@
+"""Track lifecycle events pushed to the backend in batches.
+
+``SortTracker`` reports ``created``/``updated``/``lost`` events and the service
+adds ``target`` changes. Events go into a bounded queue where ``updated``
+events of the same track coalesce into the newest one, so the queue holds at
+most one summary per live track plus the lifecycle events. A background
+thread posts batches as JSON over one keep-alive HTTP connection and retries
+with exponential backoff. When the queue is full, pending summaries are
+evicted before lifecycle events; every evicted event is counted, and the
+counts travel with the next batch as ``dropped``.
+"""
+from __future__ import annotations
+
+import http.client
+import json
+import logging
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from ..monitoring.metrics import MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+# Retryable HTTP statuses; other 4xx responses reject the batch for good
+RETRY_STATUSES = {408, 429}
+# Errors of a reused keep-alive connection that the server had already closed
+STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError)
+INITIAL_BACKOFF = 0.5
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class TrackEventQueue:
+    """Bounded FIFO of events with per-track coalescing of ``updated`` events."""
+
+    def __init__(self, capacity: int = 1000):
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        self.capacity = capacity
+        self._events: "OrderedDict[tuple, dict]" = OrderedDict()
+        self._update_keys: "OrderedDict[tuple, None]" = OrderedDict()
+        self._dropped: Counter = Counter()
+        self._next_key = 0
+        self.coalesced = 0
+        self.cond = threading.Condition()
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def put(self, event: dict) -> bool:
+        """Queues ``event``; False if it was dropped because the queue is full of lifecycle events."""
+        kind = event.get("type")
+        with self.cond:
+            if kind == "updated":
+                key = ("updated", event.get("camera"), event.get("trackId"))
+                if key in self._events:
+                    # Keeps its place in the queue, carries the newest state
+                    self._events[key] = event
+                    self.coalesced += 1
+                    return True
+                if len(self._events) >= self.capacity and not self._evict_update():
+                    self._dropped[kind] += 1
+                    return False
+                self._update_keys[key] = None
+            else:
+                if kind == "lost":
+                    stale = ("updated", event.get("camera"), event.get("trackId"))
+                    if self._events.pop(stale, None) is not None:
+                        self._update_keys.pop(stale, None)
+                        self.coalesced += 1
+                if len(self._events) >= self.capacity and not self._evict_update():
+                    _, oldest = self._events.popitem(last=False)
+                    self._dropped[oldest.get("type")] += 1
+                key = ("event", self._next_key)
+                self._next_key += 1
+            self._events[key] = event
+            self.cond.notify()
+            return True
+
+    def _evict_update(self) -> bool:
+        if not self._update_keys:
+            return False
+        key, _ = self._update_keys.popitem(last=False)
+        self._events.pop(key, None)
+        self._dropped["updated"] += 1
+        return True
+
+    def take(self, limit: int) -> Tuple[List[Tuple[tuple, dict]], Dict[str, int]]:
+        """Removes up to ``limit`` oldest events; also returns (and resets) the drop counts."""
+        with self.cond:
+            batch = []
+            while self._events and len(batch) < limit:
+                key, event = self._events.popitem(last=False)
+                self._update_keys.pop(key, None)
+                batch.append((key, event))
+            dropped = dict(self._dropped)
+            self._dropped.clear()
+            return batch, dropped
+
+    def requeue(self, batch: List[Tuple[tuple, dict]], dropped: Dict[str, int]) -> None:
+        """Puts a failed batch back in front; newer summaries of the same track win."""
+        with self.cond:
+            for key, event in reversed(batch):
+                if key in self._events:
+                    continue
+                self._events[key] = event
+                self._events.move_to_end(key, last=False)
+                if key[0] == "updated":
+                    self._update_keys[key] = None
+                    self._update_keys.move_to_end(key, last=False)
+            self._dropped.update(dropped)
+            while len(self._events) > self.capacity:
+                if not self._evict_update():
+                    _, oldest = self._events.popitem(last=False)
+                    self._dropped[oldest.get("type")] += 1
+
+    def wait(self, timeout: float) -> bool:
+        with self.cond:
+            if not self._events:
+                self.cond.wait(timeout)
+            return bool(self._events)
+
+    def dropped_pending(self) -> int:
+        with self.cond:
+            return sum(self._dropped.values())
+
+
+class TrackEventPusher:
+    """Posts queued events as ``{"source", "events", "dropped"}`` batches to ``url``."""
+
+    def __init__(
+        self,
+        url: str,
+        metrics: MetricsRegistry,
+        queue_size: int = 1000,
+        batch_size: int = 200,
+        flush_interval: float = 0.5,
+        timeout: float = 3.0,
+        max_backoff: float = 30.0,
+        source: str = "detection",
+    ):
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise ValueError(f"Unsupported events URL: {url}")
+        self.url = url
+        self._scheme = parts.scheme
+        self._host = parts.hostname
+        self._port = parts.port
+        self._path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        self.queue = TrackEventQueue(queue_size)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.timeout = timeout
+        self.max_backoff = max_backoff
+        self.source = source
+        self.metrics = metrics
+        self._connection: Optional[http.client.HTTPConnection] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.backoff = 0.0
+        self.last_error: Optional[str] = None
+        self.connections_opened = 0
+        self._sent_total = metrics.counter("track_events_sent_total", "Track events delivered to the backend")
+        self._post_seconds = metrics.histogram("track_event_post_seconds", "Time to post one batch of track events")
+        metrics.gauge("track_event_queue_depth", "Track events waiting to be pushed", fn=lambda: len(self.queue))
+
+    # Producers -----------------------------------------------------------------------
+
+    def emit(self, camera_id: str, kind: str, track: Optional[dict] = None, **fields) -> bool:
+        """Queues one event; cheap enough for the detection thread (no I/O, no serialization)."""
+        event = {"type": kind, "camera": camera_id, "timestamp": time.time(), **fields}
+        if track is not None:
+            event["trackId"] = track.get("trackId")
+            event["track"] = track
+        # Drops are counted when the summary goes out with the next batch
+        return self.queue.put(event)
+
+    def sink(self, camera_id: str):
+        """``SortTracker.on_event`` callback bound to one camera."""
+        def _on_event(kind: str, track: dict) -> None:
+            self.emit(camera_id, kind, track)
+        return _on_event
+
+    # Sender thread -------------------------------------------------------------------
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="track-events", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 3.0) -> None:
+        self._stop.set()
+        with self.queue.cond:
+            self.queue.cond.notify_all()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=timeout)
+        self._close_connection()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            if not self.queue.wait(self.flush_interval):
+                continue
+            delivered = self.flush()
+            if delivered:
+                # Gives updates time to coalesce before the next batch
+                self._stop.wait(self.flush_interval)
+            else:
+                self._stop.wait(self.backoff)
+        # Last attempt so recent lifecycle events survive a clean shutdown
+        self.flush()
+
+    def flush(self) -> bool:
+        """Sends one batch; True if it was delivered (or there was nothing to send)."""
+        batch, dropped = self.queue.take(self.batch_size)
+        if not batch and not dropped:
+            return True
+        for kind, count in dropped.items():
+            self.metrics.counter("track_events_dropped_total", "Track events dropped on overload", type=kind).inc(count)
+        payload = {"source": self.source, "events": [event for _, event in batch]}
+        if dropped:
+            payload["dropped"] = dropped
+        status = self._post(payload)
+        if status is not None and (200 <= status < 300 or (400 <= status < 500 and status not in RETRY_STATUSES)):
+            if status >= 400:
+                logger.warning("Backend отклонил пакет событий треков: HTTP %s", status)
+            self.metrics.counter(
+                "track_event_batches_total", "Track event batches by outcome",
+                result="ok" if status < 300 else "rejected",
+            ).inc()
+            if status < 300:
+                self._sent_total.inc(len(batch))
+            self.backoff = 0.0
+            self.last_error = None
+            return True
+        self.metrics.counter("track_event_batches_total", "Track event batches by outcome", result="retry").inc()
+        self.queue.requeue(batch, dropped)
+        self.backoff = min(self.max_backoff, self.backoff * 2 if self.backoff else INITIAL_BACKOFF)
+        return False
+
+    def _post(self, payload: dict) -> Optional[int]:
+        body = json.dumps(payload, separators=(",", ":"), default=_json_default).encode("utf-8")
+        headers = {"Content-Type": "application/json", "Connection": "keep-alive"}
+        for attempt in range(2):
+            # A keep-alive connection the server closed meanwhile fails once; retry on a fresh one
+            connection = self._get_connection()
+            try:
+                with self._post_seconds.time():
+                    connection.request("POST", self._path, body=body, headers=headers)
+                    response = connection.getresponse()
+                    response.read()
+                if response.will_close:
+                    self._close_connection()
+                if response.status >= 500 or response.status in RETRY_STATUSES:
+                    self.last_error = f"HTTP {response.status}"
+                return response.status
+            except (OSError, http.client.HTTPException) as exc:
+                self._close_connection()
+                self.last_error = str(exc) or type(exc).__name__
+                if attempt == 0 and isinstance(exc, STALE_CONNECTION_ERRORS):
+                    continue
+                logger.debug("Не удалось отправить события треков на %s: %s", self.url, exc)
+                return None
+        return None
+
+    def _get_connection(self) -> http.client.HTTPConnection:
+        if self._connection is None:
+            connection_class = http.client.HTTPSConnection if self._scheme == "https" else http.client.HTTPConnection
+            self._connection = connection_class(self._host, self._port, timeout=self.timeout)
+            self.connections_opened += 1
+        return self._connection
+
+    def _close_connection(self) -> None:
+        if self._connection is not None:
+            try:
+                self._connection.close()
+            except Exception:
+                pass
+            self._connection = None
+
+    def stats(self) -> dict:
+        return {
+            "url": self.url,
+            "queued": len(self.queue),
+            "coalesced": self.queue.coalesced,
+            "sent": int(self._sent_total.value),
+            "dropped_pending": self.queue.dropped_pending(),
+            "backoff_seconds": self.backoff,
+            "connections_opened": self.connections_opened,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,358 @@
+"""Low-resolution detection heatmaps with exponential time decay.
+
+Each processed frame adds the time since the previous frame (capped at
+``MAX_STEP``) to the cells covered by every tracked box, so a cell reads as
+seconds of presence. Grids are kept as 2D difference arrays, one layer per
+label: a box adds its weight at four corners and the grid is the running sum,
+computed only when it is read. A frame is therefore a single ``np.add.at`` of
+four entries per box, whatever the box sizes and however long the heatmap has
+been accumulating.
+
+Decay is lazy: contributions are scaled up by ``exp((t - ref) / tau)`` instead
+of multiplying the grid down every frame, and the arrays are renormalized only
+when that factor grows large. Reads decay the grid to the time of the
+query (the latest frame of the camera, empty ones included, or a later
+``now``), so a camera that goes quiet keeps fading. Grids are saved to an
+``.npz`` file from a background thread and loaded back at startup. Rendered
+PNG/JSON payloads are cached per camera until its grid changes or has decayed
+by more than ``RENDER_DECAY_TOLERANCE`` since the render.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import math
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, Mapping, Optional, Tuple
+
+import numpy as np
+
+from ..monitoring.metrics import MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+# Longest frame gap credited to a box, so a stalled camera does not paint one huge blob
+MAX_STEP = 1.0
+# Weight of the first frame of a camera, before a frame gap is known
+FIRST_STEP = 0.1
+# Renormalize once contributions are scaled by more than e**RENORMALIZE_EXPONENT
+RENORMALIZE_EXPONENT = 20.0
+# Label used for boxes without one
+UNLABELED = "unknown"
+MAX_RENDER_WIDTH = 1920
+# Rendered payloads kept (camera x label x format x width)
+RENDER_CACHE_SIZE = 64
+# Relative decay after which a cached render of an unchanged grid is redrawn
+RENDER_DECAY_TOLERANCE = 0.01
+
+
+def parse_heatmap_query(args: Mapping[str, str]) -> Dict[str, object]:
+    """``camera``/``label``/``format`` (png|json)/``width``; raises ``ValueError``."""
+    query: Dict[str, object] = {}
+    for key in ("camera", "label"):
+        if args.get(key) not in (None, ""):
+            query[key] = str(args[key])
+    fmt = str(args.get("format") or "png").lower()
+    if fmt not in ("png", "json"):
+        raise ValueError("format must be png or json")
+    query["fmt"] = fmt
+    if args.get("width") not in (None, ""):
+        width = int(args["width"])
+        if width <= 0:
+            raise ValueError("width must be positive")
+        query["width"] = min(width, MAX_RENDER_WIDTH)
+    return query
+
+
+class _CameraHeatmap:
+    """Difference arrays of one camera, ``(labels, rows + 1, columns + 1)``; labels share the decay reference."""
+
+    __slots__ = ("labels", "delta", "ref", "last_update", "last_ts", "version", "frame_size")
+
+    def __init__(self, ref: float, rows: int, columns: int):
+        self.labels: Dict[str, int] = {}
+        self.delta = np.zeros((0, rows + 1, columns + 1), dtype=np.float64)
+        self.ref = ref
+        self.last_update = ref
+        self.last_ts: Optional[float] = None
+        self.version = 0
+        self.frame_size: Optional[Tuple[int, int]] = None
+
+
+class DetectionHeatmap:
+    """Per-camera, per-label occupancy grids of ``grid_size`` = (columns, rows)."""
+
+    def __init__(
+        self,
+        metrics: MetricsRegistry,
+        grid_size: Tuple[int, int] = (64, 36),
+        half_life: float = 6 * 3600.0,
+        path: Optional[Path] = None,
+        save_interval: float = 60.0,
+    ):
+        self.columns, self.rows = grid_size
+        self.half_life = half_life
+        self.tau = half_life / math.log(2)
+        self.path = Path(path) if path is not None else None
+        self.save_interval = save_interval
+        self._cameras: Dict[str, _CameraHeatmap] = {}
+        self._lock = threading.Lock()
+        self._render_cache: Dict[tuple, Tuple[int, float, object]] = {}
+        self._saved_versions: Dict[str, int] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.saves = 0
+        metrics.gauge("heatmap_labels", "Label layers held by the detection heatmap", fn=self._layer_count)
+        if self.path is not None:
+            self.load()
+
+    # Updates (detection thread) ------------------------------------------------------
+
+    def observe(self, camera_id: str, tracked: Iterable[dict], frame_shape: Tuple[int, ...], timestamp: float) -> None:
+        with self._lock:
+            camera = self._cameras.get(camera_id)
+            if camera is None:
+                camera = self._cameras[camera_id] = _CameraHeatmap(timestamp, self.rows, self.columns)
+            step = FIRST_STEP if camera.last_ts is None else min(max(timestamp - camera.last_ts, 0.0), MAX_STEP)
+            camera.last_ts = timestamp
+            if not tracked or step <= 0.0:
+                return
+            exponent = (timestamp - camera.ref) / self.tau
+            if exponent > RENORMALIZE_EXPONENT:
+                self._renormalize(camera, timestamp)
+                exponent = 0.0
+            weight = step * math.exp(exponent)
+            columns, rows = self.columns, self.rows
+            scale_x = columns / frame_shape[1]
+            scale_y = rows / frame_shape[0]
+            layer_size = (rows + 1) * (columns + 1)
+            stride = columns + 1
+            indices = []
+            weights = []
+            for track in tracked:
+                bbox = track.get("bbox")
+                if not bbox:
+                    continue
+                label = track.get("label") or UNLABELED
+                layer = camera.labels.get(label)
+                if layer is None:
+                    layer = self._add_label(camera, label)
+                x1, y1, x2, y2 = bbox
+                # Every cell the box touches, at least one
+                col0 = min(max(int(x1 * scale_x), 0), columns - 1)
+                row0 = min(max(int(y1 * scale_y), 0), rows - 1)
+                col1 = min(max(math.ceil(x2 * scale_x), col0 + 1), columns)
+                row1 = min(max(math.ceil(y2 * scale_y), row0 + 1), rows)
+                base = layer * layer_size
+                top = base + row0 * stride
+                bottom = base + row1 * stride
+                indices += (top + col0, top + col1, bottom + col0, bottom + col1)
+                weights += (weight, -weight, -weight, weight)
+            if indices:
+                np.add.at(camera.delta.reshape(-1), indices, weights)
+                camera.frame_size = (frame_shape[1], frame_shape[0])
+                camera.last_update = timestamp
+                camera.version += 1
+
+    def _add_label(self, camera: _CameraHeatmap, label: str) -> int:
+        layer = len(camera.labels)
+        camera.delta = np.concatenate((camera.delta, np.zeros((1,) + camera.delta.shape[1:], dtype=np.float64)))
+        camera.labels[label] = layer
+        return layer
+
+    def _renormalize(self, camera: _CameraHeatmap, now: float) -> None:
+        camera.delta *= math.exp(-(now - camera.ref) / self.tau)
+        camera.ref = now
+
+    # Queries -------------------------------------------------------------------------
+
+    def _as_of(self, camera: _CameraHeatmap, now: Optional[float]) -> float:
+        """Time the grid is decayed to: the latest frame seen (with or without boxes), or ``now`` if later."""
+        as_of = camera.last_update if camera.last_ts is None else max(camera.last_update, camera.last_ts)
+        return as_of if now is None else max(as_of, now)
+
+    def grid(
+        self, camera_id: str, label: Optional[str] = None, now: Optional[float] = None
+    ) -> Optional[Tuple[np.ndarray, int, float]]:
+        """Values decayed to the latest frame or ``now`` (summed over labels when ``label`` is None), version, timestamp."""
+        with self._lock:
+            camera = self._cameras.get(camera_id)
+            if camera is None or not camera.labels:
+                return None
+            if label is not None:
+                layer = camera.labels.get(label)
+                if layer is None:
+                    return None
+                delta = camera.delta[layer].copy()
+            else:
+                delta = camera.delta.sum(axis=0)
+            as_of = self._as_of(camera, now)
+            factor = math.exp(-(as_of - camera.ref) / self.tau)
+            version = camera.version
+        values = delta[: self.rows, : self.columns].cumsum(axis=0).cumsum(axis=1)
+        values *= factor
+        # Running sums of +w/-w leave rounding noise in cells that should be zero
+        np.maximum(values, 0.0, out=values)
+        return values, version, as_of
+
+    def labels(self, camera_id: str) -> list:
+        with self._lock:
+            camera = self._cameras.get(camera_id)
+            return sorted(camera.labels) if camera is not None else []
+
+    def render(
+        self,
+        camera_id: str,
+        label: Optional[str] = None,
+        fmt: str = "png",
+        width: Optional[int] = None,
+        now: Optional[float] = None,
+    ):
+        """PNG bytes or a JSON-ready dict; None if the camera or label has no data (or PNG without OpenCV)."""
+        key = (camera_id, label, fmt, width if fmt == "png" else None)
+        with self._lock:
+            camera = self._cameras.get(camera_id)
+            version = camera.version if camera is not None else None
+            as_of = self._as_of(camera, now) if camera is not None else None
+            frame_size = camera.frame_size if camera is not None else None
+            cached = self._render_cache.get(key)
+        if (
+            cached is not None
+            and cached[0] == version
+            and 1.0 - math.exp(-(as_of - cached[1]) / self.tau) <= RENDER_DECAY_TOLERANCE
+        ):
+            return cached[2]
+        result = self.grid(camera_id, label, now)
+        if result is None:
+            return None
+        values, version, as_of = result
+        if fmt == "json":
+            rendered = {
+                "camera": camera_id,
+                "label": label,
+                "labels": self.labels(camera_id),
+                "columns": self.columns,
+                "rows": self.rows,
+                "frameSize": list(frame_size) if frame_size else None,
+                "halfLifeSeconds": self.half_life,
+                "asOf": as_of,
+                "max": float(values.max()),
+                "grid": np.round(values, 3).tolist(),
+            }
+        else:
+            rendered = self._render_png(values, width)
+            if rendered is None:
+                return None
+        with self._lock:
+            if len(self._render_cache) >= RENDER_CACHE_SIZE:
+                self._render_cache.clear()
+            self._render_cache[key] = (version, as_of, rendered)
+        return rendered
+
+    def _render_png(self, values: np.ndarray, width: Optional[int]) -> Optional[bytes]:
+        try:
+            import cv2
+        except ImportError:
+            return None
+        peak = float(values.max())
+        # Square root keeps rarely visited cells visible next to hot spots
+        scaled = np.sqrt(values / peak) if peak > 0 else values
+        image = (scaled * 255.0).astype(np.uint8)
+        if width is not None and width != self.columns:
+            height = max(1, round(width * self.rows / self.columns))
+            image = cv2.resize(image, (width, height), interpolation=cv2.INTER_LINEAR)
+        success, buffer = cv2.imencode(".png", cv2.applyColorMap(image, cv2.COLORMAP_INFERNO))
+        return buffer.tobytes() if success else None
+
+    # Persistence ---------------------------------------------------------------------
+
+    def start(self) -> None:
+        if self.path is None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._save_loop, name="heatmap-saver", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 3.0) -> None:
+        self._stop.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=timeout)
+        if self.path is not None:
+            self.save()
+
+    def _save_loop(self) -> None:
+        while not self._stop.wait(self.save_interval):
+            self.save()
+
+    def save(self) -> bool:
+        """Writes all grids if any changed since the last save; False if there was nothing to write."""
+        with self._lock:
+            versions = {camera_id: camera.version for camera_id, camera in self._cameras.items()}
+            if versions == self._saved_versions:
+                return False
+            arrays = {f"camera\x1f{camera_id}": camera.delta.copy() for camera_id, camera in self._cameras.items()}
+            meta = {
+                "columns": self.columns,
+                "rows": self.rows,
+                "cameras": {
+                    camera_id: {"ref": camera.ref, "lastUpdate": camera.last_update, "labels": list(camera.labels)}
+                    for camera_id, camera in self._cameras.items()
+                },
+            }
+        arrays["__meta__"] = np.frombuffer(json.dumps(meta).encode("utf-8"), dtype=np.uint8)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        partial = self.path.with_name(self.path.name + ".part")
+        try:
+            with open(partial, "wb") as handle:
+                np.savez(handle, **arrays)
+            os.replace(partial, self.path)
+        except OSError as exc:
+            logger.error("Не удалось сохранить тепловую карту %s: %s", self.path, exc)
+            return False
+        self._saved_versions = versions
+        self.saves += 1
+        return True
+
+    def load(self) -> bool:
+        if self.path is None or not self.path.exists():
+            return False
+        try:
+            with np.load(self.path) as data:
+                meta = json.loads(bytes(data["__meta__"]).decode("utf-8"))
+                if (meta.get("columns"), meta.get("rows")) != (self.columns, self.rows):
+                    logger.warning(
+                        "Тепловая карта %s другого размера (%sx%s), начинаем заново",
+                        self.path, meta.get("columns"), meta.get("rows"),
+                    )
+                    return False
+                cameras: Dict[str, _CameraHeatmap] = {}
+                for camera_id, state in meta.get("cameras", {}).items():
+                    camera = cameras[camera_id] = _CameraHeatmap(float(state["ref"]), self.rows, self.columns)
+                    camera.last_update = float(state.get("lastUpdate", camera.ref))
+                    camera.labels = {label: layer for layer, label in enumerate(state.get("labels", []))}
+                    camera.delta = data[f"camera\x1f{camera_id}"].astype(np.float64)
+                    if camera.delta.shape != (len(camera.labels), self.rows + 1, self.columns + 1):
+                        raise ValueError(f"camera {camera_id}: unexpected array shape {camera.delta.shape}")
+        except (OSError, ValueError, KeyError) as exc:
+            logger.warning("Не удалось загрузить тепловую карту %s: %s", self.path, exc)
+            return False
+        with self._lock:
+            self._cameras = cameras
+            self._saved_versions = {camera_id: 0 for camera_id in cameras}
+        return True
+
+    def _layer_count(self) -> int:
+        with self._lock:
+            return sum(len(camera.labels) for camera in self._cameras.values())
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "grid": [self.columns, self.rows],
+                "half_life_seconds": self.half_life,
+                "cameras": {camera_id: sorted(camera.labels) for camera_id, camera in self._cameras.items()},
+                "path": str(self.path) if self.path is not None else None,
+                "saves": self.saves,
+            }
@@ -0,0 +1,328 @@
+"""On-device history of finalized tracks in SQLite (WAL mode).
+
+When a track is lost its summary is queued and a background thread appends
+queued records in one transaction per batch, so the detection thread never
+touches the disk. Queries go through a separate read connection. WAL mode
+lets reads run alongside the writer. Every supported filter is backed by an
+index, and pages are fetched by keyset (``cursor``), so responses stay fast
+with millions of rows.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import re
+import sqlite3
+import threading
+from collections import deque
+from pathlib import Path
+from typing import Deque, Dict, List, Mapping, Optional, Tuple
+
+from ..monitoring.metrics import MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+_UNSAFE_NAME = re.compile(r"[^A-Za-z0-9_.-]+")
+
+_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS tracks (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        track_id INTEGER NOT NULL,
+        camera TEXT NOT NULL,
+        label TEXT,
+        first_seen REAL NOT NULL,
+        last_seen REAL NOT NULL,
+        best_confidence REAL,
+        hits INTEGER,
+        first_bbox TEXT,
+        last_bbox TEXT,
+        best_bbox TEXT,
+        crop TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_tracks_last_seen ON tracks (last_seen, id)",
+    "CREATE INDEX IF NOT EXISTS idx_tracks_label ON tracks (label, last_seen, id)",
+    "CREATE INDEX IF NOT EXISTS idx_tracks_camera ON tracks (camera, last_seen, id)",
+    "CREATE INDEX IF NOT EXISTS idx_tracks_track_id ON tracks (track_id)",
+    # Longest track lifetime: bounds last_seen for "alive before until" range scans
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value REAL)",
+)
+_COLUMNS = (
+    "id", "track_id", "camera", "label", "first_seen", "last_seen",
+    "best_confidence", "hits", "first_bbox", "last_bbox", "best_bbox", "crop",
+)
+
+
+def parse_history_query(args: Mapping[str, str]) -> Dict[str, object]:
+    """``since``/``until``/``label``/``track_id``/``camera``/``limit``/``cursor``; raises ``ValueError``."""
+    query: Dict[str, object] = {}
+    for key in ("since", "until"):
+        if args.get(key) not in (None, ""):
+            query[key] = float(args[key])
+    for key in ("label", "camera"):
+        if args.get(key) not in (None, ""):
+            query[key] = str(args[key])
+    if args.get("track_id") not in (None, ""):
+        query["track_id"] = int(args["track_id"])
+    if args.get("limit") not in (None, ""):
+        limit = int(args["limit"])
+        if limit <= 0:
+            raise ValueError("limit must be positive")
+        query["limit"] = min(limit, MAX_LIMIT)
+    if args.get("cursor") not in (None, ""):
+        query["cursor"] = _decode_cursor(str(args["cursor"]))
+    return query
+
+
+def _decode_cursor(value: str) -> Tuple[float, int]:
+    last_seen, _, row_id = value.partition(":")
+    return float(last_seen), int(row_id)
+
+
+def _bbox_json(value) -> Optional[str]:
+    if value is None:
+        return None
+    return json.dumps([round(float(v), 2) for v in value])
+
+
+class TrackHistoryStore:
+    """Append-only table of finalized tracks with a batched background writer."""
+
+    def __init__(
+        self,
+        path: Path,
+        metrics: MetricsRegistry,
+        crops_dir: Optional[Path] = None,
+        flush_interval: float = 1.0,
+        batch_size: int = 500,
+    ):
+        self.path = Path(path)
+        self.crops_dir = Path(crops_dir) if crops_dir is not None else None
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.metrics = metrics
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._writer = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._writer.execute("PRAGMA journal_mode=WAL")
+        # WAL + NORMAL: a power cut may lose the last batches but never corrupts the database
+        self._writer.execute("PRAGMA synchronous=NORMAL")
+        for statement in _SCHEMA:
+            self._writer.execute(statement)
+        row = self._writer.execute("SELECT value FROM meta WHERE key = 'max_duration'").fetchone()
+        self.max_duration = float(row[0]) if row else 0.0
+        self._reader = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._reader.row_factory = sqlite3.Row
+        self._read_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._pending: Deque[dict] = deque()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._written_total = metrics.counter("history_records_written_total", "Finalized tracks written to history")
+        self._flush_seconds = metrics.histogram("history_flush_seconds", "Time to write one history batch")
+        metrics.gauge("history_pending_records", "Finalized tracks waiting to be written", fn=lambda: len(self._pending))
+
+    # Producers -----------------------------------------------------------------------
+
+    def add(self, camera_id: str, track: dict, crop: Optional[bytes] = None) -> None:
+        """Queues one finalized track (a ``Track.summary()`` dict); never blocks on disk."""
+        self._pending.append({"camera": camera_id, "track": track, "crop": crop})
+        if len(self._pending) >= self.batch_size:
+            self._wake.set()
+
+    # Writer thread -------------------------------------------------------------------
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._writer_loop, name="history-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 3.0) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=timeout)
+        self.flush()
+        with self._write_lock:
+            self._writer.close()
+        with self._read_lock:
+            self._reader.close()
+
+    def _writer_loop(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except sqlite3.Error as exc:
+                logger.error("Ошибка записи истории треков: %s", exc)
+
+    def flush(self) -> int:
+        """Writes everything queued so far, ``batch_size`` records per transaction."""
+        written = 0
+        with self._write_lock:
+            while self._pending:
+                batch = []
+                while self._pending and len(batch) < self.batch_size:
+                    batch.append(self._pending.popleft())
+                with self._flush_seconds.time():
+                    rows = [self._row(item) for item in batch]
+                    max_duration = max(self.max_duration, max(row[4] - row[3] for row in rows))
+                    self._writer.execute("BEGIN")
+                    try:
+                        self._writer.executemany(
+                            "INSERT INTO tracks (track_id, camera, label, first_seen, last_seen, best_confidence,"
+                            " hits, first_bbox, last_bbox, best_bbox, crop) VALUES (?,?,?,?,?,?,?,?,?,?,?)",
+                            rows,
+                        )
+                        if max_duration > self.max_duration:
+                            self._writer.execute(
+                                "INSERT OR REPLACE INTO meta (key, value) VALUES ('max_duration', ?)", (max_duration,)
+                            )
+                        self._writer.execute("COMMIT")
+                    except sqlite3.Error:
+                        self._writer.execute("ROLLBACK")
+                        raise
+                    self.max_duration = max_duration
+                written += len(rows)
+                self._written_total.inc(len(rows))
+        return written
+
+    def _row(self, item: dict) -> tuple:
+        track, camera_id = item["track"], item["camera"]
+        first_seen = float(track.get("firstSeen") or 0.0)
+        crop_name = None
+        if item["crop"] and self.crops_dir is not None:
+            crop_name = _UNSAFE_NAME.sub("_", f"{camera_id}_{track.get('trackId')}_{int(first_seen * 1000)}.jpg")
+            try:
+                self.crops_dir.mkdir(parents=True, exist_ok=True)
+                (self.crops_dir / crop_name).write_bytes(item["crop"])
+            except OSError as exc:
+                logger.debug("Не удалось сохранить кроп трека %s: %s", track.get("trackId"), exc)
+                crop_name = None
+        return (
+            int(track.get("trackId") or 0),
+            str(camera_id),
+            track.get("label"),
+            first_seen,
+            float(track.get("lastSeen") or first_seen),
+            float(track.get("bestConfidence", track.get("confidence")) or 0.0),
+            int(track.get("hits") or 0),
+            _bbox_json(track.get("firstBbox")),
+            _bbox_json(track.get("bbox")),
+            _bbox_json(track.get("bestBbox")),
+            crop_name,
+        )
+
+    # Queries -------------------------------------------------------------------------
+
+    def query(
+        self,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        label: Optional[str] = None,
+        track_id: Optional[int] = None,
+        camera: Optional[str] = None,
+        limit: int = DEFAULT_LIMIT,
+        cursor: Optional[Tuple[float, int]] = None,
+    ) -> dict:
+        """Tracks alive during ``[since, until]``, newest first; ``next_cursor`` fetches the next page."""
+        limit = max(1, min(int(limit), MAX_LIMIT))
+        sql, params = self._select(since, until, label, track_id, camera, cursor, self.max_duration)
+        with self._read_lock:
+            rows = self._reader.execute(sql, (*params, limit + 1)).fetchall()
+        records = [self._record(row) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            next_cursor = f"{last['last_seen']!r}:{last['id']}"
+        return {"records": records, "next_cursor": next_cursor}
+
+    def explain(self, **query) -> str:
+        """``EXPLAIN QUERY PLAN`` of ``query(**query)``, for checking index use."""
+        query.pop("limit", None)
+        sql, params = self._select(**query, max_duration=self.max_duration)
+        with self._read_lock:
+            rows = self._reader.execute("EXPLAIN QUERY PLAN " + sql, (*params, DEFAULT_LIMIT)).fetchall()
+        return "\n".join(row["detail"] for row in rows)
+
+    @staticmethod
+    def _select(
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        label: Optional[str] = None,
+        track_id: Optional[int] = None,
+        camera: Optional[str] = None,
+        cursor: Optional[Tuple[float, int]] = None,
+        max_duration: float = 0.0,
+    ) -> Tuple[str, List[object]]:
+        clauses: List[str] = []
+        params: List[object] = []
+        if since is not None:
+            clauses.append("last_seen >= ?")
+            params.append(since)
+        if until is not None:
+            # The upper bound on last_seen is implied by first_seen <= until but lets the index do the range scan
+            clauses.append("first_seen <= ? AND last_seen <= ?")
+            params.extend((until, until + max_duration))
+        if label is not None:
+            clauses.append("label = ?")
+            params.append(label)
+        if track_id is not None:
+            clauses.append("track_id = ?")
+            params.append(track_id)
+        if camera is not None:
+            clauses.append("camera = ?")
+            params.append(camera)
+        if cursor is not None:
+            clauses.append("(last_seen < ? OR (last_seen = ? AND id < ?))")
+            params.extend((cursor[0], cursor[0], cursor[1]))
+        sql = f"SELECT {', '.join(_COLUMNS)} FROM tracks"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        return sql + " ORDER BY last_seen DESC, id DESC LIMIT ?", params
+
+    @staticmethod
+    def _record(row: sqlite3.Row) -> dict:
+        return {
+            "id": row["id"],
+            "trackId": row["track_id"],
+            "camera": row["camera"],
+            "label": row["label"],
+            "firstSeen": row["first_seen"],
+            "lastSeen": row["last_seen"],
+            "duration": round(row["last_seen"] - row["first_seen"], 3),
+            "bestConfidence": row["best_confidence"],
+            "hits": row["hits"],
+            "firstBbox": json.loads(row["first_bbox"]) if row["first_bbox"] else None,
+            "lastBbox": json.loads(row["last_bbox"]) if row["last_bbox"] else None,
+            "bestBbox": json.loads(row["best_bbox"]) if row["best_bbox"] else None,
+            "crop": row["crop"],
+        }
+
+    def crop(self, record_id: int) -> Optional[bytes]:
+        """JPEG crop saved with the record, if any."""
+        if self.crops_dir is None:
+            return None
+        with self._read_lock:
+            row = self._reader.execute("SELECT crop FROM tracks WHERE id = ?", (record_id,)).fetchone()
+        if row is None or not row["crop"]:
+            return None
+        try:
+            return (self.crops_dir / row["crop"]).read_bytes()
+        except OSError:
+            return None
+
+    def count(self) -> int:
+        with self._read_lock:
+            return int(self._reader.execute("SELECT COUNT(*) FROM tracks").fetchone()[0])
+
+    def stats(self) -> dict:
+        return {
+            "path": str(self.path),
+            "pending": len(self._pending),
+            "written": int(self._written_total.value),
+        }
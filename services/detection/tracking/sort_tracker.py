@@ -3,7 +3,7 @@ from __future__ import annotations
 import time
 import secrets
 from dataclasses import dataclass, field
-from typing import List, Optional
+from typing import Callable, List, Optional
 
 import numpy as np
 
@@ -13,17 +13,21 @@ def iou(box_a: np.ndarray, box_b: np.ndarray) -> float:
     if box_a is None or box_b is None:
         return 0.0
 
-    x_left = max(box_a[0], box_b[0])
-    y_top = max(box_a[1], box_b[1])
-    x_right = min(box_a[2], box_b[2])
-    y_bottom = min(box_a[3], box_b[3])
+    # Conditional expressions instead of min()/max(): this runs for every
+    # detection/track pair on every frame.
+    ax1, ay1, ax2, ay2 = box_a[0], box_a[1], box_a[2], box_a[3]
+    bx1, by1, bx2, by2 = box_b[0], box_b[1], box_b[2], box_b[3]
+    x_left = ax1 if ax1 > bx1 else bx1
+    y_top = ay1 if ay1 > by1 else by1
+    x_right = ax2 if ax2 < bx2 else bx2
+    y_bottom = ay2 if ay2 < by2 else by2
 
     if x_right <= x_left or y_bottom <= y_top:
         return 0.0
 
     intersection = (x_right - x_left) * (y_bottom - y_top)
-    area_a = (box_a[2] - box_a[0]) * (box_a[3] - box_a[1])
-    area_b = (box_b[2] - box_b[0]) * (box_b[3] - box_b[1])
+    area_a = (ax2 - ax1) * (ay2 - ay1)
+    area_b = (bx2 - bx1) * (by2 - by1)
     union = area_a + area_b - intersection
     if union <= 0:
         return 0.0
@@ -42,6 +46,19 @@ class Track:
     hits: int = 1
     misses: int = 0
     history: List[np.ndarray] = field(default_factory=list)
+    # Set once the track reached min_hits and a "created" event was emitted
+    announced: bool = False
+    # Summary kept for the whole lifetime (history only holds the last boxes)
+    first_bbox: Optional[np.ndarray] = None
+    best_bbox: Optional[np.ndarray] = None
+    best_confidence: float = 0.0
+
+    def __post_init__(self):
+        if self.first_bbox is None:
+            self.first_bbox = self.bbox
+        if self.best_bbox is None:
+            self.best_bbox = self.bbox
+            self.best_confidence = float(self.confidence or 0.0)
 
     def update(self, bbox: np.ndarray, label: Optional[str], class_id: Optional[int], confidence: float, timestamp: float):
         self.bbox = bbox
@@ -51,6 +68,9 @@ class Track:
             self.class_id = class_id
         if confidence is not None:
             self.confidence = confidence
+            if confidence > self.best_confidence:
+                self.best_confidence = float(confidence)
+                self.best_bbox = bbox
         self.last_seen = timestamp
         self.hits += 1
         self.misses = 0
@@ -75,12 +95,30 @@ class Track:
             'misses': self.misses
         }
 
+    def summary(self):
+        """``to_dict`` plus lifetime fields, reported when the track is finalized."""
+        return {
+            **self.to_dict(),
+            'bestConfidence': self.best_confidence,
+            'firstBbox': np.asarray(self.first_bbox).tolist(),
+            'bestBbox': np.asarray(self.best_bbox).tolist(),
+        }
+
 
 class SortTracker:
-    def __init__(self, iou_threshold: float = 0.3, max_age: int = 5, min_hits: int = 1):
+    """IoU tracker; ``on_event(kind, track_dict)`` receives ``created``/``updated``/``lost`` events."""
+
+    def __init__(
+        self,
+        iou_threshold: float = 0.3,
+        max_age: int = 5,
+        min_hits: int = 1,
+        on_event: Optional[Callable[[str, dict], None]] = None,
+    ):
         self.iou_threshold = iou_threshold
         self.max_age = max_age
         self.min_hits = min_hits
+        self.on_event = on_event
         self.tracks: List[Track] = []
         self._next_id = 1  # legacy counter, kept for fallback
 
@@ -98,6 +136,23 @@ class SortTracker:
         self._next_id += 1
         return self._next_id
 
+    @staticmethod
+    def _track_candidates(track: Track) -> list[tuple[tuple, float]]:
+        """Boxes a detection is compared against, with their score weights.
+
+        1) current bbox; 2) position predicted by a simple linear velocity model
+        (slightly lower weight); 3) mean of the last three bboxes.
+        """
+        candidates = [(tuple(track.bbox.tolist()), 1.0)]
+        history = track.history
+        if len(history) >= 2:
+            velocity = history[-1] - history[-2]
+            candidates.append((tuple((track.bbox + velocity).tolist()), 0.85))
+        if len(history) >= 3:
+            avg_bbox = (history[-3] + history[-2] + history[-1]) / 3.0
+            candidates.append((tuple(avg_bbox.tolist()), 0.8))
+        return candidates
+
     def _match_tracks(self, detections: List[dict]) -> tuple[list[tuple[int, int]], set[int], set[int]]:
         unmatched_tracks = set(range(len(self.tracks)))
         unmatched_detections = set(range(len(detections)))
@@ -106,34 +161,21 @@ class SortTracker:
         if not detections or not self.tracks:
             return matches, unmatched_tracks, unmatched_detections
 
+        # Candidate boxes depend only on the track, so they are built once per update
+        # (as plain float tuples, which keeps iou() off numpy scalar arithmetic).
+        candidates = {index: self._track_candidates(self.tracks[index]) for index in unmatched_tracks}
+
         for det_index, det in enumerate(detections):
-            bbox_det = np.asarray(det['bbox'], dtype=float)
+            bbox_det = tuple(np.asarray(det['bbox'], dtype=float).tolist())
             best_iou = 0.0
             best_track_index: Optional[int] = None
 
             for track_index in list(unmatched_tracks):
-                current_track = self.tracks[track_index]
-
-                # 1) IOU с текущим bbox трека
-                score_current = iou(current_track.bbox, bbox_det)
-
-                # 2) IOU с предсказанной позицией (простая линейная модель скорости)
-                score_predicted = 0.0
-                if len(current_track.history) >= 2:
-                    prev = current_track.history[-2]
-                    curr = current_track.history[-1]
-                    velocity = curr - prev
-                    predicted = current_track.bbox + velocity
-                    score_predicted = iou(predicted, bbox_det) * 0.85  # слегка меньший вес
-
-                # 3) IOU со средним bbox последних точек
-                score_avg = 0.0
-                if len(current_track.history) >= 3:
-                    recent = current_track.history[-3:]
-                    avg_bbox = np.mean(recent, axis=0)
-                    score_avg = iou(avg_bbox, bbox_det) * 0.8
-
-                score = max(score_current, score_predicted, score_avg)
+                score = 0.0
+                for candidate, weight in candidates[track_index]:
+                    candidate_score = iou(candidate, bbox_det) * weight
+                    if candidate_score > score:
+                        score = candidate_score
 
                 if score > best_iou:
                     best_iou = score
@@ -196,13 +238,22 @@ class SortTracker:
             matches.append((len(self.tracks) - 1, det_index))
 
         # Remove stale tracks
+        on_event = self.on_event
+        if on_event is not None:
+            for track in self.tracks:
+                if track.misses > self.max_age and track.announced:
+                    on_event('lost', track.summary())
         self.tracks = [track for track in self.tracks if track.misses <= self.max_age]
 
         # Prepare output for active tracks with recent updates
         active_tracks: List[dict] = []
         for track in self.tracks:
             if track.hits >= self.min_hits and track.misses == 0:
-                active_tracks.append(track.to_dict())
+                track_dict = track.to_dict()
+                active_tracks.append(track_dict)
+                if on_event is not None:
+                    on_event('updated' if track.announced else 'created', track_dict)
+                track.announced = True
 
         return active_tracks
 
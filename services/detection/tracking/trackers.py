@@ -7,6 +7,8 @@ from typing import Dict, List, Optional
 import cv2
 import numpy as np
 
+from ..streaming.jpeg import encode_jpeg
+
 logger = logging.getLogger(__name__)
 
 # Кэш кадров для трекеров (max 30 кадров на трекер)
@@ -47,12 +49,10 @@ def update_tracker_cache(track_id: int, frame: np.ndarray, bbox: List[float], me
         cropped = cv2.resize(cropped, (target_width, new_height))
     
     # Кодируем в JPEG
-    success, buffer = cv2.imencode('.jpg', cropped, [cv2.IMWRITE_JPEG_QUALITY, 85])
-    if not success:
+    jpeg_bytes = encode_jpeg(cropped, use="crop")
+    if jpeg_bytes is None:
         return
     
-    jpeg_bytes = buffer.tobytes()
-    
     # Добавляем в кэш
     cache = _tracker_frames_cache[track_id]
     cache.append(jpeg_bytes)
@@ -130,11 +130,7 @@ def crop_frame_for_tracker(frame: np.ndarray, bbox: List[float]) -> Optional[byt
         new_height = int(cropped.shape[0] * scale)
         cropped = cv2.resize(cropped, (target_width, new_height))
     
-    success, buffer = cv2.imencode('.jpg', cropped, [cv2.IMWRITE_JPEG_QUALITY, 85])
-    if not success:
-        return None
-    
-    return buffer.tobytes()
+    return encode_jpeg(cropped, use="crop")
 
 
 def get_tracker_frames(track_id: int) -> List[str]:
@@ -146,6 +142,22 @@ def get_tracker_frames(track_id: int) -> List[str]:
     return [base64.b64encode(frame).decode('utf-8') for frame in frames]
 
 
+def get_tracker_last_crop(track_id: int) -> Optional[bytes]:
+    """Последний JPEG-кроп трекера из кэша (без копирования)"""
+    frames = _tracker_frames_cache.get(track_id)
+    return frames[-1] if frames else None
+
+
+def get_tracker_cache_stats() -> Dict[str, int]:
+    """Размер кэша кропов: число трекеров, кадров и байт"""
+    frames = 0
+    size = 0
+    for cache in list(_tracker_frames_cache.values()):
+        frames += len(cache)
+        size += sum(len(frame) for frame in cache)
+    return {'tracks': len(_tracker_metadata), 'frames': frames, 'bytes': size}
+
+
 def clear_tracker_cache(track_id: Optional[int] = None):
     """Очищает кэш трекера (или всех трекеров)"""
     if track_id is not None:
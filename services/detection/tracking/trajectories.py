@@ -0,0 +1,338 @@
+"""Per-track trajectories in compact float32 arrays.
+
+Each trajectory is a preallocated ``(capacity, 5)`` float32 array of
+``(t, cx, cy, w, h)`` rows; ``t`` is relative to the track's first sample so
+float32 keeps millisecond precision for hours. Appending writes one row in
+place (the array doubles up to ``max_points``, so appends are amortized
+allocation-free).
+
+Points are simplified online: the latest sample is always kept as the tail,
+and it replaces the previous tail while every sample since the last kept
+point stays within ``tolerance`` pixels of the line from that point (the
+"sleeve" test, tracked as a cone of allowed directions) and the box size
+stays within ``tolerance`` of it. A track that still outgrows ``max_points``
+is compacted to half of them by Douglas–Peucker, which is also how queries
+downsample to a requested point count.
+"""
+from __future__ import annotations
+
+import heapq
+import math
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Mapping, Optional
+
+import numpy as np
+
+from ..monitoring.metrics import MetricsRegistry
+
+# Initial rows per trajectory; grows by doubling up to max_points
+INITIAL_CAPACITY = 16
+# Columns of a trajectory row
+COLUMNS = ("t", "cx", "cy", "w", "h")
+# Upper bound for ?limit= and ?points= of trajectory queries
+MAX_LIMIT = 500
+MAX_POINTS = 10000
+
+
+def parse_trajectory_query(args: Mapping[str, str]) -> Dict[str, object]:
+    """``track_id`` (comma-separated)/``camera``/``points``/``limit``; raises ``ValueError``."""
+    query: Dict[str, object] = {}
+    if args.get("track_id") not in (None, ""):
+        query["track_ids"] = [int(value) for value in str(args["track_id"]).split(",") if value.strip()]
+    if args.get("camera") not in (None, ""):
+        query["camera_id"] = str(args["camera"])
+    for key, target, upper in (("points", "max_points", MAX_POINTS), ("limit", "limit", MAX_LIMIT)):
+        if args.get(key) not in (None, ""):
+            value = int(args[key])
+            if value < 2:
+                raise ValueError(f"{key} must be at least 2")
+            query[target] = min(value, upper)
+    return query
+
+
+def _wrap(angle: float) -> float:
+    """Angle folded into [-pi, pi)."""
+    return (angle + math.pi) % (2 * math.pi) - math.pi
+
+
+def simplify(points: np.ndarray, max_points: int) -> np.ndarray:
+    """Indices of at most ``max_points`` rows of ``points`` chosen by Douglas–Peucker.
+
+    Segments are split in order of their largest deviation, so the result is the
+    best ``max_points``-point approximation this greedy scheme finds; the first
+    and last rows are always kept. Distance is measured on the (cx, cy) columns.
+    """
+    count = len(points)
+    if count <= max_points or count <= 2:
+        return np.arange(count)
+    xy = points[:, 1:3].astype(np.float64)
+    keep = [0, count - 1]
+    heap: list = []
+
+    def push(start: int, end: int) -> None:
+        if end - start < 2:
+            return
+        inner = xy[start + 1:end]
+        direction = xy[end] - xy[start]
+        length = math.hypot(direction[0], direction[1])
+        offsets = inner - xy[start]
+        if length > 0:
+            distance = np.abs(offsets[:, 0] * direction[1] - offsets[:, 1] * direction[0]) / length
+        else:
+            distance = np.hypot(offsets[:, 0], offsets[:, 1])
+        index = int(np.argmax(distance))
+        heapq.heappush(heap, (-float(distance[index]), start, end, start + 1 + index))
+
+    push(0, count - 1)
+    while heap and len(keep) < max_points:
+        _, start, end, index = heapq.heappop(heap)
+        keep.append(index)
+        push(start, index)
+        push(index, end)
+    return np.array(sorted(keep))
+
+
+class Trajectory:
+    """Simplified path of one track."""
+
+    __slots__ = (
+        "track_id", "camera_id", "label", "t0", "points", "count", "max_points", "tolerance",
+        "samples", "active", "_cone", "_reach",
+    )
+
+    def __init__(self, track_id: int, camera_id: str, t0: float, max_points: int = 256, tolerance: float = 2.0):
+        self.track_id = track_id
+        self.camera_id = camera_id
+        self.label: Optional[str] = None
+        self.t0 = t0
+        self.max_points = max(max_points, 4)
+        self.points = np.empty((min(INITIAL_CAPACITY, self.max_points), 5), dtype=np.float32)
+        self.count = 0
+        self.tolerance = tolerance
+        self.samples = 0
+        self.active = True
+        # Allowed directions from the anchor as (base, lo, hi), lo/hi relative to base
+        self._cone: Optional[tuple] = None
+        # Farthest distance from the anchor of any sample replaced since
+        self._reach = 0.0
+
+    def append(self, timestamp: float, cx: float, cy: float, w: float, h: float) -> None:
+        self.samples += 1
+        count = self.count
+        if count >= 2 and self._within_sleeve(cx, cy, w, h):
+            # The previous tail is redundant: overwrite it with the new sample
+            self._write(self.points[count - 1], timestamp, cx, cy, w, h)
+            return
+        if count == len(self.points):
+            self._grow()
+            count = self.count
+        self._write(self.points[count], timestamp, cx, cy, w, h)
+        self.count = count + 1
+        self._reset_sleeve()
+
+    def _write(self, row: np.ndarray, timestamp: float, cx: float, cy: float, w: float, h: float) -> None:
+        row[0] = timestamp - self.t0
+        row[1] = cx
+        row[2] = cy
+        row[3] = w
+        row[4] = h
+
+    def _reset_sleeve(self) -> None:
+        """The last kept point becomes the anchor of a new sleeve ending at the tail."""
+        self._cone = None
+        if self.count >= 2:
+            anchor = self.points[self.count - 2]
+            tail = self.points[self.count - 1]
+            self._reach = math.hypot(float(tail[1] - anchor[1]), float(tail[2] - anchor[2]))
+        else:
+            self._reach = 0.0
+
+    def _within_sleeve(self, cx: float, cy: float, w: float, h: float) -> bool:
+        """True if the tail and every sample it replaced stay within tolerance of anchor -> (cx, cy)."""
+        anchor = self.points[self.count - 2]
+        tolerance = self.tolerance
+        if abs(w - anchor[3]) > tolerance or abs(h - anchor[4]) > tolerance:
+            return False
+        dx = cx - float(anchor[1])
+        dy = cy - float(anchor[2])
+        distance = math.hypot(dx, dy)
+        if distance <= tolerance:
+            # Inside the dead band around the anchor, valid only if nothing left it yet
+            return self._reach <= tolerance
+        if distance + tolerance < self._reach:
+            return False  # turned back: the shorter segment no longer covers earlier samples
+        if self._cone is None:
+            self._cone = (math.atan2(dy, dx), -math.pi, math.pi)
+            tail = self.points[self.count - 1]
+            if self._reach > tolerance and not self._narrow(
+                math.atan2(float(tail[2] - anchor[2]), float(tail[1] - anchor[1])), math.asin(tolerance / self._reach)
+            ):
+                return False
+        if not self._narrow(math.atan2(dy, dx), math.asin(tolerance / distance)):
+            return False
+        if distance > self._reach:
+            self._reach = distance
+        return True
+
+    def _narrow(self, angle: float, half_width: float) -> bool:
+        """Intersects the cone with this sample's; the sample itself must lie inside the current cone,
+        since the segment will end at it."""
+        base, lo, hi = self._cone
+        offset = _wrap(angle - base)
+        if not lo <= offset <= hi:
+            return False
+        new_lo = max(lo, offset - half_width)
+        new_hi = min(hi, offset + half_width)
+        if new_lo > new_hi:
+            return False
+        self._cone = (base, new_lo, new_hi)
+        return True
+
+    def _grow(self) -> None:
+        capacity = len(self.points)
+        if capacity < self.max_points:
+            grown = np.empty((min(capacity * 2, self.max_points), 5), dtype=np.float32)
+            grown[:capacity] = self.points
+            self.points = grown
+            return
+        # Full: keep the half of the points that best preserves the shape
+        keep = simplify(self.points[:self.count], self.max_points // 2)
+        kept = len(keep)
+        self.points[:kept] = self.points[keep]
+        self.count = kept
+        self._reset_sleeve()
+
+    def last_timestamp(self) -> float:
+        return self.t0 + float(self.points[self.count - 1, 0]) if self.count else self.t0
+
+    def finish(self) -> None:
+        """Marks the track lost and trims the spare rows."""
+        self.active = False
+        self._cone = None
+        self.points = self.points[:self.count].copy()
+
+    def to_dict(self, max_points: Optional[int] = None) -> dict:
+        rows = self.points[:self.count]
+        if max_points is not None and self.count > max_points:
+            rows = rows[simplify(rows, max_points)]
+        points = rows.astype(np.float64)
+        points[:, 0] += self.t0
+        return {
+            "trackId": self.track_id,
+            "cameraId": self.camera_id,
+            "label": self.label,
+            "active": self.active,
+            "samples": self.samples,
+            "columns": list(COLUMNS),
+            "points": np.round(points, 3).tolist(),
+        }
+
+
+class TrajectoryStore:
+    """Trajectories of live tracks plus the last ``max_tracks`` finished ones."""
+
+    def __init__(
+        self,
+        metrics: MetricsRegistry,
+        max_points: int = 256,
+        tolerance: float = 2.0,
+        max_tracks: int = 1000,
+    ):
+        self.max_points = max_points
+        self.tolerance = tolerance
+        self.max_tracks = max_tracks
+        self._active: Dict[int, Trajectory] = {}
+        self._finished: "OrderedDict[int, Trajectory]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evicted = 0
+        metrics.gauge("trajectory_tracks", "Trajectories held in memory", fn=lambda: len(self))
+        metrics.gauge("trajectory_points", "Trajectory points held in memory", fn=self.points_held)
+
+    def __len__(self) -> int:
+        return len(self._active) + len(self._finished)
+
+    def observe(self, camera_id: str, tracked: Iterable[dict], timestamp: float) -> None:
+        """Appends the current box of every tracked object; called once per processed frame."""
+        with self._lock:
+            for track in tracked:
+                track_id = track.get("trackId")
+                bbox = track.get("bbox")
+                if track_id is None or not bbox:
+                    continue
+                trajectory = self._active.get(track_id)
+                if trajectory is None:
+                    if len(self._active) >= self.max_tracks:
+                        self._retire_stale()
+                    trajectory = Trajectory(track_id, camera_id, timestamp, self.max_points, self.tolerance)
+                    self._active[track_id] = trajectory
+                trajectory.label = track.get("label")
+                x1, y1, x2, y2 = bbox
+                trajectory.append(timestamp, (x1 + x2) * 0.5, (y1 + y2) * 0.5, x2 - x1, y2 - y1)
+
+    def finish(self, track_id: int) -> None:
+        """Moves a lost track's trajectory to the finished set, evicting the oldest beyond ``max_tracks``."""
+        with self._lock:
+            self._finish(track_id)
+
+    def _finish(self, track_id: int) -> None:
+        trajectory = self._active.pop(track_id, None)
+        if trajectory is None:
+            return
+        trajectory.finish()
+        self._finished[track_id] = trajectory
+        while len(self._finished) > self.max_tracks:
+            self._finished.popitem(last=False)
+            self.evicted += 1
+
+    def _retire_stale(self) -> None:
+        """Finishes the least recently updated half of the live set (tracks whose loss was never reported)."""
+        by_last_update = sorted(self._active.values(), key=Trajectory.last_timestamp)
+        for trajectory in by_last_update[: max(1, len(by_last_update) // 2)]:
+            self._finish(trajectory.track_id)
+
+    def get(self, track_id: int, max_points: Optional[int] = None) -> Optional[dict]:
+        with self._lock:
+            trajectory = self._active.get(track_id) or self._finished.get(track_id)
+            return trajectory.to_dict(max_points) if trajectory is not None else None
+
+    def query(
+        self,
+        track_ids: Optional[List[int]] = None,
+        camera_id: Optional[str] = None,
+        max_points: Optional[int] = None,
+        limit: int = 50,
+    ) -> List[dict]:
+        """Trajectories of ``track_ids``, or the most recent ``limit`` ones (live tracks first)."""
+        with self._lock:
+            if track_ids is not None:
+                selected = [
+                    trajectory
+                    for trajectory in (self._active.get(track_id) or self._finished.get(track_id) for track_id in track_ids)
+                    if trajectory is not None
+                ]
+            else:
+                selected = list(self._active.values()) + list(reversed(self._finished.values()))
+            if camera_id is not None:
+                selected = [trajectory for trajectory in selected if trajectory.camera_id == camera_id]
+            return [trajectory.to_dict(max_points) for trajectory in selected[:limit]]
+
+    def points_held(self) -> int:
+        with self._lock:
+            return sum(trajectory.count for trajectory in self._active.values()) + sum(
+                trajectory.count for trajectory in self._finished.values()
+            )
+
+    def stats(self) -> dict:
+        with self._lock:
+            samples = sum(t.samples for t in self._active.values()) + sum(t.samples for t in self._finished.values())
+            points = sum(t.count for t in self._active.values()) + sum(t.count for t in self._finished.values())
+            return {
+                "active": len(self._active),
+                "finished": len(self._finished),
+                "points": points,
+                "samples": samples,
+                "evicted": self.evicted,
+                "max_points": self.max_points,
+                "tolerance": self.tolerance,
+            }